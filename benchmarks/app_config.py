@@ -0,0 +1,35 @@
+"""
+Config getter calls per second: re-parsing config.json on every call, as
+the getters used to, against the cached config and a held snapshot.
+
+    poetry run python benchmarks/app_config.py
+"""
+
+import json, time
+from discord_tron_client.classes.app_config import AppConfig
+
+
+def benchmark(calls: int = 20000) -> dict:
+    config = AppConfig()
+
+    def parse_each_call():
+        with open(config.config_path, "r") as config_file:
+            return max(json.load(config_file).get("maximum_batch_size", 4), 1)
+
+    results = {}
+    for name, getter in (
+        ("reparse", parse_each_call),
+        ("cached", config.maximum_batch_size),
+        ("snapshot", lambda: config.get_snapshot().maximum_batch_size),
+    ):
+        started_at = time.perf_counter()
+        for _ in range(calls):
+            getter()
+        results[f"{name}_calls_per_second"] = calls / (
+            time.perf_counter() - started_at
+        )
+    return results
+
+
+if __name__ == "__main__":
+    print(benchmark())
@@ -0,0 +1,78 @@
+"""
+Uploads per second to a local stand-in master's /upload_image, for the
+pooled HttpClient against a fresh requests.post per upload.
+
+    poetry run python benchmarks/http_client.py
+"""
+
+import asyncio, io, time
+import requests
+from aiohttp import web
+from discord_tron_client.classes.http_client import HttpClient
+
+
+async def _benchmark(uploads: int, size_bytes: int, concurrency: int) -> dict:
+    async def upload_image(request):
+        reader = await request.multipart()
+        async for part in reader:
+            await part.read()
+        return web.json_response({"image_url": "http://127.0.0.1/image.png"})
+
+    app = web.Application(client_max_size=size_bytes * 2)
+    app.router.add_post("/upload_image", upload_image)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/upload_image"
+    payload = b"\0" * size_bytes
+    results = {}
+    try:
+        # The old path: a fresh connection per upload, from worker threads.
+        semaphore = asyncio.Semaphore(concurrency)
+        loop = asyncio.get_running_loop()
+
+        async def unpooled():
+            async with semaphore:
+                await loop.run_in_executor(
+                    None,
+                    lambda: requests.post(
+                        url, files={"file": ("image.png", io.BytesIO(payload))}
+                    ).json(),
+                )
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(unpooled() for _ in range(uploads)))
+        results["unpooled_uploads_per_second"] = uploads / (
+            time.perf_counter() - started_at
+        )
+        client = HttpClient(max_concurrency=concurrency)
+        started_at = time.perf_counter()
+        await asyncio.gather(
+            *(
+                client.request(
+                    "POST",
+                    url,
+                    body=lambda: client.multipart(
+                        {"file": ("image.png", io.BytesIO(payload), "image/png")}
+                    ),
+                )
+                for _ in range(uploads)
+            )
+        )
+        results["pooled_uploads_per_second"] = uploads / (
+            time.perf_counter() - started_at
+        )
+        await client.close()
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def benchmark(uploads: int = 200, size_bytes: int = 256 * 1024, concurrency: int = 4):
+    return asyncio.run(_benchmark(uploads, size_bytes, concurrency))
+
+
+if __name__ == "__main__":
+    print(benchmark())
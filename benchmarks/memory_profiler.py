@@ -0,0 +1,65 @@
+"""
+Seconds per job for the Python-side work of a job with tracing off (the
+default now) and with tracemalloc running, as it did for the whole life of
+the worker before the memory profiler.
+
+    poetry run python benchmarks/memory_profiler.py
+"""
+
+import base64, json, re, time, tracemalloc
+
+
+def _job(payload_items: int) -> int:
+    """A stand-in for the Python-side work of one job: payload parsing, prompt handling, encoding."""
+    payload = json.dumps(
+        {
+            "config": {f"setting_{index}": index for index in range(200)},
+            "history": [{"prompt": "a photo of a cat " * 8, "seed": index} for index in range(payload_items)],
+        }
+    )
+    parsed = json.loads(payload)
+    tokens = sum(
+        len(re.findall(r"\w+|[^\w\s]", item["prompt"])) for item in parsed["history"]
+    )
+    encoded = base64.b64encode(bytes(range(256)) * payload_items)
+    try:
+        from PIL import Image
+        from io import BytesIO
+
+        buffer = BytesIO()
+        Image.new("RGB", (512, 512), (120, 30, 200)).save(buffer, format="PNG")
+    except ImportError:
+        pass
+    return tokens + len(encoded)
+
+
+def benchmark(jobs: int = 50, payload_items: int = 2000) -> dict:
+    was_tracing = tracemalloc.is_tracing()
+    if was_tracing:
+        tracemalloc.stop()
+
+    def run() -> float:
+        _job(payload_items)
+        started_at = time.perf_counter()
+        for _ in range(jobs):
+            _job(payload_items)
+        return (time.perf_counter() - started_at) / jobs
+
+    off = run()
+    tracemalloc.start()
+    try:
+        traced = run()
+    finally:
+        tracemalloc.stop()
+        if was_tracing:
+            tracemalloc.start()
+    return {
+        "off_seconds_per_job": off,
+        "tracemalloc_seconds_per_job": traced,
+        "overhead": traced / off - 1 if off else None,
+    }
+
+
+if __name__ == "__main__":
+    for payload_items in (200, 2000, 20000):
+        print(payload_items, benchmark(payload_items=payload_items))
@@ -0,0 +1,35 @@
+"""
+Microseconds per counter increment and per histogram observation, and the
+time to render the registry.
+
+    poetry run python benchmarks/metrics.py
+"""
+
+import time
+from discord_tron_client.classes.metrics import MetricsRegistry
+
+
+def benchmark(updates: int = 200000) -> dict:
+    registry = MetricsRegistry(prefix="benchmark_")
+    counter = registry.counter("events_total", "", ("kind",))
+    histogram = registry.histogram("event_seconds", "", ("kind",))
+    started_at = time.perf_counter()
+    for _ in range(updates):
+        counter.inc(kind="upload")
+    increment = time.perf_counter() - started_at
+    started_at = time.perf_counter()
+    for index in range(updates):
+        histogram.observe(index % 100 / 10, kind="upload")
+    observe = time.perf_counter() - started_at
+    started_at = time.perf_counter()
+    text = registry.render()
+    return {
+        "counter_inc_microseconds": increment / updates * 1e6,
+        "histogram_observe_microseconds": observe / updates * 1e6,
+        "render_milliseconds": (time.perf_counter() - started_at) * 1e3,
+        "render_bytes": len(text),
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark())
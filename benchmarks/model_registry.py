@@ -0,0 +1,27 @@
+"""
+Import time per module while warming up model families (all of them, or
+those named on the command line), or with --check-startup, whether the
+worker's startup imports load any torch model weights.
+
+    poetry run python benchmarks/model_registry.py [family ...]
+    poetry run python benchmarks/model_registry.py --check-startup
+"""
+
+import logging, sys
+from discord_tron_client.classes.model_registry import (
+    check_startup,
+    get_model_registry,
+    profile_imports,
+)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if "--check-startup" in sys.argv[1:]:
+        sys.exit(0 if check_startup() else 1)
+    registry = get_model_registry()
+    with profile_imports() as profile:
+        registry.warm_up(sys.argv[1:] or None, background=False)
+    profile.log()
+    for record in registry.import_report():
+        print(record)
@@ -0,0 +1,53 @@
+"""
+Seconds per 1,000 words against a stub acoustic model that costs
+`call_seconds` per call and returns silence at speaking pace: the old
+one-call-per-sentence path with repeated concatenation, and the TTSEngine.
+
+    poetry run python benchmarks/tts_engine.py
+"""
+
+import time
+from typing import List, Optional
+import numpy as np
+from discord_tron_client.classes.tts.engine import (
+    WORDS_PER_SECOND,
+    TTSEngine,
+    _word_count,
+    split_sentences,
+)
+
+
+def benchmark(words: int = 5000, call_seconds: float = 0.002, sample_rate: int = 24000) -> dict:
+    sentence = "The quick brown fox jumps over the lazy dog again and again."
+    per_sentence = len(sentence.split())
+    text = " ".join([sentence] * max(words // per_sentence, 1))
+    total_words = _word_count(text)
+
+    def clip(group: str) -> np.ndarray:
+        return np.zeros(int(_word_count(group) / WORDS_PER_SECOND * sample_rate), dtype=np.float32)
+
+    def stub(texts: List[str], voice: Optional[str]) -> List[np.ndarray]:
+        time.sleep(call_seconds)
+        return [clip(group) for group in texts]
+
+    started_at = time.perf_counter()
+    combined = np.array([], dtype=np.int16)
+    for group in split_sentences(text):
+        combined = np.concatenate((combined, stub([group], None)[0]))
+    legacy = time.perf_counter() - started_at
+
+    engine = TTSEngine(stub, sample_rate, group_words=30, groups_per_call=4)
+    started_at = time.perf_counter()
+    audio = engine.synthesize([(text, None)])
+    grouped = time.perf_counter() - started_at
+    assert audio.shape[0] > 0
+    return {
+        "words": total_words,
+        "legacy_seconds_per_1000_words": legacy / total_words * 1000,
+        "engine_seconds_per_1000_words": grouped / total_words * 1000,
+    }
+
+
+if __name__ == "__main__":
+    for words in (1000, 5000, 20000):
+        print(benchmark(words))
@@ -0,0 +1,64 @@
+"""
+Encode synthetic frames on the CPU the old way (whole-clip numpy and uint8
+copies) and through the streaming VideoEncoder, each in a fresh process so
+their peak RSS can be compared.
+
+    poetry run python benchmarks/video_encoder.py
+"""
+
+import multiprocessing, os, resource, time
+import numpy as np
+import torch
+from discord_tron_client.classes.image_manipulation.video_encoder import VideoEncoder
+
+
+def _peak_rss_bytes() -> int:
+    # Linux reports kilobytes.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _current_rss_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _benchmark_run(mode: str, frames: int, height: int, width: int, results):
+    # What a VAE decode hands back with output_type="pt".
+    video = torch.rand(frames, 3, height, width)
+    baseline = _current_rss_bytes()
+    started_at = time.perf_counter()
+    with VideoEncoder(fps=24, video_format="mp4") as encoder:
+        if mode == "streaming":
+            encoder.write(video)
+        else:
+            # The old path: a numpy copy of the clip, then a uint8 copy of that.
+            arrays = list(video.permute(0, 2, 3, 1).numpy().copy())
+            arrays = [(frame * 255).astype(np.uint8) for frame in arrays]
+            encoder.write(arrays)
+    seconds = time.perf_counter() - started_at
+    os.remove(encoder.path)
+    results.put(
+        {
+            "mode": mode,
+            "seconds": seconds,
+            "peak_rss_mb": _peak_rss_bytes() / 2**20,
+            "peak_over_decoded_mb": (_peak_rss_bytes() - baseline) / 2**20,
+        }
+    )
+
+
+def benchmark(frames: int = 121, height: int = 512, width: int = 768) -> list:
+    context = multiprocessing.get_context("fork")
+    results = []
+    for mode in ("copying", "streaming"):
+        outputs = context.Queue()
+        process = context.Process(target=_benchmark_run, args=(mode, frames, height, width, outputs))
+        process.start()
+        results.append(outputs.get())
+        process.join()
+    return results
+
+
+if __name__ == "__main__":
+    for result in benchmark():
+        print(result)
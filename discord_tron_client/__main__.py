@@ -27,17 +27,26 @@ def _apply_protobuf_compat():
 
 
 _apply_protobuf_compat()
-from discord_tron_client.classes.image_manipulation.diffusion import (
-    DiffusionPipelineManager,
+from discord_tron_client.classes.model_registry import (
+    get_model_registry,
+    profile_imports,
 )
 
 config = AppConfig()
-config.set_pipeline_manager(DiffusionPipelineManager())
 
 
 def main():
     try:
-        from .ws_client import websocket_client
+        # Imported here rather than at module level, because the spawned
+        # encode processes import this module too and need none of it.
+        # Model families are imported on first use; see model_registry.
+        with profile_imports() as startup_imports:
+            from discord_tron_client.classes.image_manipulation.diffusion import (
+                DiffusionPipelineManager,
+            )
+            from .ws_client import websocket_client
+        config.set_pipeline_manager(DiffusionPipelineManager())
+        startup_imports.log()
         # Detect an expired token.
         logging.info("Inspecting auth ticket...")
         from discord_tron_client.classes.auth import Auth
@@ -85,18 +94,18 @@ def main():
             arguments=machine_info,
         )
         startup_sequence.append(hardware_info_message)
+        # Optional: import the families in `warm_up_families` while we register.
+        get_model_registry().warm_up()
+        # The local Flask endpoints (/metrics, /diagnostics) run beside the websocket loop.
+        from discord_tron_client.app_factory import start_server
+
+        start_server()
         main_loop = asyncio.get_event_loop()
         # Add the main loop to the central Config object.
         AppConfig.set_loop(main_loop)
         main_loop.run_until_complete(
             websocket_client(config, startup_sequence, auth=auth)
         )
-
-        # Start the Flask server
-        from discord_tron_client.app_factory import create_app
-
-        app = create_app()
-        app.run()
     except KeyboardInterrupt:
         logging.info("Shutting down...")
         exit(0)
@@ -1,11 +1,46 @@
+import logging, threading
 from flask import Flask
 from discord_tron_client.classes.app_config import AppConfig
 
+logger = logging.getLogger(__name__)
+
 
 def create_app(config_class=AppConfig):
     app = Flask(__name__)
     # app.config.from_object(config_class)
 
     # Add any app configurations, blueprints, or extensions here
+    from discord_tron_client.classes.memory_profiler import blueprint as diagnostics
+    from discord_tron_client.classes.metrics import blueprint as metrics
+
+    app.register_blueprint(diagnostics())
+    app.register_blueprint(metrics())
 
     return app
+
+
+def start_server(config: AppConfig = None):
+    """
+    Serve the Flask app on a daemon thread, so it runs alongside the
+    websocket loop instead of after it. Configured by `metrics_server`
+    (enabled, host, port); it listens on localhost unless told otherwise.
+    Returns the server, or None when disabled or the port is taken.
+    """
+    from werkzeug.serving import make_server
+
+    config = config or AppConfig()
+    settings = config.get_config_value("metrics_server", {}) or {}
+    if not settings.get("enabled", True):
+        return None
+    host = settings.get("host", "127.0.0.1")
+    port = int(settings.get("port", 9420))
+    try:
+        server = make_server(host, port, create_app(), threaded=True)
+    except (OSError, SystemExit) as e:
+        logger.warning(f"Could not start the local HTTP server on {host}:{port}: {e}")
+        return None
+    threading.Thread(
+        target=server.serve_forever, name="local-http-server", daemon=True
+    ).start()
+    logger.info(f"Serving /metrics and /diagnostics on http://{host}:{port}")
+    return server
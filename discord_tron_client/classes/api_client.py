@@ -1,6 +1,15 @@
-import logging, json, requests, sys, os, io, time
+import logging, json, sys, os, io, time
 from discord_tron_client.classes.auth import Auth
 from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.http_client import (
+    get_http_client,
+    get_http_session,
+)
+from discord_tron_client.classes.image_manipulation.image_encoder import (
+    EncodedImage,
+    encode_image,
+)
+from discord_tron_client.classes.metrics import UPLOAD_BYTES, UPLOAD_SECONDS, UPLOADS
 from PIL import Image
 import urllib3
 
@@ -14,6 +23,9 @@ class ApiClient:
         self.verify_ssl = config.verify_master_ssl()
         self.api_key = config.get_master_api_key()
         self.headers = self._set_auth_header()
+        # Pooled keep-alive connections for sync calls, and the async upload client.
+        self.session = get_http_session()
+        self.http = get_http_client()
 
     def update_auth(self):
         self._set_auth_header()
@@ -24,7 +36,7 @@ class ApiClient:
         url = self.base_url + endpoint
         params["api_key"] = self.api_key
         params["access_token"] = self.auth.get()
-        response = requests.get(url, params=params, verify=self.verify_ssl)
+        response = self.session.get(url, params=params, verify=self.verify_ssl)
         return self.handle_response(response)
 
     def put(self, endpoint: str, params: dict = None):
@@ -33,7 +45,7 @@ class ApiClient:
         url = self.base_url + endpoint
         params["api_key"] = self.api_key
         params["access_token"] = self.auth.get()
-        response = requests.put(url, params=params, verify=self.verify_ssl)
+        response = self.session.put(url, params=params, verify=self.verify_ssl)
         return self.handle_response(response)
 
     def post(
@@ -52,7 +64,7 @@ class ApiClient:
             if send_auth:
                 self.headers = self._set_auth_header()
             url = self.base_url + endpoint
-            response = requests.post(
+            response = self.session.post(
                 url,
                 timeout=60,
                 params=params,
@@ -72,28 +84,76 @@ class ApiClient:
                 logging.error("Error in ApiClient.post when checking error: " + str(e2))
                 raise e2
 
+    def _upload_headers(self, send_auth: bool) -> dict:
+        if send_auth:
+            return self._set_auth_header()
+        return self.headers
+
+    async def upload(
+        self,
+        endpoint: str,
+        files: dict,
+        params: dict = None,
+        send_auth: bool = True,
+        size_bytes: int = None,
+    ):
+        """
+        Stream a multipart upload to the master through the shared async
+        client. `files` maps field names to a callable that returns a fresh
+        file object (or a (filename, file object, content type) tuple), so
+        the body can be rebuilt for each retry.
+        """
+        logging.debug(f"Uploading {list(files)} to {endpoint} using params {params}")
+        started_at = time.monotonic()
+        try:
+            result = await self.http.request(
+                "POST",
+                self.base_url + endpoint,
+                params=params,
+                headers=lambda: self._upload_headers(send_auth),
+                body=lambda: self.http.multipart(
+                    {name: opener() for name, opener in files.items()}
+                ),
+                on_unauthorized=self.auth.get_access_token if send_auth else None,
+            )
+        except Exception:
+            UPLOADS.inc(endpoint=endpoint, outcome="error")
+            raise
+        UPLOADS.inc(endpoint=endpoint, outcome="ok")
+        UPLOAD_SECONDS.observe(time.monotonic() - started_at, endpoint=endpoint)
+        if size_bytes is not None:
+            UPLOAD_BYTES.inc(size_bytes, endpoint=endpoint)
+        return result
+
     async def send_file(self, endpoint: str, file_path: str):
         logging.debug(f"send_file loading {file_path} to endpoint {endpoint}")
-        with open(file_path, "rb") as f:
-            response = self.post(endpoint, files={"file": f})
-        return response
+        return await self.upload(
+            endpoint,
+            {"file": lambda: open(file_path, "rb")},
+            size_bytes=os.path.getsize(file_path),
+        )
 
     async def send_audio(
         self, endpoint: str, buffer: io.BytesIO, send_auth: bool = True
     ):
-        import asyncio
-
-        loop = asyncio.get_event_loop()
         logging.debug(f"Uploading audio: {buffer}")
-        response = await loop.run_in_executor(
-            AppConfig.get_image_worker_thread(),  # Use a dedicated image processing thread worker.
-            self.post,
+        data = buffer.getvalue()
+        return await self.upload(
             endpoint,
-            None,
-            {"audio_buffer": buffer},
-            send_auth,
+            {"audio_buffer": lambda: ("audio.wav", io.BytesIO(data), "audio/wav")},
+            send_auth=send_auth,
+            size_bytes=len(data),
+        )
+
+    async def send_encoded_audio(
+        self, endpoint: str, audio, send_auth: bool = True
+    ):
+        return await self.upload(
+            endpoint,
+            {"audio_buffer": lambda: (audio.filename, audio.as_file(), audio.mime_type)},
+            send_auth=send_auth,
+            size_bytes=len(audio.data),
         )
-        return response
 
     async def send_pil_image(
         self,
@@ -102,33 +162,31 @@ class ApiClient:
         send_auth: bool = True,
         image_metadata: dict = {},
     ):
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        attempt = 0
-        while attempt < 15:
-            try:
-                buffer.seek(0)
-                import asyncio
-
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(
-                    AppConfig.get_image_worker_thread(),  # Use a dedicated image processing thread worker.
-                    self.post,
-                    endpoint,
-                    image_metadata,
-                    {"image": buffer},
-                    send_auth,
-                )
-                return response
-            except Exception as e:
-                attempt += 1
-                sleep_time = 2**attempt
-                logging.error(
-                    f"Error in ApiClient.post. Sleeping for {sleep_time} seconds."
-                )
-                time.sleep(sleep_time)
-                if attempt >= 15:
-                    raise Exception(f"Upload failed after 15 attempts")
+        if not isinstance(image, EncodedImage):
+            text_chunks = {
+                key: value
+                for key, value in getattr(image, "info", {}).items()
+                if isinstance(value, str)
+            }
+            image = encode_image(image, text_chunks)
+        return await self.send_encoded_image(
+            endpoint, image, send_auth, image_metadata
+        )
+
+    async def send_encoded_image(
+        self,
+        endpoint: str,
+        image: EncodedImage,
+        send_auth: bool = True,
+        image_metadata: dict = {},
+    ):
+        return await self.upload(
+            endpoint,
+            {"image": lambda: (image.filename, image.as_file(), image.mime_type)},
+            params=image_metadata,
+            send_auth=send_auth,
+            size_bytes=len(image.data),
+        )
 
     def send_buffer(self, endpoint: str, buffer: io.BytesIO):
         response = self.post(endpoint, files={"file": buffer})
@@ -1,7 +1,35 @@
 # classes/app_config.py
 
-import json, os, logging, traceback
-from concurrent.futures import ThreadPoolExecutor
+import json, os, logging, threading, time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """
+    Read-only view of the values that the generation hot paths consult per job.
+
+    A snapshot is rebuilt only when config.json changes on disk, so callers may
+    hold on to it for the duration of a job without re-reading anything.
+    """
+
+    version: int
+    maximum_batch_size: int
+    enable_compel: bool
+    cuda_cache_clear: bool
+    master_url: str
+    verify_master_ssl: bool
+    max_concurrent_uploads: int
+    concurrent_slots: int
+    use_safetensors: bool
+    enable_offload: bool
+    enable_sequential_offload: bool
+    maxres: Mapping[str, dict] = field(default_factory=dict)
+
+    def get_max_resolution_by_aspect_ratio(self, aspect_ratio: str):
+        return self.maxres.get(aspect_ratio, {"width": 3840, "height": 2160})
 
 
 class AppConfig:
@@ -12,7 +40,21 @@ class AppConfig:
     main_pipelinerunner = None
     main_websocket = None
     main_ollama_runtime = None
-    image_processing_executor = None
+    executor_topology = None
+    _executor_lock = threading.Lock()
+    # Parsed config.json, shared by every AppConfig instance.
+    _config_cache = None
+    # What readers see: _config_cache with _config_overrides layered on top.
+    _config_view = None
+    _config_stamp = None
+    _config_checked_at = 0.0
+    _config_version = 0
+    _config_lock = threading.Lock()
+    # Values layered over config.json in memory, eg. by the replay harness.
+    _config_overrides = None
+    _snapshot = None
+    # How often (in milliseconds) we stat() config.json to look for changes.
+    default_stat_interval_ms = 500
 
     # Initialize the config object.
     def __init__(self):
@@ -26,14 +68,101 @@ class AppConfig:
         self.auth_ticket_path = os.path.join(config_path, "auth.json")
         self.reload_config()
 
-    def reload_config(self):
-        if not os.path.exists(self.config_path):
-            with open(self.example_config_path, "r") as example_file:
-                example_config = json.load(example_file)
-            with open(self.config_path, "w") as config_file:
-                json.dump(example_config, config_file, indent=4)
-        with open(self.config_path, "r") as config_file:
-            self.config = json.load(config_file)
+    def reload_config(self, force: bool = False):
+        """
+        Refresh self.config from the shared cache, re-parsing config.json only
+        when its inode, mtime or size has changed since the last read.
+
+        The file is stat()'d at most once per `config_stat_interval_ms`.
+        """
+        cls = AppConfig
+        now = time.monotonic()
+        if (
+            not force
+            and cls._config_cache is not None
+            and (now - cls._config_checked_at) * 1000 < cls._get_stat_interval_ms()
+        ):
+            self.config = cls._config_view
+            return
+        with cls._config_lock:
+            if not os.path.exists(self.config_path):
+                with open(self.example_config_path, "r") as example_file:
+                    example_config = json.load(example_file)
+                with open(self.config_path, "w") as config_file:
+                    json.dump(example_config, config_file, indent=4)
+            stat = os.stat(self.config_path)
+            stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if force or cls._config_cache is None or stamp != cls._config_stamp:
+                with open(self.config_path, "r") as config_file:
+                    cls._config_cache = json.load(config_file)
+                cls._config_view = cls._layer_overrides(cls._config_cache)
+                cls._config_stamp = stamp
+                cls._config_version += 1
+                logging.debug(
+                    f"Loaded {self.config_path} (version {cls._config_version})."
+                )
+            cls._config_checked_at = time.monotonic()
+        self.config = cls._config_view
+
+    @classmethod
+    def _layer_overrides(cls, file_config: dict) -> dict:
+        if not cls._config_overrides:
+            return file_config
+        return {**file_config, **cls._config_overrides}
+
+    @classmethod
+    def set_config_overrides(cls, overrides: dict = None):
+        """
+        Layer `overrides` over config.json for this process without writing
+        the file, or remove them with None. Top-level keys replace the file's.
+
+        Overrides only ever reach readers; set_user_config() and friends save
+        the file's own values.
+        """
+        cls._config_overrides = dict(overrides) if overrides else None
+        cls().reload_config(force=True)
+
+    def reload(self) -> ConfigSnapshot:
+        """Unconditionally re-read config.json and return a fresh snapshot."""
+        self.reload_config(force=True)
+        return self.get_snapshot()
+
+    @classmethod
+    def _get_stat_interval_ms(cls):
+        try:
+            return float(
+                cls._config_view.get(
+                    "config_stat_interval_ms", cls.default_stat_interval_ms
+                )
+            )
+        except (TypeError, ValueError):
+            return cls.default_stat_interval_ms
+
+    def get_snapshot(self) -> ConfigSnapshot:
+        """
+        Return the frozen view of the current config, rebuilding it only
+        when config.json has changed.
+        """
+        self.reload_config()
+        snapshot = AppConfig._snapshot
+        if snapshot is not None and snapshot.version == AppConfig._config_version:
+            return snapshot
+        snapshot = ConfigSnapshot(
+            version=AppConfig._config_version,
+            maximum_batch_size=self.maximum_batch_size(),
+            enable_compel=self.enable_compel(),
+            cuda_cache_clear=self.get_cuda_cache_clear_toggle(),
+            master_url=self.get_master_url(),
+            verify_master_ssl=self.verify_master_ssl(),
+            max_concurrent_uploads=self.get_max_concurrent_uploads(),
+            concurrent_slots=self.get_concurrent_slots(),
+            use_safetensors=self.use_safetensors(),
+            enable_offload=self.enable_offload(),
+            enable_sequential_offload=self.enable_sequential_offload(),
+            maxres=MappingProxyType(dict(self.get_config_value("maxres", {}))),
+        )
+        AppConfig._snapshot = snapshot
+        return snapshot
 
     @classmethod
     def set_loop(cls, loop):
@@ -68,20 +197,35 @@ class AppConfig:
         return cls.main_ollama_runtime
 
     @classmethod
-    def get_image_worker_thread(cls):
-        if cls.get_image_worker_thread is None:
-            raise Exception(
-                f"AppConfig.image_processing_executor is not set! Traceback: {traceback.format_stack()}"
-            )
+    def get_executors(cls):
+        if cls.executor_topology is None:
+            with cls._executor_lock:
+                if cls.executor_topology is None:
+                    from discord_tron_client.classes.executors import (
+                        build_executor_topology,
+                    )
+
+                    cls.executor_topology = build_executor_topology()
+        return cls.executor_topology
+
+    @classmethod
+    def get_image_worker_thread(cls, device: int = None):
+        """The single-thread lane that runs GPU work for a device."""
+        return cls.get_executors().gpu(device)
 
     @classmethod
     def set_image_worker_thread(cls):
-        if cls.image_processing_executor is not None:
-            return cls.image_processing_executor
-        config = AppConfig()
-        cls.image_processing_executor = ThreadPoolExecutor(
-            max_workers=config.get_concurrent_slots()
-        )
+        return cls.get_image_worker_thread()
+
+    @classmethod
+    def get_encode_executor(cls):
+        """The process pool for CPU-heavy encoding work."""
+        return cls.get_executors().encode
+
+    @classmethod
+    def get_io_executor(cls):
+        """The thread pool for blocking network I/O."""
+        return cls.get_executors().io
 
     @classmethod
     def get_loop(cls):
@@ -104,7 +248,7 @@ class AppConfig:
         return cls.main_pipelinerunner
 
     def get_config_value(self, key, default_value=None):
-        # Always ensure we get up-to-date values.
+        # Cheap when config.json is unchanged; see reload_config().
         self.reload_config()
         return self.config.get(key, default_value)
 
@@ -242,17 +386,25 @@ class AppConfig:
         return self.get_config_value("users", {}).get(str(user_id), {})
 
     def set_user_config(self, user_id, user_config):
-        self.config["users"][str(user_id)] = user_config
+        self.reload_config()
+        # Write the file's own values, never the in-memory overrides.
+        file_config = AppConfig._config_cache
+        file_config.setdefault("users", {})[str(user_id)] = user_config
         with open(self.config_path, "w") as config_file:
-            json.dump(self.config, config_file)
+            json.dump(file_config, config_file)
+        self.reload_config(force=True)
 
     def set_user_setting(self, user_id, setting_key, value):
         user_id = str(user_id)
-        if user_id not in self.config["users"]:
-            self.config["users"][user_id] = {}
-        self.config["users"][user_id][setting_key] = value
+        self.reload_config()
+        file_config = AppConfig._config_cache
+        users = file_config.setdefault("users", {})
+        if user_id not in users:
+            users[user_id] = {}
+        users[user_id][setting_key] = value
         with open(self.config_path, "w") as config_file:
-            json.dump(self.config, config_file)
+            json.dump(file_config, config_file)
+        self.reload_config(force=True)
 
     def get_user_setting(self, user_id, setting_key, default_value=None):
         user_id = str(user_id)
@@ -354,3 +506,4 @@ class AppConfig:
 
     def use_safetensors(self):
         return self.get_config_value("use_safetensors", True)
+
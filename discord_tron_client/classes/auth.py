@@ -1,5 +1,6 @@
 import logging, time
 from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.http_client import get_http_session
 from datetime import datetime
 from threading import Semaphore
 
@@ -29,9 +30,7 @@ class Auth:
         logging.debug(f"Running refresh_client_token unconditionally.")
         url = self.base_url + "/refresh_token"
         payload = {"refresh_token": refresh_token}
-        import requests
-
-        response = requests.post(
+        response = get_http_session().post(
             url, json=payload, verify=self.config.verify_master_ssl()
         )
 
@@ -57,9 +56,7 @@ class Auth:
             payload = {"api_key": api_key, "client_id": auth_ticket["client_id"]}
             logging.debug(f"get_access_token payload: {payload}")
 
-            import requests
-
-            response = requests.post(
+            response = get_http_session().post(
                 url, json=payload, verify=self.config.verify_master_ssl()
             )
             logging.info(f"Response: {response.text}")
@@ -0,0 +1,162 @@
+import asyncio, json, logging, re
+from typing import Callable, List
+from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.cost_model import get_cost_model, gpu_memory_bytes
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+# User settings that shape the shared pipeline call. Jobs may only share a
+# batch when all of these match; everything else (seed, prompts, style,
+# refiner and tile settings) is applied per job.
+BATCH_KEY_FIELDS = (
+    "model",
+    "steps",
+    "resolution",
+    "scheduler",
+    "guidance_scaling",
+    "guidance_rescale",
+    "latent_refiner",
+    "refiner_strength",
+    "prompt_weighting",
+    "clip_skip",
+    "flux_guidance_scale",
+    "skip_guidance_layers",
+    "enable_teacache",
+    "teacache_distance",
+    "enable_sageattn",
+    "enable_deepcache",
+    "deepcache_interval",
+    "deepcache_branch_id",
+    "deepcache_skip_mode",
+    "enable_tiling",
+)
+ADAPTER_FIELD = re.compile(r"_adapter_\d+$")
+
+
+class BatchScheduler:
+    """
+    Groups text-to-image jobs by a compatibility key (model, resolution,
+    steps, scheduler, adapters and the other settings that shape the
+    pipeline call), so that each group runs as one batched pipeline call.
+
+    When the GPU lane of the WorkerQueue picks a batchable job, collect()
+    takes compatible jobs that are already queued behind it. If nothing
+    else is waiting, it first holds the job for a short window so that
+    compatible jobs arriving together still share a batch.
+
+    `batch_limit(payload, max_jobs)`, when given, caps the batch for a job,
+    eg. by the memory the cost model predicts it needs.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = 0.25,
+        max_jobs: int = 4,
+        batch_limit: Callable[[dict, int], int] = None,
+    ):
+        self.window_seconds = max(float(window_seconds), 0.0)
+        self.max_jobs = max(int(max_jobs), 1)
+        self.batch_limit = batch_limit
+        self.batches = 0
+        self.batched_jobs = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_jobs > 1
+
+    @staticmethod
+    def is_batchable(payload: dict) -> bool:
+        """Plain text2img jobs only: no reference images, upscaling or prompt flags."""
+        if payload.get("job_type") != "gpu":
+            return False
+        if (payload.get("module_name"), payload.get("module_command")) != (
+            "image_generation",
+            "generate_image",
+        ):
+            return False
+        if payload.get("image_data") or payload.get("upscaler"):
+            return False
+        # --parameters in a prompt override pipeline arguments for the whole call.
+        return "--" not in str(payload.get("image_prompt", ""))
+
+    @staticmethod
+    def batch_key(payload: dict) -> str:
+        user_config = payload.get("config", {})
+        fields = {
+            name: user_config.get(name)
+            for name in user_config
+            if name in BATCH_KEY_FIELDS or ADAPTER_FIELD.search(name)
+        }
+        fields["model_config"] = payload.get("model_config", {})
+        return json.dumps(fields, sort_keys=True, default=str)
+
+    async def collect(
+        self,
+        first,
+        take: Callable[[Callable[[dict], bool], int], List],
+        queued: Callable[[], int],
+    ) -> List:
+        """
+        Return `first` plus the queued jobs that can share its batch.
+
+        Jobs are objects with a `payload`. `take(match, limit)` removes up to
+        `limit` queued jobs whose payload satisfies `match`, and `queued()`
+        is the number of jobs still waiting in the lane.
+        """
+        if not self.enabled or not self.is_batchable(first.payload):
+            return [first]
+        key = self.batch_key(first.payload)
+        max_jobs = self.max_jobs
+        if self.batch_limit is not None:
+            max_jobs = max(min(self.batch_limit(first.payload, max_jobs), max_jobs), 1)
+
+        def compatible(payload: dict) -> bool:
+            return self.is_batchable(payload) and self.batch_key(payload) == key
+
+        jobs = [first] + take(compatible, max_jobs - 1)
+        if len(jobs) < max_jobs and self.window_seconds > 0 and queued() == 0:
+            # The GPU would otherwise sit idle anyway; give peers a moment.
+            await asyncio.sleep(self.window_seconds)
+            jobs += take(compatible, max_jobs - len(jobs))
+        if len(jobs) > 1:
+            self.batches += 1
+            self.batched_jobs += len(jobs)
+            logger.info(
+                f"Batching {len(jobs)} jobs, average batch size {self.batched_jobs / self.batches:.2f}."
+            )
+        return jobs
+
+
+def memory_batch_limit(payload: dict, max_jobs: int) -> int:
+    """The most jobs like `payload` whose batched call is predicted to fit the GPU."""
+    budget = gpu_memory_bytes()
+    user_config = payload.get("config", {})
+    model = user_config.get("model")
+    cost_model = get_cost_model()
+    if budget is None or "resolution" not in user_config:
+        return max_jobs
+    resolution = user_config["resolution"]
+    images_per_job = config.get_snapshot().maximum_batch_size
+    if not cost_model.predict(model, resolution).measured:
+        # Guessing would only ever shrink batches; just avoid sizes that ran out of memory.
+        jobs = max_jobs
+        while jobs > 1 and cost_model.oom_rung(model, resolution, jobs * images_per_job):
+            jobs -= 1
+        return jobs
+    return cost_model.max_batch(
+        model,
+        resolution,
+        budget,
+        max_jobs,
+        images_per_job=images_per_job,
+        tiling=bool(user_config.get("enable_tiling", False)),
+    )
+
+
+def build_batch_scheduler() -> BatchScheduler:
+    return BatchScheduler(
+        window_seconds=float(config.get_config_value("batch_window_ms", 250)) / 1000,
+        max_jobs=int(config.get_config_value("batch_max_jobs", 4)),
+        batch_limit=memory_batch_limit,
+    )
@@ -0,0 +1,418 @@
+import atexit, json, logging, os, threading, time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from discord_tron_client.classes.app_config import AppConfig
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+# Before anything is measured: an 8GB GPU handles about 1280x720, ie. roughly
+# 9000 bytes of peak memory per generated pixel.
+DEFAULT_BYTES_PER_PIXEL = 9000
+MAX_SAMPLES_PER_MODEL = 200
+# A recorded OOM ladder rung is trusted for this long before the job shape
+# is tried at full settings again, since running out of memory can be a
+# one-off (eg. another process briefly holding VRAM).
+OOM_RUNG_TTL_SECONDS = 6 * 3600
+# Profile writes are coalesced over this many seconds, so that recording a
+# sample never waits on the disk.
+SAVE_DELAY_SECONDS = 5.0
+
+
+class CostSample:
+    """One measured pipeline call."""
+
+    FIELDS = (
+        "model",
+        "pipe_type",
+        "width",
+        "height",
+        "batch",
+        "steps",
+        "tiling",
+        "peak_bytes",
+        "seconds",
+    )
+
+    def __init__(
+        self,
+        model: str,
+        pipe_type: str,
+        width: int,
+        height: int,
+        batch: int,
+        steps: int,
+        tiling: bool,
+        peak_bytes: Optional[int],
+        seconds: float,
+    ):
+        self.model = model
+        self.pipe_type = pipe_type
+        self.width = int(width)
+        self.height = int(height)
+        self.batch = max(int(batch), 1)
+        self.steps = max(int(steps), 1)
+        self.tiling = bool(tiling)
+        self.peak_bytes = None if peak_bytes is None else int(peak_bytes)
+        self.seconds = float(seconds)
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height * self.batch
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CostSample":
+        return cls(**{name: data.get(name) for name in cls.FIELDS})
+
+
+class LinearFit:
+    """y = intercept + slope * x, by least squares."""
+
+    def __init__(self, intercept: float, slope: float, samples: int):
+        self.intercept = intercept
+        self.slope = slope
+        self.samples = samples
+
+    def __call__(self, x: float) -> float:
+        return self.intercept + self.slope * x
+
+    @classmethod
+    def fit(cls, points: List[tuple], default_slope: float = None) -> Optional["LinearFit"]:
+        """
+        Fit `points` of (x, y). With a single distinct x the slope falls back
+        to `default_slope`, anchored at the mean of the measurements.
+        """
+        if not points:
+            return None
+        n = len(points)
+        mean_x = sum(x for x, _ in points) / n
+        mean_y = sum(y for _, y in points) / n
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+        if var_x > 0:
+            slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+        elif default_slope is not None:
+            slope = default_slope
+        else:
+            slope = mean_y / mean_x if mean_x else 0.0
+        # Memory and time never shrink as the work grows.
+        slope = max(slope, 0.0)
+        return cls(mean_y - slope * mean_x, slope, n)
+
+
+class CostPrediction:
+    def __init__(self, peak_bytes: float, seconds: Optional[float], samples: int):
+        self.peak_bytes = peak_bytes
+        self.seconds = seconds
+        # Zero means the prediction is the built-in heuristic, not a measurement.
+        self.samples = samples
+
+    @property
+    def measured(self) -> bool:
+        return self.samples > 0
+
+
+class CostModel:
+    """
+    Measured GPU memory and run time per pipeline call, and a per-model
+    linear regression over them.
+
+    Samples are recorded for each (model, pipe type, width x height, batch,
+    steps, VAE tiling) and persisted as JSON. Peak memory is fitted against
+    the number of generated pixels (width x height x batch) and wall time
+    against pixels x steps, separately per model and tiling mode. Models
+    without measurements fall back to the fit over every model, and then to
+    DEFAULT_BYTES_PER_PIXEL.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        max_samples: int = MAX_SAMPLES_PER_MODEL,
+        oom_rung_ttl: float = OOM_RUNG_TTL_SECONDS,
+        save_delay: float = SAVE_DELAY_SECONDS,
+    ):
+        self.path = path
+        self.max_samples = max(int(max_samples), 1)
+        self.samples: Dict[str, List[CostSample]] = {}
+        self.lock = threading.RLock()
+        self._fits: Dict[tuple, tuple] = {}
+        # The OOM ladder rung that last worked, and when, per job shape.
+        self.oom_rungs: Dict[str, dict] = {}
+        # Seconds a recorded rung is used for; 0 keeps it forever.
+        self.oom_rung_ttl = float(oom_rung_ttl or 0)
+        # Seconds to wait before writing a change; 0 writes straight away.
+        self.save_delay = max(float(save_delay or 0), 0.0)
+        self._save_timer = None
+        if path:
+            self.load()
+
+    # Persistence
+
+    def load(self):
+        if not self.path or not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            with self.lock:
+                for sample in data.get("samples", []):
+                    self._add(CostSample.from_dict(sample))
+                for key, rung in data.get("oom_rungs", {}).items():
+                    if isinstance(rung, str):
+                        # Profiles from before rungs expired.
+                        rung = {"rung": rung, "recorded_at": time.time()}
+                    self.oom_rungs[key] = rung
+        except Exception as e:
+            logger.error(f"Error loading cost profile {self.path}: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = {
+                "samples": [
+                    sample.to_dict()
+                    for samples in self.samples.values()
+                    for sample in samples
+                ],
+                "oom_rungs": dict(self.oom_rungs),
+            }
+        try:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving cost profile {self.path}: {e}")
+
+    def schedule_save(self):
+        """Save after `save_delay`, folding in any other changes made meanwhile."""
+        if not self.path:
+            return
+        if not self.save_delay:
+            self.save()
+            return
+        with self.lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Write any scheduled save now."""
+        with self.lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is None:
+            return
+        timer.cancel()
+        self.save()
+
+    # Samples
+
+    def _add(self, sample: CostSample):
+        samples = self.samples.setdefault(sample.model, [])
+        samples.append(sample)
+        del samples[: -self.max_samples]
+        self._fits.clear()
+
+    def record(self, sample: CostSample, save: bool = True):
+        with self.lock:
+            self._add(sample)
+        if save:
+            self.schedule_save()
+
+    @contextmanager
+    def profile(
+        self,
+        model: str,
+        pipe_type: str,
+        width: int,
+        height: int,
+        batch: int = 1,
+        steps: int = 1,
+        tiling: bool = False,
+    ):
+        """Measure the peak CUDA memory and wall time of the enclosed call."""
+        cuda = _cuda()
+        if cuda is not None:
+            cuda.synchronize()
+            cuda.reset_peak_memory_stats()
+        started_at = time.monotonic()
+        yield
+        if cuda is not None:
+            cuda.synchronize()
+        self.record(
+            CostSample(
+                model,
+                pipe_type,
+                width,
+                height,
+                batch,
+                steps,
+                tiling,
+                cuda.max_memory_allocated() if cuda is not None else None,
+                time.monotonic() - started_at,
+            )
+        )
+
+    @staticmethod
+    def _shape_key(model: Optional[str], resolution: dict, batch: int) -> str:
+        return f"{model}|{int(resolution['width'])}x{int(resolution['height'])}|{max(int(batch), 1)}"
+
+    def oom_rung(self, model: Optional[str], resolution: dict, batch: int = 1) -> Optional[str]:
+        """The rung to start this job shape on, or None once the recorded one has expired."""
+        with self.lock:
+            recorded = self.oom_rungs.get(self._shape_key(model, resolution, batch))
+        if recorded is None:
+            return None
+        if self.oom_rung_ttl and time.time() - recorded["recorded_at"] > self.oom_rung_ttl:
+            # Probe the full settings again; running out of memory re-records it.
+            return None
+        return recorded["rung"]
+
+    def record_oom_rung(
+        self, model: Optional[str], resolution: dict, batch: int, rung: str, save: bool = True
+    ):
+        with self.lock:
+            self.oom_rungs[self._shape_key(model, resolution, batch)] = {
+                "rung": rung,
+                "recorded_at": time.time(),
+            }
+        if save:
+            self.schedule_save()
+
+    # Prediction
+
+    def _fit(self, model: Optional[str], tiling: bool) -> tuple:
+        key = (model, tiling)
+        with self.lock:
+            if key in self._fits:
+                return self._fits[key]
+            if model is None:
+                samples = [s for group in self.samples.values() for s in group]
+            else:
+                samples = self.samples.get(model, [])
+            samples = [s for s in samples if s.tiling == tiling] or samples
+            default_slope = DEFAULT_BYTES_PER_PIXEL
+            if model is not None:
+                # A single resolution says nothing about scaling; borrow the pooled slope.
+                pooled = self._fit(None, tiling)[0]
+                if pooled is not None and pooled.slope > 0:
+                    default_slope = pooled.slope
+            memory = LinearFit.fit(
+                [(s.pixels, s.peak_bytes) for s in samples if s.peak_bytes is not None],
+                default_slope=default_slope,
+            )
+            duration = LinearFit.fit([(s.pixels * s.steps, s.seconds) for s in samples])
+            self._fits[key] = (memory, duration)
+            return self._fits[key]
+
+    def predict(
+        self,
+        model: Optional[str],
+        resolution: dict,
+        batch: int = 1,
+        steps: int = None,
+        tiling: bool = False,
+    ) -> CostPrediction:
+        """
+        Predict the peak memory in bytes and wall time in seconds of one
+        pipeline call. `seconds` is None until something has been timed.
+        """
+        pixels = int(resolution["width"]) * int(resolution["height"]) * max(batch, 1)
+        memory, duration = self._fit(model, tiling)
+        if memory is None and model is not None:
+            memory = self._fit(None, tiling)[0]
+        if duration is None and model is not None:
+            duration = self._fit(None, tiling)[1]
+        peak_bytes = memory(pixels) if memory else pixels * DEFAULT_BYTES_PER_PIXEL
+        seconds = None
+        if duration is not None and steps:
+            seconds = max(duration(pixels * int(steps)), 0.0)
+        samples = len(self.samples.get(model, [])) if model is not None else (
+            sum(len(group) for group in self.samples.values())
+        )
+        return CostPrediction(peak_bytes, seconds, samples)
+
+    def fits(
+        self,
+        model: Optional[str],
+        resolution: dict,
+        budget_bytes: float,
+        batch: int = 1,
+        tiling: bool = False,
+    ) -> bool:
+        return self.predict(model, resolution, batch, tiling=tiling).peak_bytes <= budget_bytes
+
+    def max_batch(
+        self,
+        model: Optional[str],
+        resolution: dict,
+        budget_bytes: float,
+        limit: int,
+        images_per_job: int = 1,
+        tiling: bool = False,
+    ) -> int:
+        """The most jobs, up to `limit`, whose batched call fits in `budget_bytes`."""
+        for jobs in range(max(int(limit), 1), 1, -1):
+            if self.oom_rung(model, resolution, jobs * images_per_job) is not None:
+                # This batch has run out of memory before.
+                continue
+            if self.fits(model, resolution, budget_bytes, jobs * images_per_job, tiling):
+                return jobs
+        return 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                model: {"samples": len(samples), "last_seconds": samples[-1].seconds}
+                for model, samples in self.samples.items()
+            }
+
+
+def _cuda():
+    try:
+        import torch
+    except ImportError:
+        return None
+    return torch.cuda if torch.cuda.is_available() else None
+
+
+def gpu_memory_bytes() -> Optional[int]:
+    cuda = _cuda()
+    if cuda is None:
+        return None
+    return cuda.get_device_properties(0).total_memory
+
+
+_cost_model: Optional[CostModel] = None
+_cost_model_lock = threading.Lock()
+
+
+def get_cost_model() -> CostModel:
+    global _cost_model
+    with _cost_model_lock:
+        if _cost_model is None:
+            _cost_model = CostModel(
+                path=config.get_config_value(
+                    "cost_profile_path",
+                    os.path.join(os.path.dirname(config.config_path), "cost_profile.json"),
+                ),
+                max_samples=int(
+                    config.get_config_value("cost_profile_max_samples", MAX_SAMPLES_PER_MODEL)
+                ),
+                oom_rung_ttl=float(
+                    config.get_config_value("oom_rung_ttl_seconds", OOM_RUNG_TTL_SECONDS)
+                ),
+                save_delay=float(
+                    config.get_config_value(
+                        "cost_profile_save_delay_seconds", SAVE_DELAY_SECONDS
+                    )
+                ),
+            )
+            atexit.register(_cost_model.flush)
+        return _cost_model
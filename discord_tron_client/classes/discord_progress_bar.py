@@ -24,6 +24,8 @@ class DiscordProgressBar:
         self.discord_first_message = discord_first_message
         # Last updated time.
         self.last_update = time.time()
+        # Progress arrives coalesced, so we send whenever a new 30% band is reached.
+        self.last_sent_band = -1
 
     async def update_progress_bar(self, step: int):
         if step < self.current_step:
@@ -41,8 +43,9 @@ class DiscordProgressBar:
         bar = "█" * filled_length + "-" * (self.progress_bar_length - filled_length)
         percent = round(progress * 100, 1)
         progress_text = "`" + f"[{bar}] {percent}% complete`"
-        we_have_another_fifth_of_progress = percent % 30
-        if we_have_another_fifth_of_progress == 0:
+        progress_band = int(percent // 30)
+        if progress_band != self.last_sent_band:
+            self.last_sent_band = progress_band
             try:
                 # Update the websocket message template
                 self.websocket_msg.update(
@@ -0,0 +1,206 @@
+import logging, multiprocessing, os, threading, time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict
+from discord_tron_client.classes.app_config import AppConfig
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+
+def _timed_call(fn, args, kwargs):
+    # Top-level so that it can be pickled into a process pool worker.
+    started_at = time.time()
+    return started_at, fn(*args, **kwargs)
+
+
+class LaneStats:
+    """Queue depth and wait/run times for one executor lane."""
+
+    def __init__(self, name: str, workers: int, tracks_running: bool = True):
+        self.name = name
+        self.workers = workers
+        # Process pools cannot report when work starts, only when it ends.
+        self.tracks_running = tracks_running
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+
+    def queue_depth(self) -> int:
+        """Work that has been submitted but has not started yet."""
+        in_flight = self.submitted - self.completed - self.failed
+        if not self.tracks_running:
+            return max(in_flight - self.workers, 0)
+        return in_flight - self.running
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            finished = self.completed + self.failed
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth(),
+                "running": self.running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "wait_seconds_avg": (
+                    self.wait_seconds_total / finished if finished else 0.0
+                ),
+                "wait_seconds_max": self.wait_seconds_max,
+                "run_seconds_avg": (
+                    self.run_seconds_total / finished if finished else 0.0
+                ),
+            }
+
+
+class InstrumentedExecutor(Executor):
+    """
+    Wraps a thread or process pool and records how long work waits in the
+    queue and how long it runs. Usable anywhere an Executor is expected,
+    including loop.run_in_executor().
+    """
+
+    def __init__(self, name: str, executor: Executor, workers: int):
+        self.name = name
+        self.executor = executor
+        self.is_process_pool = isinstance(executor, ProcessPoolExecutor)
+        self.stats = LaneStats(name, workers, tracks_running=not self.is_process_pool)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        stats = self.stats
+        submitted_at = time.time()
+        with stats.lock:
+            stats.submitted += 1
+        outer = Future()
+        if self.is_process_pool:
+            # We only learn the start time once the result comes back.
+            inner = self.executor.submit(_timed_call, fn, args, kwargs)
+        else:
+
+            def started(*args, **kwargs):
+                with stats.lock:
+                    stats.running += 1
+                return _timed_call(fn, args, kwargs)
+
+            inner = self.executor.submit(started, *args, **kwargs)
+
+        def done(inner: Future):
+            finished_at = time.time()
+            try:
+                started_at, result = inner.result()
+            except BaseException as e:
+                with stats.lock:
+                    stats.failed += 1
+                    if not self.is_process_pool:
+                        stats.running -= 1
+                outer.set_exception(e)
+                return
+            with stats.lock:
+                stats.completed += 1
+                if not self.is_process_pool:
+                    stats.running -= 1
+                wait = max(started_at - submitted_at, 0.0)
+                stats.wait_seconds_total += wait
+                stats.wait_seconds_max = max(stats.wait_seconds_max, wait)
+                stats.run_seconds_total += max(finished_at - started_at, 0.0)
+            outer.set_result(result)
+
+        outer.set_running_or_notify_cancel()
+        inner.add_done_callback(done)
+        return outer
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        self.executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+class ExecutorTopology:
+    """
+    The named executors that blocking work runs on:
+
+    - one single-thread lane per GPU, so work on a device is strictly serial;
+    - a process pool for CPU-heavy image encoding and metadata work;
+    - a thread pool for blocking network I/O.
+    """
+
+    def __init__(self, gpu_count: int = 1, encode_workers: int = 2, io_workers: int = 8):
+        self.gpu_lanes: Dict[int, InstrumentedExecutor] = {
+            device: InstrumentedExecutor(
+                f"gpu{device}",
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"gpu{device}"),
+                1,
+            )
+            for device in range(max(int(gpu_count), 1))
+        }
+        # Spawned, not forked: by now the parent holds a CUDA context and
+        # several threads, and a forked child can inherit their locks held.
+        self.encode = InstrumentedExecutor(
+            "encode",
+            ProcessPoolExecutor(
+                max_workers=encode_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            ),
+            encode_workers,
+        )
+        self.io = InstrumentedExecutor(
+            "io",
+            ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="io"),
+            io_workers,
+        )
+
+    def gpu(self, device: int = None) -> InstrumentedExecutor:
+        if device is None:
+            device = int(config.get_config_value("cuda_device", 0))
+        return self.gpu_lanes.get(device, self.gpu_lanes[0])
+
+    def lanes(self) -> Dict[str, InstrumentedExecutor]:
+        lanes = {lane.name: lane for lane in self.gpu_lanes.values()}
+        lanes["encode"] = self.encode
+        lanes["io"] = self.io
+        return lanes
+
+    def stats(self) -> dict:
+        return {name: lane.stats.as_dict() for name, lane in self.lanes().items()}
+
+    def shutdown(self, wait: bool = False):
+        for lane in self.lanes().values():
+            lane.shutdown(wait=wait)
+
+
+def _gpu_count() -> int:
+    try:
+        import torch
+
+        if torch.cuda.is_available():
+            return torch.cuda.device_count()
+    except Exception as e:
+        logger.debug(f"Could not count CUDA devices: {e}")
+    return 1
+
+
+def build_executor_topology() -> ExecutorTopology:
+    """Size the lanes from the HardwareInfo limits, unless overridden in config."""
+    from discord_tron_client.classes.hardware import HardwareInfo
+
+    cpu_count = HardwareInfo().get_hardware_limits().get("cpu") or 0
+    if cpu_count <= 0:
+        cpu_count = os.cpu_count() or 1
+    # Leave cores free for the denoising loop and the event loop itself.
+    encode_workers = config.get_config_value(
+        "image_encode_workers", max(min(cpu_count // 4, 8), 1)
+    )
+    io_workers = config.get_config_value(
+        "io_workers", max(config.get_max_concurrent_uploads() * 2, 4)
+    )
+    topology = ExecutorTopology(
+        gpu_count=_gpu_count(),
+        encode_workers=int(encode_workers),
+        io_workers=int(io_workers),
+    )
+    logger.info(
+        f"Executors: {len(topology.gpu_lanes)} GPU lane(s), {encode_workers} encode processes, {io_workers} I/O threads."
+    )
+    return topology
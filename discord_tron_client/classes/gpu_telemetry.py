@@ -0,0 +1,276 @@
+import logging, threading, time
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional
+from discord_tron_client.classes.app_config import AppConfig
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+
+class TelemetrySample(NamedTuple):
+    timestamp: float
+    power_watts: float
+    vram_used_mb: float
+    vram_total_mb: float
+    utilization: float
+    temperature: float
+
+
+class NvmlBackend:
+    """
+    Reads GPU telemetry in-process through pynvml (the nvidia-ml-py package),
+    instead of starting an nvidia-smi subprocess for every query.
+    """
+
+    def __init__(self):
+        import pynvml
+
+        self.nvml = pynvml
+        pynvml.nvmlInit()
+        self.handles = [
+            pynvml.nvmlDeviceGetHandleByIndex(idx)
+            for idx in range(pynvml.nvmlDeviceGetCount())
+        ]
+
+    def device_count(self) -> int:
+        return len(self.handles)
+
+    def device_name(self, index: int) -> str:
+        name = self.nvml.nvmlDeviceGetName(self.handles[index])
+        if isinstance(name, bytes):
+            name = name.decode()
+        return name
+
+    def read(self, index: int) -> TelemetrySample:
+        handle = self.handles[index]
+        memory = self.nvml.nvmlDeviceGetMemoryInfo(handle)
+        return TelemetrySample(
+            timestamp=time.monotonic(),
+            power_watts=self.nvml.nvmlDeviceGetPowerUsage(handle) / 1000.0,
+            vram_used_mb=memory.used / 1024**2,
+            vram_total_mb=memory.total / 1024**2,
+            utilization=float(self.nvml.nvmlDeviceGetUtilizationRates(handle).gpu),
+            temperature=float(
+                self.nvml.nvmlDeviceGetTemperature(
+                    handle, self.nvml.NVML_TEMPERATURE_GPU
+                )
+            ),
+        )
+
+    def shutdown(self):
+        try:
+            self.nvml.nvmlShutdown()
+        except Exception as e:
+            logger.debug(f"NVML shutdown failed: {e}")
+
+
+class FakeNvmlBackend:
+    """
+    A stand-in for NvmlBackend on machines without an NVIDIA GPU.
+
+    Each device is a dict of the TelemetrySample fields (minus timestamp) plus
+    an optional "name". Values can be changed at any time through set().
+    """
+
+    def __init__(self, devices: List[Dict] = None):
+        if devices is None:
+            devices = [
+                {
+                    "name": "Fake GPU",
+                    "power_watts": 100.0,
+                    "vram_used_mb": 0.0,
+                    "vram_total_mb": 24576.0,
+                    "utilization": 0.0,
+                    "temperature": 40.0,
+                }
+            ]
+        self.devices = devices
+
+    def device_count(self) -> int:
+        return len(self.devices)
+
+    def device_name(self, index: int) -> str:
+        return self.devices[index].get("name", f"Fake GPU {index}")
+
+    def set(self, index: int = 0, **values):
+        self.devices[index].update(values)
+
+    def read(self, index: int) -> TelemetrySample:
+        device = self.devices[index]
+        return TelemetrySample(
+            timestamp=time.monotonic(),
+            power_watts=float(device.get("power_watts", 0.0)),
+            vram_used_mb=float(device.get("vram_used_mb", 0.0)),
+            vram_total_mb=float(device.get("vram_total_mb", 0.0)),
+            utilization=float(device.get("utilization", 0.0)),
+            temperature=float(device.get("temperature", 0.0)),
+        )
+
+    def shutdown(self):
+        pass
+
+
+class GpuTelemetrySampler:
+    """
+    Polls a telemetry backend on a background thread and keeps a ring buffer
+    of samples per device.
+
+    Readers never take a lock: the sampler only appends to bounded deques and
+    swaps in a new tuple for the latest sample, both of which are atomic
+    under the GIL. Timestamps are time.monotonic() values.
+    """
+
+    def __init__(self, backend, interval_ms: float = 200, history_seconds: float = 900):
+        self.backend = backend
+        self.interval = max(float(interval_ms), 10.0) / 1000.0
+        maxlen = max(int(history_seconds / self.interval), 2)
+        self.device_count = backend.device_count()
+        self.device_names = [
+            backend.device_name(idx) for idx in range(self.device_count)
+        ]
+        self.samples = [deque(maxlen=maxlen) for _ in range(self.device_count)]
+        self._latest = tuple(None for _ in range(self.device_count))
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self.sample_once()
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="gpu-telemetry", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 5)
+            self._thread = None
+        self.backend.shutdown()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample_once()
+            except Exception as e:
+                logger.error(f"GPU telemetry sample failed: {e}")
+
+    def sample_once(self):
+        latest = []
+        for idx in range(self.device_count):
+            sample = self.backend.read(idx)
+            self.samples[idx].append(sample)
+            latest.append(sample)
+        self._latest = tuple(latest)
+
+    def _history(self, device: int) -> tuple:
+        # Copying a deque while the sampler appends can raise; just try again.
+        for _ in range(3):
+            try:
+                return tuple(self.samples[device])
+            except RuntimeError:
+                continue
+        return ()
+
+    def _devices(self, device: Optional[int]):
+        if device is None:
+            return range(self.device_count)
+        return (device,)
+
+    def latest(self, device: int = None):
+        """
+        The newest sample for one device, or a tuple of the newest sample for
+        every device when device is None.
+        """
+        if device is None:
+            return self._latest
+        return self._latest[device]
+
+    def total_power_watts(self) -> float:
+        return sum(s.power_watts for s in self._latest if s is not None)
+
+    def max_since(
+        self, t0: float, field: str = "power_watts", device: int = None
+    ) -> float:
+        """The highest value of a TelemetrySample field seen since t0."""
+        result = 0.0
+        for idx in self._devices(device):
+            for sample in self._history(idx):
+                if sample.timestamp >= t0:
+                    result = max(result, getattr(sample, field))
+        return result
+
+    def energy_joules(self, t0: float, t1: float = None, device: int = None) -> float:
+        """
+        Integrate power draw over [t0, t1] with the trapezoid rule, summed
+        across devices unless a single device is requested.
+        """
+        if t1 is None:
+            t1 = time.monotonic()
+        if t1 <= t0:
+            return 0.0
+        energy = 0.0
+        for idx in self._devices(device):
+            history = self._history(idx)
+            if not history:
+                continue
+            for previous, current in zip(history, history[1:]):
+                start = max(previous.timestamp, t0)
+                end = min(current.timestamp, t1)
+                if end <= start:
+                    continue
+                energy += (
+                    (previous.power_watts + current.power_watts) / 2.0 * (end - start)
+                )
+            # Hold the edge readings across any part of the window without samples.
+            first, last = history[0], history[-1]
+            if first.timestamp > t0:
+                energy += first.power_watts * (min(first.timestamp, t1) - t0)
+            if last.timestamp < t1:
+                energy += last.power_watts * (t1 - max(last.timestamp, t0))
+        return energy
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_telemetry_sampler(backend=None) -> Optional[GpuTelemetrySampler]:
+    """
+    Return the process-wide sampler, starting it on first use.
+
+    Returns None when no telemetry backend is available (no pynvml, or no
+    NVIDIA devices), in which case callers fall back to their old behaviour.
+    Passing a backend (e.g. FakeNvmlBackend) replaces the running sampler.
+    """
+    global _sampler
+    with _sampler_lock:
+        if _sampler is not None and backend is None:
+            return _sampler or None
+        if backend is None:
+            if not config.get_config_value("enable_gpu_telemetry", True):
+                _sampler = False
+                return None
+            try:
+                backend = NvmlBackend()
+            except Exception as e:
+                logger.info(f"NVML telemetry unavailable, using nvidia-smi: {e}")
+                _sampler = False
+                return None
+            if backend.device_count() == 0:
+                backend.shutdown()
+                _sampler = False
+                return None
+        if _sampler:
+            _sampler.stop()
+        _sampler = GpuTelemetrySampler(
+            backend,
+            interval_ms=config.get_config_value("gpu_telemetry_interval_ms", 200),
+            history_seconds=config.get_config_value(
+                "gpu_telemetry_history_seconds", 900
+            ),
+        ).start()
+        return _sampler
@@ -1,6 +1,8 @@
 import subprocess, torch, sys
 import logging, socket
 from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.gpu_telemetry import get_telemetry_sampler
+from discord_tron_client.classes.cost_model import get_cost_model
 from diffusers.utils.logging import set_verbosity_warning
 
 set_verbosity_warning()
@@ -113,6 +115,10 @@ class HardwareInfo:
                 self.gpu_type = output.decode().strip().split("Chip: ")[1]
             except Exception as e:
                 raise ValueError("Failed to get GPU type: " + str(e))
+        sampler = get_telemetry_sampler()
+        if sampler is not None:
+            self.gpu_type = "\n".join(sampler.device_names)
+            return
         try:
             output = subprocess.check_output(
                 ["nvidia-smi", "--query-gpu=name", "--format=csv,noheader"]
@@ -232,6 +238,19 @@ class HardwareInfo:
                 self.video_memory_amount = total_mem
                 return int(self.video_memory_amount)
 
+            sampler = get_telemetry_sampler()
+            if sampler is not None:
+                # GPU lanes can run on any device, so size for the smallest one.
+                self.video_memory_amount = (
+                    min(
+                        sample.vram_total_mb
+                        for sample in sampler.latest()
+                        if sample is not None
+                    )
+                    / 1024
+                )
+                return self.video_memory_amount
+
             output = subprocess.check_output(
                 [
                     "nvidia-smi",
@@ -272,6 +291,9 @@ class HardwareInfo:
         try:
             if self.is_mps:
                 return 0
+            sampler = get_telemetry_sampler()
+            if sampler is not None:
+                return sampler.total_power_watts()
 
             output = subprocess.check_output(
                 [
@@ -323,16 +345,14 @@ class HardwareInfo:
             "hostname": identifier,
         }
 
-    def should_disable_resolution(self, resolution: dict):
+    def should_disable_resolution(self, resolution: dict, model: str = None):
         gpu_memory = self.video_memory_amount
         if gpu_memory == "Unknown":
             gpu_memory = 8
-        pixel_count = resolution["width"] * resolution["height"]
-        memory_to_pixel_ratio = gpu_memory * (1024**3) / pixel_count
-        # In practice, an 8GB GPU can handle about 1280x720 which is a ratio of 9320 pixels per GiB.
-        resolution_performance_threshold = 9000
-        result = memory_to_pixel_ratio < resolution_performance_threshold
-        # logging.debug(f"Resolution {resolution} requires {memory_to_pixel_ratio} pixels per GiB of video memory. This resolution is is {'disabled' if result else 'enabled'}.")
+        # Measured peaks when we have them, otherwise about 9000 bytes per pixel.
+        prediction = get_cost_model().predict(model, resolution)
+        result = prediction.peak_bytes > gpu_memory * (1024**3)
+        # logging.debug(f"Resolution {resolution} is predicted to need {prediction.peak_bytes / 1024**3:.2f} GiB of video memory. This resolution is is {'disabled' if result else 'enabled'}.")
         return result
 
     def get_compute_capability():
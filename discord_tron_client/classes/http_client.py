@@ -0,0 +1,254 @@
+import asyncio, logging, random, threading
+from typing import Callable
+from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.metrics import HTTP_RETRIES
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+# Status codes that are worth another attempt rather than an immediate failure.
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, text: str):
+        super().__init__(f"Error: {text}")
+        self.status = status
+        self.text = text
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def get_http_session():
+    """
+    A process-wide requests.Session for the synchronous callers (auth, Ollama
+    and the small JSON calls in ApiClient), so they reuse pooled keep-alive
+    connections instead of handshaking on every request.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            pool_size = max(int(config.get_max_concurrent_uploads()), 4)
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+class HttpClient:
+    """
+    The long-lived async HTTP client used for uploads to the master.
+
+    One aiohttp session (and connection pool) is kept per event loop, so
+    uploads reuse keep-alive connections. At most `max_concurrency` requests
+    are in flight at once. Failed attempts are retried with jittered backoff
+    that awaits instead of blocking the loop. A 401 is retried only after
+    the caller's `on_unauthorized` hook has refreshed the credentials.
+
+    Request bodies come from a factory called once per attempt, because a
+    streamed multipart body cannot be replayed after it has been sent.
+    """
+
+    def __init__(
+        self,
+        verify_ssl: bool = True,
+        max_concurrency: int = 4,
+        timeout: float = 60,
+        max_attempts: int = 8,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 30.0,
+    ):
+        self.verify_ssl = verify_ssl
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.timeout = timeout
+        self.max_attempts = max(int(max_attempts), 1)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Sessions and semaphores belong to the loop that created them.
+            self._discard_session()
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if aiohttp is not None and (self._session is None or self._session.closed):
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                ssl=bool(self.verify_ssl),
+                keepalive_timeout=60,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    def _discard_session(self):
+        """Close the session of a previous event loop, releasing its sockets."""
+        session, loop = self._session, self._loop
+        self._session = None
+        if session is None or session.closed:
+            return
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        # The old loop has stopped, so nothing can await the close.
+        connector = session.connector
+        session.detach()
+        if connector is not None:
+            connector.close()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: dict = None,
+        headers: Callable[[], dict] = None,
+        body: Callable[[], dict] = None,
+        on_unauthorized: Callable[[], object] = None,
+    ):
+        """
+        Send a request and return the decoded JSON response.
+
+        `headers` and `body` are callables evaluated for each attempt. `body`
+        returns the keyword arguments for the request, eg. {"data": FormData}
+        or {"json": {...}}.
+
+        `on_unauthorized` is a blocking callable that renews the credentials
+        `headers` reads. It runs once, off the loop, after the first 401;
+        without it a 401 is raised straight away.
+        """
+        session = self._bind()
+        if params:
+            # aiohttp only accepts str, int and float query values.
+            params = {key: str(value) for key, value in params.items()}
+        last_error = None
+        refreshed = False
+        for attempt in range(self.max_attempts):
+            if attempt > 0:
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                logger.warning(
+                    f"{method} {url} failed ({last_error}), retrying in {delay:.2f}s."
+                )
+                HTTP_RETRIES.inc(
+                    method=method,
+                    reason=str(getattr(last_error, "status", type(last_error).__name__)),
+                )
+                await asyncio.sleep(delay)
+            try:
+                async with self._semaphore:
+                    kwargs = body() if body is not None else {}
+                    request_headers = headers() if headers is not None else None
+                    if session is None:
+                        return await self._request_blocking(
+                            method, url, params, request_headers, kwargs
+                        )
+                    async with session.request(
+                        method, url, params=params, headers=request_headers, **kwargs
+                    ) as response:
+                        text = await response.text()
+                        if response.status == 200:
+                            return await response.json(content_type=None)
+                        raise HttpError(response.status, text)
+            except HttpError as e:
+                last_error = e
+                if e.status == 401:
+                    if on_unauthorized is None or refreshed:
+                        raise
+                    refreshed = True
+                    await asyncio.get_running_loop().run_in_executor(
+                        AppConfig.get_io_executor(), on_unauthorized
+                    )
+                elif e.status not in RETRYABLE_STATUS:
+                    raise
+            except (asyncio.TimeoutError, OSError) as e:
+                last_error = e
+            except Exception as e:
+                if aiohttp is None or not isinstance(e, aiohttp.ClientError):
+                    raise
+                last_error = e
+        raise Exception(
+            f"{method} {url} failed after {self.max_attempts} attempts: {last_error}"
+        )
+
+    async def _request_blocking(self, method, url, params, headers, kwargs):
+        # Without aiohttp, fall back to the pooled requests session in a thread.
+        if "data" in kwargs and isinstance(kwargs["data"], dict):
+            kwargs = {"files": kwargs["data"]}
+        session = get_http_session()
+        response = await asyncio.get_running_loop().run_in_executor(
+            AppConfig.get_io_executor(),
+            lambda: session.request(
+                method,
+                url,
+                params=params,
+                headers=headers,
+                verify=self.verify_ssl,
+                timeout=self.timeout,
+                **kwargs,
+            ),
+        )
+        if response.status_code == 200:
+            return response.json()
+        raise HttpError(response.status_code, response.text)
+
+    @staticmethod
+    def multipart(fields: dict):
+        """
+        Build a streaming multipart body. Values are file objects, or
+        (filename, file object, content type) tuples.
+        """
+        if aiohttp is None:
+            return {"data": fields}
+        form = aiohttp.FormData()
+        for name, value in fields.items():
+            if isinstance(value, tuple):
+                filename, fileobj, content_type = value
+                form.add_field(
+                    name, fileobj, filename=filename, content_type=content_type
+                )
+            else:
+                form.add_field(
+                    name, value, filename=getattr(value, "name", name) or name
+                )
+        return {"data": form}
+
+
+_session = None
+_session_lock = threading.Lock()
+_client = None
+
+
+def get_http_client() -> HttpClient:
+    global _client
+    if _client is None:
+        _client = HttpClient(
+            verify_ssl=config.verify_master_ssl(),
+            max_concurrency=config.get_max_concurrent_uploads(),
+            timeout=float(config.get_config_value("http_timeout_seconds", 60)),
+            max_attempts=int(config.get_config_value("upload_max_attempts", 8)),
+            backoff_cap=float(config.get_config_value("upload_backoff_cap_seconds", 30)),
+        )
+    return _client
+
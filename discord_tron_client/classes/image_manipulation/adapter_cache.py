@@ -0,0 +1,218 @@
+import logging, threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.image_manipulation.embedding_cache import (
+    TEXT_ENCODER_COMPONENTS,
+    embedding_nbytes,
+)
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+# Pipeline components that LoRAs patch, and so may carry a fused delta.
+ADAPTER_COMPONENTS = ("unet", "transformer") + TEXT_ENCODER_COMPONENTS
+
+
+def _pin(tensor):
+    try:
+        if tensor.device.type == "cpu" and not tensor.is_pinned():
+            return tensor.pin_memory()
+    except RuntimeError:
+        # No CUDA, or page-locked memory is exhausted; plain memory still works.
+        pass
+    return tensor
+
+
+def combination_key(adapters: Dict[str, dict]) -> tuple:
+    return tuple(
+        sorted(
+            (spec["adapter_type"], spec["adapter_path"], float(spec["adapter_strength"]))
+            for spec in adapters.values()
+        )
+    )
+
+
+class AdapterCache:
+    """
+    A host memory LRU of adapter weights, so switching between LoRA and
+    LyCORIS adapters does not go back to the Hub or the disk.
+
+    Two kinds of entries share one byte budget: the parsed state dict of
+    each adapter file, keyed by (adapter type, path), and the pre-fused
+    weight delta of an adapter combination that has been fused at least
+    `delta_min_uses` times, keyed by the combination. Applying a delta is
+    one in-place add per patched weight, instead of loading and fusing
+    every adapter again. Tensors are pinned when `pin` is set, to speed up
+    the copy to the GPU.
+    """
+
+    def __init__(self, budget_bytes: int, pin: bool = True, delta_min_uses: int = 3):
+        self.budget_bytes = max(int(budget_bytes), 0)
+        self.pin = pin
+        self.delta_min_uses = max(int(delta_min_uses), 1)
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.RLock()
+        self.combination_uses: Dict[tuple, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.delta_hits = 0
+        self.evictions = 0
+        self.swaps = 0
+        self.swap_seconds = 0.0
+        self.last_swap_seconds = 0.0
+
+    # Entries
+
+    def _get(self, key: tuple):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def _put(self, key: tuple, value):
+        nbytes = embedding_nbytes(list(value.values()))
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if nbytes > self.budget_bytes:
+                return
+            self.entries[key] = (value, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.budget_bytes:
+                _, (_, old_bytes) = self.entries.popitem(last=False)
+                self.bytes -= old_bytes
+                self.evictions += 1
+
+    def _host_copy(self, state_dict: dict) -> dict:
+        copied = {}
+        for name, tensor in state_dict.items():
+            if hasattr(tensor, "detach"):
+                tensor = tensor.detach().to("cpu")
+                if self.pin:
+                    tensor = _pin(tensor)
+            copied[name] = tensor
+        return copied
+
+    def state_dict(
+        self, adapter_type: str, adapter_path: str, loader: Callable[[], dict]
+    ) -> dict:
+        """The adapter's weights, calling `loader()` only when they are not cached."""
+        key = ("state_dict", adapter_type, adapter_path)
+        state_dict = self._get(key)
+        if state_dict is not None:
+            self.hits += 1
+            return state_dict
+        self.misses += 1
+        state_dict = self._host_copy(loader())
+        self._put(key, state_dict)
+        return state_dict
+
+    # Fused deltas
+
+    def note_fused(self, key: tuple) -> bool:
+        """Count a fused use of a combination; True once it deserves a cached delta."""
+        with self.lock:
+            uses = self.combination_uses.get(key, 0) + 1
+            self.combination_uses[key] = uses
+            return uses >= self.delta_min_uses and self._get(("delta", key)) is None
+
+    def fused_delta(self, key: tuple) -> Optional[dict]:
+        delta = self._get(("delta", key))
+        if delta is not None:
+            self.delta_hits += 1
+        return delta
+
+    def store_fused_delta(self, key: tuple, delta: dict):
+        self._put(("delta", key), self._host_copy(delta))
+
+    # Metrics
+
+    def record_swap(self, seconds: float):
+        with self.lock:
+            self.swaps += 1
+            self.swap_seconds += seconds
+            self.last_swap_seconds = seconds
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "delta_hits": self.delta_hits,
+                "evictions": self.evictions,
+                "swaps": self.swaps,
+                "average_swap_seconds": self.swap_seconds / self.swaps if self.swaps else 0.0,
+                "last_swap_seconds": self.last_swap_seconds,
+            }
+
+
+def lora_deltas(pipeline, adapter_names) -> dict:
+    """
+    The weight delta that fusing `adapter_names` applies, per (component,
+    parameter name), from the PEFT LoRA layers currently loaded.
+    """
+    deltas = {}
+    for component_name in ADAPTER_COMPONENTS:
+        component = getattr(pipeline, component_name, None)
+        if component is None or not hasattr(component, "named_modules"):
+            continue
+        for module_name, module in component.named_modules():
+            lora_a = getattr(module, "lora_A", None)
+            if lora_a is None or not hasattr(module, "get_delta_weight"):
+                continue
+            delta = None
+            for adapter_name in adapter_names:
+                if adapter_name not in lora_a:
+                    continue
+                part = module.get_delta_weight(adapter_name)
+                delta = part if delta is None else delta + part
+            if delta is not None:
+                deltas[(component_name, f"{module_name}.weight")] = delta
+    return deltas
+
+
+def apply_deltas(pipeline, deltas: dict, sign: float = 1.0) -> set:
+    """Add (or with sign=-1, remove) cached deltas. Returns the components touched."""
+    touched = set()
+    parameters = {}
+    for (component_name, name), delta in deltas.items():
+        if component_name not in parameters:
+            component = getattr(pipeline, component_name, None)
+            parameters[component_name] = (
+                dict(component.named_parameters()) if component is not None else {}
+            )
+        parameter = parameters[component_name].get(name)
+        if parameter is None:
+            logger.warning(f"Fused delta for missing weight {component_name}.{name}")
+            continue
+        parameter.data.add_(
+            delta.to(parameter.device, parameter.dtype, non_blocking=True), alpha=sign
+        )
+        touched.add(component_name)
+    return touched
+
+
+_cache: Optional[AdapterCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_adapter_cache() -> AdapterCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AdapterCache(
+                budget_bytes=float(config.get_config_value("adapter_cache_mb", 2048))
+                * 2**20,
+                pin=bool(config.get_config_value("pin_adapter_cache", True)),
+                delta_min_uses=int(config.get_config_value("adapter_delta_min_uses", 3)),
+            )
+        return _cache
@@ -0,0 +1,285 @@
+import copy, hashlib, json, logging, os, threading
+from typing import Any, Callable, Dict, Optional
+from discord_tron_client.classes.app_config import AppConfig
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+# Pipeline components that are commonly identical across model repos.
+DEFAULT_SHARED_COMPONENTS = ("text_encoder", "text_encoder_2", "text_encoder_3", "vae")
+WEIGHT_SUFFIXES = (".safetensors", ".bin")
+
+
+class SharedComponent:
+    def __init__(self, key: str, module, source: str):
+        self.key = key
+        self.module = module
+        self.source = source
+        self.owners = set()
+
+
+class ComponentStore:
+    """
+    A content-addressed cache of pipeline sub-models (text encoders, VAEs,
+    ControlNets), so identical weights are loaded once and handed to every
+    pipeline that needs them.
+
+    Keys combine the dtype and variant with the SHA-256 of the component's
+    weight files, read from the blob names of the local Hub cache snapshot,
+    so the same T5 or VAE under different repos shares one key without a
+    request to the Hub. Local folders use file names, sizes and
+    modification times instead. When neither is available, eg. before the
+    first download, the key falls back to (repo, subfolder, revision).
+
+    A component stays cached while at least one pipeline owns it. Anything
+    that changes a component in place (a fused LoRA, a cached adapter
+    delta) must call make_private() first.
+    """
+
+    def __init__(self, shared_components=DEFAULT_SHARED_COMPONENTS, snapshot_files: Callable = None):
+        self.shared_components = tuple(shared_components)
+        self.snapshot_files = snapshot_files or self._snapshot_files
+        self.components: Dict[str, SharedComponent] = {}
+        self.lock = threading.RLock()
+        self._file_hashes: Dict[tuple, Optional[Dict[str, str]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    # Keys
+
+    @staticmethod
+    def _folder_files(folder: str) -> Dict[str, str]:
+        """
+        Identify every file in a folder. Files in the Hub cache are symlinks
+        to blobs named after their SHA-256 (LFS) or git hash, which is a
+        content address; anything else gets its size and modification time.
+        """
+        files = {}
+        for root, _, names in os.walk(folder):
+            for name in names:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    identity = os.path.basename(os.path.realpath(path))
+                else:
+                    stat = os.stat(path)
+                    identity = f"{stat.st_size}:{stat.st_mtime_ns}"
+                files[os.path.relpath(path, folder)] = identity
+        return files
+
+    @staticmethod
+    def _snapshot_files(repo: str, revision: str = None) -> Optional[Dict[str, str]]:
+        """Identify the files of a Hub repo from its local cache snapshot, never the network."""
+        from huggingface_hub import snapshot_download
+
+        folder = snapshot_download(
+            repo,
+            revision=revision,
+            local_files_only=True,
+            token=config.get_huggingface_api_key(),
+        )
+        return ComponentStore._folder_files(folder)
+
+    def _repo_files(self, repo: str, revision: str = None) -> Optional[Dict[str, str]]:
+        cache_key = (repo, revision)
+        if cache_key not in self._file_hashes:
+            if os.path.isdir(repo):
+                self._file_hashes[cache_key] = self._folder_files(repo)
+            else:
+                try:
+                    files = self.snapshot_files(repo, revision)
+                except Exception as e:
+                    # Not downloaded yet; try again once from_pretrained() has.
+                    logger.debug(f"No local snapshot of {repo}: {e}")
+                    return None
+                self._file_hashes[cache_key] = files
+        return self._file_hashes[cache_key]
+
+    def key_for(
+        self,
+        repo: str,
+        subfolder: str = None,
+        revision: str = None,
+        dtype=None,
+        variant: str = None,
+    ) -> str:
+        suffix = f"{dtype}|{variant or ''}"
+        files = self._repo_files(repo, revision)
+        prefix = f"{subfolder}/" if subfolder else ""
+        if files:
+            weights = sorted(
+                (name[len(prefix):], digest)
+                for name, digest in files.items()
+                if name.startswith(prefix)
+                and "/" not in name[len(prefix):]
+                and name.endswith(WEIGHT_SUFFIXES)
+            )
+            if weights:
+                digest = hashlib.sha256(json.dumps(weights).encode()).hexdigest()
+                return f"sha256:{digest}|{suffix}"
+        return f"repo:{repo}|{subfolder or ''}|{revision or 'main'}|{suffix}"
+
+    def pipeline_component_names(self, repo: str, revision: str = None) -> list:
+        """The shareable components listed in a pipeline's model_index.json."""
+        try:
+            if os.path.isdir(repo):
+                index_path = os.path.join(repo, "model_index.json")
+            else:
+                from huggingface_hub import hf_hub_download
+
+                index_path = hf_hub_download(
+                    repo,
+                    "model_index.json",
+                    revision=revision,
+                    token=config.get_huggingface_api_key(),
+                    local_files_only=True,
+                )
+            with open(index_path, "r") as f:
+                model_index = json.load(f)
+        except Exception as e:
+            logger.debug(f"Could not read model_index.json for {repo}: {e}")
+            return []
+        return [
+            name
+            for name, value in model_index.items()
+            if name in self.shared_components and isinstance(value, list) and value[0]
+        ]
+
+    # Sharing
+
+    def lookup(
+        self, repo: str, revision: str = None, dtype=None, variant: str = None
+    ) -> Dict[str, Any]:
+        """
+        Already-loaded components for a pipeline repo, ready to pass to
+        from_pretrained() as keyword arguments.
+        """
+        found = {}
+        with self.lock:
+            for name in self.pipeline_component_names(repo, revision):
+                key = self.key_for(repo, name, revision, dtype, variant)
+                shared = self.components.get(key)
+                if shared is None:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                logger.info(f"Reusing {name} for {repo} from {shared.source}.")
+                found[name] = shared.module
+        return found
+
+    def adopt(
+        self,
+        owner: str,
+        components: Dict[str, Any],
+        repo: str = None,
+        revision: str = None,
+        dtype=None,
+        variant: str = None,
+    ):
+        """Record the shareable components of a freshly built pipeline."""
+        repo = repo or owner
+        with self.lock:
+            for name, module in components.items():
+                if name not in self.shared_components or module is None:
+                    continue
+                key = self.key_for(repo, name, revision, dtype, variant)
+                shared = self.components.get(key)
+                if shared is None:
+                    shared = SharedComponent(key, module, f"{repo}/{name}")
+                    self.components[key] = shared
+                if shared.module is module:
+                    shared.owners.add(owner)
+
+    def load(
+        self,
+        owner: str,
+        loader: Callable[..., Any],
+        repo: str,
+        subfolder: str = None,
+        revision: str = None,
+        dtype=None,
+        variant: str = None,
+        **kwargs,
+    ):
+        """
+        Return the shared copy of a standalone component, eg. a VAE or a
+        ControlNet, calling `loader(repo, ...)` (typically a from_pretrained)
+        only the first time.
+        """
+        with self.lock:
+            key = self.key_for(repo, subfolder, revision, dtype, variant)
+            shared = self.components.get(key)
+            if shared is None:
+                self.misses += 1
+                load_args = dict(kwargs)
+                if subfolder:
+                    load_args["subfolder"] = subfolder
+                if revision:
+                    load_args["revision"] = revision
+                if variant:
+                    load_args["variant"] = variant
+                if dtype is not None:
+                    load_args["torch_dtype"] = dtype
+                shared = SharedComponent(key, loader(repo, **load_args), repo)
+                self.components[key] = shared
+            else:
+                self.hits += 1
+            shared.owners.add(owner)
+            return shared.module
+
+    def release(self, owner: str) -> list:
+        """Drop an owner's references. Returns the modules nobody owns any more."""
+        released = []
+        with self.lock:
+            for key, shared in list(self.components.items()):
+                shared.owners.discard(owner)
+                if not shared.owners:
+                    released.append(shared.module)
+                    del self.components[key]
+        return released
+
+    def disown(self, owner: str, module):
+        """Drop one owner's claim on a specific module, eg. a replaced VAE."""
+        with self.lock:
+            for key, shared in list(self.components.items()):
+                if shared.module is module:
+                    shared.owners.discard(owner)
+                    if not shared.owners:
+                        del self.components[key]
+
+    def make_private(self, owner: str, module, copier: Callable = copy.deepcopy):
+        """
+        Give `owner` a copy of `module` that it can change in place. A module
+        other pipelines still share is copied, and the copy is not shared;
+        one that only `owner` holds is withdrawn from the store instead, so
+        no later pipeline picks up the patched weights.
+        """
+        with self.lock:
+            for key, shared in list(self.components.items()):
+                if shared.module is not module:
+                    continue
+                shared.owners.discard(owner)
+                if not shared.owners:
+                    del self.components[key]
+                    return module
+                logger.info(f"Copying the shared {shared.source} for {owner} before patching it.")
+                return copier(module)
+        return module
+
+    def owners(self, module) -> set:
+        with self.lock:
+            for shared in self.components.values():
+                if shared.module is module:
+                    return set(shared.owners)
+        return set()
+
+    def stats(self) -> dict:
+        # Read from the metrics thread while the GPU lane adopts components.
+        with self.lock:
+            return {
+                "components": len(self.components),
+                "shared": sum(
+                    1 for c in self.components.values() if len(c.owners) > 1
+                ),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
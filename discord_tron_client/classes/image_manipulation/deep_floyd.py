@@ -30,13 +30,21 @@ if not torch.backends.mps.is_available():
 else:
     torch_backend = "mps"
 device = torch.device(torch_backend)
-# stage 1
-logging.debug(f"Loading DeepFloyd Stage1 model.")
-stage_1 = DiffusionPipeline.from_pretrained(
-    "DeepFloyd/IF-I-XL-v1.0", variant="fp16", torch_dtype=torch.float16
-)
-logging.debug(f"Enable DeepFloyd model CPU offload.")
-stage_1.enable_model_cpu_offload()
+stage_1 = None
+
+
+def load_stage_1():
+    """Load the stage 1 pipeline on first use rather than at import."""
+    global stage_1
+    if stage_1 is None:
+        logging.debug(f"Loading DeepFloyd Stage1 model.")
+        stage_1 = DiffusionPipeline.from_pretrained(
+            "DeepFloyd/IF-I-XL-v1.0", variant="fp16", torch_dtype=torch.float16
+        )
+        logging.debug(f"Enable DeepFloyd model CPU offload.")
+        stage_1.enable_model_cpu_offload()
+    return stage_1
+
 
 logging.debug(f"Using DeepFloyd Stage2")
 deepfloyd_stage2 = True
@@ -67,6 +75,7 @@ def generate(
     width=64,
     height=64,
 ):
+    stage_1 = load_stage_1()
     logging.debug(f"Generating prompt embeds.")
     prompt_embeds, negative_embeds = stage_1.encode_prompt(prompt, negative_prompt)
     logging.debug(f"Generating stage 1 output.")
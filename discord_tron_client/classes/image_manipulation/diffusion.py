@@ -1,6 +1,3 @@
-import tracemalloc
-
-tracemalloc.start()
 from diffusers import models
 
 try:
@@ -8,102 +5,48 @@ try:
 except:
     pass
 from diffusers import (
-    StableDiffusionPipeline,
     StableDiffusionXLPipeline,
     StableDiffusionImageVariationPipeline,
     StableDiffusionControlNetPipeline,
     ControlNetModel,
-    StableDiffusion3Pipeline,
-    StableDiffusionUpscalePipeline,
-    StableDiffusionKDiffusionPipeline,
-    DiffusionPipeline,
     AutoencoderKL,
     DDIMScheduler,
     UniPCMultistepScheduler,
     AutoPipelineForText2Image,
-    KandinskyV22CombinedPipeline,
-    SanaPipeline,
-    AuraFlowPipeline,
-    LTXPipeline,
-    LTXImageToVideoPipeline,
-    FluxPipeline,
 )
 from diffusers.models.attention_processor import AttnProcessor2_0
 import torch, gc, logging, diffusers, transformers, os, time, psutil
 
 logger = logging.getLogger("DiffusionPipelineManager")
 logger.setLevel("DEBUG")
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.pixart import (
-        PixArtSigmaPipeline,
-    )
-except Exception as e:
-    logging.error(f"Could not import dependency: {e}")
-    PixArtSigmaPipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.z_image import (
-        ZImagePipeline,
-    )
-except Exception as e:
-    logging.error(f"Could not import dependency: {e}")
-    ZImagePipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.stable_cascade.pipeline_combined import (
-        StableCascadeCombinedPipeline,
-    )
-except Exception as e:
-    logging.error(f"Could not import dependency: {e}")
-    StableCascadeCombinedPipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.ace_step.pipeline import (
-        ACEStepPipeline,
-    )
-except Exception as e:
-    logging.error(f"Could not import dependency: {e}")
-    ACEStepPipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.flux2.pipeline import (
-        Flux2Pipeline,
-    )
-except Exception as e:
-    logging.error(f"Could not import dependency: {e}")
-    Flux2Pipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.kandinsky5_image.pipeline_kandinsky5_t2i import (
-        Kandinsky5T2IPipeline,
-    )
-except Exception as e:
-    logging.error(f"Could not import dependency: {e}")
-    Kandinsky5T2IPipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.kandinsky5_video.pipeline_kandinsky5_t2v import (
-        Kandinsky5T2VPipeline,
-    )
-except Exception as e:
-    logging.error(f"Could not import dependency: {e}")
-    Kandinsky5T2VPipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.cosmos.pipeline import (
-        Cosmos2TextToImagePipeline,
-    )
-except Exception as e:
-    logging.error(f"Could not import dependency: {e}")
-    Cosmos2TextToImagePipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.wan.pipeline import (
-        WanPipeline,
-    )
-except Exception as e:
-    logging.error(f"Could not import dependency: {e}")
-    WanPipeline = None
-from diffusers import Lumina2Pipeline, OmniGenPipeline
 from diffusers import DiffusionPipeline as Pipeline
-from typing import Dict
+from typing import Dict, Optional
 from discord_tron_client.classes.hardware import HardwareInfo
 from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.llm.llama.registry import get_llama_registry
+from discord_tron_client.classes.model_registry import get_model_registry
+from discord_tron_client.classes.metrics import (
+    PIPELINE_LOAD_BYTES,
+    PIPELINE_LOAD_SECONDS,
+    PIPELINE_LOADS,
+    PIPELINE_LOOKUPS,
+)
+from discord_tron_client.classes.image_manipulation.component_store import (
+    ComponentStore,
+    DEFAULT_SHARED_COMPONENTS,
+)
+from discord_tron_client.classes.image_manipulation.embedding_cache import (
+    TEXT_ENCODER_COMPONENTS,
+    get_embedding_cache,
+)
+from discord_tron_client.classes.image_manipulation.residency import (
+    CPU,
+    DISK,
+    GPU,
+    ResidencyManager,
+)
 from PIL import Image
 from torch import OutOfMemoryError
-import json
 
 if not torch.backends.mps.is_available():
     torch.backends.cudnn.deterministic = False
@@ -122,6 +65,18 @@ hardware = HardwareInfo()
 config = AppConfig()
 
 
+def pin_module_memory(module: torch.nn.Module):
+    """Page-lock a module's CPU parameters and buffers for faster host-to-GPU copies."""
+    for param in module.parameters():
+        if param.device.type == "cpu" and not param.data.is_pinned():
+            param.data = param.data.pin_memory()
+            if param.grad is not None:
+                param.grad.data = param.grad.data.pin_memory()
+    for buffer in module.buffers():
+        if buffer is not None and buffer.device.type == "cpu":
+            buffer.data = buffer.data.pin_memory()
+
+
 def pin_pipeline_memory(pipe: diffusers.DiffusionPipeline):
     """
     Recursively pins (page-locks) the .data of all parameters and buffers
@@ -129,73 +84,36 @@ def pin_pipeline_memory(pipe: diffusers.DiffusionPipeline):
     """
     for component_name, component in pipe.components.items():
         if isinstance(component, torch.nn.Module):
-            for param in component.parameters():
-                param.data = param.data.pin_memory()
-                if param.grad is not None:
-                    param.grad.data = param.grad.data.pin_memory()
-            for buffer_name, buffer in component.named_buffers():
-                if buffer is not None and buffer.device.type == "cpu":
-                    buffer.data = buffer.data.pin_memory()
+            pin_module_memory(component)
 
 
 class PipelineRecord:
     """
-    Stores a Pipeline along with metadata for LRU/offload management.
+    Stores a Pipeline along with usage metadata. Where its components live is
+    decided by the ResidencyManager; `location` mirrors the slowest tier.
     """
 
     def __init__(self, pipeline: Pipeline, model_id: str, location: str):
         self.pipeline = pipeline
         self.model_id = model_id
-        # "cuda", "cpu", or "meta" (fully removed from memory).
+        # "cuda" or "cpu"; records are dropped once they are pushed to disk.
         self.location = location
         # For usage-based heuristics:
         self.last_access_time = time.time()
         self.usage_count = 0
         # Track creation time so older, less-used pipelines can be offloaded first
         self.creation_time = time.time()
+        # "model" or "sequential" while the OOM ladder has CPU offload enabled.
+        self.offload = None
 
     def update_access(self):
         self.last_access_time = time.time()
         self.usage_count += 1
 
-    def get_offload_score(self) -> float:
-        """
-        Combine multiple factors to determine which pipeline to offload first:
-          - If a pipeline is old and not accessed recently, its score gets bigger.
-          - A pipeline that was used a lot gets a negative offset so it stays around longer.
-        """
-        now = time.time()
-        time_since_access = now - self.last_access_time
-        pipeline_age = now - self.creation_time
-
-        # Tweak the weights as you like:
-        # Larger usage_count => keep pipeline => subtract from score
-        # Larger time_since_access => bigger score => more likely to offload
-        # Larger pipeline_age => bigger score => more likely to offload
-        score = (time_since_access) + 0.5 * (pipeline_age) - 50 * (self.usage_count)
-        return score
-
 
 class DiffusionPipelineManager:
-    PIPELINE_CLASSES = {
-        "text2img": DiffusionPipeline,
-        "sana": SanaPipeline,
-        "pixart": PixArtSigmaPipeline,
-        "z_image": ZImagePipeline,
-        "stable_cascade": StableCascadeCombinedPipeline,
-        "ace_step": ACEStepPipeline,
-        "flux2": Flux2Pipeline,
-        "kandinsky5_image": Kandinsky5T2IPipeline,
-        "kandinsky5_video": Kandinsky5T2VPipeline,
-        "cosmos": Cosmos2TextToImagePipeline,
-        "wan": WanPipeline,
-        "lumina2": Lumina2Pipeline,
-        "omnigen": OmniGenPipeline,
-        "kandinsky-2.2": KandinskyV22CombinedPipeline,
-        "prompt_variation": LTXImageToVideoPipeline,
-        "variation": StableDiffusionPipeline,
-        "upscaler": StableDiffusionPipeline,
-    }
+    # Pipeline classes by pipe_type, imported the first time each is used.
+    PIPELINE_CLASSES = get_model_registry().mapping("pipeline")
     SCHEDULER_MAPPINGS = {
         "DPMSolverMultistepScheduler": diffusers.DPMSolverMultistepScheduler,
         "PNDMScheduler": diffusers.PNDMScheduler,
@@ -232,11 +150,22 @@ class DiffusionPipelineManager:
             else "mps" if torch.backends.mps.is_available() else "cpu"
         )
 
-        # Track concurrency
-        self.max_gpu_pipelines = hardware.get_concurrent_pipe_count()
         # Track CPU memory usage threshold
         self.max_cpu_mem = hardware.get_memory_total() - 64
         self.cpu_mem_threshold = 0.75
+        # Pipeline components are placed on GPU / CPU / disk by measured size.
+        self.residency = ResidencyManager(
+            gpu_budget_bytes=self._get_gpu_budget_bytes(hw_limits),
+            cpu_budget_bytes=int(max(self.max_cpu_mem, 0) * 2**30),
+            mover=self._move_component,
+            dropper=self._drop_pipeline,
+            external_cpu_usage=lambda: get_llama_registry().resident_bytes(),
+        )
+
+        # Text encoders, VAEs and ControlNets shared between pipelines.
+        self.component_store = ComponentStore(
+            config.get_config_value("shared_components", DEFAULT_SHARED_COMPONENTS)
+        )
 
         # We'll store PipelineRecords in self.pipelines
         self.pipelines: Dict[str, PipelineRecord] = {}
@@ -246,47 +175,85 @@ class DiffusionPipelineManager:
         self.pipeline_versions = {}
         self.pipeline_runner = {"model": None}
 
-        self.vram_usage_map = {}
-        self._load_vram_usage_cache()
-
-    def _load_vram_usage_cache(self):
-        cache_path = "vram_usage_cache.json"
-        if os.path.isfile(cache_path):
-            try:
-                with open(cache_path, "r") as f:
-                    self.vram_usage_map = json.load(f)
-                for k, v in list(self.vram_usage_map.items()):
-                    if not isinstance(v, int) and not isinstance(v, float):
-                        self.vram_usage_map[k] = float(v)
-            except Exception as e:
-                logger.error(f"Error loading VRAM usage cache: {e}")
-
-    def _save_vram_usage_cache(self):
-        cache_path = "vram_usage_cache.json"
-        try:
-            with open(cache_path, "w") as f:
-                json.dump(self.vram_usage_map, f)
-        except Exception as e:
-            logger.error(f"Error saving VRAM usage cache: {e}")
-
-    def _get_current_cpu_mem_usage(self) -> int:
+        # Resident llama.cpp models draw from the same system memory budget.
+        llama_registry = get_llama_registry()
+        llama_registry.set_external_usage(
+            lambda: self._get_current_cpu_mem_usage(include_llm=False) * 2**30
+        )
+        if llama_registry.memory_budget_bytes is None:
+            llama_registry.memory_budget_bytes = int(max(self.max_cpu_mem, 0) * 2**30)
+
+    def _get_gpu_budget_bytes(self, hw_limits: dict) -> Optional[int]:
+        vram_gb = hw_limits.get("gpu")
+        if vram_gb == "Unknown" or vram_gb is None:
+            if not torch.cuda.is_available():
+                # No limit, rather than a zero budget that evicts everything.
+                return None
+            vram_gb = torch.cuda.get_device_properties(0).total_memory / 2**30
+        # Leave room for activations, the VAE decode and the CUDA context.
+        reserve_gb = float(config.get_config_value("gpu_activation_reserve_gb", 4))
+        return int(max(float(vram_gb) - reserve_gb, 0) * 2**30)
+
+    def _get_current_cpu_mem_usage(self, include_llm: bool = True) -> int:
         """
-        Return a rough measure of system memory usage
+        Return system memory held by offloaded pipeline components in GiB,
+        including resident llama.cpp models unless include_llm is False.
         """
         usage = 0
         try:
-            # Custom logic for CPU usage
-            for model, record in self.pipelines.items():
-                if record.location == "cpu" and model in self.vram_usage_map:
-                    usage_multiplier = 1.5
-                    usage += self.vram_usage_map[model] * usage_multiplier
+            usage = sum(e.size_bytes for e in self.residency.entries(CPU)) / 2**30
+            if include_llm:
+                usage += get_llama_registry().resident_bytes() / 2**30
         except Exception as e:
             logger.error(f"Error getting CPU memory usage: {e}")
         return usage
 
+    def _move_component(self, entry, tier: str):
+        """ResidencyManager mover: shift one pipeline component between devices."""
+        if tier == GPU:
+            entry.module.to(self.device, non_blocking=False)
+        else:
+            entry.module.to("cpu")
+            if config.get_config_value("pin_offloaded_components", False):
+                try:
+                    pin_module_memory(entry.module)
+                except Exception as e:
+                    logger.warning(f"Could not pin {entry.model_id}/{entry.name}: {e}")
+
+    def _sync_locations(self):
+        for model_id, record in self.pipelines.items():
+            record.location = self.residency.model_tier(model_id)
+
+    def _drop_pipeline(self, model_id: str):
+        """ResidencyManager dropper: release a pipeline back to disk."""
+        record = self.pipelines.pop(model_id, None)
+        if record is None:
+            return
+        logger.info(f"Fully removing pipeline {model_id} from memory.")
+        self.component_store.release(model_id)
+        for name, component in record.pipeline.components.items():
+            # Components that other pipelines still hold must stay intact.
+            if not isinstance(component, torch.nn.Module):
+                continue
+            if self.residency.is_tracked(component) or self.component_store.owners(
+                component
+            ):
+                continue
+            if name in TEXT_ENCODER_COMPONENTS:
+                get_embedding_cache().invalidate(component)
+            try:
+                component.to("meta")
+            except Exception as e:
+                logger.error(f"Error moving {model_id}/{name} to meta: {e}")
+        del record.pipeline
+        if self.pipeline_runner.get("model") == model_id:
+            self.pipeline_runner["model"] = None
+        self.clear_cuda_cache()
+
     def _move_pipeline_to_device(self, record: PipelineRecord, device: str):
         """
-        Move a pipeline to a new device, updating the record's location.
+        Move a pipeline to a new device through the residency manager, which
+        evicts other components as needed to stay within the byte budgets.
 
         Args:
             record (PipelineRecord): The pipeline record object.
@@ -296,118 +263,37 @@ class DiffusionPipelineManager:
             return
         try:
             if device == "cuda" and torch.cuda.is_available():
-                # If we haven't measured VRAM usage yet, do so
-                if (
-                    record.model_id not in self.vram_usage_map
-                    or self.vram_usage_map[record.model_id] == 0
-                ):
-                    mem_before = torch.cuda.memory_allocated()
-                    record.pipeline.to(device, non_blocking=False)
-                    mem_after = torch.cuda.memory_allocated()
-                    used_bytes = mem_after - mem_before
-                    used_gb = used_bytes / 2**30
-                    if used_gb > 0:
-                        self.vram_usage_map[record.model_id] = used_gb
-                        logger.info(
-                            f"Pipeline {record.model_id} uses ~{used_gb:.2f} GB VRAM (measured)."
-                        )
-                        self._save_vram_usage_cache()
-                    else:
-                        logger.info(
-                            f"Measured VRAM usage for {record.model_id} = {used_gb} GB, skipping update."
-                        )
-                else:
-                    record.pipeline.to(device, non_blocking=False)
-                    cached_gb = self.vram_usage_map[record.model_id]
-                    logger.info(
-                        f"Pipeline {record.model_id} VRAM usage is ~{cached_gb:.2f} GB (cached)."
-                    )
+                self.residency.make_resident(record.model_id, GPU, force=True)
+                logger.info(
+                    f"Pipeline {record.model_id} is on the GPU ({self.residency.model_bytes(record.model_id) / 2**30:.2f} GiB of components)."
+                )
+            elif device == "meta":
+                self.residency.demote(record.model_id, DISK)
             else:
-                # Move to CPU or meta
-                record.pipeline.to(device, non_blocking=(device == "cpu"))
-            record.location = device
+                self.residency.demote(record.model_id, CPU)
         except Exception as e:
             logger.error(f"Error moving pipeline {record.model_id} to {device}: {e}")
-
-    def _offload_one_pipeline_from_gpu(self, exclude_model_id: str = None):
-        """
-        If GPU concurrency is at max, pick the pipeline with the highest "offload_score"
-        (meaning it's the best candidate to remove), excluding exclude_model_id.
-        """
-        candidates = [
-            r
-            for r in self.pipelines.values()
-            if r.location == "cuda" and r.model_id != exclude_model_id
-        ]
-        if not candidates:
-            return
-
-        # Sort by get_offload_score() descending => highest score offloaded first
-        candidates.sort(key=lambda x: x.get_offload_score(), reverse=True)
-        worst_record = candidates[0]
-        logger.info(
-            f"Offloading pipeline {worst_record.model_id} from GPU to CPU (score={worst_record.get_offload_score():.2f})."
-        )
-        self._move_pipeline_to_device(worst_record, "cpu")
+        self._sync_locations()
 
     def _remove_pipeline_from_memory(self, model_id: str):
         if model_id not in self.pipelines:
             return
-        record = self.pipelines[model_id]
-
-        if record.location == "cuda":
-            self._move_pipeline_to_device(record, "cpu")
-
-        logger.info(f"Fully removing pipeline {model_id} from memory.")
-        try:
-            record.pipeline.to("meta")
-        except Exception as e:
-            logger.error(f"Error moving {model_id} to meta: {e}")
-
-        del record.pipeline
-        del self.pipelines[model_id]
-
-        if self.pipeline_runner.get("model") == model_id:
-            self.pipeline_runner["model"] = None
-
-        self.clear_cuda_cache()
+        self.residency.demote(model_id, DISK)
+        self._sync_locations()
 
     def _cleanup_cpu_memory_if_needed(self, pipeline=None):
         """
-        If CPU memory usage exceeds the threshold, remove the oldest pipelines.
+        If offloaded components exceed the CPU budget, push the lowest
+        priority models back to disk.
         """
-        usage_multiplier = 1.0
-        if pipeline is not None:
-            if "flux" in str(pipeline).lower():
-                usage_multiplier = 2.0
-        current_cpu_usage = self._get_current_cpu_mem_usage() * usage_multiplier
-        if current_cpu_usage <= self.max_cpu_mem:
-            logger.info(
-                f"Not clearing memory, usage {current_cpu_usage}(x{usage_multiplier}) < {self.max_cpu_mem}"
-            )
-            return
-
-        logger.warning(
-            f"CPU memory usage {current_cpu_usage}(x{usage_multiplier}) exceeds threshold {self.max_cpu_mem}. "
-            f"Removing older pipelines from CPU memory..."
-        )
-
-        # Collect pipelines on CPU, sort by offload_score descending
-        candidates = [
-            r
-            for r in self.pipelines.values()
-            if r.location == "cpu" and r.pipeline != pipeline
-        ]
-        candidates.sort(key=lambda x: x.get_offload_score(), reverse=True)
-
-        idx = 0
-        while current_cpu_usage > self.max_cpu_mem and idx < len(candidates):
-            worst_record = candidates[idx]
-            idx += 1
-            self._remove_pipeline_from_memory(worst_record.model_id)
-            current_cpu_usage = self._get_current_cpu_mem_usage() * usage_multiplier
-            self.clear_cuda_cache()
-            logger.info(f"New memory usage level {current_cpu_usage}")
+        protect = {
+            model_id
+            for model_id, record in self.pipelines.items()
+            if pipeline is not None and record.pipeline is pipeline
+        }
+        self.residency.enforce_budget(CPU, protect=protect)
+        self._sync_locations()
+        logger.info(f"Memory residency: {self.residency.stats()}")
 
     def _ensure_pipeline_on_gpu(self, model_id: str):
         """
@@ -421,11 +307,7 @@ class DiffusionPipelineManager:
         record = self.pipelines[model_id]
         if record.location == "cuda":
             return
-        if self.num_pipelines_on_gpu() < self.max_gpu_pipelines:
-            self._move_pipeline_to_device(record, "cuda")
-        else:
-            self._offload_one_pipeline_from_gpu(exclude_model_id=model_id)
-            self._move_pipeline_to_device(record, "cuda")
+        self._move_pipeline_to_device(record, "cuda")
 
     def num_pipelines_on_gpu(self) -> int:
         """
@@ -486,10 +368,24 @@ class DiffusionPipelineManager:
             for key in safety_modules:
                 extra_args[key] = safety_modules[key]
 
+        variant = (
+            config.get_config_value("model_default_variant", None)
+            if pipe_type == "text2img"
+            else None
+        )
+        # Assemble the pipeline around any text encoders / VAE already loaded.
+        extra_args.update(
+            self.component_store.lookup(model_id, dtype=pipeline_dtype, variant=variant)
+        )
+
+        load_started = time.monotonic()
         if pipe_type in ["variation", "upscaler"]:
             logger.debug(f"Creating a ControlNet model for {model_id}")
-            controlnet = ControlNetModel.from_pretrained(
-                "lllyasviel/control_v11f1e_sd15_tile", torch_dtype=pipeline_dtype
+            controlnet = self.component_store.load(
+                model_id,
+                ControlNetModel.from_pretrained,
+                "lllyasviel/control_v11f1e_sd15_tile",
+                dtype=pipeline_dtype,
             )
             logger.debug(f"StableDiffusionControlNetPipeline for {model_id}")
             pipeline = pipeline_class.from_pretrained(
@@ -517,7 +413,7 @@ class DiffusionPipelineManager:
                 torch_dtype=pipeline_dtype,
                 use_safetensors=use_safetensors,
                 use_auth_token=config.get_huggingface_api_key(),
-                variant=config.get_config_value("model_default_variant", None),
+                variant=variant,
                 **extra_args,
             )
             logger.debug(f"Model config: {pipeline.config}")
@@ -532,9 +428,13 @@ class DiffusionPipelineManager:
             )
 
         self.pipelines[model_id] = PipelineRecord(pipeline, model_id, location="cpu")
+        self.component_store.adopt(
+            model_id, pipeline.components, dtype=pipeline_dtype, variant=variant
+        )
 
-        quanto_quantized_models = [LTXPipeline, LTXImageToVideoPipeline, FluxPipeline]
-        if type(pipeline) in quanto_quantized_models and not hasattr(
+        if get_model_registry().matches(
+            pipeline, "ltx", "ltx_image_to_video", "flux", exact=True
+        ) and not hasattr(
             pipeline, "quantized"
         ):
             from optimum.quanto import quantize, freeze, qint8
@@ -546,6 +446,19 @@ class DiffusionPipelineManager:
             self.delete_pipes(keep_model=model_id)
             setattr(pipeline, "quantized", True)
 
+        # Register after quantisation so the component sizes are the real ones.
+        load_seconds = time.monotonic() - load_started
+        self.residency.register(
+            model_id,
+            pipeline.components,
+            tier=CPU,
+            load_seconds=load_seconds,
+        )
+        self._sync_locations()
+        PIPELINE_LOADS.inc(pipe_type=pipe_type)
+        PIPELINE_LOAD_SECONDS.observe(load_seconds, pipe_type=pipe_type)
+        PIPELINE_LOAD_BYTES.inc(self.residency.model_bytes(model_id), pipe_type=pipe_type)
+
         if hasattr(pipeline, "safety_checker") and pipeline.safety_checker is not None:
             pipeline.safety_checker = lambda images, clip_input: (images, False)
         if hasattr(pipeline, "watermark") and pipeline.watermark is not None:
@@ -735,19 +648,17 @@ class DiffusionPipelineManager:
                 safety_modules=safety_modules,
             )
             self.last_pipe_type[model_id] = pipe_type
+            PIPELINE_LOOKUPS.inc(result="miss")
         else:
             logger.info(f"Using existing pipeline for {model_id}.")
+            PIPELINE_LOOKUPS.inc(result="hit")
 
         self._ensure_pipeline_on_gpu(model_id)
         record = self.pipelines[model_id]
         record.update_access()
 
-        # If user config says to enable tiling, do so
-        enable_tiling = user_config.get("enable_tiling", True)
-        if hasattr(record.pipeline, "vae") and enable_tiling:
-            logger.warning("Enabling VAE tiling (could cause artifacts).")
-            record.pipeline.vae.enable_tiling()
-            record.pipeline.vae.enable_slicing()
+        # Set on every job, because the VAE may be shared with other pipelines.
+        self.set_vae_tiling(record.pipeline, user_config.get("enable_tiling", True))
 
         self._cleanup_cpu_memory_if_needed(pipeline=record.pipeline)
         return record.pipeline
@@ -768,6 +679,92 @@ class DiffusionPipelineManager:
             )
         )
 
+    def set_vae_tiling(self, pipeline, enabled: bool):
+        """Turn VAE tiling and slicing on or off for the next call."""
+        vae = getattr(pipeline, "vae", None)
+        if vae is None or not hasattr(vae, "enable_tiling"):
+            return
+        if enabled:
+            logger.debug("Enabling VAE tiling (could cause artifacts).")
+            vae.enable_tiling()
+            vae.enable_slicing()
+        else:
+            vae.disable_tiling()
+            vae.disable_slicing()
+
+    def make_components_private(self, pipeline, names) -> list:
+        """
+        Copy-on-write for components about to be changed in place, eg. by
+        loading or fusing a LoRA, so the change does not reach the other
+        pipelines that share them. Returns the names that were replaced.
+        """
+        model_id = next(
+            (model_id for model_id, record in self.pipelines.items() if record.pipeline is pipeline),
+            None,
+        )
+        if model_id is None:
+            return []
+        replaced = []
+        for name in names:
+            module = getattr(pipeline, name, None)
+            if module is None:
+                continue
+            private = self.component_store.make_private(model_id, module)
+            if private is module:
+                continue
+            entry = self.residency.components.get(model_id, {}).get(name)
+            tier = entry.tier if entry is not None else CPU
+            setattr(pipeline, name, private)
+            self.residency.replace_component(model_id, name, private, tier=tier)
+            replaced.append(name)
+        if replaced:
+            # The copies are new bytes in whichever tier the originals were in.
+            for tier in (GPU, CPU):
+                self.residency.enforce_budget(tier, protect={model_id})
+            self._sync_locations()
+        return replaced
+
+    def offload_pipeline(self, model_id: str, sequential: bool = False):
+        """
+        Hand a pipeline's placement over to accelerate's CPU offload hooks,
+        eg. after it ran out of memory. Undo with restore_pipeline_placement().
+        """
+        record = self.pipelines.get(model_id)
+        if record is None or record.offload:
+            return
+        # The offload hooks expect to start from system memory.
+        self.residency.demote(model_id, CPU)
+        self._sync_locations()
+        if sequential:
+            logger.warning(f"Enabling sequential CPU offload for {model_id}.")
+            record.pipeline.enable_sequential_cpu_offload()
+        else:
+            logger.warning(f"Enabling model CPU offload for {model_id}.")
+            record.pipeline.enable_model_cpu_offload()
+        record.offload = "sequential" if sequential else "model"
+
+    def restore_pipeline_placement(self, model_id: str, vae_tiling: bool = False):
+        """
+        Undo an OOM ladder rung: set VAE tiling back to `vae_tiling`, and
+        remove any offload hooks so the residency manager places the
+        pipeline again.
+        """
+        record = self.pipelines.get(model_id)
+        if record is None:
+            return
+        self.set_vae_tiling(record.pipeline, vae_tiling)
+        if not record.offload:
+            return
+        try:
+            record.pipeline.remove_all_hooks()
+            # Sequential offload leaves the weights with the hooks until removed.
+            for entry in self.residency.components.get(model_id, {}).values():
+                entry.module.to("cpu")
+        except Exception as e:
+            logger.error(f"Could not remove the offload hooks from {model_id}: {e}")
+        record.offload = None
+        self._sync_locations()
+
     def clear_cuda_cache(self):
         import ctypes
 
@@ -782,7 +779,7 @@ class DiffusionPipelineManager:
             logger.debug("NOT clearing CUDA cache (config disabled).")
 
     def get_controlnet_pipe(self):
-        self.delete_pipes()
+        # The residency manager makes room on the GPU only if it has to.
         return self.get_pipe(
             user_config={},
             model_id="emilianJR/epiCRealism",
@@ -798,10 +795,19 @@ class DiffusionPipelineManager:
         pipeline = self.get_pipe(
             user_config={}, model_id=refiner_model, prompt_variation=True
         )
-        pipeline.vae = AutoencoderKL.from_pretrained(
+        # Loaded once and then shared, rather than fetched on every call.
+        vae = self.component_store.load(
+            refiner_model,
+            AutoencoderKL.from_pretrained,
             "madebyollin/sdxl-vae-fp16-fix",
-            torch_dtype=self.torch_dtype,
+            dtype=self.torch_dtype,
             use_safetensors=True,
             use_auth_token=config.get_huggingface_api_key(),
-        ).to(self.device)
+        )
+        if pipeline.vae is not vae:
+            self.component_store.disown(refiner_model, pipeline.vae)
+            pipeline.vae = vae
+            self.residency.replace_component(refiner_model, "vae", vae)
+            self.residency.make_resident(refiner_model, GPU, force=True)
+            self._sync_locations()
         return pipeline
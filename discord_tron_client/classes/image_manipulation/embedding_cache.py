@@ -0,0 +1,326 @@
+import logging, threading, weakref
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Sequence
+from discord_tron_client.classes.app_config import AppConfig
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+TEXT_ENCODER_COMPONENTS = ("text_encoder", "text_encoder_2", "text_encoder_3")
+
+
+def _is_tensor(value) -> bool:
+    return hasattr(value, "numel") and hasattr(value, "element_size")
+
+
+def _map_tensors(value, fn):
+    if isinstance(value, (tuple, list)):
+        return type(value)(_map_tensors(item, fn) for item in value)
+    if _is_tensor(value):
+        return fn(value)
+    return value
+
+
+def embedding_nbytes(value) -> int:
+    total = 0
+
+    def count(tensor):
+        nonlocal total
+        total += tensor.numel() * tensor.element_size()
+        return tensor
+
+    _map_tensors(value, count)
+    return total
+
+
+def _first_device(value):
+    if isinstance(value, (tuple, list)):
+        for item in value:
+            device = _first_device(item)
+            if device is not None:
+                return device
+        return None
+    return getattr(value, "device", None)
+
+
+def tokenizer_settings(tokenizer) -> tuple:
+    """The tokenizer properties that change what a piece of text encodes to."""
+    if tokenizer is None:
+        return ()
+    try:
+        vocab_size = len(tokenizer)
+    except TypeError:
+        vocab_size = None
+    return (
+        type(tokenizer).__name__,
+        getattr(tokenizer, "name_or_path", None),
+        getattr(tokenizer, "model_max_length", None),
+        getattr(tokenizer, "padding_side", None),
+        # Textual inversion adds tokens, which changes the vocabulary size.
+        vocab_size,
+    )
+
+
+class CacheEntry:
+    def __init__(self, value, nbytes: int, device):
+        self.value = value
+        self.nbytes = nbytes
+        self.device = device
+
+
+class PromptEmbeddingCache:
+    """
+    An LRU cache of text encoder outputs, so that repeated prompts, negative
+    prompts and style templates are only encoded once.
+
+    Entries are keyed by (text encoder identity, tokenizer settings, text,
+    max length, extra settings) and hold a tensor or a tuple of tensors, eg.
+    (prompt_embeds, pooled_prompt_embeds) for SDXL. Entries are kept where
+    the encoder produced them, up to `budget_bytes`. Entries evicted from
+    there spill to system memory, up to `cpu_budget_bytes`, and are moved
+    back on their next hit. A budget of zero disables that tier.
+
+    Entries for a text encoder are dropped when it is garbage collected, or
+    when `invalidate()` is called because its weights changed (eg. a LoRA).
+    """
+
+    def __init__(self, budget_bytes: int, cpu_budget_bytes: int = 0):
+        self.budget_bytes = max(int(budget_bytes), 0)
+        self.cpu_budget_bytes = max(int(cpu_budget_bytes), 0)
+        self.entries: "OrderedDict[tuple, CacheEntry]" = OrderedDict()
+        self.spilled: "OrderedDict[tuple, CacheEntry]" = OrderedDict()
+        self.bytes = 0
+        self.spilled_bytes = 0
+        self.lock = threading.RLock()
+        self._watched = {}
+        self.hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spills = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_bytes > 0 or self.cpu_budget_bytes > 0
+
+    # Keys
+
+    def _watch(self, encoder):
+        encoder_id = id(encoder)
+        if encoder_id in self._watched:
+            return
+        try:
+            self._watched[encoder_id] = weakref.finalize(
+                encoder, self._forget, encoder_id
+            )
+        except TypeError:
+            # Not weak-referenceable; rely on explicit invalidation.
+            self._watched[encoder_id] = None
+
+    def key(
+        self,
+        encoders: Sequence,
+        text: str,
+        max_len: int = None,
+        tokenizers: Sequence = (),
+        **settings,
+    ) -> tuple:
+        encoders = [encoder for encoder in encoders if encoder is not None]
+        with self.lock:
+            for encoder in encoders:
+                self._watch(encoder)
+        return (
+            tuple(id(encoder) for encoder in encoders),
+            tuple(tokenizer_settings(tokenizer) for tokenizer in tokenizers),
+            text,
+            max_len,
+            tuple(sorted((name, str(value)) for name, value in settings.items())),
+        )
+
+    # Lookup
+
+    def get(self, key: tuple):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            entry = self.spilled.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.spilled_bytes -= entry.nbytes
+            self.spill_hits += 1
+        value = entry.value
+        if entry.device is not None and self.budget_bytes > 0:
+            value = _map_tensors(
+                value, lambda tensor: tensor.to(entry.device, non_blocking=True)
+            )
+        self.put(key, value)
+        return value
+
+    def put(self, key: tuple, value):
+        """Cache a value and return it, detached from any autograd graph."""
+        value = _map_tensors(value, lambda tensor: tensor.detach())
+        if not self.enabled:
+            return value
+        entry = CacheEntry(value, embedding_nbytes(value), _first_device(value))
+        with self.lock:
+            self._remove(key)
+            if self.budget_bytes > 0 and entry.nbytes <= self.budget_bytes:
+                self.entries[key] = entry
+                self.bytes += entry.nbytes
+                while self.bytes > self.budget_bytes:
+                    old_key, old_entry = self.entries.popitem(last=False)
+                    self.bytes -= old_entry.nbytes
+                    self._spill(old_key, old_entry)
+            else:
+                self._spill(key, entry)
+        return value
+
+    def _spill(self, key: tuple, entry: CacheEntry):
+        if entry.nbytes > self.cpu_budget_bytes:
+            self.evictions += 1
+            return
+        if entry.device is not None and str(entry.device) != "cpu":
+            entry = CacheEntry(
+                _map_tensors(entry.value, lambda tensor: tensor.to("cpu")),
+                entry.nbytes,
+                entry.device,
+            )
+            self.spills += 1
+        self.spilled[key] = entry
+        self.spilled_bytes += entry.nbytes
+        while self.spilled_bytes > self.cpu_budget_bytes:
+            _, old_entry = self.spilled.popitem(last=False)
+            self.spilled_bytes -= old_entry.nbytes
+            self.evictions += 1
+
+    def _remove(self, key: tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.nbytes
+        entry = self.spilled.pop(key, None)
+        if entry is not None:
+            self.spilled_bytes -= entry.nbytes
+
+    def get_or_encode(self, key: tuple, encode: Callable[[], Any]):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, encode())
+        return value
+
+    def encode_batch(
+        self,
+        encoders: Sequence,
+        texts: List[str],
+        encode: Callable[[List[str]], Any],
+        max_len: int = None,
+        tokenizers: Sequence = (),
+        **settings,
+    ):
+        """
+        Encode a batch of texts, running `encode` only on the texts that are
+        not cached yet. `encode(texts)` returns a tensor or tuple of tensors
+        batched along the first dimension; the result has the same shape, in
+        the order of `texts`.
+        """
+        import torch
+
+        keys = [
+            self.key(encoders, text, max_len, tokenizers, **settings) for text in texts
+        ]
+        rows = [self.get(key) for key in keys] if self.enabled else [None] * len(keys)
+        missing = list(
+            dict.fromkeys(text for text, row in zip(texts, rows) if row is None)
+        )
+        if missing:
+            encoded = encode(missing)
+            as_tuple = isinstance(encoded, (tuple, list))
+            parts = encoded if as_tuple else (encoded,)
+            fresh = {}
+            for index, text in enumerate(missing):
+                row = tuple(
+                    part[index : index + 1] if _is_tensor(part) else part
+                    for part in parts
+                )
+                fresh[text] = self.put(
+                    self.key(encoders, text, max_len, tokenizers, **settings),
+                    row if as_tuple else row[0],
+                )
+            rows = [
+                row if row is not None else fresh[text] for text, row in zip(texts, rows)
+            ]
+        if not isinstance(rows[0], (tuple, list)):
+            return torch.cat(rows, dim=0)
+        return tuple(
+            torch.cat([row[index] for row in rows], dim=0)
+            if _is_tensor(rows[0][index])
+            else rows[0][index]
+            for index in range(len(rows[0]))
+        )
+
+    # Invalidation
+
+    def _forget(self, encoder_id: int):
+        with self.lock:
+            for entries in (self.entries, self.spilled):
+                for key in [key for key in entries if encoder_id in key[0]]:
+                    self._remove(key)
+            self._watched.pop(encoder_id, None)
+
+    def invalidate(self, encoder):
+        """Drop every entry produced by `encoder`, eg. after its weights change."""
+        if encoder is None:
+            return
+        watcher = self._watched.get(id(encoder))
+        self._forget(id(encoder))
+        if watcher is not None:
+            watcher.detach()
+
+    def invalidate_pipeline(self, pipeline):
+        for name in TEXT_ENCODER_COMPONENTS:
+            self.invalidate(getattr(pipeline, name, None))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.spilled.clear()
+            self.bytes = 0
+            self.spilled_bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.spill_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "spilled_entries": len(self.spilled),
+                "spilled_bytes": self.spilled_bytes,
+                "hits": self.hits,
+                "spill_hits": self.spill_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.spill_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "spills": self.spills,
+            }
+
+
+_cache: Optional[PromptEmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> PromptEmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PromptEmbeddingCache(
+                budget_bytes=float(config.get_config_value("prompt_embed_cache_mb", 256))
+                * 2**20,
+                cpu_budget_bytes=float(
+                    config.get_config_value("prompt_embed_cache_cpu_mb", 1024)
+                )
+                * 2**20,
+            )
+        return _cache
@@ -0,0 +1,255 @@
+import gc, logging
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Callable, Optional, Sequence
+from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.cost_model import get_cost_model, gpu_memory_bytes
+from discord_tron_client.classes.image_manipulation.oom_ladder import is_out_of_memory
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+# "auto" batches unless the cost model predicts the doubled batch will not fit.
+CFG_BATCHING_MODES = ("auto", "always", "never")
+# The model id of the job being run, which pipelines rebuilt from another
+# pipeline's components (eg. Flux) no longer carry in `name_or_path`.
+_job_model: ContextVar[Optional[str]] = ContextVar("guidance_job_model", default=None)
+
+
+def _is_tensor(value) -> bool:
+    return hasattr(value, "shape") and hasattr(value, "to")
+
+
+def _move(value, device=None, dtype=None):
+    if isinstance(value, (tuple, list)):
+        return type(value)(_move(item, device, dtype) for item in value)
+    if not _is_tensor(value):
+        return value
+    if dtype is not None and value.is_floating_point():
+        return value.to(device=device, dtype=dtype)
+    return value.to(device=device) if device is not None else value
+
+
+def _batch_length(value) -> Optional[int]:
+    if isinstance(value, list):
+        return len(value)
+    if _is_tensor(value) and value.ndim > 0:
+        return value.shape[0]
+    return None
+
+
+def _same(a, b) -> bool:
+    if _is_tensor(a) or _is_tensor(b):
+        import torch
+
+        return (
+            _is_tensor(a)
+            and _is_tensor(b)
+            and a.shape == b.shape
+            and (a is b or torch.equal(a, b))
+        )
+    return a is b or a == b
+
+
+def _join(a, b):
+    """(True, a and b as one batch), or (False, None) when they cannot share one."""
+    if isinstance(a, list) and isinstance(b, list):
+        # Per-sample lists (eg. Z-Image's variable length captions) just extend.
+        return True, a + b
+    if _is_tensor(a) and _is_tensor(b):
+        import torch
+
+        if a.ndim == 0 or a.shape[1:] != b.shape[1:] or a.dtype != b.dtype:
+            return False, None
+        return True, torch.cat([a, b], dim=0)
+    if _is_tensor(a) or _is_tensor(b) or isinstance(a, list) or isinstance(b, list):
+        return False, None
+    # Settings such as `skip_layers` are shared only when both branches agree.
+    return _same(a, b), a
+
+
+def _join_inputs(cond: dict, uncond: dict, unbatched: Sequence[str] = ()) -> Optional[dict]:
+    if cond.keys() != uncond.keys():
+        return None
+    joint = {}
+    for name, value in cond.items():
+        if name in unbatched:
+            # Inputs without a batch dimension (eg. Flux's txt_ids) must match.
+            if not _same(value, uncond[name]):
+                return None
+            joint[name] = value
+            continue
+        ok, joint[name] = _join(value, uncond[name])
+        if not ok:
+            return None
+    return joint
+
+
+def _split(output, length: int) -> tuple:
+    return output[:length], output[length:]
+
+
+def batch_guidance(model: Optional[str], width: int, height: int, batch_size: int = 1) -> bool:
+    """
+    Whether to run the conditional and unconditional branches as one batch.
+    Only `cfg_batching: never`, or a prediction that the doubled batch will
+    not fit, keeps them sequential.
+    """
+    mode = str(config.get_config_value("cfg_batching", "auto")).lower()
+    if mode not in CFG_BATCHING_MODES:
+        logger.warning(f"Unknown cfg_batching mode {mode!r}, using auto.")
+        mode = "auto"
+    if mode != "auto":
+        return mode == "always"
+    cost_model = get_cost_model()
+    resolution = {"width": width, "height": height}
+    # Twice the images runs the transformer at the same batch as batched guidance.
+    batch = 2 * max(int(batch_size), 1)
+    if cost_model.oom_rung(model, resolution, batch) is not None:
+        return False
+    budget = gpu_memory_bytes()
+    if budget is None or not cost_model.predict(model, resolution).measured:
+        return True
+    # Samples taken with batched guidance already include it, so this errs towards sequential.
+    return cost_model.fits(model, resolution, budget, batch)
+
+
+class GuidanceEngine:
+    """
+    Runs the conditional and unconditional branches of classifier-free
+    guidance. Each branch's fixed inputs (the prompt and negative prompt
+    embeddings) are handed over once per job with `set_branches`, which
+    moves them to the device and, when batching, concatenates them once.
+    Each step then costs one transformer call instead of two. Without an
+    unconditional branch, only the conditional one ever runs.
+
+    Falls back to two calls when the branches cannot share a batch (their
+    shapes differ, or a per-step setting such as `skip_layers` differs), or
+    for the rest of the job once a batched call runs out of memory.
+    """
+
+    def __init__(self, batched: bool = True):
+        self.batched = batched
+        self.cond = {}
+        self.uncond = {}
+        self.joint = None
+        self.batched_steps = 0
+        self.sequential_steps = 0
+
+    def set_branches(
+        self,
+        cond: dict,
+        uncond: dict = None,
+        device=None,
+        dtype=None,
+        unbatched: Sequence[str] = (),
+    ) -> "GuidanceEngine":
+        self.cond = {name: _move(value, device, dtype) for name, value in cond.items()}
+        self.uncond = {
+            name: _move(value, device, dtype) for name, value in (uncond or {}).items()
+        }
+        self.joint = None
+        if self.batched and uncond is not None:
+            self.joint = _join_inputs(self.cond, self.uncond, unbatched)
+            if self.joint is None:
+                logger.info("Guidance branches cannot share a batch; running them sequentially.")
+        return self
+
+    def _fall_back(self, error: BaseException):
+        logger.warning(f"Batched guidance ran out of memory, running branches sequentially: {error}")
+        self.batched = False
+        self.joint = None
+        gc.collect()
+        try:
+            import torch
+
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+    def _batched(self, forward, step: dict, shared: dict, cond: dict, uncond: dict, context):
+        extras = _join_inputs(cond, uncond)
+        inputs = _join_inputs(step, step)
+        if extras is None or inputs is None:
+            return None
+        length = next(
+            (
+                _batch_length(value)
+                for value in list(step.values()) + list(self.cond.values())
+                if _batch_length(value) is not None
+            ),
+            None,
+        )
+        if length is None:
+            return None
+        try:
+            with context("cond_uncond"):
+                output = forward(**shared, **inputs, **self.joint, **extras)
+        except Exception as error:
+            if not is_out_of_memory(error):
+                raise
+            self._fall_back(error)
+            return None
+        self.batched_steps += 1
+        return _split(output, length)
+
+    def __call__(
+        self,
+        forward: Callable,
+        step: dict = None,
+        shared: dict = None,
+        cond: dict = None,
+        uncond: dict = None,
+        guidance: bool = True,
+        context: Callable = None,
+    ) -> tuple:
+        """
+        `forward(**inputs)` for both branches, returning (cond, uncond).
+        `step` holds this step's batched inputs (latents, timestep), used by
+        both branches; `shared` is passed through untouched; `cond` and
+        `uncond` hold this step's branch specific settings. `forward` must
+        return the prediction itself, a tensor or a list of per-sample
+        tensors. Without `guidance`, only the conditional branch runs and
+        uncond is None. `context(name)` wraps each call, eg. a cache context.
+        """
+        step, shared = step or {}, shared or {}
+        cond, uncond = cond or {}, uncond or {}
+        context = context or (lambda name: nullcontext())
+        if not guidance or not self.uncond:
+            with context("cond"):
+                return forward(**shared, **step, **self.cond, **cond), None
+        if self.batched and self.joint is not None:
+            outputs = self._batched(forward, step, shared, cond, uncond, context)
+            if outputs is not None:
+                return outputs
+        with context("cond"):
+            cond_output = forward(**shared, **step, **self.cond, **cond)
+        with context("uncond"):
+            uncond_output = forward(**shared, **step, **self.uncond, **uncond)
+        self.sequential_steps += 1
+        return cond_output, uncond_output
+
+
+@contextmanager
+def guidance_model(model: Optional[str]):
+    """Run the enclosed pipeline call as a job for `model`; see build_guidance_engine()."""
+    token = _job_model.set(model or None)
+    try:
+        yield
+    finally:
+        _job_model.reset(token)
+
+
+def build_guidance_engine(
+    pipeline, width: int, height: int, batch_size: int = 1, model: str = None
+) -> GuidanceEngine:
+    """
+    The guidance engine for one pipeline call. `model` defaults to the job's
+    model id from guidance_model(), so the cost model lookups match the
+    samples recorded under it.
+    """
+    model = model or _job_model.get() or getattr(pipeline, "name_or_path", None)
+    batched = batch_guidance(model, width, height, batch_size)
+    logger.debug(f"{'Batched' if batched else 'Sequential'} guidance for {model} at {width}x{height}.")
+    return GuidanceEngine(batched=batched)
@@ -0,0 +1,165 @@
+import asyncio, base64, json, logging
+from io import BytesIO
+from typing import List
+from PIL import Image, PngImagePlugin
+from discord_tron_client.classes.app_config import AppConfig
+
+config = AppConfig()
+logger = logging.getLogger(__name__)
+
+ENCODER_FORMATS = {
+    "png": ("PNG", "image/png", "png"),
+    "webp": ("WEBP", "image/webp", "webp"),
+    "jxl": ("JXL", "image/jxl", "jxl"),
+}
+
+
+class EncodedImage:
+    """
+    The final, compressed bytes of a generated image plus its text metadata.
+
+    Produced once after generation and handed unchanged to the uploader and
+    the websocket message builders, so no stage needs to encode it again.
+    """
+
+    def __init__(
+        self, data: bytes, encoder: str, size: tuple, metadata: dict = None
+    ):
+        self.data = data
+        self.encoder = encoder
+        self.format, self.mime_type, self.extension = ENCODER_FORMATS[encoder]
+        self.size = size
+        self.metadata = metadata or {}
+
+    @property
+    def info(self) -> dict:
+        # Mirrors PIL's Image.info, which the uploader sends along as parameters.
+        return self.metadata
+
+    @property
+    def filename(self) -> str:
+        return f"image.{self.extension}"
+
+    def as_file(self) -> BytesIO:
+        return BytesIO(self.data)
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.data).decode("utf-8")
+
+    def to_pil(self) -> Image:
+        return Image.open(BytesIO(self.data))
+
+
+def _encoder_options(encoder: str) -> dict:
+    if encoder == "png":
+        return {"compress_level": int(config.get_config_value("png_compress_level", 6))}
+    if encoder == "webp":
+        return {"lossless": True, "method": int(config.get_config_value("webp_method", 4))}
+    if encoder == "jxl":
+        return {"lossless": True, "effort": int(config.get_config_value("jxl_effort", 7))}
+    return {}
+
+
+def _resolve_encoder(encoder: str = None) -> str:
+    encoder = str(encoder or config.get_config_value("image_encoder", "png")).lower()
+    if encoder not in ENCODER_FORMATS:
+        logger.warning(f"Unknown image encoder {encoder}, using PNG.")
+        return "png"
+    if encoder == "jxl":
+        try:
+            import pillow_jxl  # noqa: F401 registers the JXL plugin
+        except ImportError:
+            logger.warning("JPEG-XL requested but pillow-jxl-plugin is missing, using PNG.")
+            return "png"
+    return encoder
+
+
+def _encode(image: Image, metadata: dict, encoder: str, options: dict) -> bytes:
+    """Compress one image. Runs inside the encode process pool."""
+    if encoder == "jxl":
+        import pillow_jxl  # noqa: F401
+    buffer = BytesIO()
+    save_args = dict(options)
+    if encoder == "png":
+        pnginfo = PngImagePlugin.PngInfo()
+        for key, value in metadata.items():
+            pnginfo.add_text(key, str(value))
+        save_args["pnginfo"] = pnginfo
+    elif metadata:
+        # WebP and JPEG-XL have no text chunks; keep the metadata in EXIF.
+        exif = Image.Exif()
+        exif[0x010E] = json.dumps(metadata)  # ImageDescription
+        save_args["exif"] = exif.tobytes()
+    image.save(buffer, format=ENCODER_FORMATS[encoder][0], **save_args)
+    return buffer.getvalue()
+
+
+def encode_image(
+    image: Image, metadata: dict = None, encoder: str = None, use_pool: bool = False
+) -> EncodedImage:
+    return encode_images([image], [metadata], encoder=encoder, use_pool=use_pool)[0]
+
+
+def encode_images(
+    images: List[Image],
+    metadata: List[dict] = None,
+    encoder: str = None,
+    use_pool: bool = True,
+) -> List[EncodedImage]:
+    """
+    Compress a batch of images exactly once each. With use_pool, the work is
+    spread over the encode process pool so it does not hold the GIL.
+    """
+    encoder = _resolve_encoder(encoder)
+    options = _encoder_options(encoder)
+    if metadata is None:
+        metadata = [None] * len(images)
+    metadata = [m or {} for m in metadata]
+    if use_pool and config.get_config_value("image_encode_in_subprocess", True):
+        try:
+            pool = AppConfig.get_encode_executor()
+            futures = [
+                pool.submit(_encode, image, meta, encoder, options)
+                for image, meta in zip(images, metadata)
+            ]
+            encoded = [future.result() for future in futures]
+        except Exception as e:
+            logger.warning(f"Encode pool failed ({e}), encoding in-process.")
+            encoded = [
+                _encode(image, meta, encoder, options)
+                for image, meta in zip(images, metadata)
+            ]
+    else:
+        encoded = [
+            _encode(image, meta, encoder, options)
+            for image, meta in zip(images, metadata)
+        ]
+    return [
+        EncodedImage(data, encoder, image.size, meta)
+        for data, image, meta in zip(encoded, images, metadata)
+    ]
+
+
+async def encode_images_async(
+    images: List[Image], metadata: List[dict] = None, encoder: str = None
+) -> List[EncodedImage]:
+    """encode_images() for the event loop: awaits the encode pool."""
+    if not config.get_config_value("image_encode_in_subprocess", True):
+        return encode_images(images, metadata, encoder=encoder, use_pool=False)
+    encoder = _resolve_encoder(encoder)
+    options = _encoder_options(encoder)
+    if metadata is None:
+        metadata = [None] * len(images)
+    metadata = [m or {} for m in metadata]
+    loop = asyncio.get_running_loop()
+    pool = AppConfig.get_encode_executor()
+    encoded = await asyncio.gather(
+        *[
+            loop.run_in_executor(pool, _encode, image, meta, encoder, options)
+            for image, meta in zip(images, metadata)
+        ]
+    )
+    return [
+        EncodedImage(data, encoder, image.size, meta)
+        for data, image, meta in zip(encoded, images, metadata)
+    ]
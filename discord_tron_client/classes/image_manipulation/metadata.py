@@ -8,21 +8,29 @@ from PIL import Image, PngImagePlugin
 
 class ImageMetadata:
     @staticmethod
-    def encode(image: Image, user_config: dict, attributes: dict = None):
-        metadata = PngImagePlugin.PngInfo()
+    def text_chunks(user_config: dict, attributes: dict = None) -> dict:
+        """Build the text metadata that gets embedded into an output image."""
         # remove gpt_role from metadata, if there:
         user_config_copy = user_config.copy()
         if "gpt_role" in user_config:
             del user_config_copy["gpt_role"]
-        metadata.add_text("user_config", json.dumps(user_config_copy))
-        metadata.add_text(
-            "parameters",
-            ImageMetadata.automatic1111_metadata(user_config_copy, attributes),
-        )
+        chunks = {
+            "user_config": json.dumps(user_config_copy),
+            "parameters": ImageMetadata.automatic1111_metadata(
+                user_config_copy, attributes or {}
+            ),
+        }
         if attributes is not None:
             # Random attributes can be added to the image, eg. "prompt", "user_id", "user_name"
             for key, value in attributes.items():
-                metadata.add_text(key, str(value))
+                chunks[key] = str(value)
+        return chunks
+
+    @staticmethod
+    def encode(image: Image, user_config: dict, attributes: dict = None):
+        metadata = PngImagePlugin.PngInfo()
+        for key, value in ImageMetadata.text_chunks(user_config, attributes).items():
+            metadata.add_text(key, value)
         # Save into a buffer:
         buffered = BytesIO()
         image.save(buffered, format="PNG", pnginfo=metadata)
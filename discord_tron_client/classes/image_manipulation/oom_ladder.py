@@ -0,0 +1,203 @@
+import gc, logging
+from typing import Callable, Optional, TypeVar
+from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.cost_model import CostModel
+
+try:
+    from torch.cuda import OutOfMemoryError
+except Exception:
+    OutOfMemoryError = None
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+# Each rung keeps every degradation of the rungs before it.
+FULL = "full"
+SMALLER_BATCH = "smaller_batch"
+VAE_TILING = "vae_tiling"
+MODEL_OFFLOAD = "model_cpu_offload"
+SEQUENTIAL_OFFLOAD = "sequential_cpu_offload"
+CAPPED_RESOLUTION = "capped_resolution"
+RUNGS = (
+    FULL,
+    SMALLER_BATCH,
+    VAE_TILING,
+    MODEL_OFFLOAD,
+    SEQUENTIAL_OFFLOAD,
+    CAPPED_RESOLUTION,
+)
+
+# The last rung halves the pixel count, keeping sides on a multiple of 64.
+CAPPED_SIDE_SCALE = 0.5**0.5
+MIN_CAPPED_SIDE = 256
+
+T = TypeVar("T")
+
+
+class SimulatedOutOfMemoryError(RuntimeError):
+    """Raised instead of running a rung that the injector marks as failing."""
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    if OutOfMemoryError is not None and isinstance(error, OutOfMemoryError):
+        return True
+    return "out of memory" in str(error).lower()
+
+
+def _cap_side(side: int) -> int:
+    return max(int(side * CAPPED_SIDE_SCALE) // 64 * 64, MIN_CAPPED_SIDE)
+
+
+class Degradation:
+    """The settings a rung runs the pipeline with."""
+
+    def __init__(
+        self,
+        rung: str,
+        batch_size: int,
+        side_x: int,
+        side_y: int,
+        tiling: bool = False,
+        offload: Optional[str] = None,
+    ):
+        self.rung = rung
+        self.batch_size = batch_size
+        self.side_x = side_x
+        self.side_y = side_y
+        self.tiling = tiling
+        # None, "model" or "sequential".
+        self.offload = offload
+
+    def __repr__(self):
+        return (
+            f"Degradation({self.rung}, batch={self.batch_size}, {self.side_x}x{self.side_y}, "
+            f"tiling={self.tiling}, offload={self.offload})"
+        )
+
+
+class OOMLadder:
+    """
+    Retries a pipeline call that ran out of GPU memory with progressively
+    cheaper settings: a batch of one, then VAE tiling and slicing, then
+    model CPU offload, then sequential offload, then a capped resolution.
+
+    The rung that worked is recorded in the cost model per (model,
+    resolution, batch), so the next job of that shape starts there instead
+    of failing its way up again, until the record expires and the full
+    settings are probed again (`oom_rung_ttl_seconds`).
+
+    `cleanup()` runs after every failed rung. `inject(rung)` returning True
+    makes that rung fail with a SimulatedOutOfMemoryError without running
+    it, so the ladder can be exercised without a GPU.
+    """
+
+    def __init__(
+        self,
+        cost_model: CostModel = None,
+        cleanup: Callable[[], None] = None,
+        inject: Callable[[str], bool] = None,
+    ):
+        self.cost_model = cost_model
+        self.cleanup = cleanup or self._default_cleanup
+        self.inject = inject
+
+    @staticmethod
+    def _default_cleanup():
+        gc.collect()
+        try:
+            import torch
+
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+    def degradation(
+        self, rung: str, batch_size: int, side_x: int, side_y: int
+    ) -> Degradation:
+        index = RUNGS.index(rung)
+        offload = None
+        if index >= RUNGS.index(SEQUENTIAL_OFFLOAD):
+            offload = "sequential"
+        elif index >= RUNGS.index(MODEL_OFFLOAD):
+            offload = "model"
+        capped = index >= RUNGS.index(CAPPED_RESOLUTION)
+        return Degradation(
+            rung,
+            batch_size=1 if index >= RUNGS.index(SMALLER_BATCH) else batch_size,
+            side_x=_cap_side(side_x) if capped else side_x,
+            side_y=_cap_side(side_y) if capped else side_y,
+            tiling=index >= RUNGS.index(VAE_TILING),
+            offload=offload,
+        )
+
+    def _applies(self, rung: str, batch_size: int, side_x: int, side_y: int) -> bool:
+        if rung == SMALLER_BATCH:
+            return batch_size > 1
+        if rung == CAPPED_RESOLUTION:
+            return (_cap_side(side_x), _cap_side(side_y)) != (side_x, side_y)
+        return True
+
+    def start_rung(self, model: str, side_x: int, side_y: int, batch_size: int) -> str:
+        if self.cost_model is None:
+            return FULL
+        rung = self.cost_model.oom_rung(
+            model, {"width": side_x, "height": side_y}, batch_size
+        )
+        return rung if rung in RUNGS else FULL
+
+    def run(
+        self,
+        attempt: Callable[[Degradation], T],
+        model: str,
+        side_x: int,
+        side_y: int,
+        batch_size: int = 1,
+        restore: Callable[[Degradation], None] = None,
+    ) -> T:
+        """
+        Call `attempt(degradation)` from the recorded starting rung upwards
+        until one does not run out of memory. `restore(degradation)` undoes
+        a rung's changes to the pipeline after every attempt. Errors other
+        than running out of memory propagate immediately, and the last
+        out-of-memory error propagates once every rung has failed.
+        """
+        start = self.start_rung(model, side_x, side_y, batch_size)
+        if start != FULL:
+            logger.info(f"Starting {model} at {side_x}x{side_y} on the {start} rung.")
+        last_error = None
+        for rung in RUNGS[RUNGS.index(start) :]:
+            if rung != start and not self._applies(rung, batch_size, side_x, side_y):
+                continue
+            degradation = self.degradation(rung, batch_size, side_x, side_y)
+            try:
+                if self.inject is not None and self.inject(rung):
+                    raise SimulatedOutOfMemoryError(
+                        f"Simulated CUDA out of memory on the {rung} rung."
+                    )
+                result = attempt(degradation)
+            except Exception as e:
+                if not is_out_of_memory(e):
+                    raise
+                last_error = e
+                logger.warning(f"Out of memory with {degradation}: {e}")
+                self.cleanup()
+                continue
+            finally:
+                if restore is not None:
+                    restore(degradation)
+            if rung != start and self.cost_model is not None:
+                self.cost_model.record_oom_rung(
+                    model, {"width": side_x, "height": side_y}, batch_size, rung
+                )
+            return result
+        raise last_error
+
+
+def build_oom_ladder(cost_model: CostModel = None, cleanup=None) -> OOMLadder:
+    simulated = set(config.get_config_value("simulate_oom_rungs", []))
+    return OOMLadder(
+        cost_model=cost_model,
+        cleanup=cleanup,
+        inject=(lambda rung: rung in simulated) if simulated else None,
+    )
@@ -1,93 +1,66 @@
-import logging, sys, torch, gc, traceback, time, asyncio, diffusers
+import logging, torch, gc, traceback, time, asyncio, diffusers
 from torch.cuda import OutOfMemoryError
-from tqdm import tqdm
+from contextlib import nullcontext
 from discord_tron_client.classes.app_config import AppConfig
 from discord_tron_client.classes.hardware import HardwareInfo
-from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.pixart import (
-    PixArtSigmaPipeline,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.z_image import (
-    ZImagePipeline,
-)
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.stable_cascade.pipeline_combined import (
-        StableCascadeCombinedPipeline,
-    )
-except Exception:
-    StableCascadeCombinedPipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.ace_step.pipeline import (
-        ACEStepPipeline,
-    )
-except Exception:
-    ACEStepPipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.flux2.pipeline import (
-        Flux2Pipeline,
-    )
-except Exception:
-    Flux2Pipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.kandinsky5_image.pipeline_kandinsky5_t2i import (
-        Kandinsky5T2IPipeline,
-    )
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.kandinsky5_image.pipeline_kandinsky5_i2i import (
-        Kandinsky5I2IPipeline,
-    )
-except Exception:
-    Kandinsky5T2IPipeline = None
-    Kandinsky5I2IPipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.kandinsky5_video.pipeline_kandinsky5_t2v import (
-        Kandinsky5T2VPipeline,
-    )
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.kandinsky5_video.pipeline_kandinsky5_i2v import (
-        Kandinsky5I2VPipeline,
-    )
-except Exception:
-    Kandinsky5T2VPipeline = None
-    Kandinsky5I2VPipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.cosmos.pipeline import (
-        Cosmos2TextToImagePipeline,
-    )
-except Exception:
-    Cosmos2TextToImagePipeline = None
-try:
-    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.wan.pipeline import (
-        WanPipeline,
-    )
-except Exception:
-    WanPipeline = None
-try:
-    from diffusers import Lumina2Pipeline, OmniGenPipeline
-except Exception:
-    Lumina2Pipeline = None
-    OmniGenPipeline = None
+from discord_tron_client.classes.cost_model import get_cost_model
+from discord_tron_client.classes.model_registry import get_model_registry
 from discord_tron_client.classes.image_manipulation.resolution import ResolutionManager
 from discord_tron_client.classes.image_manipulation import upscaler as upscaling_helper
 from discord_tron_client.classes.image_manipulation.prompt_manipulation import (
     PromptManipulation,
 )
-from discord_tron_client.classes.tqdm_capture import TqdmCapture
+from discord_tron_client.classes.image_manipulation.embedding_cache import (
+    get_embedding_cache,
+)
+from discord_tron_client.classes.image_manipulation.guidance import guidance_model
+from discord_tron_client.classes.image_manipulation.oom_ladder import (
+    SMALLER_BATCH,
+    build_oom_ladder,
+    is_out_of_memory,
+)
+from discord_tron_client.classes.progress_channel import ProgressChannel
 from discord_tron_client.classes.discord_progress_bar import DiscordProgressBar
 from discord_tron_client.message.discord import DiscordMessage
 from PIL import Image
 from discord_tron_client.classes.image_manipulation.metadata import ImageMetadata
+from discord_tron_client.classes.image_manipulation.image_encoder import (
+    encode_images_async,
+)
 from discord_tron_client.classes.image_manipulation.pipeline_runners import (
-    BasePipelineRunner,
-    Text2ImgPipelineRunner,
-    Img2ImgPipelineRunner,
-    SdxlBasePipelineRunner,
-    SdxlRefinerPipelineRunner,
-    KandinskyTwoTwoPipelineRunner,
-    DeepFloydPipelineRunner,
-    SD3PipelineRunner,
-    FluxPipelineRunner,
     runner_map,
 )
 
 hardware = HardwareInfo()
+registry = get_model_registry()
+
+# Pipelines whose runners accept a list of prompts and per-sample generators.
+BATCHABLE_PIPELINES = {
+    "StableDiffusionPipeline",
+    "StableDiffusionXLPipeline",
+    "StableDiffusion3Pipeline",
+    "FluxPipeline",
+    "SanaPipeline",
+    "AuraFlowPipeline",
+}
+
+
+def _first_rows(tensor, rows: int):
+    """The first `rows` rows of a batched embedding; None and shorter tensors pass through."""
+    if tensor is None or tensor.shape[0] <= rows:
+        return tensor
+    return tensor[:rows]
+
+
+class BatchItem:
+    """One job's share of a batched text2img call."""
+
+    def __init__(self, user_config: dict, prompt: str, negative_prompt: str = ""):
+        self.user_config = user_config
+        self.prompt = prompt
+        self.negative_prompt = negative_prompt
+        self.seed = None
+        self.images = None
 
 
 class PipelineRunner:
@@ -124,7 +97,7 @@ class PipelineRunner:
             progress_bar_length=20,
             discord_first_message=discord_msg,
         )
-        self.tqdm_capture = TqdmCapture(self.progress_bar, main_loop)
+        self.progress_channel = ProgressChannel(self.progress_bar, main_loop)
         self.websocket = websocket
         self.model_config = model_config
         self.prompt_manager = None
@@ -142,7 +115,7 @@ class PipelineRunner:
             progress_bar_length=20,
             discord_first_message=discord_msg,
         )
-        self.tqdm_capture = TqdmCapture(self.progress_bar, main_loop)
+        self.progress_channel = ProgressChannel(self.progress_bar, main_loop)
 
     async def _prepare_pipe_async(
         self,
@@ -235,29 +208,21 @@ class PipelineRunner:
             guidance_scale = min(float(guidance_scale), float(20))
 
             self.gpu_power_consumption = 0.0
+            self.gpu_energy_joules = None
+            self.progress_channel.begin()
             generator = self._get_generator(user_config=user_config)
-            # Strip the user_config piece from the prompt.
-            prompt = PromptManipulation.remove_duplicate_prompts(prompt, user_config)
             prompt_embed = None
             negative_embed = None
             pooled_embed = None
             negative_pooled_embed = None
-            positive_prompt = user_config.get("positive_prompt", None)
-            if positive_prompt is not None:
-                prompt = f"{prompt} {positive_prompt}"
-            user_style = user_config.get("style", None)
-            logging.debug(f"User prompt style: {user_style}")
-            if user_style is not None and user_style != "base":
-                prompt, negative_prompt = PromptManipulation.stylize_prompt(
-                    user_prompt=prompt,
-                    user_negative=negative_prompt,
-                    user_style=user_style,
-                )
+            prompt, negative_prompt = self._prepare_prompts(
+                prompt, negative_prompt, user_config
+            )
             if (
                 self.prompt_manager is not None
                 and not promptless_variation
                 and self.prompt_manager.should_enable(pipe, user_config)
-                and self.config.enable_compel()
+                and self.config.get_snapshot().enable_compel
             ):
                 embeddings = self.prompt_manager.process_long_prompt(
                     positive_prompt=prompt, negative_prompt=negative_prompt
@@ -275,16 +240,43 @@ class PipelineRunner:
                     raise ValueError(
                         f"Unexpected number of embeddings returned: {len(embeddings)}"
                     )
+                logging.debug(f"Prompt embedding cache: {get_embedding_cache().stats()}")
 
-            with torch.no_grad():
-                with tqdm(total=steps, ncols=100, file=self.tqdm_capture) as pbar:
-                    new_image = self._run_pipeline(
-                        pipe,
+            model_id = user_config.get("model", "")
+
+            def attempt(degradation):
+                self._apply_degradation(pipe, model_id, degradation)
+                # SDXL carries the batch in the embeddings rather than
+                # num_images_per_prompt, so a smaller batch needs fewer rows.
+                batch_embeds = [
+                    _first_rows(embed, degradation.batch_size)
+                    for embed in (
                         prompt_embed,
-                        side_x,
-                        side_y,
-                        steps,
                         negative_embed,
+                        pooled_embed,
+                        negative_pooled_embed,
+                    )
+                ]
+                with torch.no_grad(), self.progress_channel.attached(), guidance_model(
+                    model_id
+                ), self._profile(
+                    pipe,
+                    user_config,
+                    degradation.side_x,
+                    degradation.side_y,
+                    steps,
+                    batch=degradation.batch_size,
+                    # Offloaded runs would skew the memory fit.
+                    enabled=image is None and degradation.offload is None,
+                    tiling=degradation.tiling,
+                ):
+                    return self._run_pipeline(
+                        pipe,
+                        batch_embeds[0],
+                        degradation.side_x,
+                        degradation.side_y,
+                        steps,
+                        batch_embeds[1],
                         guidance_scale,
                         generator,
                         user_config,
@@ -293,16 +285,303 @@ class PipelineRunner:
                         upscaler,
                         positive_prompt=prompt,
                         negative_prompt=negative_prompt,
-                        pooled_embed=pooled_embed,
-                        negative_pooled_embed=negative_pooled_embed,
+                        pooled_embed=batch_embeds[2],
+                        negative_pooled_embed=batch_embeds[3],
+                        batch_size=degradation.batch_size,
                     )
-            self.gpu_power_consumption = self.tqdm_capture.gpu_power_consumption
+
+            try:
+                new_image = self._oom_ladder(model_id).run(
+                    attempt,
+                    model_id,
+                    side_x,
+                    side_y,
+                    batch_size=self.config.get_snapshot().maximum_batch_size,
+                    restore=lambda degradation: self.pipeline_manager.restore_pipeline_placement(
+                        model_id,
+                        vae_tiling=bool(user_config.get("enable_tiling", True)),
+                    ),
+                )
+            except Exception as e:
+                if not is_out_of_memory(e):
+                    raise
+                logging.warning(f"Out of memory on every rung of the OOM ladder: {e}")
+                self.pipeline_manager.delete_pipes()
+                raise Exception(
+                    "The GPU ran out of memory when generating your awesome image. Please try again with a lower size.."
+                )
             return new_image
         except Exception as e:
             logging.error(
                 f"Error while generating image: {e}\n{traceback.format_exc()}"
             )
             raise e
+        finally:
+            self._finish_progress()
+
+    def _finish_progress(self):
+        """Close the job's progress bar and settle its energy figures."""
+        self.progress_channel.finish()
+        self.gpu_power_consumption = self.progress_channel.gpu_power_consumption
+        self.gpu_energy_joules = self.progress_channel.gpu_energy_joules
+
+    def _profile(
+        self,
+        pipe,
+        user_config: dict,
+        side_x: int,
+        side_y: int,
+        steps: int,
+        batch: int = 1,
+        enabled: bool = True,
+        tiling: bool = False,
+    ):
+        """
+        Record the peak memory and wall time of a text2img call in the cost
+        model. `tiling` is set when the OOM ladder turned VAE tiling on.
+        """
+        if not enabled:
+            return nullcontext()
+        return get_cost_model().profile(
+            model=user_config.get("model", ""),
+            pipe_type=type(pipe).__name__,
+            width=side_x,
+            height=side_y,
+            batch=batch,
+            steps=int(float(steps)),
+            tiling=tiling or bool(user_config.get("enable_tiling", False)),
+        )
+
+    def _recover_memory(self, model_id: str):
+        """Free what we can before retrying a call that ran out of GPU memory."""
+        self.pipeline_manager.delete_pipes(keep_model=model_id)
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _oom_ladder(self, model_id: str):
+        return build_oom_ladder(
+            cost_model=get_cost_model(), cleanup=lambda: self._recover_memory(model_id)
+        )
+
+    def _apply_degradation(self, pipe, model_id: str, degradation):
+        if degradation.tiling and hasattr(pipe, "vae"):
+            pipe.vae.enable_tiling()
+            pipe.vae.enable_slicing()
+        if degradation.offload is not None:
+            self.pipeline_manager.offload_pipeline(
+                model_id, sequential=degradation.offload == "sequential"
+            )
+
+    def _prepare_prompts(self, prompt: str, negative_prompt: str, user_config: dict):
+        # Strip the user_config piece from the prompt.
+        prompt = PromptManipulation.remove_duplicate_prompts(prompt, user_config)
+        positive_prompt = user_config.get("positive_prompt", None)
+        if positive_prompt is not None:
+            prompt = f"{prompt} {positive_prompt}"
+        user_style = user_config.get("style", None)
+        logging.debug(f"User prompt style: {user_style}")
+        if user_style is not None and user_style != "base":
+            prompt, negative_prompt = PromptManipulation.stylize_prompt(
+                user_prompt=prompt,
+                user_negative=negative_prompt,
+                user_style=user_style,
+            )
+        return prompt, negative_prompt
+
+    def _get_latent_settings(
+        self, pipe, user_config: dict, steps: int, image_return_type: str = "pil"
+    ):
+        use_latent_result = user_config.get("latent_refiner", True)
+        denoising_start = None
+        if use_latent_result:
+            if user_config.get("refiner_strength", 0.5) > 1.0:
+                raise ValueError("refiner_strength must be between 0.0 and 1.0")
+
+            image_return_type = "latent"
+            if not type(pipe) in [
+                diffusers.StableDiffusionXLPipeline,
+                diffusers.StableDiffusionXLImg2ImgPipeline,
+            ]:
+                # We can't send latents directly from a non-SDXL pipeline into the SDXL refiner.
+                image_return_type = "pil"
+                denoising_start = None
+            else:
+                # Max inference steps are an inverse relationship of the refiner strength with the base steps.
+                denoising_start = 1 - user_config.get("refiner_strength", 0.5)
+                logging.debug(
+                    f"Final inference step: {denoising_start}, steps: {steps}"
+                )
+        return use_latent_result, image_return_type, denoising_start
+
+    def _get_pipeline_runner(
+        self, pipe, user_model: str, use_latent_result: bool, image_return_type: str
+    ):
+        """
+        Pick the runner for a pipeline, reusing the preserved runner when the
+        model has not changed. Some pipelines cannot hand latents to the SDXL
+        refiner, so the latent settings may be overridden too.
+        """
+        if (
+            getattr(self.pipeline_manager, "pipeline_runner", {}).get("model")
+            is not None
+            and getattr(self.pipeline_manager, "pipeline_runner", {}).get("runner")
+            is not None
+            and getattr(self.pipeline_manager, "pipeline_runner", {}).get("model")
+            == user_model
+        ):
+            logging.info("Using preserved pipeline_runner.")
+            pipeline_runner = getattr(
+                self.pipeline_manager, "pipeline_runner", {}
+            ).get("runner")
+        elif (
+            type(pipe) is diffusers.StableDiffusionXLPipeline
+            or "ptx0/s1" in user_model
+            or "stable-diffusion-xl" in user_model
+            or "-xl" in user_model
+        ):
+            pipeline_runner = runner_map["sdxl_base"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+        elif type(pipe) is diffusers.StableDiffusion3Pipeline:
+            pipeline_runner = runner_map["sd3"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+        elif registry.matches(pipe, "stable_cascade"):
+            pipeline_runner = runner_map["text2img"](pipeline=pipe)
+            use_latent_result = False
+            image_return_type = "pil"
+        elif registry.matches(pipe, "ace_step"):
+            pipeline_runner = runner_map["text2img"](pipeline=pipe)
+            use_latent_result = False
+            image_return_type = "pil"
+        elif registry.matches(pipe, "flux2"):
+            pipeline_runner = runner_map["flux2"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+            use_latent_result = False
+            image_return_type = "pil"
+        elif registry.matches(pipe, "z_image"):
+            pipeline_runner = runner_map["z_image"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+            use_latent_result = False
+            image_return_type = "pil"
+        elif registry.matches(pipe, "flux", exact=True):
+            from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.flux import (
+                FluxPipeline as FluxPipelineOverride,
+            )
+
+            pipe = FluxPipelineOverride(**pipe.components)
+            pipeline_runner = runner_map["flux"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+        elif registry.matches(pipe, "kandinsky5_image", "kandinsky5_i2i"):
+            pipeline_runner = runner_map["text2img"](pipeline=pipe)
+            use_latent_result = False
+            image_return_type = "pil"
+        elif registry.matches(pipe, "kandinsky5_video", "kandinsky5_i2v"):
+            pipeline_runner = runner_map["kandinsky5_video"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+            use_latent_result = False
+            image_return_type = "pil"
+        elif registry.matches(pipe, "cosmos"):
+            pipeline_runner = runner_map["text2img"](pipeline=pipe)
+            use_latent_result = False
+            image_return_type = "pil"
+        elif registry.matches(pipe, "wan"):
+            pipeline_runner = runner_map["wan"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+            use_latent_result = False
+            image_return_type = "pil"
+        elif registry.matches(pipe, "lumina2"):
+            pipeline_runner = runner_map["text2img"](pipeline=pipe)
+            use_latent_result = False
+            image_return_type = "pil"
+        elif registry.matches(pipe, "omnigen"):
+            pipeline_runner = runner_map["text2img"](pipeline=pipe)
+            use_latent_result = False
+            image_return_type = "pil"
+        elif registry.matches(pipe, "pixart", exact=True):
+            use_latent_result = False
+            pipeline_runner = runner_map["pixart"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+        elif registry.matches(pipe, "sana", exact=True):
+            pipeline_runner = runner_map["sana"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+            use_latent_result = False
+        elif registry.matches(pipe, "ltx", "ltx_image_to_video", exact=True):
+            pipeline_runner = runner_map["ltxvideo"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+            pipe.vae.enable_tiling()
+            pipe.vae.enable_slicing()
+            use_latent_result = False
+        elif registry.matches(pipe, "aura", exact=True):
+            pipeline_runner = runner_map["aura"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+        elif "ptx0/s2" in user_model or "xl-refiner" in user_model:
+            pipeline_runner = runner_map["sdxl_refiner"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+        elif "kandinsky-2-2" in user_model:
+            pipeline_runner = runner_map["kandinsky_2.2"](
+                pipeline=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+        elif "DeepFloyd" in user_model:
+            pipeline_runner = runner_map["deep_floyd"](
+                stage1=pipe,
+                pipeline_manager=self.pipeline_manager,
+                diffusion_manager=self,
+            )
+            # DeepFloyd pipeline handles all of this.
+            use_latent_result = False
+            image_return_type = "pil"
+        else:
+            logging.debug(f"Received type of pipeline: {type(pipe)}")
+            pipeline_runner = runner_map["text2img"](pipeline=pipe)
+        if (
+            getattr(self.pipeline_manager, "pipeline_runner", {}).get("model")
+            is None
+            or getattr(self.pipeline_manager, "pipeline_runner", {}).get("model")
+            != user_model
+        ):
+            if not hasattr(self.pipeline_manager, "pipeline_runner"):
+                setattr(self.pipeline_manager, "pipeline_runner", {})
+            self.pipeline_manager.pipeline_runner["model"] = user_model
+            self.pipeline_manager.pipeline_runner["runner"] = pipeline_runner
+        return pipe, pipeline_runner, use_latent_result, image_return_type
 
     def _run_pipeline(
         self,
@@ -323,196 +602,23 @@ class PipelineRunner:
         pooled_embed=None,
         image_return_type="pil",
         negative_pooled_embed=None,
+        batch_size: int = None,
     ):
-        original_stderr = sys.stderr
-        sys.stderr = self.tqdm_capture
-        batch_size = self.config.maximum_batch_size()
+        batch_size = batch_size or self.config.get_snapshot().maximum_batch_size
         try:
-            use_latent_result = user_config.get("latent_refiner", True)
-            denoising_start = None
             preprocessed_images = None
             user_model = user_config.get("model", "")
-            if use_latent_result:
-                if user_config.get("refiner_strength", 0.5) > 1.0:
-                    raise ValueError("refiner_strength must be between 0.0 and 1.0")
-
-                image_return_type = "latent"
-                if not type(pipe) in [
-                    diffusers.StableDiffusionXLPipeline,
-                    diffusers.StableDiffusionXLImg2ImgPipeline,
-                ]:
-                    # We can't send latents directly from a non-SDXL pipeline into the SDXL refiner.
-                    image_return_type = "pil"
-                    denoising_start = None
-                else:
-                    # Max inference steps are an inverse relationship of the refiner strength with the base steps.
-                    denoising_start = 1 - user_config.get("refiner_strength", 0.5)
-                    logging.debug(
-                        f"Final inference step: {denoising_start}, steps: {steps}"
-                    )
+            use_latent_result, image_return_type, denoising_start = (
+                self._get_latent_settings(pipe, user_config, steps, image_return_type)
+            )
             logging.info(
                 f"Running text2img with batch_size {batch_size} via model {user_model}."
             )
-            # text2img workflow
-            if (
-                getattr(self.pipeline_manager, "pipeline_runner", {}).get("model")
-                is not None
-                and getattr(self.pipeline_manager, "pipeline_runner", {}).get("runner")
-                is not None
-                and getattr(self.pipeline_manager, "pipeline_runner", {}).get("model")
-                == user_model
-            ):
-                logging.info("Using preserved pipeline_runner.")
-                pipeline_runner = getattr(
-                    self.pipeline_manager, "pipeline_runner", {}
-                ).get("runner")
-            elif (
-                type(pipe) is diffusers.StableDiffusionXLPipeline
-                or "ptx0/s1" in user_model
-                or "stable-diffusion-xl" in user_model
-                or "-xl" in user_model
-            ):
-                pipeline_runner = runner_map["sdxl_base"](
-                    pipeline=pipe,
-                    pipeline_manager=self.pipeline_manager,
-                    diffusion_manager=self,
-                )
-            elif type(pipe) is diffusers.StableDiffusion3Pipeline:
-                pipeline_runner = runner_map["sd3"](
-                    pipeline=pipe,
-                    pipeline_manager=self.pipeline_manager,
-                    diffusion_manager=self,
-                )
-            elif StableCascadeCombinedPipeline is not None and isinstance(
-                pipe, StableCascadeCombinedPipeline
-            ):
-                pipeline_runner = runner_map["text2img"](pipeline=pipe)
-                use_latent_result = False
-                image_return_type = "pil"
-            elif ACEStepPipeline is not None and isinstance(pipe, ACEStepPipeline):
-                pipeline_runner = runner_map["text2img"](pipeline=pipe)
-                use_latent_result = False
-                image_return_type = "pil"
-            elif Flux2Pipeline is not None and isinstance(pipe, Flux2Pipeline):
-                pipeline_runner = runner_map["flux2"](
-                    pipeline=pipe,
-                    pipeline_manager=self.pipeline_manager,
-                    diffusion_manager=self,
-                )
-                use_latent_result = False
-                image_return_type = "pil"
-            elif isinstance(pipe, ZImagePipeline):
-                pipeline_runner = runner_map["z_image"](
-                    pipeline=pipe,
-                    pipeline_manager=self.pipeline_manager,
-                    diffusion_manager=self,
-                )
-                use_latent_result = False
-                image_return_type = "pil"
-            elif type(pipe) is diffusers.FluxPipeline:
-                from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.flux import (
-                    FluxPipeline as FluxPipelineOverride,
-                )
-
-                pipe = FluxPipelineOverride(**pipe.components)
-                pipeline_runner = runner_map["flux"](
-                    pipeline=pipe,
-                    pipeline_manager=self.pipeline_manager,
-                    diffusion_manager=self,
-                )
-            elif (
-                (Kandinsky5T2IPipeline is not None and isinstance(pipe, Kandinsky5T2IPipeline))
-                or (Kandinsky5I2IPipeline is not None and isinstance(pipe, Kandinsky5I2IPipeline))
-                or (Kandinsky5T2VPipeline is not None and isinstance(pipe, Kandinsky5T2VPipeline))
-                or (Kandinsky5I2VPipeline is not None and isinstance(pipe, Kandinsky5I2VPipeline))
-            ):
-                pipeline_runner = runner_map["text2img"](pipeline=pipe)
-                use_latent_result = False
-                image_return_type = "pil"
-            elif Cosmos2TextToImagePipeline is not None and isinstance(
-                pipe, Cosmos2TextToImagePipeline
-            ):
-                pipeline_runner = runner_map["text2img"](pipeline=pipe)
-                use_latent_result = False
-                image_return_type = "pil"
-            elif WanPipeline is not None and isinstance(pipe, WanPipeline):
-                pipeline_runner = runner_map["text2img"](pipeline=pipe)
-                use_latent_result = False
-                image_return_type = "pil"
-            elif Lumina2Pipeline is not None and isinstance(pipe, Lumina2Pipeline):
-                pipeline_runner = runner_map["text2img"](pipeline=pipe)
-                use_latent_result = False
-                image_return_type = "pil"
-            elif OmniGenPipeline is not None and isinstance(pipe, OmniGenPipeline):
-                pipeline_runner = runner_map["text2img"](pipeline=pipe)
-                use_latent_result = False
-                image_return_type = "pil"
-            elif type(pipe) is PixArtSigmaPipeline:
-                use_latent_result = False
-                pipeline_runner = runner_map["pixart"](
-                    pipeline=pipe,
-                    pipeline_manager=self.pipeline_manager,
-                    diffusion_manager=self,
-                )
-            elif type(pipe) is diffusers.pipelines.SanaPipeline:
-                pipeline_runner = runner_map["sana"](
-                    pipeline=pipe,
-                    pipeline_manager=self.pipeline_manager,
-                    diffusion_manager=self,
-                )
-                use_latent_result = False
-            elif (
-                type(pipe) is diffusers.pipelines.LTXPipeline
-                or type(pipe) is diffusers.pipelines.LTXImageToVideoPipeline
-            ):
-                pipeline_runner = runner_map["ltxvideo"](
-                    pipeline=pipe,
-                    pipeline_manager=self.pipeline_manager,
-                    diffusion_manager=self,
-                )
-                pipe.vae.enable_tiling()
-                pipe.vae.enable_slicing()
-                use_latent_result = False
-            elif type(pipe) is diffusers.pipelines.AuraFlowPipeline:
-                pipeline_runner = runner_map["aura"](
-                    pipeline=pipe,
-                    pipeline_manager=self.pipeline_manager,
-                    diffusion_manager=self,
-                )
-            elif "ptx0/s2" in user_model or "xl-refiner" in user_model:
-                pipeline_runner = runner_map["sdxl_refiner"](
-                    pipeline=pipe,
-                    pipeline_manager=self.pipeline_manager,
-                    diffusion_manager=self,
-                )
-            elif "kandinsky-2-2" in user_model:
-                pipeline_runner = runner_map["kandinsky_2.2"](
-                    pipeline=pipe,
-                    pipeline_manager=self.pipeline_manager,
-                    diffusion_manager=self,
-                )
-            elif "DeepFloyd" in user_model:
-                pipeline_runner = runner_map["deep_floyd"](
-                    stage1=pipe,
-                    pipeline_manager=self.pipeline_manager,
-                    diffusion_manager=self,
+            pipe, pipeline_runner, use_latent_result, image_return_type = (
+                self._get_pipeline_runner(
+                    pipe, user_model, use_latent_result, image_return_type
                 )
-                # DeepFloyd pipeline handles all of this.
-                use_latent_result = False
-                image_return_type = "pil"
-            else:
-                logging.debug(f"Received type of pipeline: {type(pipe)}")
-                pipeline_runner = runner_map["text2img"](pipeline=pipe)
-            if (
-                getattr(self.pipeline_manager, "pipeline_runner", {}).get("model")
-                is None
-                or getattr(self.pipeline_manager, "pipeline_runner", {}).get("model")
-                != user_model
-            ):
-                if not hasattr(self.pipeline_manager, "pipeline_runner"):
-                    setattr(self.pipeline_manager, "pipeline_runner", {})
-                self.pipeline_manager.pipeline_runner["model"] = user_model
-                self.pipeline_manager.pipeline_runner["runner"] = pipeline_runner
+            )
             if image is None:
                 preprocessed_images = pipeline_runner(
                     prompt=positive_prompt,
@@ -534,9 +640,12 @@ class PipelineRunner:
                 )
 
                 if type(preprocessed_images) is str:
-                    # probably is a file path
-
-                    return preprocessed_images
+                    # Video and audio runners return the path of the encoded file.
+                    return (
+                        preprocessed_images,
+                        positive_prompt,
+                        self._image_params(guidance_scale, user_config),
+                    )
                 if use_latent_result:
                     logging.info(
                         f"Putting text2img latents into refiner at {(denoising_start or 1) * 100} percent of the way through the process.."
@@ -609,19 +718,15 @@ class PipelineRunner:
                 raise Exception(
                     "Invalid combination of parameters for image generation"
                 )
-        except OutOfMemoryError as e:
-            logging.warn(f"Out of memory error: {e}")
-            self.pipeline_manager.delete_pipes()
-            raise Exception(
-                "The GPU ran out of memory when generating your awesome image. Please try again with a lower size.."
-            )
+        except OutOfMemoryError:
+            # The OOM ladder in _generate_image_with_pipe decides what happens next.
+            raise
         except Exception as e:
             logging.error(
                 f"Error while generating image: {e}\n{traceback.format_exc()}"
             )
             raise e
         finally:
-            sys.stderr = original_stderr
             # This should help with sporadic GPU memory errors.
             # https://github.com/damian0815/compel/issues/24
             try:
@@ -636,14 +741,19 @@ class PipelineRunner:
         if should_upscale:
             logging.info("Upscaling image using Real-ESRGAN!")
             new_image = self.pipeline_manager.upscale_image(new_image)
-        image_params = {
+        # Encoding happens off the GPU lane, see generate_image().
+        return (
+            new_image,
+            positive_prompt,
+            self._image_params(guidance_scale, user_config),
+        )
+
+    def _image_params(self, guidance_scale: float, user_config: dict) -> dict:
+        return {
             "seed": self.seed,
             "guidance_scaling": guidance_scale,
             "strength": user_config.get("strength", 0.5),
         }
-        return self._encode_output(
-            new_image, positive_prompt, user_config, image_params
-        )
 
     async def generate_image(
         self,
@@ -678,7 +788,7 @@ class PipelineRunner:
 
         # The final cap-off attempt to clamp memory use.
         side_x, side_y = self._get_maximum_generation_res(side_x, side_y)
-        new_image = await self._generate_image_with_pipe_async(
+        new_image, positive_prompt, image_params = await self._generate_image_with_pipe_async(
             pipe,
             prompt,
             side_x,
@@ -693,7 +803,188 @@ class PipelineRunner:
         # Get the rescaled resolution
         self.pipeline_manager.clear_cuda_cache()
 
-        return new_image
+        return await self._encode_output(
+            new_image, positive_prompt, self.user_config, image_params
+        )
+
+    async def generate_batch(
+        self,
+        items: list,
+        model_id: str,
+        side_x: int,
+        side_y: int,
+        steps: int,
+    ) -> bool:
+        """
+        Run several compatible text2img jobs as one pipeline call, with a
+        generator per sample. Each item receives its own encoded images and
+        seed. Returns False without generating anything when the pipeline
+        cannot be batched.
+        """
+        if self.config.is_ollama_enabled():
+            try:
+                AppConfig.get_ollama_runtime().prepare_for_diffusion()
+            except Exception as exc:
+                logging.warning(f"Failed preparing GPU for diffusion by unloading Ollama: {exc}")
+        user_config = items[0].user_config
+        self.user_config = user_config
+        resolution = {"width": side_x, "height": side_y}
+        pipe = await self._prepare_pipe_async(user_config, resolution, model_id)
+        if type(pipe).__name__ not in BATCHABLE_PIPELINES:
+            logging.info(f"{type(pipe).__name__} does not support batched jobs.")
+            return False
+        self.prompt_manager = self._get_prompt_manager(pipe)
+        side_x, side_y = self._get_maximum_generation_res(side_x, side_y)
+        try:
+            outputs = await asyncio.get_event_loop().run_in_executor(
+                AppConfig.get_image_worker_thread(),
+                self._generate_batch_with_pipe,
+                pipe,
+                items,
+                side_x,
+                side_y,
+                steps,
+            )
+        except Exception as e:
+            if not is_out_of_memory(e):
+                raise
+            # The first rung of the OOM ladder: remember that this batch is too
+            # big, and let each job run (and climb the ladder) on its own.
+            logging.warning(f"Batch of {len(items)} jobs ran out of memory: {e}")
+            get_cost_model().record_oom_rung(
+                model_id,
+                user_config.get("resolution", resolution),
+                len(items) * self.config.get_snapshot().maximum_batch_size,
+                SMALLER_BATCH,
+            )
+            await asyncio.get_event_loop().run_in_executor(
+                AppConfig.get_image_worker_thread(), self._recover_memory, model_id
+            )
+            return False
+        self.pipeline_manager.clear_cuda_cache()
+        for item, (images, prompt, image_params) in zip(items, outputs):
+            item.seed = image_params["seed"]
+            item.images = await self._encode_output(
+                images, prompt, item.user_config, image_params
+            )
+        return True
+
+    def _generate_batch_with_pipe(
+        self, pipe, items: list, side_x: int, side_y: int, steps: int
+    ):
+        batch_size = self.config.get_snapshot().maximum_batch_size
+        user_config = items[0].user_config
+        user_model = user_config.get("model", "")
+        guidance_scale = min(float(user_config.get("guidance_scaling", 7.5)), float(20))
+        self.gpu_power_consumption = 0.0
+        self.gpu_energy_joules = None
+        prompt_embed = None
+        negative_embed = None
+        pooled_embed = None
+        negative_pooled_embed = None
+        outputs = []
+        self.progress_channel.begin()
+        try:
+            prompts, negative_prompts, seeds, generators = [], [], [], []
+            for item in items:
+                prompt, negative_prompt = self._prepare_prompts(
+                    item.prompt, item.negative_prompt, item.user_config
+                )
+                prompts.append(prompt)
+                negative_prompts.append(negative_prompt)
+                # The first sample matches what an unbatched job with this seed draws.
+                generators.append(self._get_generator(user_config=item.user_config))
+                seeds.append(self.seed)
+                generators.extend(
+                    torch.Generator(device="cpu").manual_seed(int(self.seed) + index)
+                    for index in range(1, batch_size)
+                )
+            if (
+                self.prompt_manager is not None
+                and self.prompt_manager.should_enable(pipe, user_config)
+                and self.config.get_snapshot().enable_compel
+            ):
+                embeddings = self.prompt_manager.process_long_prompts(
+                    prompts, negative_prompts
+                )
+                prompt_embed, negative_embed = embeddings[0], embeddings[1]
+                if len(embeddings) == 4:
+                    pooled_embed, negative_pooled_embed = embeddings[2], embeddings[3]
+            use_latent_result, image_return_type, denoising_start = (
+                self._get_latent_settings(pipe, user_config, steps)
+            )
+            pipe, pipeline_runner, use_latent_result, image_return_type = (
+                self._get_pipeline_runner(
+                    pipe, user_model, use_latent_result, image_return_type
+                )
+            )
+            logging.info(
+                f"Running batched text2img for {len(items)} jobs with batch_size {batch_size} via model {user_model}."
+            )
+            with torch.no_grad(), self.progress_channel.attached(), guidance_model(
+                user_model
+            ):
+                # Only the base call is profiled; the refiner, ControlNet and
+                # hires passes below would skew the text2img cost samples.
+                with self._profile(
+                    pipe,
+                    user_config,
+                    side_x,
+                    side_y,
+                    steps,
+                    batch=len(items) * batch_size,
+                ):
+                    images = pipeline_runner(
+                        prompt=prompts,
+                        negative_prompt=negative_prompts,
+                        user_config=user_config,
+                        prompt_embeds=prompt_embed,
+                        negative_prompt_embeds=negative_embed,
+                        pooled_prompt_embeds=pooled_embed,
+                        negative_pooled_prompt_embeds=negative_pooled_embed,
+                        num_images_per_prompt=batch_size,
+                        height=side_y,
+                        width=side_x,
+                        num_inference_steps=int(float(steps)),
+                        denoising_end=denoising_start,
+                        guidance_rescale=float(
+                            user_config.get("guidance_rescale", 0.3)
+                        ),
+                        guidance_scale=float(guidance_scale),
+                        output_type=image_return_type,
+                        generator=generators,
+                    )
+                # Outputs are grouped by prompt, so each job owns a contiguous slice.
+                for index, item in enumerate(items):
+                    self.seed = seeds[index]
+                    job_images = images[index * batch_size : (index + 1) * batch_size]
+                    if use_latent_result:
+                        job_images = self._refiner_pipeline(
+                            images=job_images,
+                            user_config=item.user_config,
+                            prompt=prompts[index],
+                            negative_prompt=negative_prompts[index],
+                            denoising_start=denoising_start,
+                        )
+                    job_images = self._controlnet_all_images(
+                        preprocessed_images=list(job_images),
+                        user_config=item.user_config,
+                        generator=generators[index * batch_size],
+                    )
+                    if item.user_config.get("hires_fix", False):
+                        job_images = self.pipeline_manager.upscale_image(job_images)
+                    image_params = {
+                        "seed": seeds[index],
+                        "guidance_scaling": guidance_scale,
+                        "strength": item.user_config.get("strength", 0.5),
+                    }
+                    outputs.append((job_images, prompts[index], image_params))
+        finally:
+            del prompt_embed
+            del negative_embed
+            gc.collect()
+            self._finish_progress()
+        return outputs
 
     def _get_generator(self, user_config: dict, override_seed: int = None):
         if override_seed is None:
@@ -747,46 +1038,72 @@ class PipelineRunner:
         img = input_image.resize((W, H), resample=Image.BICUBIC)
         return img
 
-    def _controlnet_pipeline(
+    def _tile_engine(self, pipe, generator):
+        return upscaling_helper.TileEngine(
+            pipe,
+            generator,
+            tile_size=self.config.get_config_value("tile_size", 1024),
+            overlap=self.config.get_config_value("tile_overlap", 128),
+            batch_size=self.config.get_config_value("tile_batch_size", 4),
+        )
+
+    def _controlnet_images(
         self,
-        image: Image,
+        images: list,
         user_config: dict,
         pipe,
         generator,
         prompt: str = None,
         negative_prompt: str = None,
         controlnet_strength: float = None,
-    ):
-        # Get the image width/height from 'image' if it's provided
-        logging.info(f"Running promptless variation with image.size {image.size}.")
-        width, height = image.size
-        if width != 1024 or height != 1024:
-            # If neither width nor height is 1024, resize the image so that one is, while
-            # maintaining the aspect ratio.
-            image = self._resize_for_condition_image(input_image=image, resolution=1024)
+    ) -> list:
+        """Run the ControlNet tile pipeline over every image, tiles batched together."""
+        conditioned = []
+        for image in images:
+            width, height = image.size
+            if width != 1024 or height != 1024:
+                # If neither width nor height is 1024, resize the image so that one is, while
+                # maintaining the aspect ratio.
+                image = self._resize_for_condition_image(
+                    input_image=image, resolution=1024
+                )
+            conditioned.append(image)
         if prompt is None:
             prompt = user_config["tile_positive"]
             negative_prompt = user_config["tile_negative"]
-        prompt_embed, negative_embed = None, None
         # if self.config.enable_compel():
         #     controlnet_prompt_manager = self._get_prompt_manager(pipe)
         #     prompt_embed, negative_embed = controlnet_prompt_manager.process_long_prompt(
         #         positive_prompt=prompt, negative_prompt=negative_prompt
         #     )
-        new_image = pipe(
-            # prompt_embeds=prompt_embed,
-            # negative_prompt_embeds=negative_embed,
+        return self._tile_engine(pipe, generator).run(
+            conditioned,
             prompt=prompt,
             negative_prompt=negative_prompt,
-            image=image,
-            controlnet_conditioning_image=image,
-            width=image.size[0],
-            height=image.size[1],
             strength=controlnet_strength,
-            generator=generator,
             num_inference_steps=user_config.get("tile_steps", 32),
-        ).images[0]
-        return new_image
+        )
+
+    def _controlnet_pipeline(
+        self,
+        image: Image,
+        user_config: dict,
+        pipe,
+        generator,
+        prompt: str = None,
+        negative_prompt: str = None,
+        controlnet_strength: float = None,
+    ):
+        logging.info(f"Running promptless variation with image.size {image.size}.")
+        return self._controlnet_images(
+            [image],
+            user_config,
+            pipe,
+            generator,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            controlnet_strength=controlnet_strength,
+        )[0]
 
     def _refiner_pipeline(
         self,
@@ -868,31 +1185,28 @@ class PipelineRunner:
             # Zero strength = Zero CTU.
             return preprocessed_images
 
-        idx = 0
         controlnet_pipe = self.pipeline_manager.get_controlnet_pipe()
-        for image in preprocessed_images:
-            preprocessed_images[idx] = self._controlnet_pipeline(
-                image=image,
-                user_config=user_config,
-                pipe=controlnet_pipe,
-                generator=generator,
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                controlnet_strength=controlnet_strength,
-            )
-            gc.collect()
-            idx += 1
+        images = self._controlnet_images(
+            list(preprocessed_images),
+            user_config=user_config,
+            pipe=controlnet_pipe,
+            generator=generator,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            controlnet_strength=controlnet_strength,
+        )
         del controlnet_pipe
-        return preprocessed_images
+        gc.collect()
+        return images
 
-    def _encode_image_metadata(self, image: Image, prompt, user_config, image_params):
+    def _image_attributes(self, prompt, user_config, image_params):
         model_id = user_config.get("model", "unknown")
         sampler_string = self.pipeline_manager.last_pipe_scheduler.get(
             model_id, "unknown"
         )
         # Remove "DiscreteScheduler" from the string:
         sampler_string = sampler_string.replace("DiscreteScheduler", "")
-        attributes = {
+        return {
             "prompt": prompt,
             "original_user": str(user_config["user_id"]),
             "guidance_scaling": str(image_params.get("guidance_scaling", 7.5)),
@@ -905,27 +1219,45 @@ class PipelineRunner:
             ).get("last_modified", "unknown"),
             "sampler": sampler_string,
         }
-        if not user_config.get("encode_metadata", True) or not hasattr(image, "save"):
-            return image
-        return ImageMetadata.encode(image, user_config, attributes)
 
-    def _encode_images_metadata(
+    async def _encode_image_metadata(
+        self, image: Image, prompt, user_config, image_params
+    ):
+        return (
+            await self._encode_images_metadata(
+                [image], prompt, user_config, image_params
+            )
+        )[0]
+
+    async def _encode_images_metadata(
         self, images: list, prompt, user_config, image_params: dict = {}
     ):
-        idx = 0
+        """
+        Compress the finished images once, with their metadata, into
+        EncodedImage objects that are uploaded as-is. This runs on the encode
+        process pool, leaving the GPU lane free.
+        """
         for image in images:
             if not hasattr(image, "save"):
                 logging.warning(f"Returning un-processable image: {type(image)}")
                 return images
-            images[idx] = self._encode_image_metadata(
-                image, prompt, user_config, image_params
-            )
-            idx += 1
-        return images
+        if not user_config.get("encode_metadata", True):
+            return images
+        metadata = ImageMetadata.text_chunks(
+            user_config, self._image_attributes(prompt, user_config, image_params)
+        )
+        return await encode_images_async(images, [metadata] * len(images))
 
-    def _encode_output(self, output, prompt, user_config, image_params: dict = {}):
+    async def _encode_output(
+        self, output, prompt, user_config, image_params: dict = {}
+    ):
+        if type(output) is str:
+            # A video or audio file that the runner already encoded.
+            return output
         if type(output) == list:
-            return self._encode_images_metadata(
+            return await self._encode_images_metadata(
                 output, prompt, user_config, image_params
             )
-        return self._encode_image_metadata(output, prompt, user_config, image_params)
+        return await self._encode_image_metadata(
+            output, prompt, user_config, image_params
+        )
@@ -1,78 +1,17 @@
 from discord_tron_client.classes.image_manipulation.pipeline_runners.base_runner import (
     BasePipelineRunner,
 )
-from discord_tron_client.classes.image_manipulation.pipeline_runners.text2img import (
-    Text2ImgPipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.img2img import (
-    Img2ImgPipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.sdxl_base import (
-    SdxlBasePipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.sdxl_refiner import (
-    SdxlRefinerPipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.kandinsky_2_2 import (
-    KandinskyTwoTwoPipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.deep_floyd import (
-    DeepFloydPipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.sd3_runner import (
-    SD3PipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.sana_runner import (
-    SanaPipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.aura import (
-    AuraPipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.pixart import (
-    PixArtPipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.flux import (
-    FluxPipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.ltxvideo import (
-    LtxVideoPipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.extra import (
-    StableCascadePipelineRunner,
-    Flux2PipelineRunner,
-    Kandinsky5ImagePipelineRunner,
-    Kandinsky5VideoPipelineRunner,
-    CosmosPipelineRunner,
-    WanPipelineRunner,
-    Lumina2PipelineRunner,
-    OmniGenPipelineRunner,
-    ACEStepPipelineRunner,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.z_image import (
-    ZImagePipelineRunner,
-)
+from discord_tron_client.classes.model_registry import get_model_registry
+
+# Runner modules (and the pipeline overrides they pull in) are imported on first lookup.
+runner_map = get_model_registry().mapping("runner")
+
 
-runner_map = {
-    "text2img": Text2ImgPipelineRunner,
-    "img2img": Img2ImgPipelineRunner,
-    "sdxl_base": SdxlBasePipelineRunner,
-    "sdxl_refiner": SdxlRefinerPipelineRunner,
-    "kandinsky_2.2": KandinskyTwoTwoPipelineRunner,
-    "deep_floyd": DeepFloydPipelineRunner,
-    "sd3": SD3PipelineRunner,
-    "sana": SanaPipelineRunner,
-    "pixart": PixArtPipelineRunner,
-    "aura": AuraPipelineRunner,
-    "flux": FluxPipelineRunner,
-    "ltxvideo": LtxVideoPipelineRunner,
-    "z_image": ZImagePipelineRunner,
-    "stable_cascade": StableCascadePipelineRunner,
-    "flux2": Flux2PipelineRunner,
-    "kandinsky5_image": Kandinsky5ImagePipelineRunner,
-    "kandinsky5_video": Kandinsky5VideoPipelineRunner,
-    "cosmos": CosmosPipelineRunner,
-    "wan": WanPipelineRunner,
-    "lumina2": Lumina2PipelineRunner,
-    "omnigen": OmniGenPipelineRunner,
-    "ace_step": ACEStepPipelineRunner,
-}
+def __getattr__(name: str):
+    # Keeps `from ...pipeline_runners import FluxPipelineRunner` working without eager imports.
+    registry = get_model_registry()
+    for family in registry.families("runner"):
+        entry_point = registry.entry_points["runner"][family]
+        if isinstance(entry_point, str) and entry_point.endswith(f":{name}"):
+            return registry.resolve("runner", family)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
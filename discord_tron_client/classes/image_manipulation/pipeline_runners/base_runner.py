@@ -1,8 +1,22 @@
 from PIL import Image
 from diffusers import DiffusionPipeline
-import torch, logging, gc, re, os
+import torch, logging, gc, re, os, time
 from discord_tron_client.classes.app_config import AppConfig
 from discord_tron_client.classes.hardware import HardwareInfo
+from discord_tron_client.classes.image_manipulation.adapter_cache import (
+    ADAPTER_COMPONENTS,
+    apply_deltas,
+    combination_key,
+    get_adapter_cache,
+    lora_deltas,
+)
+from discord_tron_client.classes.image_manipulation.embedding_cache import (
+    TEXT_ENCODER_COMPONENTS,
+    get_embedding_cache,
+)
+from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.step_cache import (
+    user_thresholds,
+)
 from huggingface_hub import hf_hub_download
 
 config = AppConfig()
@@ -14,6 +28,9 @@ class BasePipelineRunner:
         self.generation_time = None
         self.keep_fused_loaded = False
         self.loaded_adapters = {}
+        # The cached fused delta applied to the weights, if any. Held here so
+        # it can be removed even after the cache evicts it.
+        self.fused_delta = None
         self.pipeline = None
         self.pipeline_manager = None
         self.diffusion_manager = None
@@ -99,6 +116,25 @@ class BasePipelineRunner:
 
         return prompts[0] if len(prompts) == 1 else prompts, parameters
 
+    def _step_cache_settings(self, user_config: dict, parameters: dict) -> tuple:
+        """
+        Whether to cache transformer steps and at which threshold, from the
+        `--teacache` and `--teacache_distance` prompt parameters or the user
+        config. The parameters are removed so the pipeline never sees them.
+
+        Returns (enabled, threshold). A prompt's distance applies to whichever
+        model runs; the user config's are per model, see `user_thresholds`.
+        """
+        user_config = user_config or {}
+        enabled = bool(user_config.get("enable_teacache", False))
+        for name in ("teacache", "enable_teacache"):
+            if name in parameters:
+                enabled = parameters.pop(name) not in (False, "false", "0")
+        threshold = parameters.pop("teacache_distance", None)
+        if threshold not in (None, True):
+            return enabled, float(threshold)
+        return enabled, user_thresholds(user_config)
+
     def download_adapter(self, adapter_type: str, adapter_path: str):
         """download from huggingface hub if the adapter_type is not eg. lora"""
 
@@ -126,6 +162,68 @@ class BasePipelineRunner:
             .replace(" ", "_")
         )
 
+    def _read_adapter(self, adapter_type: str, adapter_path: str) -> dict:
+        from safetensors.torch import load_file
+
+        if os.path.isfile(adapter_path):
+            path_to_adapter = adapter_path
+        elif os.path.isdir(adapter_path):
+            path_to_adapter = os.path.join(
+                adapter_path, "pytorch_lora_weights.safetensors"
+            )
+        else:
+            path_to_adapter = self.download_adapter(adapter_type, adapter_path)
+        return load_file(path_to_adapter)
+
+    def adapter_weights(self, adapter_type: str, adapter_path: str) -> dict:
+        """The adapter's state dict, from host memory after the first load."""
+        return get_adapter_cache().state_dict(
+            adapter_type,
+            adapter_path,
+            lambda: self._read_adapter(adapter_type, adapter_path),
+        )
+
+    def requested_adapters(self, user_config: dict, model_prefix: str = "model") -> dict:
+        """The adapters a user config asks for, by clean adapter name."""
+        requested = {}
+        if type(user_config) is not dict:
+            return requested
+        for i in range(1, 11, 1):
+            user_adapter = user_config.get(f"{model_prefix}_adapter_{i}", None)
+            if user_adapter is None or user_adapter == "":
+                continue
+            # <path>, <type>:<path> or <type>:<path>:<strength>
+            pieces = user_adapter.split(":")
+            adapter_strength = 1.0
+            adapter_type = "lora"
+            if len(pieces) == 1:
+                adapter_path = pieces[0]
+            elif len(pieces) == 2:
+                adapter_type, adapter_path = pieces
+            elif len(pieces) == 3:
+                adapter_type, adapter_path, adapter_strength = pieces
+            else:
+                logging.error(f"Could not parse adapter {user_adapter}")
+                continue
+            try:
+                adapter_strength = float(adapter_strength)
+            except ValueError:
+                logging.error(f"Invalid strength for adapter {user_adapter}")
+                continue
+            requested[self.clean_adapter_name(adapter_path)] = {
+                "adapter_type": adapter_type,
+                "adapter_path": adapter_path,
+                "adapter_strength": adapter_strength,
+            }
+        return requested
+
+    @staticmethod
+    def _same_adapter(loaded: dict, requested: dict) -> bool:
+        return loaded is not None and all(
+            loaded.get(key) == requested[key]
+            for key in ("adapter_type", "adapter_path", "adapter_strength")
+        )
+
     def load_adapter(
         self,
         adapter_type: str,
@@ -133,47 +231,39 @@ class BasePipelineRunner:
         adapter_strength: float = 1.0,
         fuse_adapter: bool = False,
     ):
-        """load the adapter from the path"""
+        """load the adapter from the host memory cache, or the path"""
         # remove / and other chars from the adapter name
         clean_adapter_name = self.clean_adapter_name(adapter_path)
         lycoris_wrapper = None
         if clean_adapter_name in self.loaded_adapters:
-            if (
-                self.loaded_adapters[clean_adapter_name]["adapter_strength"]
-                == adapter_strength
-            ):
-                logging.info(f"Adapter {clean_adapter_name} is already loaded.")
-                return None
-            else:
-                # we have to unload it first
-                logging.info(
-                    f"Adapter {clean_adapter_name} is already loaded with different strength. Unloading it first."
-                )
-                self.clear_adapters(user_config=None)
+            logging.info(f"Adapter {clean_adapter_name} is already loaded.")
+            return None
         logging.info(f"Loading adapter: {clean_adapter_name}")
         logging.info(f"Previously-loaded adapters: {self.loaded_adapters.keys()}")
+        state_dict = self.adapter_weights(adapter_type, adapter_path)
         if adapter_type == "lora":
             self.pipeline.load_lora_weights(
-                pretrained_model_name_or_path_or_dict=adapter_path,
+                # The loader may pop keys, so it gets its own dict.
+                pretrained_model_name_or_path_or_dict=dict(state_dict),
                 adapter_name=clean_adapter_name,
-                weight_name="pytorch_lora_weights.safetensors",
             )
             if fuse_adapter:
                 self.pipeline.fuse_lora(
                     adapter_names=[clean_adapter_name], lora_scale=adapter_strength
                 )
+            # LoRAs may patch the text encoders, so their cached embeddings are stale.
+            get_embedding_cache().invalidate_pipeline(self.pipeline)
         if adapter_type == "lycoris":
             from lycoris import create_lycoris_from_weights
 
             model_to_patch = getattr(
                 self.pipeline, "transformer", getattr(self.pipeline, "unet", None)
             )
-            path_to_adapter = self.download_adapter(adapter_type, adapter_path)
-            adapter_filename = "pytorch_lora_weights.safetensors"
             lycoris_wrapper, _ = create_lycoris_from_weights(
                 multiplier=float(adapter_strength),
-                file=path_to_adapter,
+                file=None,
                 module=model_to_patch,
+                weights_sd=state_dict,
             )
             if fuse_adapter:
                 lycoris_wrapper.merge_to(adapter_strength)
@@ -194,58 +284,76 @@ class BasePipelineRunner:
             "lycoris_wrapper": lycoris_wrapper,
         }
 
-    def clear_adapters(self, user_config: dict = None):
-        """remove any loaded_adapters from the pipeline"""
+    def _remove_lycoris(self, clean_adapter_name: str, config: dict):
+        lycoris_wrapper = config.get("lycoris_wrapper")
+        if not lycoris_wrapper:
+            logging.error(f"Failed to clear adapter {clean_adapter_name}")
+            return
+        if config.get("is_fused", False):
+            logging.info(
+                f"De-fusing the Lycoris wrapper {clean_adapter_name} by merging in at -1 strength. keep_fused_loaded={self.keep_fused_loaded}"
+            )
+            lycoris_wrapper.merge_to(config.get("adapter_strength", 1.0) * -1)
+        else:
+            logging.debug(f"Restoring lycoris wrapper for {clean_adapter_name}")
+        lycoris_wrapper.restore()
+        # The weights live on in the adapter cache; the wrapper's copy can go.
+        lycoris_wrapper.to("meta")
+
+    def _remove_fused_delta(self):
+        touched = apply_deltas(self.pipeline, self.fused_delta, sign=-1.0)
+        if touched & set(TEXT_ENCODER_COMPONENTS):
+            get_embedding_cache().invalidate_pipeline(self.pipeline)
+        self.fused_delta = None
+        self.loaded_adapters.clear()
+
+    def clear_adapters(self, user_config: dict = None, model_prefix: str = "model"):
+        """remove the loaded_adapters that user_config does not ask for"""
         logging.info(f"Running clear_adapters with {type(user_config)} userconfig")
         if not self.loaded_adapters:
             logging.debug("No adapters loaded; skipping clear_adapters.")
             return
-        loaded_adapters = dict(self.loaded_adapters.items())
-        user_adapters_to_keep = set()
-        if user_config is not None and type(user_config) is dict:
-            for i in range(1, 11, 1):
-                user_adapter = user_config.get(f"model_adapter_{i}", None)
-                if user_adapter is None:
-                    continue
-                clean_user_adapter_name = self.clean_adapter_name(user_adapter)
-                if user_adapter != "":
-                    logging.info(f"Keeping user adapter {clean_user_adapter_name}")
-                    user_adapters_to_keep.add(clean_user_adapter_name)
+        requested = self.requested_adapters(user_config, model_prefix)
         adapters_to_remove = [
             clean_adapter_name
-            for clean_adapter_name in loaded_adapters.keys()
-            if clean_adapter_name not in user_adapters_to_keep
+            for clean_adapter_name, config in self.loaded_adapters.items()
+            if not self._same_adapter(config, requested.get(clean_adapter_name, {}))
         ]
         if not adapters_to_remove:
             logging.debug("Loaded adapters already match requested adapters; skipping unload.")
             return
-        for clean_adapter_name, config in loaded_adapters.items():
+        if self.fused_delta is not None:
+            # A cached delta is applied as a whole, so it is removed as a whole.
+            self._remove_fused_delta()
+            return
+        fused_loras = [
+            name
+            for name, config in self.loaded_adapters.items()
+            if config.get("adapter_type") == "lora" and config.get("is_fused", False)
+        ]
+        if fused_loras:
+            # Unfusing is all or nothing; kept adapters are fused again later.
+            self.pipeline.unfuse_lora()
+            for name in fused_loras:
+                self.loaded_adapters[name]["is_fused"] = False
+        lora_names = []
+        for clean_adapter_name in adapters_to_remove:
+            config = self.loaded_adapters.pop(clean_adapter_name)
             if not config:
                 logging.error(f"Adapter {clean_adapter_name} is missing config.")
                 continue
             if config.get("adapter_type") == "lora":
-                if config.get("is_fused", False):
-                    self.pipeline.unfuse_lora()
+                lora_names.append(clean_adapter_name)
             if config.get("adapter_type") == "lycoris":
-                lycoris_wrapper = config.get("lycoris_wrapper")
-                if not lycoris_wrapper:
-                    logging.error(f"Failed to clear adapter {clean_adapter_name}")
-                    continue
-                if config.get("is_fused", False):
-                    logging.info(
-                        f"De-fusing the Lycoris wrapper {clean_adapter_name} by merging in at -1 strength. keep_fused_loaded={self.keep_fused_loaded}"
-                    )
-                    lycoris_wrapper.merge_to(config.get("adapter_strength", 1.0) * -1)
-                    lycoris_wrapper.restore()
-                    lycoris_wrapper.to("meta")
-                    logging.debug("Sent lycoris to the abyss, meta tensors.")
-                else:
-                    logging.debug(f"Restoring lycoris wrapper for {clean_adapter_name}")
-                    lycoris_wrapper.restore()
-                    lycoris_wrapper.to("meta")
-                    logging.debug("Sent lycoris to the abyss, meta tensors.")
-        self.loaded_adapters.clear()
-        self.pipeline.unload_lora_weights()
+                self._remove_lycoris(clean_adapter_name, config)
+        if not any(
+            config.get("adapter_type") == "lora"
+            for config in self.loaded_adapters.values()
+        ):
+            self.pipeline.unload_lora_weights()
+        elif lora_names:
+            self.pipeline.delete_adapters(lora_names)
+        get_embedding_cache().invalidate_pipeline(self.pipeline)
 
     def apply_adapters(
         self,
@@ -253,32 +361,91 @@ class BasePipelineRunner:
         model_prefix: str = "model",
         fuse_adapters: bool = False,
     ):
-        # we will apply user LoRAs one at a time. the lora name can be split optionally with a : at the end so that <lora_path>:<strength> are set.
-        self.clear_adapters(user_config=user_config)
-        for i in range(1, 11, 1):
-            user_adapter = user_config.get(f"{model_prefix}_adapter_{i}", None)
-            if user_adapter is not None and user_adapter != "":
-                pieces = user_adapter.split(":")
-                adapter_strength = 1.0
-                adapter_type = "lora"
-                if len(pieces) == 1:
-                    adapter_path = pieces[0]
-                elif len(pieces) == 2:
-                    adapter_type, adapter_path = pieces
-                elif len(pieces) == 3:
-                    adapter_type, adapter_path, adapter_strength = pieces
-                try:
-                    adapter_strength = float(adapter_strength)
-                    self.load_adapter(
-                        adapter_type,
-                        adapter_path,
-                        adapter_strength,
-                        fuse_adapter=fuse_adapters,
+        """
+        Bring the loaded adapters in line with the user's, loading and
+        unloading only the difference. Adapter weights come from the host
+        memory cache, and combinations that are fused often are applied as
+        one cached weight delta.
+        """
+        started = time.monotonic()
+        self.clear_adapters(user_config=user_config, model_prefix=model_prefix)
+        requested = self.requested_adapters(user_config, model_prefix)
+        missing = [name for name in requested if name not in self.loaded_adapters]
+        lora_names = [
+            name
+            for name, spec in requested.items()
+            if spec["adapter_type"] == "lora"
+        ]
+        unfused = [
+            name
+            for name in lora_names
+            if not self.loaded_adapters.get(name, {}).get("is_fused", False)
+        ]
+        if not missing and not (fuse_adapters and unfused):
+            return
+        # Adapters patch weights in place, so shared components are copied first.
+        self.pipeline_manager.make_components_private(self.pipeline, ADAPTER_COMPONENTS)
+        cache = get_adapter_cache()
+        combination = combination_key(requested)
+        all_loras = len(lora_names) == len(requested)
+        if fuse_adapters and all_loras and not self.loaded_adapters:
+            deltas = cache.fused_delta(combination)
+            if deltas is not None:
+                touched = apply_deltas(self.pipeline, deltas)
+                if touched & set(TEXT_ENCODER_COMPONENTS):
+                    get_embedding_cache().invalidate_pipeline(self.pipeline)
+                for name, spec in requested.items():
+                    self.loaded_adapters[name] = dict(
+                        spec, is_fused=True, lycoris_wrapper=None
                     )
-                except Exception as e:
-                    import traceback
+                self.fused_delta = deltas
+                cache.record_swap(time.monotonic() - started)
+                logging.info(
+                    f"Applied the cached fused delta for {list(requested)} in {time.monotonic() - started:.2f}s."
+                )
+                return
+        for clean_adapter_name in missing:
+            spec = requested[clean_adapter_name]
+            try:
+                self.load_adapter(
+                    spec["adapter_type"],
+                    spec["adapter_path"],
+                    spec["adapter_strength"],
+                    # LoRAs are fused together below.
+                    fuse_adapter=fuse_adapters and spec["adapter_type"] != "lora",
+                )
+            except Exception as e:
+                import traceback
 
-                    logging.error(
-                        f"Failed to download adapter {adapter_path}: {e}, {traceback.format_exc()}"
-                    )
+                logging.error(
+                    f"Failed to download adapter {spec['adapter_path']}: {e}, {traceback.format_exc()}"
+                )
+                continue
+        loaded_loras = [name for name in lora_names if name in self.loaded_adapters]
+        if loaded_loras and not fuse_adapters:
+            self.pipeline.set_adapters(
+                loaded_loras,
+                adapter_weights=[
+                    self.loaded_adapters[name]["adapter_strength"] for name in loaded_loras
+                ],
+            )
+        elif loaded_loras:
+            for name in loaded_loras:
+                if self.loaded_adapters[name]["is_fused"]:
                     continue
+                self.pipeline.fuse_lora(
+                    adapter_names=[name],
+                    lora_scale=self.loaded_adapters[name]["adapter_strength"],
+                )
+                self.loaded_adapters[name]["is_fused"] = True
+            get_embedding_cache().invalidate_pipeline(self.pipeline)
+            if all_loras and len(loaded_loras) == len(requested) and cache.note_fused(
+                combination
+            ):
+                cache.store_fused_delta(
+                    combination, lora_deltas(self.pipeline, loaded_loras)
+                )
+        cache.record_swap(time.monotonic() - started)
+        logging.info(
+            f"Adapters {list(self.loaded_adapters)} ready in {time.monotonic() - started:.2f}s, cache {cache.stats()}"
+        )
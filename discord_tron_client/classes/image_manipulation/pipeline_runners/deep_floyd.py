@@ -381,6 +381,9 @@ class DeepFloydPipelineRunner(BasePipelineRunner):
             logging.debug(
                 f"Loading DeepFloyd Stage1 Lora model from {deepfloyd_stage1_lora_model_path}"
             )
+            self.pipeline_manager.make_components_private(
+                self.stage1, ("unet", "text_encoder")
+            )
             self.stage1.load_lora_weights(
                 deepfloyd_stage1_lora_model,
                 weight_name=deepfloyd_stage1_lora_model_path,
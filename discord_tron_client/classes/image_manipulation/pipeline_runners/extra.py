@@ -1,4 +1,4 @@
-import logging
+import inspect, logging
 from typing import Any
 import numpy as np
 import torch
@@ -6,6 +6,10 @@ import torch
 from discord_tron_client.classes.image_manipulation.pipeline_runners import (
     BasePipelineRunner,
 )
+from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.step_cache import (
+    step_cache,
+)
+from discord_tron_client.classes.image_manipulation.video_encoder import encode_video
 
 
 class _DirectPipelineRunner(BasePipelineRunner):
@@ -50,15 +54,26 @@ class _DirectPipelineRunner(BasePipelineRunner):
             return result.paths
         return result
 
+    def _step_cache(self, user_config: dict, args: dict):
+        """Step caching on the pipeline's transformer, when the user enabled it."""
+        enabled, threshold = self._step_cache_settings(user_config, args)
+        return step_cache(
+            self.pipeline,
+            num_inference_steps=args.get("num_inference_steps"),
+            threshold=threshold,
+            disable=not enabled,
+        )
+
     def __call__(self, **args: Any):
         prompt_value = args.get("prompt")
         if prompt_value is not None:
             args["prompt"], prompt_parameters = self._extract_parameters(prompt_value)
             args.update(prompt_parameters)
-        args.pop("user_config", None)
+        user_config = args.pop("user_config", None)
         args = self._normalize_args(args)
         logging.debug(f"Args for {_safe_name(self)}: {args}")
-        return self._run_pipeline(args)
+        with self._step_cache(user_config, args):
+            return self._run_pipeline(args)
 
 
 def _safe_name(obj: Any) -> str:
@@ -98,34 +113,57 @@ class Flux2PipelineRunner(_DirectPipelineRunner):
             args.update(prompt_parameters)
         user_config = args.pop("user_config", {}) or {}
         self.apply_adapters(user_config, model_prefix="model")
+        cache = self._step_cache(user_config, args)
 
         # Flux2 does not accept many SD/SDXL-only kwargs used elsewhere.
         args = {k: v for k, v in args.items() if k in self._allowed_args}
         args = self._normalize_args(args)
         logging.debug(f"Args for Flux2PipelineRunner: {args}")
-        return self._run_pipeline(args)
+        with cache:
+            return self._run_pipeline(args)
 
 
 class Kandinsky5ImagePipelineRunner(_DirectPipelineRunner):
     pass
 
 
-class Kandinsky5VideoPipelineRunner(_DirectPipelineRunner):
+class _VideoPipelineRunner(_DirectPipelineRunner):
+    """
+    Has the pipeline hand back decoded tensors and streams them to ffmpeg,
+    returning the video's path instead of a list of frames.
+    """
+
+    fps = 24
+
+    def _pipeline_args(self, args: dict) -> dict:
+        # Image generation passes SD-style kwargs that video pipelines reject.
+        try:
+            parameters = inspect.signature(self.pipeline.__call__).parameters
+        except (TypeError, ValueError):
+            return args
+        if any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters.values()):
+            return args
+        return {key: value for key, value in args.items() if key in parameters}
+
     def _run_pipeline(self, args: dict):
-        result = self.pipeline(**args)
-        if hasattr(result, "videos"):
-            return result.videos
-        return super()._run_pipeline(args)
+        args = self._pipeline_args(args)
+        args["output_type"] = "pt"
+        frames = self.pipeline(**args).frames
+        return encode_video(frames[0], fps=self.fps)
 
 
-class CosmosPipelineRunner(_DirectPipelineRunner):
+class Kandinsky5VideoPipelineRunner(_VideoPipelineRunner):
     pass
 
 
-class WanPipelineRunner(_DirectPipelineRunner):
+class CosmosPipelineRunner(_DirectPipelineRunner):
     pass
 
 
+class WanPipelineRunner(_VideoPipelineRunner):
+    fps = 16
+
+
 class Lumina2PipelineRunner(_DirectPipelineRunner):
     pass
 
@@ -142,10 +180,11 @@ class ACEStepPipelineRunner(_DirectPipelineRunner):
         if prompt_value is not None:
             args["prompt"], prompt_parameters = self._extract_parameters(prompt_value)
             args.update(prompt_parameters)
-        args.pop("user_config", None)
+        user_config = args.pop("user_config", None)
         args = self._normalize_args(args)
 
-        result = self.pipeline(**args)
+        with self._step_cache(user_config, args):
+            result = self.pipeline(**args)
         audios = getattr(result, "audios", None)
         if audios is None:
             audios = result
@@ -3,9 +3,6 @@ from discord_tron_client.classes.image_manipulation.pipeline_runners import (
     BasePipelineRunner,
 )
 from discord_tron_client.classes.app_config import AppConfig
-from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.flux import (
-    flux_teacache_monkeypatch,
-)
 from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.accel import (
     optimize_pipeline,
 )
@@ -22,11 +19,10 @@ class FluxPipelineRunner(BasePipelineRunner):
         user_config = args.get("user_config", None)
         del args["user_config"]
         # Use the prompt parameters to override args now
-        enable_teacache = user_config.get("enable_teacache", False)
+        enable_teacache, teacache_distance = self._step_cache_settings(
+            user_config, prompt_parameters
+        )
         enable_sageattn = user_config.get("enable_sageattn", True)
-        if "enable_teacache" in prompt_parameters:
-            enable_teacache = True
-            del prompt_parameters["teacache"]
         args.update(prompt_parameters)
         logging.debug(f"Args (minus user_config) for Flux: {args}")
         # Remove unwanted arguments for this condition
@@ -58,9 +54,7 @@ class FluxPipelineRunner(BasePipelineRunner):
             pipeline=self.pipeline,
             enable_teacache=enable_teacache,
             teacache_num_inference_steps=args.get("num_inference_steps"),
-            teacache_rel_l1_thresh=float(
-                prompt_parameters.get("teacache_distance", 0.6)
-            ),
+            teacache_rel_l1_thresh=teacache_distance,
             enable_deepcache=False,
             deepcache_cache_interval=3,
             deepcache_cache_branch_id=0,
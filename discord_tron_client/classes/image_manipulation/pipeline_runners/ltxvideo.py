@@ -3,7 +3,9 @@ from discord_tron_client.classes.image_manipulation.pipeline_runners import (
     BasePipelineRunner,
 )
 from discord_tron_client.classes.app_config import AppConfig
-from diffusers.utils.export_utils import export_to_video
+from discord_tron_client.classes.image_manipulation.video_encoder import (
+    encode_video,
+)
 from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.accel import (
     optimize_pipeline,
 )
@@ -18,6 +20,9 @@ class LtxVideoPipelineRunner(BasePipelineRunner):
         # Get user_config and delete it from args, it doesn't get passed to the pipeline
         user_config = args.get("user_config", None)
         del args["user_config"]
+        enable_teacache, teacache_distance = self._step_cache_settings(
+            user_config, prompt_parameters
+        )
         args.update(prompt_parameters)
         logging.debug(f"Args (minus user_config) for Sana: {args}")
         # Remove unwanted arguments for this condition
@@ -49,6 +54,9 @@ class LtxVideoPipelineRunner(BasePipelineRunner):
             # resize/crop without distorting to 768x512
             args["image"] = args["image"].resize((768, 512))
 
+        # Decoded frames stay tensors and stream to ffmpeg in chunks.
+        args["output_type"] = "pt"
+
         if "decode_noise_scale" in args:
             args["decode_noise_scale"] = float(args["decode_noise_scale"])
         if "decode_timestep" in args:
@@ -57,19 +65,11 @@ class LtxVideoPipelineRunner(BasePipelineRunner):
         print(f"Pipeline: {self.pipeline}")
         print(f"Pipeline args: {args}")
         enable_sageattn = user_config.get("enable_sageattn", True)
-        enable_teacache = user_config.get("enable_teacache", False)
-        if "enable_teacache" in prompt_parameters:
-            enable_teacache = True
-            del prompt_parameters["teacache"]
         with optimize_pipeline(
             pipeline=self.pipeline,
             enable_teacache=enable_teacache,
             teacache_num_inference_steps=args.get("num_inference_steps"),
-            teacache_rel_l1_thresh=float(
-                prompt_parameters.get(
-                    "teacache_distance", user_config.get("teacache_distance", 0.6)
-                )
-            ),
+            teacache_rel_l1_thresh=teacache_distance,
             enable_deepcache=False,
             deepcache_cache_interval=3,
             deepcache_cache_branch_id=0,
@@ -77,7 +77,7 @@ class LtxVideoPipelineRunner(BasePipelineRunner):
             enable_sageattn=enable_sageattn,
         ):
             pipeline_output = self.pipeline(**args).frames[0]
-        video_path = export_to_video(pipeline_output, fps=24)
+        video_path = encode_video(pipeline_output, fps=24)
         print(f"Output: {video_path}")
 
         return video_path
@@ -1,10 +1,7 @@
 import contextlib, logging
 from DeepCache import DeepCacheSDHelper
-from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.flux import (
-    flux_teacache_monkeypatch,
-)
-from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.sd3 import (
-    sd3_teacache_monkeypatch,
+from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.step_cache import (
+    step_cache,
 )
 
 sage_mechanisms = {}
@@ -29,7 +26,14 @@ def enable_sageattention(sageattention_mechanism: str = "sageattn"):
     original_attention = F.scaled_dot_product_attention
 
     def sdpa_hijack_flash(
-        query, key, value, attn_mask=None, dropout_p=0.0, is_causal=False, scale=None
+        query,
+        key,
+        value,
+        attn_mask=None,
+        dropout_p=0.0,
+        is_causal=False,
+        scale=None,
+        enable_gqa=False,
     ):
         try:
             return sage_mechanisms[sageattention_mechanism](query, key, value)
@@ -47,6 +51,7 @@ def enable_sageattention(sageattention_mechanism: str = "sageattn"):
                 dropout_p=dropout_p,
                 is_causal=is_causal,
                 scale=scale,
+                enable_gqa=enable_gqa,
             )
         return hidden_states
 
@@ -68,7 +73,7 @@ def optimize_pipeline(
     # TeaCache toggles
     enable_teacache: bool = False,
     teacache_num_inference_steps: int = 20,
-    teacache_rel_l1_thresh: float = 0.6,
+    teacache_rel_l1_thresh=None,
     # DeepCache toggles
     enable_deepcache: bool = False,
     deepcache_cache_interval: int = 3,
@@ -78,14 +83,14 @@ def optimize_pipeline(
     sageattention_mechanism: str = "sageattn",
 ):
     """
-    A unified context manager that enables TeaCache on `pipeline.transformer` (if present)
-    and DeepCache on `pipeline.unet` (if present).
+    A unified context manager that enables step caching (TeaCache or first-block cache)
+    on the pipeline's transformer (if supported) and DeepCache on `pipeline.unet` (if present).
 
     Arguments:
         pipeline: The pipeline object (e.g. FluxPipeline or StableDiffusionPipeline).
-        enable_teacache: If True, will apply TeaCache monkeypatch to pipeline.transformer.
-        teacache_num_inference_steps: The number of inference steps to pass to TeaCache.
-        teacache_rel_l1_thresh: The relative L1 threshold for TeaCache.
+        enable_teacache: If True, will cache steps on the pipeline's transformer.
+        teacache_num_inference_steps: The number of inference steps of the job.
+        teacache_rel_l1_thresh: The accumulated relative L1 threshold, or a dict of them by model; None uses the model's default.
         enable_deepcache: If True, will create (if missing) and enable DeepCache on pipeline.unet.
         deepcache_cache_interval: Interval at which the unet forward pass is cached.
         deepcache_cache_branch_id: Branch ID for DeepCache.
@@ -95,39 +100,15 @@ def optimize_pipeline(
     """
 
     # --------------------------
-    # 1. TeaCache Setup
+    # 1. Step cache Setup
     # --------------------------
-    # If the pipeline has a `transformer` attribute and the user wants to enable TeaCache,
-    # we wrap it with the teacache_monkeypatch context manager. Otherwise do a "no-op" context.
-    # If no transformer, do a dummy context
-    @contextlib.contextmanager
-    def _nullctx():
-        yield pipeline
-
-    teacache_ctx = _nullctx()
-    if (
-        hasattr(pipeline, "transformer")
-        and getattr(pipeline, "transformer") is not None
-    ):
-        if "flux" in str(type(pipeline.transformer)).casefold():
-            logging.info("Optimizing Flux pipeline with TeaCache")
-            teacache_ctx = flux_teacache_monkeypatch(
-                pipeline,
-                num_inference_steps=teacache_num_inference_steps,
-                rel_l1_thresh=teacache_rel_l1_thresh,
-                disable=(not enable_teacache),
-            )
-        elif "sd3" in str(type(pipeline.transformer)).casefold():
-            logging.info("Optimizing SD3 pipeline with TeaCache")
-            teacache_ctx = sd3_teacache_monkeypatch(
-                pipeline,
-                num_inference_steps=teacache_num_inference_steps,
-                rel_l1_thresh=teacache_rel_l1_thresh,
-                disable=(not enable_teacache),
-            )
-        logging.info(
-            f"TeaCache enabled: {enable_teacache}, pipeline type: {type(pipeline.transformer)}"
-        )
+    # Pipelines without a supported transformer run unchanged.
+    teacache_ctx = step_cache(
+        pipeline,
+        num_inference_steps=teacache_num_inference_steps,
+        threshold=teacache_rel_l1_thresh,
+        disable=(not enable_teacache),
+    )
 
     # --------------------------
     # 2. DeepCache Setup
@@ -29,6 +29,8 @@ from diffusers.video_processor import VideoProcessor
 from transformers import T5EncoderModel, T5TokenizerFast
 
 from diffusers.pipelines.flux.pipeline_flux import FluxLoraLoaderMixin
+from discord_tron_client.classes.image_manipulation.embedding_cache import get_embedding_cache
+from discord_tron_client.classes.image_manipulation.guidance import build_guidance_engine
 from .scheduler import RectifiedFlowAB2Scheduler
 
 if is_torch_xla_available():
@@ -208,32 +210,42 @@ class Cosmos2TextToImagePipeline(DiffusionPipeline, FluxLoraLoaderMixin):
         dtype = dtype or self.text_encoder.dtype
         prompt = [prompt] if isinstance(prompt, str) else prompt
 
-        text_inputs = self.tokenizer(
-            prompt,
-            padding="max_length",
-            max_length=max_sequence_length,
-            truncation=True,
-            return_tensors="pt",
-            return_length=True,
-            return_offsets_mapping=False,
-        )
-        text_input_ids = text_inputs.input_ids
-        prompt_attention_mask = text_inputs.attention_mask.bool().to(device)
-
-        untruncated_ids = self.tokenizer(prompt, padding="longest", return_tensors="pt").input_ids
-        if untruncated_ids.shape[-1] >= text_input_ids.shape[-1] and not torch.equal(text_input_ids, untruncated_ids):
-            removed_text = self.tokenizer.batch_decode(untruncated_ids[:, max_sequence_length - 1 : -1])
-            logger.warning(
-                "The following part of your input was truncated because `max_sequence_length` is set to "
-                f" {max_sequence_length} tokens: {removed_text}"
+        def encode(texts):
+            text_inputs = self.tokenizer(
+                texts,
+                padding="max_length",
+                max_length=max_sequence_length,
+                truncation=True,
+                return_tensors="pt",
+                return_length=True,
+                return_offsets_mapping=False,
             )
+            text_input_ids = text_inputs.input_ids
+            prompt_attention_mask = text_inputs.attention_mask.bool().to(device)
+
+            untruncated_ids = self.tokenizer(texts, padding="longest", return_tensors="pt").input_ids
+            if untruncated_ids.shape[-1] >= text_input_ids.shape[-1] and not torch.equal(text_input_ids, untruncated_ids):
+                removed_text = self.tokenizer.batch_decode(untruncated_ids[:, max_sequence_length - 1 : -1])
+                logger.warning(
+                    "The following part of your input was truncated because `max_sequence_length` is set to "
+                    f" {max_sequence_length} tokens: {removed_text}"
+                )
 
-        prompt_embeds = self.text_encoder(text_input_ids.to(device), attention_mask=prompt_attention_mask).last_hidden_state
-        prompt_embeds = prompt_embeds.to(dtype=dtype, device=device)
+            embeds = self.text_encoder(text_input_ids.to(device), attention_mask=prompt_attention_mask).last_hidden_state
+            lengths = prompt_attention_mask.sum(dim=1).cpu()
+            for i, length in enumerate(lengths):
+                embeds[i, length:] = 0
+            return embeds
 
-        lengths = prompt_attention_mask.sum(dim=1).cpu()
-        for i, length in enumerate(lengths):
-            prompt_embeds[i, length:] = 0
+        # Cached per text, so the shared negative prompt is only encoded once.
+        prompt_embeds = get_embedding_cache().encode_batch(
+            [self.text_encoder],
+            prompt,
+            encode,
+            max_len=max_sequence_length,
+            tokenizers=[self.tokenizer],
+        )
+        prompt_embeds = prompt_embeds.to(dtype=dtype, device=device)
 
         return prompt_embeds
 
@@ -558,6 +570,22 @@ class Cosmos2TextToImagePipeline(DiffusionPipeline, FluxLoraLoaderMixin):
 
         padding_mask = latents.new_zeros(1, 1, height, width, dtype=transformer_dtype)
 
+        # The positive and negative prompts share one transformer call when it fits.
+        guidance_engine = build_guidance_engine(self, width, height, batch_size * num_images_per_prompt)
+
+        def set_guidance_branches():
+            guidance_engine.set_branches(
+                cond={"encoder_hidden_states": prompt_embeds},
+                uncond=(
+                    {"encoder_hidden_states": negative_prompt_embeds} if self.do_classifier_free_guidance else None
+                ),
+            )
+
+        def forward(**inputs):
+            return self.transformer(**inputs, return_dict=False)[0]
+
+        set_guidance_branches()
+
         # 6. Denoising loop
         num_warmup_steps = len(timesteps) - num_inference_steps * self.scheduler.order
         self._num_timesteps = len(timesteps)
@@ -581,23 +609,15 @@ class Cosmos2TextToImagePipeline(DiffusionPipeline, FluxLoraLoaderMixin):
                 latent_model_input = latents * c_in
                 latent_model_input = latent_model_input.to(transformer_dtype)
 
-                noise_pred = self.transformer(
-                    hidden_states=latent_model_input,
-                    timestep=timestep,
-                    encoder_hidden_states=prompt_embeds,
-                    padding_mask=padding_mask,
-                    return_dict=False,
-                )[0]
+                noise_pred, noise_pred_uncond = guidance_engine(
+                    forward,
+                    step={"hidden_states": latent_model_input, "timestep": timestep},
+                    shared={"padding_mask": padding_mask},
+                    guidance=self.do_classifier_free_guidance,
+                )
                 x0_pred = (c_skip * latents + c_out * noise_pred.float()).to(latents.dtype)
 
-                if self.do_classifier_free_guidance:
-                    noise_pred_uncond = self.transformer(
-                        hidden_states=latent_model_input,
-                        timestep=timestep,
-                        encoder_hidden_states=negative_prompt_embeds,
-                        padding_mask=padding_mask,
-                        return_dict=False,
-                    )[0]
+                if noise_pred_uncond is not None:
                     noise_pred_uncond = (c_skip * latents + c_out * noise_pred_uncond.float()).to(latents.dtype)
                     x0_pred = noise_pred_uncond + self.guidance_scale * (x0_pred - noise_pred_uncond)
 
@@ -614,6 +634,7 @@ class Cosmos2TextToImagePipeline(DiffusionPipeline, FluxLoraLoaderMixin):
                     latents = callback_outputs.pop("latents", latents)
                     prompt_embeds = callback_outputs.pop("prompt_embeds", prompt_embeds)
                     negative_prompt_embeds = callback_outputs.pop("negative_prompt_embeds", negative_prompt_embeds)
+                    set_guidance_branches()
 
                 # call the callback, if provided
                 if i == len(timesteps) - 1 or ((i + 1) > num_warmup_steps and (i + 1) % self.scheduler.order == 0):
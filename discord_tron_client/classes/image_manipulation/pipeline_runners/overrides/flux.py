@@ -36,10 +36,19 @@ from diffusers.utils import (
     replace_example_docstring,
     scale_lora_layers,
     unscale_lora_layers,
-    is_torch_version,
 )
 from diffusers.utils.torch_utils import randn_tensor
 from diffusers.pipelines.pipeline_utils import DiffusionPipeline
+from discord_tron_client.classes.image_manipulation.embedding_cache import (
+    get_embedding_cache,
+)
+from discord_tron_client.classes.image_manipulation.guidance import (
+    build_guidance_engine,
+)
+from discord_tron_client.classes.image_manipulation.rope_cache import (
+    cache_pos_embed,
+    get_rope_cache,
+)
 
 
 if is_torch_xla_available():
@@ -148,460 +157,6 @@ def retrieve_timesteps(
     return timesteps, num_inference_steps
 
 
-from diffusers.models.modeling_outputs import Transformer2DModelOutput
-
-
-def teacache_forward(
-    self,
-    hidden_states: torch.Tensor,
-    encoder_hidden_states: torch.Tensor = None,
-    pooled_projections: torch.Tensor = None,
-    timestep: torch.LongTensor = None,
-    img_ids: torch.Tensor = None,
-    txt_ids: torch.Tensor = None,
-    guidance: torch.Tensor = None,
-    joint_attention_kwargs: Optional[Dict[str, Any]] = None,
-    controlnet_block_samples=None,
-    controlnet_single_block_samples=None,
-    return_dict: bool = True,
-    controlnet_blocks_repeat: bool = False,
-) -> Union[torch.FloatTensor, Transformer2DModelOutput]:
-    """
-    The [`FluxTransformer2DModel`] forward method.
-
-    Args:
-        hidden_states (`torch.FloatTensor` of shape `(batch size, channel, height, width)`):
-            Input `hidden_states`.
-        encoder_hidden_states (`torch.FloatTensor` of shape `(batch size, sequence_len, embed_dims)`):
-            Conditional embeddings (embeddings computed from the input conditions such as prompts) to use.
-        pooled_projections (`torch.FloatTensor` of shape `(batch_size, projection_dim)`): Embeddings projected
-            from the embeddings of input conditions.
-        timestep ( `torch.LongTensor`):
-            Used to indicate denoising step.
-        block_controlnet_hidden_states: (`list` of `torch.Tensor`):
-            A list of tensors that if specified are added to the residuals of transformer blocks.
-        joint_attention_kwargs (`dict`, *optional*):
-            A kwargs dictionary that if specified is passed along to the `AttentionProcessor` as defined under
-            `self.processor` in
-            [diffusers.models.attention_processor](https://github.com/huggingface/diffusers/blob/main/src/diffusers/models/attention_processor.py).
-        return_dict (`bool`, *optional*, defaults to `True`):
-            Whether or not to return a [`~models.transformer_2d.Transformer2DModelOutput`] instead of a plain
-            tuple.
-
-    Returns:
-        If `return_dict` is True, an [`~models.transformer_2d.Transformer2DModelOutput`] is returned, otherwise a
-        `tuple` where the first element is the sample tensor.
-    """
-    if joint_attention_kwargs is not None:
-        joint_attention_kwargs = joint_attention_kwargs.copy()
-        lora_scale = joint_attention_kwargs.pop("scale", 1.0)
-    else:
-        lora_scale = 1.0
-
-    if USE_PEFT_BACKEND:
-        # weight the lora layers by setting `lora_scale` for each PEFT layer
-        scale_lora_layers(self, lora_scale)
-    else:
-        if (
-            joint_attention_kwargs is not None
-            and joint_attention_kwargs.get("scale", None) is not None
-        ):
-            logger.warning(
-                "Passing `scale` via `joint_attention_kwargs` when not using the PEFT backend is ineffective."
-            )
-
-    hidden_states = self.x_embedder(hidden_states)
-
-    timestep = timestep.to(hidden_states.dtype) * 1000
-    if guidance is not None:
-        guidance = guidance.to(hidden_states.dtype) * 1000
-    else:
-        guidance = None
-
-    temb = (
-        self.time_text_embed(timestep, pooled_projections)
-        if guidance is None
-        else self.time_text_embed(timestep, guidance, pooled_projections)
-    )
-    encoder_hidden_states = self.context_embedder(encoder_hidden_states)
-
-    if txt_ids.ndim == 3:
-        logger.warning(
-            "Passing `txt_ids` 3d torch.Tensor is deprecated."
-            "Please remove the batch dimension and pass it as a 2d torch Tensor"
-        )
-        txt_ids = txt_ids[0]
-    if img_ids.ndim == 3:
-        logger.warning(
-            "Passing `img_ids` 3d torch.Tensor is deprecated."
-            "Please remove the batch dimension and pass it as a 2d torch Tensor"
-        )
-        img_ids = img_ids[0]
-
-    ids = torch.cat((txt_ids, img_ids), dim=0)
-    image_rotary_emb = self.pos_embed(ids)
-
-    if (
-        joint_attention_kwargs is not None
-        and "ip_adapter_image_embeds" in joint_attention_kwargs
-    ):
-        ip_adapter_image_embeds = joint_attention_kwargs.pop("ip_adapter_image_embeds")
-        ip_hidden_states = self.encoder_hid_proj(ip_adapter_image_embeds)
-        joint_attention_kwargs.update({"ip_hidden_states": ip_hidden_states})
-
-    if self.enable_teacache:
-        inp = hidden_states.clone()
-        temb_ = temb.clone()
-        (
-            modulated_inp,
-            gate_msa,
-            shift_mlp,
-            scale_mlp,
-            gate_mlp,
-        ) = self.transformer_blocks[0].norm1(inp, emb=temb_)
-        if self.cnt == 0 or self.cnt == self.num_steps - 1:
-            should_calc = True
-            self.accumulated_rel_l1_distance = 0
-        else:
-            coefficients = [
-                4.98651651e02,
-                -2.83781631e02,
-                5.58554382e01,
-                -3.82021401e00,
-                2.64230861e-01,
-            ]
-            rescale_func = np.poly1d(coefficients)
-            self.accumulated_rel_l1_distance += rescale_func(
-                (
-                    (modulated_inp - self.previous_modulated_input).abs().mean()
-                    / self.previous_modulated_input.abs().mean()
-                )
-                .cpu()
-                .item()
-            )
-            if self.accumulated_rel_l1_distance < self.rel_l1_thresh:
-                should_calc = False
-            else:
-                should_calc = True
-                self.accumulated_rel_l1_distance = 0
-        self.previous_modulated_input = modulated_inp
-        self.cnt += 1
-        if self.cnt == self.num_steps:
-            self.cnt = 0
-
-    if self.enable_teacache:
-        print(f"Running TeaCache")
-        if not should_calc:
-            print(f"Skipping calculation")
-            hidden_states += self.previous_residual
-        else:
-            print(f"Calculating states")
-            ori_hidden_states = hidden_states.clone()
-            for index_block, block in enumerate(self.transformer_blocks):
-                if torch.is_grad_enabled() and self.gradient_checkpointing:
-
-                    def create_custom_forward(module, return_dict=None):
-                        def custom_forward(*inputs):
-                            if return_dict is not None:
-                                return module(*inputs, return_dict=return_dict)
-                            else:
-                                return module(*inputs)
-
-                        return custom_forward
-
-                    ckpt_kwargs: Dict[str, Any] = (
-                        {"use_reentrant": False}
-                        if is_torch_version(">=", "1.11.0")
-                        else {}
-                    )
-                    (
-                        encoder_hidden_states,
-                        hidden_states,
-                    ) = torch.utils.checkpoint.checkpoint(
-                        create_custom_forward(block),
-                        hidden_states,
-                        encoder_hidden_states,
-                        temb,
-                        image_rotary_emb,
-                        **ckpt_kwargs,
-                    )
-
-                else:
-                    encoder_hidden_states, hidden_states = block(
-                        hidden_states=hidden_states,
-                        encoder_hidden_states=encoder_hidden_states,
-                        temb=temb,
-                        image_rotary_emb=image_rotary_emb,
-                        joint_attention_kwargs=joint_attention_kwargs,
-                    )
-
-                # controlnet residual
-                if controlnet_block_samples is not None:
-                    interval_control = len(self.transformer_blocks) / len(
-                        controlnet_block_samples
-                    )
-                    interval_control = int(np.ceil(interval_control))
-                    # For Xlabs ControlNet.
-                    if controlnet_blocks_repeat:
-                        hidden_states = (
-                            hidden_states
-                            + controlnet_block_samples[
-                                index_block % len(controlnet_block_samples)
-                            ]
-                        )
-                    else:
-                        hidden_states = (
-                            hidden_states
-                            + controlnet_block_samples[index_block // interval_control]
-                        )
-            hidden_states = torch.cat([encoder_hidden_states, hidden_states], dim=1)
-
-            for index_block, block in enumerate(self.single_transformer_blocks):
-                if torch.is_grad_enabled() and self.gradient_checkpointing:
-
-                    def create_custom_forward(module, return_dict=None):
-                        def custom_forward(*inputs):
-                            if return_dict is not None:
-                                return module(*inputs, return_dict=return_dict)
-                            else:
-                                return module(*inputs)
-
-                        return custom_forward
-
-                    ckpt_kwargs: Dict[str, Any] = (
-                        {"use_reentrant": False}
-                        if is_torch_version(">=", "1.11.0")
-                        else {}
-                    )
-                    hidden_states = torch.utils.checkpoint.checkpoint(
-                        create_custom_forward(block),
-                        hidden_states,
-                        temb,
-                        image_rotary_emb,
-                        **ckpt_kwargs,
-                    )
-
-                else:
-                    hidden_states = block(
-                        hidden_states=hidden_states,
-                        temb=temb,
-                        image_rotary_emb=image_rotary_emb,
-                        joint_attention_kwargs=joint_attention_kwargs,
-                    )
-
-                # controlnet residual
-                if controlnet_single_block_samples is not None:
-                    interval_control = len(self.single_transformer_blocks) / len(
-                        controlnet_single_block_samples
-                    )
-                    interval_control = int(np.ceil(interval_control))
-                    hidden_states[:, encoder_hidden_states.shape[1] :, ...] = (
-                        hidden_states[:, encoder_hidden_states.shape[1] :, ...]
-                        + controlnet_single_block_samples[
-                            index_block // interval_control
-                        ]
-                    )
-
-            hidden_states = hidden_states[:, encoder_hidden_states.shape[1] :, ...]
-            self.previous_residual = hidden_states - ori_hidden_states
-    else:
-        for index_block, block in enumerate(self.transformer_blocks):
-            if torch.is_grad_enabled() and self.gradient_checkpointing:
-
-                def create_custom_forward(module, return_dict=None):
-                    def custom_forward(*inputs):
-                        if return_dict is not None:
-                            return module(*inputs, return_dict=return_dict)
-                        else:
-                            return module(*inputs)
-
-                    return custom_forward
-
-                ckpt_kwargs: Dict[str, Any] = (
-                    {"use_reentrant": False} if is_torch_version(">=", "1.11.0") else {}
-                )
-                (
-                    encoder_hidden_states,
-                    hidden_states,
-                ) = torch.utils.checkpoint.checkpoint(
-                    create_custom_forward(block),
-                    hidden_states,
-                    encoder_hidden_states,
-                    temb,
-                    image_rotary_emb,
-                    **ckpt_kwargs,
-                )
-
-            else:
-                encoder_hidden_states, hidden_states = block(
-                    hidden_states=hidden_states,
-                    encoder_hidden_states=encoder_hidden_states,
-                    temb=temb,
-                    image_rotary_emb=image_rotary_emb,
-                    joint_attention_kwargs=joint_attention_kwargs,
-                )
-
-            # controlnet residual
-            if controlnet_block_samples is not None:
-                interval_control = len(self.transformer_blocks) / len(
-                    controlnet_block_samples
-                )
-                interval_control = int(np.ceil(interval_control))
-                # For Xlabs ControlNet.
-                if controlnet_blocks_repeat:
-                    hidden_states = (
-                        hidden_states
-                        + controlnet_block_samples[
-                            index_block % len(controlnet_block_samples)
-                        ]
-                    )
-                else:
-                    hidden_states = (
-                        hidden_states
-                        + controlnet_block_samples[index_block // interval_control]
-                    )
-        hidden_states = torch.cat([encoder_hidden_states, hidden_states], dim=1)
-
-        for index_block, block in enumerate(self.single_transformer_blocks):
-            if torch.is_grad_enabled() and self.gradient_checkpointing:
-
-                def create_custom_forward(module, return_dict=None):
-                    def custom_forward(*inputs):
-                        if return_dict is not None:
-                            return module(*inputs, return_dict=return_dict)
-                        else:
-                            return module(*inputs)
-
-                    return custom_forward
-
-                ckpt_kwargs: Dict[str, Any] = (
-                    {"use_reentrant": False} if is_torch_version(">=", "1.11.0") else {}
-                )
-                hidden_states = torch.utils.checkpoint.checkpoint(
-                    create_custom_forward(block),
-                    hidden_states,
-                    temb,
-                    image_rotary_emb,
-                    **ckpt_kwargs,
-                )
-
-            else:
-                hidden_states = block(
-                    hidden_states=hidden_states,
-                    temb=temb,
-                    image_rotary_emb=image_rotary_emb,
-                    joint_attention_kwargs=joint_attention_kwargs,
-                )
-
-            # controlnet residual
-            if controlnet_single_block_samples is not None:
-                interval_control = len(self.single_transformer_blocks) / len(
-                    controlnet_single_block_samples
-                )
-                interval_control = int(np.ceil(interval_control))
-                hidden_states[:, encoder_hidden_states.shape[1] :, ...] = (
-                    hidden_states[:, encoder_hidden_states.shape[1] :, ...]
-                    + controlnet_single_block_samples[index_block // interval_control]
-                )
-
-        hidden_states = hidden_states[:, encoder_hidden_states.shape[1] :, ...]
-
-    hidden_states = self.norm_out(hidden_states, temb)
-    output = self.proj_out(hidden_states)
-
-    if USE_PEFT_BACKEND:
-        # remove `lora_scale` from each PEFT layer
-        unscale_lora_layers(self, lora_scale)
-
-    if not return_dict:
-        return (output,)
-
-    return Transformer2DModelOutput(sample=output)
-
-
-import contextlib
-import types
-
-# A unique sentinel to mark attributes that did not exist originally.
-_SENTINEL = object()
-
-
-@contextlib.contextmanager
-def flux_teacache_monkeypatch(
-    pipeline, num_inference_steps, rel_l1_thresh=0.6, disable=False
-):
-    """
-    Temporarily monkeypatches the transformer's instance in the given pipeline.
-
-    If disable is False (the default), this context manager:
-      - Binds and overrides the instance's forward method with teacache_forward.
-      - Sets several attributes on the transformer instance:
-            enable_teacache, cnt, num_steps, rel_l1_thresh,
-            accumulated_rel_l1_distance, previous_modulated_input, previous_residual.
-    If disable is True, the forward method is left unmodified and enable_teacache is set to False.
-
-    Parameters:
-      pipeline: A DiffusionPipeline instance with a `.transformer` attribute.
-      num_inference_steps: The number of inference steps to set.
-      rel_l1_thresh: The relative L1 threshold (default is 0.6).
-      disable: If True, disables teaCache (forward remains unchanged and enable_teacache is False).
-    """
-    transformer = pipeline.transformer
-
-    # Save the original forward method from the instance (if it exists).
-    orig_forward = transformer.__dict__.get("forward", _SENTINEL)
-
-    # Prepare the attributes to patch; note that enable_teacache is based on disable.
-    attrs_to_patch = {
-        "enable_teacache": not disable,
-        "cnt": 0,
-        "num_steps": num_inference_steps,
-        "rel_l1_thresh": rel_l1_thresh,
-        "accumulated_rel_l1_distance": 0,
-        "previous_modulated_input": None,
-        "previous_residual": None,
-    }
-
-    # Save the original attribute values (if they exist on the instance).
-    original_attrs = {}
-    for attr in attrs_to_patch:
-        if attr in transformer.__dict__:
-            original_attrs[attr] = transformer.__dict__[attr]
-        else:
-            original_attrs[attr] = _SENTINEL
-
-    try:
-        if not disable:
-            # Bind teacache_forward to the transformer instance so that self is passed correctly.
-            transformer.forward = types.MethodType(teacache_forward, transformer)
-        else:
-            # If disabling, make sure we don't have an instance-specific forward override.
-            if "forward" in transformer.__dict__:
-                delattr(transformer, "forward")
-
-        # Apply the patched attributes.
-        for attr, value in attrs_to_patch.items():
-            setattr(transformer, attr, value)
-
-        # Yield control to the caller with the patch active.
-        yield pipeline
-    finally:
-        # Restore the original forward method.
-        if orig_forward is _SENTINEL:
-            if "forward" in transformer.__dict__:
-                delattr(transformer, "forward")
-        else:
-            transformer.forward = orig_forward
-
-        # Restore all the other original attributes.
-        for attr, orig_value in original_attrs.items():
-            if orig_value is _SENTINEL:
-                if attr in transformer.__dict__:
-                    delattr(transformer, attr)
-            else:
-                setattr(transformer, attr, orig_value)
-
-
 class FluxPipeline(DiffusionPipeline, FluxLoraLoaderMixin):
     r"""
     The Flux pipeline for text-to-image generation.
@@ -687,35 +242,30 @@ class FluxPipeline(DiffusionPipeline, FluxLoraLoaderMixin):
         prompt = [prompt] if isinstance(prompt, str) else prompt
         batch_size = len(prompt)
 
-        text_inputs = self.tokenizer_2(
-            prompt,
-            padding="max_length",
-            max_length=max_sequence_length,
-            truncation=True,
-            return_length=False,
-            return_overflowing_tokens=False,
-            return_tensors="pt",
-        )
-        prompt_attention_mask = text_inputs.attention_mask
-        text_input_ids = text_inputs.input_ids
-        untruncated_ids = self.tokenizer_2(
-            prompt, padding="longest", return_tensors="pt"
-        ).input_ids
-
-        if untruncated_ids.shape[-1] >= text_input_ids.shape[-1] and not torch.equal(
-            text_input_ids, untruncated_ids
-        ):
-            removed_text = self.tokenizer_2.batch_decode(
-                untruncated_ids[:, self.tokenizer_max_length - 1 : -1]
+        def encode(texts):
+            text_inputs = self.tokenizer_2(
+                texts,
+                padding="max_length",
+                max_length=max_sequence_length,
+                truncation=True,
+                return_length=False,
+                return_overflowing_tokens=False,
+                return_tensors="pt",
             )
-            # logger.warning(
-            #     "The following part of your input was truncated because `max_sequence_length` is set to "
-            #     f" {max_sequence_length} tokens: {removed_text}"
-            # )
+            embeds = self.text_encoder_2(
+                text_inputs.input_ids.to(device), output_hidden_states=False
+            )[0]
+            return embeds, text_inputs.attention_mask
 
-        prompt_embeds = self.text_encoder_2(
-            text_input_ids.to(device), output_hidden_states=False
-        )[0]
+        # Repeated prompts and negatives are served from the embedding cache.
+        prompt_embeds, prompt_attention_mask = get_embedding_cache().encode_batch(
+            [self.text_encoder_2],
+            prompt,
+            encode,
+            max_len=max_sequence_length,
+            tokenizers=[self.tokenizer_2],
+            lora_scale=getattr(self, "_lora_scale", None),
+        )
 
         dtype = self.text_encoder_2.dtype
         prompt_embeds = prompt_embeds.to(dtype=dtype, device=device)
@@ -861,8 +411,17 @@ class FluxPipeline(DiffusionPipeline, FluxLoraLoaderMixin):
                 # Retrieve the original scale by scaling back the LoRA layers
                 unscale_lora_layers(self.text_encoder_2, lora_scale)
 
-        text_ids = torch.zeros(batch_size, prompt_embeds.shape[1], 3).to(
-            device=device, dtype=prompt_embeds.dtype
+        text_ids = get_rope_cache().grid(
+            (
+                "flux_text_ids",
+                batch_size,
+                prompt_embeds.shape[1],
+                str(device),
+                str(prompt_embeds.dtype),
+            ),
+            lambda: torch.zeros(batch_size, prompt_embeds.shape[1], 3).to(
+                device=device, dtype=prompt_embeds.dtype
+            ),
         )
 
         return prompt_embeds, pooled_prompt_embeds, text_ids, prompt_attention_mask
@@ -930,28 +489,35 @@ class FluxPipeline(DiffusionPipeline, FluxLoraLoaderMixin):
 
     @staticmethod
     def _prepare_latent_image_ids(batch_size, height, width, device, dtype):
-        latent_image_ids = torch.zeros(height // 2, width // 2, 3)
-        latent_image_ids[..., 1] = (
-            latent_image_ids[..., 1] + torch.arange(height // 2)[:, None]
-        )
-        latent_image_ids[..., 2] = (
-            latent_image_ids[..., 2] + torch.arange(width // 2)[None, :]
-        )
+        def compute():
+            latent_image_ids = torch.zeros(height // 2, width // 2, 3)
+            latent_image_ids[..., 1] = (
+                latent_image_ids[..., 1] + torch.arange(height // 2)[:, None]
+            )
+            latent_image_ids[..., 2] = (
+                latent_image_ids[..., 2] + torch.arange(width // 2)[None, :]
+            )
 
-        (
-            latent_image_id_height,
-            latent_image_id_width,
-            latent_image_id_channels,
-        ) = latent_image_ids.shape
-
-        latent_image_ids = latent_image_ids[None, :].repeat(batch_size, 1, 1, 1)
-        latent_image_ids = latent_image_ids.reshape(
-            batch_size,
-            latent_image_id_height * latent_image_id_width,
-            latent_image_id_channels,
-        )
+            (
+                latent_image_id_height,
+                latent_image_id_width,
+                latent_image_id_channels,
+            ) = latent_image_ids.shape
+
+            latent_image_ids = latent_image_ids[None, :].repeat(batch_size, 1, 1, 1)
+            latent_image_ids = latent_image_ids.reshape(
+                batch_size,
+                latent_image_id_height * latent_image_id_width,
+                latent_image_id_channels,
+            )
 
-        return latent_image_ids.to(device=device, dtype=dtype)
+            return latent_image_ids.to(device=device, dtype=dtype)
+
+        # The grid only depends on the resolution, so it is built once per shape.
+        return get_rope_cache().grid(
+            ("flux_latent_ids", batch_size, height, width, str(device), str(dtype)),
+            compute,
+        )
 
     @staticmethod
     def _pack_latents(latents, batch_size, num_channels_latents, height, width):
@@ -1217,6 +783,8 @@ class FluxPipeline(DiffusionPipeline, FluxLoraLoaderMixin):
             )
 
         # 4. Prepare latent variables
+        # The transformer embeds the same ids every step; compute the rotary tables once.
+        cache_pos_embed(self.transformer)
         num_channels_latents = self.transformer.config.in_channels // 4
         latents, latent_image_ids = self.prepare_latents(
             batch_size * num_images_per_prompt,
@@ -1252,14 +820,53 @@ class FluxPipeline(DiffusionPipeline, FluxLoraLoaderMixin):
         )
         self._num_timesteps = len(timesteps)
 
-        latents = latents.to(self.transformer.device)
-        latent_image_ids = latent_image_ids.to(self.transformer.device)[0]
-        timesteps = timesteps.to(self.transformer.device)
-        text_ids = text_ids.to(self.transformer.device)[0]
-        negative_text_ids = negative_text_ids.to(self.transformer.device)[0]
+        transformer_device = self.transformer.device
+        latents = latents.to(transformer_device)
+        latent_image_ids = latent_image_ids.to(transformer_device)[0]
+        timesteps = timesteps.to(transformer_device)
+        text_ids = text_ids.to(transformer_device)[0]
+        negative_text_ids = negative_text_ids.to(transformer_device)[0]
+
+        # Real CFG batches the negative prompt with the positive one when it fits.
+        do_true_cfg = guidance_scale_real > 1.0
+        guidance_engine = build_guidance_engine(
+            self, width, height, batch_size * num_images_per_prompt
+        )
+
+        def branch_inputs(embeds, pooled_embeds, ids, mask):
+            inputs = {
+                "encoder_hidden_states": embeds,
+                "pooled_projections": pooled_embeds,
+                "txt_ids": ids,
+            }
+            if mask is not None:
+                inputs["attention_mask"] = mask
+            return inputs
+
+        def set_guidance_branches():
+            # The embeddings move to the transformer's device once, not every step.
+            guidance_engine.set_branches(
+                cond=branch_inputs(
+                    prompt_embeds, pooled_prompt_embeds, text_ids, prompt_mask
+                ),
+                uncond=(
+                    branch_inputs(
+                        negative_prompt_embeds,
+                        negative_pooled_prompt_embeds,
+                        negative_text_ids,
+                        negative_mask,
+                    )
+                    if do_true_cfg
+                    else None
+                ),
+                device=transformer_device,
+                unbatched=("txt_ids",),
+            )
+
+        def forward(**inputs):
+            return self.transformer(**inputs, return_dict=False)[0]
 
-        # Assume 'do_batch_cfg' is a boolean indicating whether to use batched CFG
-        do_batch_cfg = True  # Set this to False to use sequential CFG
+        set_guidance_branches()
 
         # 6. Denoising loop
 
@@ -1268,127 +875,37 @@ class FluxPipeline(DiffusionPipeline, FluxLoraLoaderMixin):
                 if self.interrupt:
                     continue
 
-                # Prepare the latent model input
-                prompt_embeds_input = prompt_embeds
-                pooled_prompt_embeds_input = pooled_prompt_embeds
-                text_ids_input = text_ids
-                latent_image_ids_input = latent_image_ids
-                prompt_mask_input = prompt_mask
-                latent_model_input = latents
-
-                if (
-                    do_batch_cfg
-                    and guidance_scale_real > 1.0
-                    and i >= no_cfg_until_timestep
-                ):
-                    print("Batching CFG")
-                    # Concatenate prompt embeddings
-                    prompt_embeds_input = torch.cat(
-                        [negative_prompt_embeds, prompt_embeds], dim=0
-                    )
-                    pooled_prompt_embeds_input = torch.cat(
-                        [negative_pooled_prompt_embeds, pooled_prompt_embeds], dim=0
-                    )
-
-                    # # Concatenate text IDs if they are used
-                    # if text_ids is not None and negative_text_ids is not None:
-                    #     text_ids_input = torch.cat([negative_text_ids, text_ids], dim=0)
-
-                    # Concatenate latent image IDs if they are used
-                    # if latent_image_ids is not None:
-                    #     latent_image_ids_input = torch.cat([latent_image_ids, latent_image_ids], dim=0)
-
-                    # Concatenate prompt masks if they are used
-                    if prompt_mask is not None and negative_mask is not None:
-                        prompt_mask_input = torch.cat(
-                            [negative_mask, prompt_mask], dim=0
-                        )
-                    # Duplicate latents for unconditional and conditional inputs
-                    latent_model_input = torch.cat([latents] * 2)
-
                 # Expand timestep to match batch size
-                timestep = t.expand(latent_model_input.shape[0]).to(latents.dtype)
+                timestep = t.expand(latents.shape[0]).to(latents.dtype)
 
                 # Handle guidance
                 if self.transformer.config.guidance_embeds:
-                    guidance = torch.tensor(
-                        [guidance_scale], device=self.transformer.device
+                    guidance = torch.full(
+                        [latents.shape[0]], guidance_scale, device=transformer_device
                     )
-                    guidance = guidance.expand(latent_model_input.shape[0])
                 else:
                     guidance = None
 
-                # Prepare extra transformer arguments
-                extra_transformer_args = {}
-                if prompt_mask is not None:
-                    extra_transformer_args["attention_mask"] = prompt_mask.to(
-                        device=self.transformer.device
-                    )
-
-                # Forward pass through the transformer
-                noise_pred = self.transformer(
-                    hidden_states=latent_model_input.to(device=self.transformer.device),
-                    timestep=timestep / 1000,
-                    guidance=guidance,
-                    pooled_projections=pooled_prompt_embeds_input.to(
-                        device=self.transformer.device
-                    ),
-                    encoder_hidden_states=prompt_embeds_input.to(
-                        device=self.transformer.device
-                    ),
-                    txt_ids=(
-                        text_ids_input.to(device=self.transformer.device)
-                        if text_ids is not None
-                        else None
-                    ),
-                    img_ids=(
-                        latent_image_ids_input.to(device=self.transformer.device)
-                        if latent_image_ids is not None
-                        else None
-                    ),
-                    joint_attention_kwargs=self.joint_attention_kwargs,
-                    return_dict=False,
-                    **extra_transformer_args,
-                )[0]
+                # Forward pass through the transformer, once per branch or batched
+                noise_pred, noise_pred_uncond = guidance_engine(
+                    forward,
+                    step={
+                        "hidden_states": latents,
+                        "timestep": timestep / 1000,
+                        "guidance": guidance,
+                    },
+                    shared={
+                        "img_ids": latent_image_ids,
+                        "joint_attention_kwargs": self.joint_attention_kwargs,
+                    },
+                    guidance=do_true_cfg and i >= no_cfg_until_timestep,
+                )
 
                 # Apply real CFG
-                if guidance_scale_real > 1.0 and i >= no_cfg_until_timestep:
-                    if do_batch_cfg:
-                        # Batched CFG: Split the noise prediction into unconditional and conditional parts
-                        noise_pred_uncond, noise_pred_cond = noise_pred.chunk(2)
-                        noise_pred = noise_pred_uncond + guidance_scale_real * (
-                            noise_pred_cond - noise_pred_uncond
-                        )
-                    else:
-                        # Sequential CFG: Compute unconditional noise prediction separately
-                        noise_pred_uncond = self.transformer(
-                            hidden_states=latents.to(device=self.transformer.device),
-                            timestep=timestep / 1000,
-                            guidance=guidance,
-                            pooled_projections=negative_pooled_prompt_embeds.to(
-                                device=self.transformer.device
-                            ),
-                            encoder_hidden_states=negative_prompt_embeds.to(
-                                device=self.transformer.device
-                            ),
-                            txt_ids=(
-                                negative_text_ids.to(device=self.transformer.device)
-                                if negative_text_ids is not None
-                                else None
-                            ),
-                            img_ids=(
-                                latent_image_ids.to(device=self.transformer.device)
-                                if latent_image_ids is not None
-                                else None
-                            ),
-                            joint_attention_kwargs=self.joint_attention_kwargs,
-                            return_dict=False,
-                        )[0]
-
-                        # Combine conditional and unconditional predictions
-                        noise_pred = noise_pred_uncond + guidance_scale_real * (
-                            noise_pred - noise_pred_uncond
-                        )
+                if noise_pred_uncond is not None:
+                    noise_pred = noise_pred_uncond + guidance_scale_real * (
+                        noise_pred - noise_pred_uncond
+                    )
 
                 # Compute the previous noisy sample x_t -> x_t-1
                 latents_dtype = latents.dtype
@@ -1408,7 +925,9 @@ class FluxPipeline(DiffusionPipeline, FluxLoraLoaderMixin):
                     }
                     callback_outputs = callback_on_step_end(self, i, t, callback_kwargs)
                     latents = callback_outputs.get("latents", latents)
-                    prompt_embeds = callback_outputs.get("prompt_embeds", prompt_embeds)
+                    if callback_outputs.get("prompt_embeds") is not None:
+                        prompt_embeds = callback_outputs["prompt_embeds"]
+                        set_guidance_branches()
 
                 # Update the progress bar
                 if i == len(timesteps) - 1 or (
@@ -30,6 +30,7 @@ from transformers import AutoProcessor, Mistral3ForConditionalGeneration
 
 from .autoencoder import AutoencoderKLFlux2
 from .transformer import Flux2Transformer2DModel
+from discord_tron_client.classes.image_manipulation.rope_cache import get_rope_cache
 
 if is_torch_xla_available():
     import torch_xla.core.xla_model as xm
@@ -946,8 +947,10 @@ class Flux2Pipeline(DiffusionPipeline, Flux2LoraLoaderMixin):
         prompt_embeds = prompt_embeds.repeat(1, num_images_per_prompt, 1)
         prompt_embeds = prompt_embeds.view(batch_size * num_images_per_prompt, seq_len, -1)
 
-        text_ids = self._prepare_text_ids(prompt_embeds)
-        text_ids = text_ids.to(device)
+        text_ids = get_rope_cache().grid(
+            ("flux2_text_ids", tuple(prompt_embeds.shape[:2]), str(device)),
+            lambda: self._prepare_text_ids(prompt_embeds).to(device),
+        )
         return prompt_embeds, text_ids
 
     def _encode_vae_image(self, image: torch.Tensor, generator: torch.Generator):
@@ -990,8 +993,10 @@ class Flux2Pipeline(DiffusionPipeline, Flux2LoraLoaderMixin):
         else:
             latents = latents.to(device=device, dtype=dtype)
 
-        latent_ids = self._prepare_latent_ids(latents)
-        latent_ids = latent_ids.to(device)
+        latent_ids = get_rope_cache().grid(
+            ("flux2_latent_ids", latents.shape[0], tuple(latents.shape[2:]), str(device)),
+            lambda: self._prepare_latent_ids(latents).to(device),
+        )
 
         latents = self._pack_latents(latents)  # [B, C, H, W] -> [B, H*W, C]
         return latents, latent_ids
@@ -0,0 +1,519 @@
+import contextlib, inspect, logging, threading
+from typing import Callable, Dict, Optional, Sequence
+from discord_tron_client.classes.app_config import AppConfig
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+# Rescale the relative L1 change of the modulated input into the change of
+# the transformer output, from the TeaCache calibrations of each model.
+FLUX_COEFFICIENTS = (
+    4.98651651e02,
+    -2.83781631e02,
+    5.58554382e01,
+    -3.82021401e00,
+    2.64230861e-01,
+)
+LTX_COEFFICIENTS = (
+    2.14700694e01,
+    -1.28016453e01,
+    2.31279151e00,
+    7.92487521e-01,
+    9.69274326e-03,
+)
+DUAL_STREAM_RETURNS = ("encoder_hidden_states", "hidden_states")
+
+
+def _norm1_modulated_input(block, inputs: dict):
+    # AdaLayerNormZero returns the modulated input first, then the gates.
+    return block.norm1(inputs["hidden_states"], emb=inputs["temb"])[0]
+
+
+def _ltx_modulated_input(block, inputs: dict):
+    hidden_states, temb = inputs["hidden_states"], inputs["temb"]
+    table = block.scale_shift_table
+    ada_values = table[None, None] + temb.reshape(
+        hidden_states.size(0), temb.size(1), table.shape[0], -1
+    )
+    shift_msa, scale_msa = ada_values.unbind(dim=2)[:2]
+    return block.norm1(hidden_states) * (1 + scale_msa) + shift_msa
+
+
+class StepCacheSpec:
+    """
+    How a transformer exposes its block stack to the step cache.
+
+    `stacks` names the block lists in the order forward() runs them, on
+    each of `components`. A block's first parameter is the hidden state it
+    updates; blocks that return a tuple return the parameters named by the
+    tail of `returns`, in order.
+
+    With `modulated_input(block, inputs)` the signal is computed from the
+    first block's inputs and a cached step skips every block (TeaCache).
+    Without it the first block always runs and its residual is the signal
+    (first-block cache). `coefficients` rescale the signal's relative L1
+    change, and `threshold` is how much accumulated change a step may
+    reuse the cached residuals for. Calls with the same `timestep` are
+    told apart as separate guidance streams.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        stacks: Sequence[str],
+        threshold: float,
+        match: str = None,
+        returns: Sequence[str] = None,
+        modulated_input: Callable = None,
+        coefficients: Sequence[float] = None,
+        components: Sequence[str] = ("transformer",),
+        timestep: str = "timestep",
+    ):
+        self.name = name
+        self.stacks = tuple(stacks)
+        self.threshold = threshold
+        self.match = match or name
+        self.returns = tuple(returns) if returns else None
+        self.modulated_input = modulated_input
+        self.coefficients = tuple(coefficients) if coefficients else None
+        self.components = tuple(components)
+        self.timestep = timestep
+
+    def rescale(self, distance: float) -> float:
+        if self.coefficients is None:
+            return distance
+        value = 0.0
+        for coefficient in self.coefficients:
+            value = value * distance + coefficient
+        return value
+
+
+# Matched against the transformer's class name in order, so "flux2" comes before "flux".
+SPECS = (
+    StepCacheSpec(
+        "flux2",
+        stacks=("transformer_blocks", "single_transformer_blocks"),
+        returns=DUAL_STREAM_RETURNS,
+        threshold=0.1,
+    ),
+    StepCacheSpec(
+        "flux",
+        stacks=("transformer_blocks", "single_transformer_blocks"),
+        returns=DUAL_STREAM_RETURNS,
+        modulated_input=_norm1_modulated_input,
+        coefficients=FLUX_COEFFICIENTS,
+        threshold=0.6,
+    ),
+    StepCacheSpec(
+        "sd3", stacks=("transformer_blocks",), returns=DUAL_STREAM_RETURNS, threshold=0.1
+    ),
+    StepCacheSpec(
+        "ltx",
+        stacks=("transformer_blocks",),
+        modulated_input=_ltx_modulated_input,
+        coefficients=LTX_COEFFICIENTS,
+        threshold=0.05,
+    ),
+    StepCacheSpec(
+        "wan", stacks=("blocks",), threshold=0.06, components=("transformer", "transformer_2")
+    ),
+    StepCacheSpec("cosmos", stacks=("transformer_blocks",), threshold=0.08),
+    StepCacheSpec("kandinsky5", stacks=("visual_transformer_blocks",), threshold=0.08),
+    StepCacheSpec("lumina2", stacks=("layers",), threshold=0.1),
+    StepCacheSpec(
+        "z_image", match="zimage", stacks=("layers",), threshold=0.1, timestep="t"
+    ),
+    StepCacheSpec(
+        "ace_step",
+        match="acestep",
+        stacks=("transformer_blocks",),
+        threshold=0.1,
+        components=("ace_step_transformer",),
+    ),
+)
+
+
+def find_spec(transformer) -> Optional[StepCacheSpec]:
+    name = type(transformer).__name__.casefold()
+    for spec in SPECS:
+        if spec.match in name:
+            return spec
+    return None
+
+
+def _shape(value):
+    return tuple(value.shape) if hasattr(value, "shape") else None
+
+
+def _scalar(value) -> Optional[float]:
+    try:
+        if hasattr(value, "flatten"):
+            value = value.flatten()[0]
+        return float(value)
+    except Exception:
+        return None
+
+
+_signatures: Dict[type, inspect.Signature] = {}
+
+
+def _bind(module, forward, args, kwargs) -> dict:
+    key = type(module)
+    if key not in _signatures:
+        _signatures[key] = inspect.signature(forward)
+    return _signatures[key].bind_partial(*args, **kwargs).arguments
+
+
+class _Stream:
+    """
+    One sequence of transformer calls, eg. the conditional or unconditional
+    half of classifier-free guidance when a pipeline calls them separately.
+    """
+
+    def __init__(self):
+        self.steps = 0
+        self.skipped = 0
+        self.accumulated = 0.0
+        self.signal = None
+        # Shapes of the first block's inputs and the residual of every stack, at the last computed step.
+        self.shapes = None
+        self.residuals = None
+
+
+class _Call:
+    def __init__(self, stream: _Stream, replayable: bool):
+        self.stream = stream
+        self.replayable = replayable
+        self.skipping = False
+        self.shapes = None
+        self.region_inputs: Dict[int, dict] = {}
+        self.residuals: Dict[int, dict] = {}
+
+
+class StepCache:
+    """
+    Skips the block stack of a transformer on steps whose input barely
+    changed since the last computed step, adding the residual (output minus
+    input) each stack produced then instead.
+
+    The transformer's forward and its blocks' forwards are wrapped while
+    attached; nothing else about the model changes. At most `max_skips`
+    steps are skipped per stream, and the first and last of `num_steps`
+    are always computed.
+    """
+
+    def __init__(
+        self,
+        transformer,
+        spec: StepCacheSpec,
+        num_steps: int = None,
+        threshold: float = None,
+        max_skip_ratio: float = 0.5,
+    ):
+        self.transformer = transformer
+        self.spec = spec
+        self.num_steps = int(float(num_steps)) if num_steps else None
+        self.threshold = spec.threshold if threshold is None else float(threshold)
+        self.max_skips = (
+            int(self.num_steps * max_skip_ratio) if self.num_steps else None
+        )
+        self.stacks = [
+            list(getattr(transformer, name, None) or []) for name in spec.stacks
+        ]
+        # The first block of the first stack decides; without a modulated input it always runs.
+        self.region_starts = [0] * len(self.stacks)
+        if spec.modulated_input is None and self.stacks:
+            self.region_starts[0] = 1
+        self.streams: Dict[int, _Stream] = {}
+        self.stream_index = 0
+        self.last_timestep = None
+        self.call: Optional[_Call] = None
+        self.templates: Dict[tuple, tuple] = {}
+        self.patched = []
+        self.calls = 0
+        self.skipped = 0
+        self.distances = []
+
+    # Patching
+
+    def _patch(self, module, forward):
+        self.patched.append((module, module.__dict__.get("forward")))
+        module.forward = forward
+
+    def attach(self):
+        if not self.stacks or not self.stacks[0]:
+            return
+        self._patch(self.transformer, self._wrap_transformer(self.transformer.forward))
+        for stack, blocks in enumerate(self.stacks):
+            for index, block in enumerate(blocks):
+                self._patch(block, self._wrap_block(stack, index, block, block.forward))
+
+    def detach(self):
+        for module, forward in reversed(self.patched):
+            if forward is None:
+                module.__dict__.pop("forward", None)
+            else:
+                module.forward = forward
+        self.patched = []
+
+    def _wrap_transformer(self, original):
+        def forward(*args, **kwargs):
+            inputs = _bind(self.transformer, original, args, kwargs)
+            stream = self._stream(inputs.get(self.spec.timestep))
+            call = _Call(stream, replayable=not inputs.get("skip_layers"))
+            self.call = call
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.call = None
+                self._finish(call)
+
+        return forward
+
+    def _wrap_block(self, stack: int, index: int, block, original):
+        last = index == len(self.stacks[stack]) - 1
+
+        def forward(*args, **kwargs):
+            call = self.call
+            if call is None:
+                return original(*args, **kwargs)
+            inputs = _bind(block, original, args, kwargs)
+            if stack == 0 and index == 0:
+                if self.spec.modulated_input is not None:
+                    signal = self.spec.modulated_input(block, inputs)
+                    call.skipping = self._decide(call, signal, inputs)
+                else:
+                    output = original(*args, **kwargs)
+                    names = self._names(block, original, output)
+                    hidden = names[-1] if names else None
+                    values = output if isinstance(output, tuple) else (output,)
+                    signal = None
+                    if hidden is not None and _shape(values[-1]) == _shape(inputs.get(hidden)):
+                        signal = values[-1] - inputs[hidden]
+                    call.skipping = self._decide(call, signal, inputs)
+                    return output
+            if index < self.region_starts[stack]:
+                return original(*args, **kwargs)
+            if call.skipping:
+                return self._replay(stack, index, inputs, last)
+            output = original(*args, **kwargs)
+            self._record(call, stack, index, block, original, inputs, output, last)
+            return output
+
+        return forward
+
+    # Streams and decisions
+
+    def _stream(self, timestep) -> _Stream:
+        value = _scalar(timestep) if timestep is not None else None
+        if value is not None and value == self.last_timestep:
+            # Another call for the same step: the next guidance branch.
+            self.stream_index += 1
+        else:
+            self.stream_index = 0
+        self.last_timestep = value
+        return self.streams.setdefault(self.stream_index, _Stream())
+
+    def _decide(self, call: _Call, signal, inputs: dict) -> bool:
+        stream = call.stream
+        previous = stream.signal
+        stream.signal = signal.detach() if signal is not None else None
+        call.shapes = tuple(_shape(value) for value in inputs.values())
+        distance = None
+        if signal is not None and previous is not None and previous.shape == signal.shape:
+            scale = previous.abs().mean()
+            if float(scale) > 1e-8:
+                distance = self.spec.rescale(
+                    float((signal - previous).abs().mean() / scale)
+                )
+                self.distances.append(distance)
+        final = self.num_steps is not None and stream.steps >= self.num_steps - 1
+        if (
+            distance is None
+            or stream.steps == 0
+            or final
+            or not call.replayable
+            or stream.residuals is None
+            or stream.shapes != call.shapes
+            or (self.max_skips is not None and stream.skipped >= self.max_skips)
+        ):
+            stream.accumulated = 0.0
+            return False
+        stream.accumulated += distance
+        if stream.accumulated < self.threshold:
+            return True
+        stream.accumulated = 0.0
+        return False
+
+    def _finish(self, call: _Call):
+        stream = call.stream
+        stream.steps += 1
+        self.calls += 1
+        if call.skipping:
+            stream.skipped += 1
+            self.skipped += 1
+            return
+        complete = all(
+            stack in call.residuals
+            for stack, blocks in enumerate(self.stacks)
+            if len(blocks) > self.region_starts[stack]
+        )
+        if call.replayable and complete:
+            stream.residuals = call.residuals
+            stream.shapes = call.shapes
+        else:
+            stream.residuals = None
+
+    # Residuals
+
+    def _names(self, block, original, output) -> Optional[list]:
+        """The parameter each element of a block's output updates."""
+        if isinstance(output, tuple):
+            if self.spec.returns is None or len(output) > len(self.spec.returns):
+                return None
+            return list(self.spec.returns[-len(output) :])
+        if _shape(output) is None:
+            return None
+        if type(block) not in _signatures:
+            _signatures[type(block)] = inspect.signature(original)
+        return [next(iter(_signatures[type(block)].parameters))]
+
+    def _record(self, call, stack, index, block, original, inputs, output, last):
+        names = self._names(block, original, output)
+        if names is None:
+            call.replayable = False
+            return
+        values = output if isinstance(output, tuple) else (output,)
+        # Skipped blocks pass their inputs through, so they must not change shapes.
+        for name, value in zip(names, values):
+            if value is not None and _shape(value) != _shape(inputs.get(name)):
+                call.replayable = False
+                return
+        self.templates[(stack, index)] = (
+            isinstance(output, tuple),
+            [name if value is not None else None for name, value in zip(names, values)],
+        )
+        if index == self.region_starts[stack]:
+            call.region_inputs[stack] = {
+                name: inputs[name] for name in names if inputs.get(name) is not None
+            }
+        if last:
+            start = call.region_inputs.get(stack, {})
+            call.residuals[stack] = {
+                name: (value - start[name]).detach()
+                for name, value in zip(names, values)
+                if value is not None and name in start
+            }
+
+    def _replay(self, stack: int, index: int, inputs: dict, last: bool):
+        is_tuple, names = self.templates[(stack, index)]
+        residual = self.call.stream.residuals[stack] if last else {}
+        values = []
+        for name in names:
+            value = inputs.get(name) if name is not None else None
+            if value is not None and name in residual:
+                value = value + residual[name]
+            values.append(value)
+        return tuple(values) if is_tuple else values[0]
+
+    def stats(self) -> dict:
+        return {
+            "model": self.spec.name,
+            "threshold": self.threshold,
+            "calls": self.calls,
+            "skipped": self.skipped,
+            "skipped_ratio": self.skipped / self.calls if self.calls else 0.0,
+            "mean_distance": (
+                sum(self.distances) / len(self.distances) if self.distances else None
+            ),
+        }
+
+
+_totals: Dict[str, dict] = {}
+_totals_lock = threading.Lock()
+
+
+def _add_totals(stats: dict):
+    with _totals_lock:
+        totals = _totals.setdefault(stats["model"], {"jobs": 0, "calls": 0, "skipped": 0})
+        totals["jobs"] += 1
+        totals["calls"] += stats["calls"]
+        totals["skipped"] += stats["skipped"]
+
+
+def step_cache_stats() -> Dict[str, dict]:
+    """Transformer calls and skipped steps per model since start-up."""
+    with _totals_lock:
+        return {model: dict(totals) for model, totals in _totals.items()}
+
+
+def user_thresholds(user_config: dict) -> Dict[str, float]:
+    """
+    Per-model thresholds from a user's config. `step_cache_thresholds` is
+    keyed by model name; `teacache_distance` is a TeaCache-rescaled distance,
+    so it only applies to the models cached that way.
+    """
+    user_config = user_config or {}
+    thresholds = {}
+    distance = user_config.get("teacache_distance")
+    if distance not in (None, True, ""):
+        for spec in SPECS:
+            if spec.modulated_input is not None:
+                thresholds[spec.name] = float(distance)
+    for name, value in (user_config.get("step_cache_thresholds") or {}).items():
+        thresholds[name] = float(value)
+    return thresholds
+
+
+def _threshold(spec: StepCacheSpec, threshold) -> Optional[float]:
+    if isinstance(threshold, dict):
+        threshold = threshold.get(spec.name)
+    if threshold is not None:
+        return float(threshold)
+    # Per-model thresholds re-calibrated on this worker's hardware, if any.
+    return config.get_config_value("step_cache_thresholds", {}).get(spec.name)
+
+
+@contextlib.contextmanager
+def step_cache(
+    pipeline,
+    num_inference_steps: int = None,
+    threshold=None,
+    disable: bool = False,
+):
+    """
+    Cache steps on whichever transformer `pipeline` has, for one job.
+    Pipelines without a supported transformer run unchanged.
+
+    `threshold` is one value for whichever model runs, or a dict of values
+    keyed by model name; models without one use their default.
+    """
+    caches = []
+    if not disable:
+        for component in dict.fromkeys(name for spec in SPECS for name in spec.components):
+            transformer = getattr(pipeline, component, None)
+            spec = find_spec(transformer) if transformer is not None else None
+            if spec is None or component not in spec.components:
+                continue
+            cache = StepCache(
+                transformer,
+                spec,
+                num_steps=num_inference_steps,
+                threshold=_threshold(spec, threshold),
+                max_skip_ratio=float(
+                    config.get_config_value("step_cache_max_skip_ratio", 0.5)
+                ),
+            )
+            cache.attach()
+            caches.append(cache)
+    try:
+        yield pipeline
+    finally:
+        for cache in caches:
+            cache.detach()
+            stats = cache.stats()
+            _add_totals(stats)
+            logger.info(
+                f"Step cache on {stats['model']} skipped {stats['skipped']} of {stats['calls']} transformer calls"
+                f" (threshold {stats['threshold']}, mean distance {stats['mean_distance']})."
+            )
@@ -31,6 +31,8 @@ from diffusers.utils.torch_utils import randn_tensor
 from diffusers.video_processor import VideoProcessor
 from PIL import Image
 from transformers import AutoTokenizer, CLIPImageProcessor, CLIPVisionModel, UMT5EncoderModel
+from discord_tron_client.classes.image_manipulation.embedding_cache import get_embedding_cache
+from discord_tron_client.classes.image_manipulation.guidance import build_guidance_engine
 
 if is_torch_xla_available():
     import torch_xla.core.xla_model as xm
@@ -172,27 +174,37 @@ class WanPipeline(DiffusionPipeline, WanLoraLoaderMixin):
         prompt = [prompt_clean(u) for u in prompt]
         batch_size = len(prompt)
 
-        text_inputs = self.tokenizer(
+        def encode(texts):
+            text_inputs = self.tokenizer(
+                texts,
+                padding="max_length",
+                max_length=max_sequence_length,
+                truncation=True,
+                add_special_tokens=True,
+                return_attention_mask=True,
+                return_tensors="pt",
+            )
+            text_input_ids, mask = text_inputs.input_ids, text_inputs.attention_mask
+            seq_lens = mask.gt(0).sum(dim=1).long()
+
+            embeds = self.text_encoder(
+                text_input_ids.to(encoder_device),
+                mask.to(encoder_device),
+            ).last_hidden_state
+            embeds = [u[:v] for u, v in zip(embeds, seq_lens)]
+            return torch.stack(
+                [torch.cat([u, u.new_zeros(max_sequence_length - u.size(0), u.size(1))]) for u in embeds], dim=0
+            )
+
+        # The negative prompt rarely changes, so it is almost always a cache hit.
+        prompt_embeds = get_embedding_cache().encode_batch(
+            [self.text_encoder],
             prompt,
-            padding="max_length",
-            max_length=max_sequence_length,
-            truncation=True,
-            add_special_tokens=True,
-            return_attention_mask=True,
-            return_tensors="pt",
+            encode,
+            max_len=max_sequence_length,
+            tokenizers=[self.tokenizer],
         )
-        text_input_ids, mask = text_inputs.input_ids, text_inputs.attention_mask
-        seq_lens = mask.gt(0).sum(dim=1).long()
-
-        prompt_embeds = self.text_encoder(
-            text_input_ids.to(encoder_device),
-            mask.to(encoder_device),
-        ).last_hidden_state
         prompt_embeds = prompt_embeds.to(dtype=target_dtype, device=target_device)
-        prompt_embeds = [u[:v] for u, v in zip(prompt_embeds, seq_lens)]
-        prompt_embeds = torch.stack(
-            [torch.cat([u, u.new_zeros(max_sequence_length - u.size(0), u.size(1))]) for u in prompt_embeds], dim=0
-        )
 
         _, seq_len, _ = prompt_embeds.shape
         prompt_embeds = prompt_embeds.repeat(1, num_videos_per_prompt, 1)
@@ -626,6 +638,23 @@ class WanPipeline(DiffusionPipeline, WanLoraLoaderMixin):
         self._current_timestep = None
         self._interrupt = False
 
+        # Both branches share one transformer call unless the negative one skips layers.
+        guidance_engine = build_guidance_engine(self, width, height, batch_size * num_videos_per_prompt)
+
+        def set_guidance_branches():
+            guidance_engine.set_branches(
+                cond={"encoder_hidden_states": prompt_embeds},
+                uncond=(
+                    {"encoder_hidden_states": negative_prompt_embeds} if self.do_classifier_free_guidance else None
+                ),
+                dtype=transformer_dtype,
+            )
+
+        def forward(**inputs):
+            return self.transformer(**inputs, return_dict=False)[0]
+
+        set_guidance_branches()
+
         with self.progress_bar(total=num_inference_steps) as progress_bar:
             for i, t in enumerate(timesteps):
                 if self.interrupt:
@@ -634,30 +663,17 @@ class WanPipeline(DiffusionPipeline, WanLoraLoaderMixin):
                 timestep = t.expand(latents.shape[0])
                 self._current_timestep = t
 
-                if self.do_classifier_free_guidance:
-                    fraction = i / float(num_inference_steps)
-                    skip_layer_indices = skip_guidance_layers
-                    if self.do_classifier_free_guidance and (
-                        skip_layer_guidance_start <= fraction < skip_layer_guidance_stop
-                    ):
-                        skip_layer_indices = None
-                    noise_pred_uncond = self.transformer(
-                        hidden_states=latents.to(transformer_dtype),
-                        timestep=timestep,
-                        encoder_hidden_states=negative_prompt_embeds.to(transformer_dtype),
-                        skip_layers=skip_layer_indices,
-                        return_dict=False,
-                    )[0]
-                else:
-                    noise_pred_uncond = None
-
-                noise_pred_text = self.transformer(
-                    hidden_states=latents.to(transformer_dtype),
-                    timestep=timestep,
-                    encoder_hidden_states=prompt_embeds.to(transformer_dtype),
-                    skip_layers=None,
-                    return_dict=False,
-                )[0]
+                fraction = i / float(num_inference_steps)
+                skip_layer_indices = skip_guidance_layers
+                if skip_layer_guidance_start <= fraction < skip_layer_guidance_stop:
+                    skip_layer_indices = None
+                noise_pred_text, noise_pred_uncond = guidance_engine(
+                    forward,
+                    step={"hidden_states": latents.to(transformer_dtype), "timestep": timestep},
+                    cond={"skip_layers": None},
+                    uncond={"skip_layers": skip_layer_indices},
+                    guidance=self.do_classifier_free_guidance,
+                )
 
                 if self.do_classifier_free_guidance:
                     noise_pred = noise_pred_uncond + self.guidance_scale * (noise_pred_text - noise_pred_uncond)
@@ -675,6 +691,7 @@ class WanPipeline(DiffusionPipeline, WanLoraLoaderMixin):
                     latents = callback_outputs.pop("latents", latents)
                     prompt_embeds = callback_outputs.pop("prompt_embeds", prompt_embeds)
                     negative_prompt_embeds = callback_outputs.pop("negative_prompt_embeds", negative_prompt_embeds)
+                    set_guidance_branches()
 
                 if i == len(timesteps) - 1 or ((i + 1) > num_warmup_steps and (i + 1) % self.scheduler.order == 0):
                     progress_bar.update()
@@ -836,6 +853,22 @@ class WanPipeline(DiffusionPipeline, WanLoraLoaderMixin):
         self._current_timestep = None
         self._interrupt = False
 
+        # Both branches share one call to whichever transformer the step runs on.
+        guidance_engine = build_guidance_engine(self, width, height, batch_size * num_videos_per_prompt)
+
+        def set_guidance_branches():
+            guidance_engine.set_branches(
+                cond={"encoder_hidden_states": prompt_embeds},
+                uncond=(
+                    {"encoder_hidden_states": negative_prompt_embeds} if self.do_classifier_free_guidance else None
+                ),
+            )
+
+        def forward(**inputs):
+            return current_model(**inputs, return_dict=False)[0]
+
+        set_guidance_branches()
+
         with self.progress_bar(total=num_inference_steps) as progress_bar:
             for i, t in enumerate(timesteps):
                 if self.interrupt:
@@ -865,27 +898,15 @@ class WanPipeline(DiffusionPipeline, WanLoraLoaderMixin):
                 if current_model is None:
                     raise ValueError("No transformer available to process the current timestep.")
 
-                with _cache_context_or_noop(current_model, "cond"):
-                    noise_pred = current_model(
-                        hidden_states=latent_model_input,
-                        timestep=timestep,
-                        encoder_hidden_states=prompt_embeds,
-                        encoder_hidden_states_image=image_embeds,
-                        attention_kwargs=attention_kwargs,
-                        return_dict=False,
-                    )[0]
-
-                if self.do_classifier_free_guidance:
-                    with _cache_context_or_noop(current_model, "uncond"):
-                        noise_uncond = current_model(
-                            hidden_states=latent_model_input,
-                            timestep=timestep,
-                            encoder_hidden_states=negative_prompt_embeds,
-                            encoder_hidden_states_image=image_embeds,
-                            attention_kwargs=attention_kwargs,
-                            return_dict=False,
-                        )[0]
-                        noise_pred = noise_uncond + current_guidance_scale * (noise_pred - noise_uncond)
+                noise_pred, noise_uncond = guidance_engine(
+                    forward,
+                    step={"hidden_states": latent_model_input, "timestep": timestep},
+                    shared={"encoder_hidden_states_image": image_embeds, "attention_kwargs": attention_kwargs},
+                    guidance=self.do_classifier_free_guidance,
+                    context=lambda name: _cache_context_or_noop(current_model, name),
+                )
+                if noise_uncond is not None:
+                    noise_pred = noise_uncond + current_guidance_scale * (noise_pred - noise_uncond)
 
                 latents = self.scheduler.step(noise_pred, t, latents, return_dict=False)[0]
 
@@ -898,6 +919,7 @@ class WanPipeline(DiffusionPipeline, WanLoraLoaderMixin):
                     latents = callback_outputs.pop("latents", latents)
                     prompt_embeds = callback_outputs.pop("prompt_embeds", prompt_embeds)
                     negative_prompt_embeds = callback_outputs.pop("negative_prompt_embeds", negative_prompt_embeds)
+                    set_guidance_branches()
 
                 if i == len(timesteps) - 1 or ((i + 1) > num_warmup_steps and (i + 1) % self.scheduler.order == 0):
                     progress_bar.update()
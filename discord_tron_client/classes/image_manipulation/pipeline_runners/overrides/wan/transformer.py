@@ -28,6 +28,7 @@ from diffusers.models.modeling_outputs import Transformer2DModelOutput
 from diffusers.models.modeling_utils import ModelMixin
 from diffusers.models.normalization import FP32LayerNorm
 from diffusers.utils import USE_PEFT_BACKEND, logging, scale_lora_layers, unscale_lora_layers
+from discord_tron_client.classes.image_manipulation.rope_cache import get_rope_cache
 
 logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
 
@@ -234,6 +235,7 @@ class WanRotaryPosEmbed(nn.Module):
         self.attention_head_dim = attention_head_dim
         self.patch_size = patch_size
         self.max_seq_len = max_seq_len
+        self.theta = theta
 
         h_dim = w_dim = 2 * (attention_head_dim // 6)
         t_dim = attention_head_dim - h_dim - w_dim
@@ -255,8 +257,20 @@ class WanRotaryPosEmbed(nn.Module):
         batch_size, num_channels, num_frames, height, width = hidden_states.shape
         p_t, p_h, p_w = self.patch_size
         ppf, pph, ppw = num_frames // p_t, height // p_h, width // p_w
+        # The table only depends on the latent grid, so it is built once per resolution.
+        key = (
+            "wan_rope",
+            self.attention_head_dim,
+            tuple(self.patch_size),
+            self.max_seq_len,
+            self.theta,
+            (ppf, pph, ppw),
+            str(hidden_states.device),
+        )
+        return get_rope_cache().grid(key, lambda: self._freqs(hidden_states.device, ppf, pph, ppw))
 
-        self.freqs = self.freqs.to(hidden_states.device)
+    def _freqs(self, device: torch.device, ppf: int, pph: int, ppw: int) -> torch.Tensor:
+        self.freqs = self.freqs.to(device)
         freqs = self.freqs.split_with_sizes(
             [
                 self.attention_head_dim // 2 - 2 * (self.attention_head_dim // 6),
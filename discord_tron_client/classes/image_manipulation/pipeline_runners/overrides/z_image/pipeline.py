@@ -37,6 +37,8 @@ from diffusers.utils import (
 from diffusers.utils.torch_utils import randn_tensor
 from transformers import AutoTokenizer, PreTrainedModel
 
+from discord_tron_client.classes.image_manipulation.guidance import build_guidance_engine
+
 from .pipeline_output import ZImagePipelineOutput
 from .transformer import ZImageTransformer2DModel
 
@@ -800,6 +802,20 @@ class ZImagePipeline(DiffusionPipeline, ZImageLoraLoaderMixin, FromSingleFileMix
         num_warmup_steps = max(len(timesteps) - num_inference_steps * self.scheduler.order, 0)
         self._num_timesteps = len(timesteps)
 
+        # The positive and negative captions share one transformer call when it fits.
+        guidance_engine = build_guidance_engine(self, width, height, batch_size * num_images_per_prompt)
+
+        def set_guidance_branches():
+            guidance_engine.set_branches(
+                cond={"cap_feats": prompt_embeds},
+                uncond={"cap_feats": negative_prompt_embeds} if self.do_classifier_free_guidance else None,
+            )
+
+        def forward(**inputs):
+            return self.transformer(**inputs)[0]
+
+        set_guidance_branches()
+
         # 6. Denoising loop
         with self.progress_bar(total=num_inference_steps) as progress_bar:
             for i, t in enumerate(timesteps):
@@ -827,29 +843,17 @@ class ZImagePipeline(DiffusionPipeline, ZImageLoraLoaderMixin, FromSingleFileMix
                 within_cfg_window = i >= no_cfg_until_timestep and (cfg_end_timestep is None or i <= cfg_end_timestep)
                 apply_cfg = self.do_classifier_free_guidance and current_guidance_scale > 0 and within_cfg_window
 
-                if apply_cfg:
-                    # Prepare inputs for CFG
-                    latent_model_input = torch.cat([latents.to(dtype)] * 2)
-                    prompt_embeds_model_input = prompt_embeds + negative_prompt_embeds
-                    timestep_model_input = torch.cat([timestep] * 2)
-                else:
-                    latent_model_input = latents.to(dtype)
-                    prompt_embeds_model_input = prompt_embeds
-                    timestep_model_input = timestep
-
-                latent_model_input = latent_model_input.unsqueeze(2)
-                latent_model_input_list = list(latent_model_input.unbind(dim=0))
-
-                model_out_list = self.transformer(
-                    latent_model_input_list,
-                    timestep_model_input,
-                    prompt_embeds_model_input,
-                )[0]
+                latent_model_input_list = list(latents.to(dtype).unsqueeze(2).unbind(dim=0))
+                pos_out_list, neg_out_list = guidance_engine(
+                    forward,
+                    step={"x": latent_model_input_list, "t": timestep},
+                    guidance=apply_cfg,
+                )
 
                 if apply_cfg:
                     # Perform CFG
-                    pos_out = torch.stack([out.float() for out in model_out_list[:batch_size]], dim=0)
-                    neg_out = torch.stack([out.float() for out in model_out_list[batch_size:]], dim=0)
+                    pos_out = torch.stack([out.float() for out in pos_out_list], dim=0)
+                    neg_out = torch.stack([out.float() for out in neg_out_list], dim=0)
 
                     if use_cfg_zero_star:
                         pos_flat = pos_out.view(batch_size, -1)
@@ -876,7 +880,7 @@ class ZImagePipeline(DiffusionPipeline, ZImageLoraLoaderMixin, FromSingleFileMix
 
                     noise_pred = guided
                 else:
-                    noise_pred = torch.stack([t.float() for t in model_out_list], dim=0)
+                    noise_pred = torch.stack([t.float() for t in pos_out_list], dim=0)
 
                 noise_pred = noise_pred.squeeze(2)
                 noise_pred = -noise_pred
@@ -915,6 +919,7 @@ class ZImagePipeline(DiffusionPipeline, ZImageLoraLoaderMixin, FromSingleFileMix
                     latents = callback_outputs.pop("latents", latents)
                     prompt_embeds = callback_outputs.pop("prompt_embeds", prompt_embeds)
                     negative_prompt_embeds = callback_outputs.pop("negative_prompt_embeds", negative_prompt_embeds)
+                    set_guidance_branches()
 
                 # call the callback, if provided
                 if i == len(timesteps) - 1 or ((i + 1) > num_warmup_steps and (i + 1) % self.scheduler.order == 0):
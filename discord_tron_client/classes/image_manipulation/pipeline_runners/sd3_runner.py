@@ -21,6 +21,9 @@ class SD3PipelineRunner(BasePipelineRunner):
         # Get user_config and delete it from args, it doesn't get passed to the pipeline
         user_config = args.get("user_config", None)
         del args["user_config"]
+        enable_teacache, teacache_distance = self._step_cache_settings(
+            user_config, prompt_parameters
+        )
         args["skip_guidance_layers"] = user_config.get("skip_guidance_layers", -1)
         if args["skip_guidance_layers"] == -1:
             # set the true default
@@ -48,8 +51,6 @@ class SD3PipelineRunner(BasePipelineRunner):
             "cache_interval",
             "cache_branch_id",
             "skip_mode",
-            "enable_teacache",
-            "teacache_distance",
         ]:
             if unwanted_arg in args:
                 del args[unwanted_arg]
@@ -91,19 +92,11 @@ class SD3PipelineRunner(BasePipelineRunner):
         # Call the pipeline with arguments and return the images
         start_time = perf_counter()
         enable_sageattn = user_config.get("enable_sageattn", True)
-        enable_teacache = user_config.get("enable_teacache", False)
-        if "enable_teacache" in prompt_parameters:
-            enable_teacache = True
-            del prompt_parameters["teacache"]
         with optimize_pipeline(
             pipeline=self.pipeline,
             enable_teacache=enable_teacache,
             teacache_num_inference_steps=args.get("num_inference_steps"),
-            teacache_rel_l1_thresh=float(
-                prompt_parameters.get(
-                    "teacache_distance", user_config.get("teacache_distance", 0.6)
-                )
-            ),
+            teacache_rel_l1_thresh=teacache_distance,
             enable_deepcache=False,
             deepcache_cache_interval=3,
             deepcache_cache_branch_id=0,
@@ -111,7 +104,8 @@ class SD3PipelineRunner(BasePipelineRunner):
             enable_sageattn=enable_sageattn,
         ):
             result = self.pipeline(**args).images
-        torch.cuda.synchronize()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
         end_time = perf_counter()
         self.generation_time = end_time - start_time
 
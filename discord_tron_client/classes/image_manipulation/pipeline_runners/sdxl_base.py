@@ -80,7 +80,8 @@ class SdxlBasePipelineRunner(BasePipelineRunner):
             ),
         ):
             result = self.pipeline(**args).images
-        torch.cuda.synchronize()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
         end_time = perf_counter()
         self.generation_time = end_time - start_time
 
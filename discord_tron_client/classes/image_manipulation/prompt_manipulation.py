@@ -1,6 +1,9 @@
 from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.image_manipulation.embedding_cache import (
+    get_embedding_cache,
+)
 
-import logging
+import logging, torch
 
 config = AppConfig()
 if config.enable_compel():
@@ -105,11 +108,19 @@ class PromptManipulation:
         if self.has_dual_text_encoders(pipeline) and not use_second_encoder_only:
             # SDXL Refiner and Base can both use the 2nd tokenizer/encoder.
             logging.debug(f"Initialising Compel prompt manager with dual encoders.")
+            self.tokenizers = [self.pipeline.tokenizer, self.pipeline.tokenizer_2]
+            self.text_encoders = [
+                self.pipeline.text_encoder,
+                self.pipeline.text_encoder_2,
+            ]
+            self.embeddings_type = (
+                ReturnedEmbeddingsType.PENULTIMATE_HIDDEN_STATES_NON_NORMALIZED
+            )
             self.compel = Compel(
-                tokenizer=[self.pipeline.tokenizer, self.pipeline.tokenizer_2],
-                text_encoder=[self.pipeline.text_encoder, self.pipeline.text_encoder_2],
+                tokenizer=self.tokenizers,
+                text_encoder=self.text_encoders,
                 truncate_long_prompts=False,
-                returned_embeddings_type=ReturnedEmbeddingsType.PENULTIMATE_HIDDEN_STATES_NON_NORMALIZED,
+                returned_embeddings_type=self.embeddings_type,
                 requires_pooled=[
                     False,  # CLIP-L does not produce pooled embeds.
                     True,  # CLIP-G produces pooled embeds.
@@ -120,11 +131,16 @@ class PromptManipulation:
             logging.debug(
                 f"Initialising Compel prompt manager with just the 2nd text encoder."
             )
+            self.tokenizers = [self.pipeline.tokenizer_2]
+            self.text_encoders = [self.pipeline.text_encoder_2]
+            self.embeddings_type = (
+                ReturnedEmbeddingsType.PENULTIMATE_HIDDEN_STATES_NON_NORMALIZED
+            )
             self.compel = Compel(
                 tokenizer=self.pipeline.tokenizer_2,
                 text_encoder=self.pipeline.text_encoder_2,
                 truncate_long_prompts=False,
-                returned_embeddings_type=ReturnedEmbeddingsType.PENULTIMATE_HIDDEN_STATES_NON_NORMALIZED,
+                returned_embeddings_type=self.embeddings_type,
                 requires_pooled=True,
             )
         else:
@@ -134,11 +150,14 @@ class PromptManipulation:
             )
             pipe_tokenizer = self.pipeline.tokenizer
             pipe_text_encoder = self.pipeline.text_encoder
+            self.tokenizers = [pipe_tokenizer]
+            self.text_encoders = [pipe_text_encoder]
+            self.embeddings_type = ReturnedEmbeddingsType.LAST_HIDDEN_STATES_NORMALIZED
             self.compel = Compel(
                 tokenizer=pipe_tokenizer,
                 text_encoder=pipe_text_encoder,
                 truncate_long_prompts=False,
-                returned_embeddings_type=ReturnedEmbeddingsType.LAST_HIDDEN_STATES_NORMALIZED,
+                returned_embeddings_type=self.embeddings_type,
             )
 
     def should_enable(self, pipeline, user_config: dict = None):
@@ -163,38 +182,72 @@ class PromptManipulation:
                 f"Cannot use PromptManipulation on a model without a tokenizer."
             )
 
+    def encode_prompt(self, prompt: str):
+        """
+        Compel conditioning for one prompt, plus its pooled embed when the
+        pipeline has dual encoders. Repeated prompts come from the cache.
+        """
+        cache = get_embedding_cache()
+        key = cache.key(
+            self.text_encoders,
+            prompt,
+            tokenizers=self.tokenizers,
+            embeddings_type=self.embeddings_type,
+        )
+        if self.has_dual_text_encoders(self.pipeline):
+            return cache.get_or_encode(key, lambda: tuple(self.compel(prompt)))
+        return cache.get_or_encode(
+            key, lambda: self.compel.build_conditioning_tensor(prompt)
+        )
+
     def process_long_prompt(self, positive_prompt: str, negative_prompt: str):
+        return self.process_long_prompts([positive_prompt], [negative_prompt])
+
+    def process_long_prompts(self, positive_prompts: list, negative_prompts: list):
+        """
+        Conditioning for several jobs at once, concatenated in job order and
+        padded to one length, so that they can share a pipeline call.
+        """
         batch_size = config.maximum_batch_size()
-        if self.has_dual_text_encoders(self.pipeline):
-            logging.debug(
-                f"Running dual encoder Compel pipeline for batch size {batch_size}."
-            )
-            # We need to make a list of positive_prompt * batch_size count.
-            positive_prompt = [positive_prompt] * batch_size
-            conditioning, pooled_embed = self.compel(positive_prompt)
-            negative_prompt = [negative_prompt] * batch_size
-            negative_conditioning, negative_pooled_embed = self.compel(negative_prompt)
-        else:
-            logging.debug(f"Running single encoder Compel pipeline.")
-            conditioning = self.compel.build_conditioning_tensor(positive_prompt)
-            negative_conditioning = self.compel.build_conditioning_tensor(
-                negative_prompt
-            )
-        [
-            conditioning,
-            negative_conditioning,
-        ] = self.compel.pad_conditioning_tensors_to_same_length(
-            [conditioning, negative_conditioning]
+        dual_encoders = self.has_dual_text_encoders(self.pipeline)
+        conditionings, negative_conditionings = [], []
+        pooled_embeds, negative_pooled_embeds = [], []
+        for positive_prompt, negative_prompt in zip(positive_prompts, negative_prompts):
+            if dual_encoders:
+                logging.debug(
+                    f"Running dual encoder Compel pipeline for batch size {batch_size}."
+                )
+                # Encode each prompt once, then repeat it for the batch.
+                conditioning, pooled_embed = self.encode_prompt(positive_prompt)
+                negative_conditioning, negative_pooled_embed = self.encode_prompt(
+                    negative_prompt
+                )
+                conditionings.append(conditioning.repeat(batch_size, 1, 1))
+                negative_conditionings.append(
+                    negative_conditioning.repeat(batch_size, 1, 1)
+                )
+                pooled_embeds.append(pooled_embed.repeat(batch_size, 1))
+                negative_pooled_embeds.append(
+                    negative_pooled_embed.repeat(batch_size, 1)
+                )
+            else:
+                logging.debug(f"Running single encoder Compel pipeline.")
+                conditionings.append(self.encode_prompt(positive_prompt))
+                negative_conditionings.append(self.encode_prompt(negative_prompt))
+        padded = self.compel.pad_conditioning_tensors_to_same_length(
+            conditionings + negative_conditionings
         )
-        if self.has_dual_text_encoders(self.pipeline):
+        conditioning = torch.cat(padded[: len(conditionings)], dim=0)
+        negative_conditioning = torch.cat(padded[len(conditionings) :], dim=0)
+        if dual_encoders:
             logging.debug(
                 f"Returning pooled embeds along with positive/negative conditionings."
             )
             return (
                 conditioning,
                 negative_conditioning,
-                pooled_embed,
-                negative_pooled_embed,
+                torch.cat(pooled_embeds, dim=0),
+                torch.cat(negative_pooled_embeds, dim=0),
             )
         return conditioning, negative_conditioning
 
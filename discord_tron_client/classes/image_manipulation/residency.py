@@ -0,0 +1,416 @@
+import logging, math, time
+from typing import Any, Callable, Dict, List, Optional
+from discord_tron_client.classes.metrics import (
+    COMPONENT_MOVE_BYTES,
+    COMPONENT_MOVE_SECONDS,
+    COMPONENT_MOVES,
+    PIPELINE_DROP_BYTES,
+    PIPELINE_DROPS,
+)
+
+logger = logging.getLogger(__name__)
+
+GPU = "cuda"
+CPU = "cpu"
+DISK = "disk"
+# Faster tiers first.
+TIERS = (GPU, CPU, DISK)
+
+
+def component_size_bytes(module) -> int:
+    """
+    The bytes held by a module's parameters and buffers. Anything with a
+    `size_bytes` attribute (eg. a fake module) reports that instead.
+    """
+    size = getattr(module, "size_bytes", None)
+    if size is not None:
+        return int(size)
+    total = 0
+    seen = set()
+    for getter in ("parameters", "buffers"):
+        if not hasattr(module, getter):
+            continue
+        for tensor in getattr(module, getter)():
+            if tensor is None:
+                continue
+            # Tied weights are only counted once.
+            ident = id(tensor)
+            if ident in seen:
+                continue
+            seen.add(ident)
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def is_movable_component(module) -> bool:
+    return module is not None and hasattr(module, "to") and (
+        hasattr(module, "parameters") or hasattr(module, "size_bytes")
+    )
+
+
+class ComponentEntry:
+    """
+    One resident component (transformer, text encoder, VAE...). A component
+    shared between pipelines has one entry with several owners.
+    """
+
+    def __init__(self, model_id: str, name: str, module, size_bytes: int, tier: str):
+        self.model_id = model_id
+        self.name = name
+        self.owners = {model_id}
+        self.module = module
+        self.size_bytes = max(int(size_bytes), 1)
+        self.tier = tier
+        self.frequency = 0
+        self.priority = 0.0
+        # Measured seconds to bring this component up from the tier below.
+        self.load_seconds: Optional[float] = None
+        self.transfer_seconds: Optional[float] = None
+        self.last_used = time.monotonic()
+
+    @property
+    def key(self) -> int:
+        return id(self.module)
+
+    @property
+    def shared(self) -> bool:
+        return len(self.owners) > 1
+
+    def __repr__(self):
+        return f"<ComponentEntry {self.model_id}/{self.name} {self.size_bytes}B on {self.tier} H={self.priority:.4g}>"
+
+
+def _budget(budget_bytes: Optional[int]) -> float:
+    return math.inf if budget_bytes is None else int(budget_bytes)
+
+
+class ResidencyManager:
+    """
+    Decides which model components live on the GPU, in (optionally pinned)
+    CPU memory, or only on disk, within byte budgets for the first two.
+
+    Eviction follows GreedyDual-Size-Frequency, per tier: every component
+    carries a priority H = L + frequency * cost / size, where `cost` is the
+    measured (or estimated) time to bring it back into the tier, and L is
+    the tier's clock, raised to the H of each victim so that entries which
+    stop being used eventually age out. The lowest H is evicted first, so
+    big, cheap-to-reload, rarely used components go before small, expensive,
+    popular ones.
+
+    GPU evictions happen per component. A model is reloaded from disk as a
+    whole, so pushing any of its components to disk drops the whole model.
+
+    Components are tracked by identity: a module that appears in several
+    pipelines (see ComponentStore) is counted and moved once, and every
+    owner sees it wherever it lives.
+
+    The manager does no tensor work of its own: `mover(entry, tier)` moves a
+    component between GPU and CPU, and `dropper(model_id)` releases a model
+    that has been pushed to disk. Both default to no-ops, which keeps the
+    class usable with fake modules of known size.
+
+    A budget of None means the tier's size is unknown, and it is never
+    evicted from to make room.
+    """
+
+    def __init__(
+        self,
+        gpu_budget_bytes: Optional[int],
+        cpu_budget_bytes: Optional[int],
+        mover: Callable[[ComponentEntry, str], None] = None,
+        dropper: Callable[[str], None] = None,
+        external_cpu_usage: Callable[[], int] = None,
+        pcie_bytes_per_second: float = 12e9,
+        disk_bytes_per_second: float = 1.5e9,
+    ):
+        self.budgets = {
+            GPU: _budget(gpu_budget_bytes),
+            CPU: _budget(cpu_budget_bytes),
+        }
+        self.mover = mover or (lambda entry, tier: None)
+        self.dropper = dropper or (lambda model_id: None)
+        self.external_cpu_usage = external_cpu_usage
+        self.pcie_bytes_per_second = pcie_bytes_per_second
+        self.disk_bytes_per_second = disk_bytes_per_second
+        self.components: Dict[str, Dict[str, ComponentEntry]] = {}
+        self._by_module: Dict[int, ComponentEntry] = {}
+        self.clock = {GPU: 0.0, CPU: 0.0}
+        self.evictions = {GPU: 0, CPU: 0}
+        self.promotions = 0
+
+    # Bookkeeping
+
+    def register(
+        self,
+        model_id: str,
+        components: Dict[str, Any],
+        tier: str = CPU,
+        load_seconds: float = None,
+    ) -> List[ComponentEntry]:
+        """
+        Track a freshly loaded model. `components` maps names to modules;
+        anything that cannot be moved between devices is ignored.
+        `load_seconds` is how long the load from disk took, and is shared
+        between the components by size.
+        """
+        entries = {}
+        loaded = []
+        for name, module in components.items():
+            if not is_movable_component(module):
+                continue
+            entry = self._by_module.get(id(module))
+            if entry is None:
+                entry = ComponentEntry(
+                    model_id, name, module, component_size_bytes(module), tier
+                )
+                self._by_module[id(module)] = entry
+                loaded.append(entry)
+            entry.owners.add(model_id)
+            entries[name] = entry
+        self.components[model_id] = entries
+        if load_seconds is not None:
+            # Only the components that were actually read from disk cost time.
+            total = sum(e.size_bytes for e in loaded) or 1
+            for entry in loaded:
+                entry.load_seconds = load_seconds * entry.size_bytes / total
+        for entry in entries.values():
+            self._reprioritise(entry)
+        if tier in self.budgets:
+            self._make_room(tier, 0, protect={model_id})
+        return list(entries.values())
+
+    def unregister(self, model_id: str):
+        self._release(model_id)
+
+    def replace_component(self, model_id: str, name: str, module, tier: str = CPU):
+        """Swap one of a model's components, eg. a VAE attached after loading."""
+        entries = self.components.get(model_id)
+        if entries is None:
+            return
+        old = entries.pop(name, None)
+        if old is not None:
+            self._release_entry(old, model_id)
+        if not is_movable_component(module):
+            return
+        entry = self._by_module.get(id(module))
+        if entry is None:
+            entry = ComponentEntry(
+                model_id, name, module, component_size_bytes(module), tier
+            )
+            self._by_module[id(module)] = entry
+        entry.owners.add(model_id)
+        entries[name] = entry
+        self._reprioritise(entry)
+
+    def is_tracked(self, module) -> bool:
+        """Whether any registered model still holds this module."""
+        return id(module) in self._by_module
+
+    def _release_entry(self, entry: ComponentEntry, model_id: str):
+        entry.owners.discard(model_id)
+        if entry.model_id == model_id and entry.owners:
+            entry.model_id = next(iter(entry.owners))
+        if not entry.owners:
+            self._by_module.pop(id(entry.module), None)
+
+    def _release(self, model_id: str) -> dict:
+        entries = self.components.pop(model_id, None) or {}
+        for entry in entries.values():
+            self._release_entry(entry, model_id)
+        return entries
+
+    def record_load(self, model_id: str, seconds: float):
+        entries = [
+            e for e in self.components.get(model_id, {}).values() if not e.shared
+        ]
+        total = sum(e.size_bytes for e in entries) or 1
+        for entry in entries:
+            entry.load_seconds = seconds * entry.size_bytes / total
+            self._reprioritise(entry)
+
+    def touch(self, model_id: str):
+        """Count a use of the model and refresh its priority."""
+        now = time.monotonic()
+        for entry in self.components.get(model_id, {}).values():
+            entry.frequency += 1
+            entry.last_used = now
+            self._reprioritise(entry)
+
+    def _cost(self, entry: ComponentEntry, tier: str) -> float:
+        """Seconds to bring the component back into `tier` after eviction."""
+        transfer = entry.transfer_seconds
+        if transfer is None:
+            transfer = entry.size_bytes / self.pcie_bytes_per_second
+        if tier == GPU:
+            return transfer
+        load = entry.load_seconds
+        if load is None:
+            load = entry.size_bytes / self.disk_bytes_per_second
+        return load
+
+    def _reprioritise(self, entry: ComponentEntry):
+        if entry.tier not in self.clock:
+            entry.priority = 0.0
+            return
+        entry.priority = self.clock[entry.tier] + max(
+            entry.frequency, 1
+        ) * self._cost(entry, entry.tier) / entry.size_bytes
+
+    # Queries
+
+    def entries(self, tier: str = None) -> List[ComponentEntry]:
+        return [
+            entry
+            for entry in self._by_module.values()
+            if tier is None or entry.tier == tier
+        ]
+
+    def tier_bytes(self, tier: str) -> int:
+        used = sum(e.size_bytes for e in self.entries(tier))
+        if tier == CPU and self.external_cpu_usage is not None:
+            try:
+                used += int(self.external_cpu_usage())
+            except Exception as e:
+                logger.warning(f"Could not read external memory usage: {e}")
+        return used
+
+    def model_tier(self, model_id: str) -> str:
+        """The slowest tier any of the model's components sits in."""
+        entries = self.components.get(model_id)
+        if entries is None:
+            return DISK
+        if not entries:
+            return CPU
+        return max((e.tier for e in entries.values()), key=TIERS.index)
+
+    def model_bytes(self, model_id: str) -> int:
+        return sum(e.size_bytes for e in self.components.get(model_id, {}).values())
+
+    # Placement
+
+    def make_resident(self, model_id: str, tier: str = GPU, force: bool = False) -> bool:
+        """
+        Move all of a model's components into `tier`, evicting other
+        components as needed. If the model cannot fit even with everything
+        else evicted, nothing is evicted and False is returned, unless
+        `force` is set, in which case the tier is cleared and the model is
+        moved in over budget.
+        """
+        entries = [
+            e for e in self.components.get(model_id, {}).values() if e.tier != tier
+        ]
+        needed = sum(e.size_bytes for e in entries)
+        pinned = sum(
+            e.size_bytes for e in self.components.get(model_id, {}).values()
+            if e.tier == tier
+        )
+        fits = pinned + needed <= self.budgets[tier]
+        if not fits and not force:
+            logger.warning(
+                f"{model_id} needs {pinned + needed} bytes, more than the {tier} budget of {self.budgets[tier]}."
+            )
+            return False
+        self._make_room(tier, needed, protect={model_id})
+        for entry in entries:
+            self._move(entry, tier, protect={model_id})
+            self.promotions += 1
+        self.touch(model_id)
+        return fits
+
+    def _move(self, entry: ComponentEntry, tier: str, protect: set = frozenset()):
+        if entry.tier == tier:
+            return
+        if tier == CPU and entry.tier == GPU:
+            # Make sure the component has somewhere to land first, or let it
+            # fall through to disk.
+            if not self._make_room(
+                CPU, entry.size_bytes, protect=protect | entry.owners
+            ):
+                tier = DISK
+        if tier == DISK:
+            # Every pipeline holding the component goes with it.
+            for owner in list(entry.owners):
+                self._drop_model(owner)
+            return
+        started = time.monotonic()
+        self.mover(entry, tier)
+        elapsed = time.monotonic() - started
+        if GPU in (tier, entry.tier) and elapsed > 0:
+            entry.transfer_seconds = elapsed
+        COMPONENT_MOVES.inc(source=entry.tier, target=tier)
+        COMPONENT_MOVE_BYTES.inc(entry.size_bytes, source=entry.tier, target=tier)
+        COMPONENT_MOVE_SECONDS.observe(elapsed, source=entry.tier, target=tier)
+        entry.tier = tier
+        self._reprioritise(entry)
+
+    def _drop_model(self, model_id: str):
+        if model_id not in self.components:
+            return
+        entries = self._release(model_id)
+        freed = sum(e.size_bytes for e in entries.values() if not e.owners)
+        logger.info(f"Dropping {model_id} from memory ({freed} bytes freed).")
+        PIPELINE_DROPS.inc()
+        PIPELINE_DROP_BYTES.inc(freed)
+        self.dropper(model_id)
+
+    def _make_room(
+        self, tier: str, incoming_bytes: int, protect: set = frozenset()
+    ) -> bool:
+        """Evict lowest-priority components from `tier` until `incoming_bytes` fit."""
+        budget = self.budgets[tier]
+        lower = TIERS[TIERS.index(tier) + 1]
+        while self.tier_bytes(tier) + incoming_bytes > budget:
+            candidates = [e for e in self.entries(tier) if not e.owners & protect]
+            if not candidates:
+                return False
+            victim = min(candidates, key=lambda e: (e.priority, e.last_used))
+            logger.info(f"Evicting {victim} from {tier} to {lower}.")
+            self.clock[tier] = max(self.clock[tier], victim.priority)
+            self.evictions[tier] += 1
+            self._move(victim, lower, protect=protect)
+        return True
+
+    def enforce_budget(self, tier: str = CPU, protect: set = frozenset()) -> bool:
+        """Evict from `tier` until it is back within budget."""
+        return self._make_room(tier, 0, protect=set(protect))
+
+    def demote(self, model_id: str, tier: str = CPU, protect: set = frozenset()):
+        """
+        Push a model down to `tier`. Components shared with a model in
+        `protect` stay where they are, and demoting to disk only drops this
+        model's hold on shared components.
+        """
+        if tier == DISK:
+            self._drop_model(model_id)
+            return
+        for entry in list(self.components.get(model_id, {}).values()):
+            if entry.owners & set(protect):
+                continue
+            if TIERS.index(entry.tier) < TIERS.index(tier):
+                self._move(entry, tier, protect=set(protect))
+
+    def stats(self) -> dict:
+        """
+        A copy of the manager's state for readers on other threads, eg. the
+        metrics server. The manager keeps no lock, so a copy that races with
+        a change to one of its dicts is retried.
+        """
+        for _ in range(3):
+            try:
+                return self._stats()
+            except RuntimeError:
+                continue
+        return self._stats()
+
+    def _stats(self) -> dict:
+        return {
+            "budgets": dict(self.budgets),
+            "used": {tier: self.tier_bytes(tier) for tier in self.budgets},
+            "clock": dict(self.clock),
+            "evictions": dict(self.evictions),
+            "promotions": self.promotions,
+            "shared_components": sum(1 for e in self.entries() if e.shared),
+            "models": {
+                model_id: self.model_tier(model_id) for model_id in self.components
+            },
+        }
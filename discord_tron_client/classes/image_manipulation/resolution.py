@@ -58,7 +58,7 @@ class ResolutionManager:
     ]
 
     @staticmethod
-    def get_resolutions_with_extra_data(aspectratio=None):
+    def get_resolutions_with_extra_data(aspectratio=None, model: str = None):
         # Return ResolutionManager.resolutions after adding more information to each row, such as whether we will attention scale that resolution, and its aspect ratio
         for res in ResolutionManager.resolutions:
             if (
@@ -67,7 +67,7 @@ class ResolutionManager:
             ):
                 continue
             res["aspect_ratio"] = ResolutionManager.aspect_ratio(res)
-            res["attention_scale"] = hardware.should_disable_resolution(res)
+            res["attention_scale"] = hardware.should_disable_resolution(res, model)
             if not hasattr(res, "default_max"):
                 res["default_max"] = False
         return ResolutionManager.resolutions
@@ -94,7 +94,9 @@ class ResolutionManager:
         aspect_ratio = ResolutionManager.aspect_ratio(
             {"width": width, "height": height}
         )
-        max_resolution = config.get_max_resolution_by_aspect_ratio(aspect_ratio)
+        max_resolution = config.get_snapshot().get_max_resolution_by_aspect_ratio(
+            aspect_ratio
+        )
         max_pixel_area = max_resolution["width"] * max_resolution["height"]
         if total_pixel_area > max_pixel_area:
             return False
@@ -122,7 +124,9 @@ class ResolutionManager:
         aspect_ratio = ResolutionManager.aspect_ratio(
             {"width": side_x, "height": side_y}
         )
-        max_resolution = config.get_max_resolution_by_aspect_ratio(aspect_ratio)
+        max_resolution = config.get_snapshot().get_max_resolution_by_aspect_ratio(
+            aspect_ratio
+        )
         logging.info(f"Our max resolution config, {max_resolution}")
         requested_pixel_area = int(side_x) * int(side_y)
         max_pixel_area = int(max_resolution["width"]) * int(max_resolution["height"])
@@ -146,7 +150,9 @@ class ResolutionManager:
             # Do not bother rescaling if it's set to 1 or 0
             return resolution
         aspect_ratio = ResolutionManager.aspect_ratio(resolution)
-        max_resolution_config = config.get_max_resolution_by_aspect_ratio(aspect_ratio)
+        max_resolution_config = config.get_snapshot().get_max_resolution_by_aspect_ratio(
+            aspect_ratio
+        )
 
         logging.info(
             f"Resize configuration is set by user factoring at {factor} based on our max resolution config, {max_resolution_config}."
@@ -0,0 +1,164 @@
+import logging, threading, time
+from collections import OrderedDict
+from typing import Callable, Optional
+from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.image_manipulation.embedding_cache import (
+    embedding_nbytes,
+)
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+# Different ids with the same shape (eg. 1024x512 and 512x1024) share a key.
+MAX_CANDIDATES_PER_SHAPE = 4
+
+
+class RopeCache:
+    """
+    A bounded LRU of rotary embedding tables and position id grids. Both
+    are pure functions of the resolution and text length, so they are
+    computed once per shape rather than on every denoising step.
+
+    Id grids are keyed by what they are built from (`grid`). Rotary tables
+    are keyed by the position embedding's settings and the ids' shape,
+    device and dtype, then matched on the ids themselves (`rotary`): a
+    transformer that concatenates its ids every step still hits the cache.
+    """
+
+    def __init__(self, max_entries: int = 64, budget_bytes: int = 256 * 2**20):
+        self.max_entries = max(int(max_entries), 1)
+        self.budget_bytes = max(int(budget_bytes), 0)
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compute_seconds = 0.0
+
+    def _get(self, key: tuple):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def _put(self, key: tuple, value):
+        nbytes = embedding_nbytes(value)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if nbytes > self.budget_bytes:
+                return
+            self.entries[key] = (value, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.budget_bytes or len(self.entries) > self.max_entries:
+                _, (_, old_bytes) = self.entries.popitem(last=False)
+                self.bytes -= old_bytes
+                self.evictions += 1
+
+    def _compute(self, compute: Callable[[], object]):
+        started_at = time.perf_counter()
+        value = compute()
+        with self.lock:
+            self.misses += 1
+            self.compute_seconds += time.perf_counter() - started_at
+        return value
+
+    def grid(self, key: tuple, compute: Callable[[], object]):
+        """The id grid for `key`, calling `compute()` only on a miss. Treat it as read-only."""
+        key = ("grid",) + tuple(key)
+        value = self._get(key)
+        if value is not None:
+            with self.lock:
+                self.hits += 1
+            return value
+        value = self._compute(compute)
+        self._put(key, value)
+        return value
+
+    def rotary(self, pos_embed, ids, compute: Callable[[], object] = None):
+        """`pos_embed(ids)`, or `compute()` when given, cached on the ids' contents."""
+        import torch
+
+        key = (
+            "rotary",
+            type(pos_embed).__name__,
+            getattr(pos_embed, "theta", None),
+            tuple(getattr(pos_embed, "axes_dim", ()) or ()),
+            tuple(ids.shape),
+            str(ids.device),
+            str(ids.dtype),
+        )
+        candidates = self._get(key) or ()
+        for cached_ids, value in candidates:
+            if torch.equal(cached_ids, ids):
+                with self.lock:
+                    self.hits += 1
+                return value
+        value = self._compute(compute or (lambda: pos_embed(ids)))
+        candidates = ((ids.detach().clone(), value),) + tuple(candidates)
+        self._put(key, candidates[:MAX_CANDIDATES_PER_SHAPE])
+        return value
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "compute_seconds": self.compute_seconds,
+            }
+
+
+def rotary_embedding(pos_embed, ids):
+    """
+    `pos_embed(ids)` through the cache. NPUs compute the table on the CPU
+    and copy it back, which now happens once per shape instead of per step.
+    """
+    if ids.device.type != "npu":
+        return get_rope_cache().rotary(pos_embed, ids)
+
+    def compute():
+        return tuple(table.npu() for table in pos_embed(ids.cpu()))
+
+    return get_rope_cache().rotary(pos_embed, ids, compute)
+
+
+def cache_pos_embed(transformer):
+    """
+    Route `transformer.pos_embed` through the cache, for transformers whose
+    forward cannot be edited here (eg. diffusers' Flux). Idempotent.
+    """
+    pos_embed = getattr(transformer, "pos_embed", None)
+    if pos_embed is None or "forward" in pos_embed.__dict__:
+        return
+    original = pos_embed.forward
+
+    def forward(ids):
+        return get_rope_cache().rotary(pos_embed, ids, lambda: original(ids))
+
+    pos_embed.forward = forward
+
+
+_cache: Optional[RopeCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_rope_cache() -> RopeCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RopeCache(
+                max_entries=int(config.get_config_value("rope_cache_entries", 64)),
+                budget_bytes=float(config.get_config_value("rope_cache_mb", 256))
+                * 2**20,
+            )
+        return _cache
+
@@ -1,9 +1,13 @@
 from PIL import Image
 from diffusers import StableDiffusionUpscalePipeline
-import torch, gc, logging
+import torch, gc, logging, inspect
+import numpy as np
 from split_image import split
+from discord_tron_client.classes.app_config import AppConfig
 import os
 
+config = AppConfig()
+
 
 class ImageSplitter:
     def __init__(self, rows, cols, should_square, padding=0, should_quiet=False):
@@ -100,129 +104,213 @@ class ImageResizer:
         return img
 
 
-class ImageUpscaler:
+class TileEngine:
+    """
+    Runs an img2img-capable pipeline (eg. the ControlNet tile pipeline) over
+    overlapping tiles, several tiles per call, and blends the results with
+    feathered masks as tensor operations.
+
+    Tiles from every input image share the batches. Only `batch_size` tiles
+    are on the GPU at once; the canvases that tiles are blended into live on
+    `canvas_device`, so GPU memory does not grow with the output size.
+    """
+
     def __init__(
-        self, pipeline, generator, rows=3, cols=3, padding=64, blend_alpha=0.5
+        self,
+        pipeline,
+        generator=None,
+        tile_size: int = 1024,
+        overlap: int = 128,
+        batch_size: int = 4,
+        canvas_device: str = "cpu",
     ):
         self.pipeline = pipeline
         self.generator = generator
-        self.rows = rows
-        self.cols = cols
-        self.padding = padding
-        self.blend_alpha = blend_alpha
-
-    def upscale(self, image):
-        original_width, original_height = image.size
-        max_dimension = max(original_width, original_height)
-        splitter = ImageSplitter(self.rows, self.cols, True, self.padding, False)
-        tiles = splitter.split_with_padding(image)
-        ups_tiles = []
-        for idx, tile in enumerate(tiles, start=1):
-            logging.info(f"Upscaling tile {idx} of {len(tiles)}")
-            conditioned_image = ImageResizer.resize_for_condition_image(
-                input_image=tile, resolution=1024
+        self.tile_size = max(int(tile_size) // 64 * 64, 64)
+        self.overlap = max(min(int(overlap), self.tile_size // 2), 0)
+        self.batch_size = max(int(batch_size), 1)
+        self.canvas_device = canvas_device
+        self._masks = {}
+        try:
+            self._parameters = set(
+                inspect.signature(self.pipeline.__call__).parameters
             )
-            ups_tile = self._get_upscaled_tile(conditioned_image)
-            ups_tiles.append(ups_tile)
-        return [
-            self._merge_tiles(
-                tiles, ups_tiles, max_dimension, original_width, original_height
-            )
-        ]
+        except (TypeError, ValueError):
+            self._parameters = set()
 
-    def _get_upscaled_tile(self, conditioned_image):
-        return self.pipeline(
-            prompt="best quality",
-            negative_prompt="blur, lowres, bad anatomy, bad hands, cropped, worst quality",
-            image=conditioned_image,
-            controlnet_conditioning_image=conditioned_image,
-            width=conditioned_image.size[0],
-            height=conditioned_image.size[1],
-            strength=0.7,
-            generator=self.generator,
-            num_inference_steps=32,
-        ).images[0]
+    # Planning
 
-    def _merge_tiles(
-        self, tiles, ups_tiles, max_dimension, original_width, original_height
-    ):
-        side = ups_tiles[0].width
-        ups_times = abs(side / tiles[0].width)
-        new_size = (max_dimension * ups_times, max_dimension * ups_times)
-        total_width = self.cols * side
-        total_height = self.rows * side
-        logging.info(
-            f"New image size: {new_size}, total width: {total_width}, total height: {total_height}"
-        )
-        merged_image = self._create_blank_image(total_width, total_height)
-        merged_image = self._paste_tiles(merged_image, ups_tiles, side)
-        return self._crop_final_image(
-            merged_image, new_size, original_width, original_height, ups_times
-        )
+    def _starts(self, length: int) -> list:
+        if length <= self.tile_size:
+            return [0]
+        stride = self.tile_size - self.overlap
+        starts = list(range(0, length - self.tile_size, stride))
+        return starts + [length - self.tile_size]
 
-    @staticmethod
-    def _create_blank_image(total_width, total_height):
-        return Image.new("RGB", (total_width, total_height))
-
-    def _paste_tiles(self, merged_image, ups_tiles, side):
-        current_width = 0
-        current_height = 0
-        maximum_width = self.cols * side
-
-        for idx, ups_tile in enumerate(ups_tiles):
-            box = (
-                max(0, current_width),
-                max(0, current_height),
-                min(merged_image.width, current_width + side),
-                min(merged_image.height, current_height + side),
-            )
+    def plan(self, width: int, height: int) -> list:
+        """(left, top, width, height) for every tile covering the image."""
+        tile_width = min(self.tile_size, width)
+        tile_height = min(self.tile_size, height)
+        return [
+            (left, top, tile_width, tile_height)
+            for top in self._starts(height)
+            for left in self._starts(width)
+        ]
 
-            if idx != 0:  # Don't blend for the first tile
-                overlap_box = (
-                    max(0, current_width - self.padding),
-                    max(0, current_height - self.padding),
-                    min(merged_image.width, current_width + self.padding),
-                    min(merged_image.height, current_height + self.padding),
-                )
+    def _ramp(self, length: int, fade_start: bool, fade_end: bool):
+        ramp = torch.ones(length)
+        fade = min(self.overlap, length // 2)
+        if fade > 0:
+            steps = torch.arange(1, fade + 1, dtype=torch.float32) / (fade + 1)
+            if fade_start:
+                ramp[:fade] = steps
+            if fade_end:
+                ramp[-fade:] = steps.flip(0)
+        return ramp
 
-                prev_tile = merged_image.crop(overlap_box)
-                logging.info(f"Cropping to box {overlap_box}")
+    def mask(self, box: tuple, width: int, height: int):
+        """A feather mask that fades the tile out towards its neighbours."""
+        left, top, tile_width, tile_height = box
+        edges = (left > 0, top > 0, left + tile_width < width, top + tile_height < height)
+        key = (tile_width, tile_height) + edges
+        if key not in self._masks:
+            ramp_x = self._ramp(tile_width, edges[0], edges[2])
+            ramp_y = self._ramp(tile_height, edges[1], edges[3])
+            self._masks[key] = torch.outer(ramp_y, ramp_x)[None].to(self.canvas_device)
+        return self._masks[key]
 
-                # Calculate overlap box relative to the upscaled tile
-                ups_tile_overlap_box = (
-                    max(0, self.padding),
-                    max(0, self.padding),
-                    min(ups_tile.width, self.padding + box[2] - overlap_box[0]),
-                    min(ups_tile.height, self.padding + box[3] - overlap_box[1]),
-                )
+    # Denoising
 
-                ups_tile_overlap = ups_tile.crop(ups_tile_overlap_box)
-                logging.info(f"Overlap box is {ups_tile_overlap_box}")
-                logging.info(f"Merged image size is {merged_image.size}")
-                logging.info(f"Prev tile (merged image) size is {prev_tile.size}")
-                logging.info(f"Ups tile overlap size is {ups_tile_overlap.size}")
+    def _generators(self, count: int, offset: int):
+        if self.generator is None:
+            return None
+        seed = self.generator.initial_seed()
+        return [
+            torch.Generator(device="cpu").manual_seed(seed + offset + index)
+            for index in range(count)
+        ]
 
-                ups_tile_blend = Image.blend(
-                    prev_tile, ups_tile_overlap, self.blend_alpha
-                )
+    def _run_tiles(self, tiles: list, offset: int, **pipeline_args) -> list:
+        width, height = tiles[0].size
+        call_args = dict(pipeline_args)
+        call_args.update(image=tiles, generator=self._generators(len(tiles), offset))
+        # Img2img-style pipelines take their size from the image instead.
+        for name, value in (("width", width), ("height", height)):
+            if name in self._parameters:
+                call_args[name] = value
+        # Whatever this pipeline calls its conditioning image.
+        for name in ("controlnet_conditioning_image", "control_image"):
+            if name in self._parameters:
+                call_args[name] = tiles
+        for name in ("prompt", "negative_prompt"):
+            if isinstance(call_args.get(name), str):
+                call_args[name] = [call_args[name]] * len(tiles)
+        if not self._parameters or "output_type" in self._parameters:
+            call_args["output_type"] = "pt"
+        images = self.pipeline(**call_args).images
+        return [self._to_tensor(image, width, height) for image in images]
 
-                merged_image.paste(ups_tile_blend, overlap_box)
+    @staticmethod
+    def _to_tensor(image, width: int, height: int):
+        if isinstance(image, Image.Image):
+            image = torch.from_numpy(np.asarray(image.convert("RGB")).copy())
+            image = image.permute(2, 0, 1).float() / 255.0
+        elif isinstance(image, np.ndarray):
+            # Pipelines without a "pt" output type hand back HWC floats.
+            image = torch.from_numpy(image).permute(2, 0, 1)
+        image = image.float()
+        if tuple(image.shape[-2:]) != (height, width):
+            image = torch.nn.functional.interpolate(
+                image[None], size=(height, width), mode="bicubic", align_corners=False
+            )[0]
+        return image
 
-            merged_image.paste(ups_tile, box)
+    def run(self, images: list, **pipeline_args) -> list:
+        """
+        Denoise every image tile by tile and return the blended results.
+        `pipeline_args` (prompt, strength, num_inference_steps, ...) are
+        passed to every pipeline call.
+        """
+        images = [image.convert("RGB") for image in images]
+        canvases = []
+        jobs = []
+        for index, image in enumerate(images):
+            width, height = image.size
+            canvases.append(
+                (
+                    torch.zeros(3, height, width, device=self.canvas_device),
+                    torch.zeros(1, height, width, device=self.canvas_device),
+                )
+            )
+            jobs.extend((index, box) for box in self.plan(width, height))
+        logging.info(
+            f"Denoising {len(jobs)} tiles from {len(images)} images in batches of {self.batch_size}."
+        )
+        offset = 0
+        while offset < len(jobs):
+            # One call handles tiles of one size; edge tiles may differ.
+            size = jobs[offset][1][2:]
+            batch = [jobs[offset]]
+            while (
+                offset + len(batch) < len(jobs)
+                and len(batch) < self.batch_size
+                and jobs[offset + len(batch)][1][2:] == size
+            ):
+                batch.append(jobs[offset + len(batch)])
+            tiles = [
+                images[index].crop((left, top, left + w, top + h))
+                for index, (left, top, w, h) in batch
+            ]
+            outputs = self._run_tiles(tiles, offset, **pipeline_args)
+            for (index, box), output in zip(batch, outputs):
+                left, top, w, h = box
+                canvas, weights = canvases[index]
+                mask = self.mask(box, *images[index].size)
+                canvas[:, top : top + h, left : left + w] += (
+                    output.to(self.canvas_device) * mask
+                )
+                weights[:, top : top + h, left : left + w] += mask
+            offset += len(batch)
+            del outputs
+        results = []
+        for canvas, weights in canvases:
+            merged = (canvas / weights.clamp(min=1e-6)).clamp(0, 1)
+            array = (merged.permute(1, 2, 0) * 255).round().to(torch.uint8).cpu().numpy()
+            results.append(Image.fromarray(array))
+        return results
 
-            current_width += side
-            if current_width >= maximum_width:
-                current_width = 0
-                current_height += side
 
-        return merged_image
+class ImageUpscaler:
+    """Upscale an image with the tile engine, `rows` x `cols` tiles wide."""
 
-    @staticmethod
-    def _crop_final_image(
-        merged_image, new_size, original_width, original_height, ups_times
+    def __init__(
+        self, pipeline, generator, rows=3, cols=3, padding=64, blend_alpha=0.5
     ):
-        crop_left = (new_size[0] - original_width * ups_times) // 2
-        crop_upper = (new_size[1] - original_height * ups_times) // 2
-        crop_right = crop_left + original_width * ups_times
-        crop_lower = crop_upper + original_height * ups_times
-        return merged_image.crop((crop_left, crop_upper, crop_right, crop_lower))
+        self.pipeline = pipeline
+        self.generator = generator
+        self.rows = rows
+        self.cols = cols
+        self.padding = padding
+        # Kept for compatibility; blending is feathered over `padding` now.
+        self.blend_alpha = blend_alpha
+
+    def upscale(self, image):
+        tile_size = 1024
+        target = ImageResizer.resize_for_condition_image(
+            input_image=image,
+            resolution=tile_size * min(self.rows, self.cols) - self.padding,
+        )
+        engine = TileEngine(
+            self.pipeline,
+            self.generator,
+            tile_size=tile_size,
+            overlap=2 * self.padding,
+            batch_size=config.get_config_value("tile_batch_size", 4),
+        )
+        return engine.run(
+            [target],
+            prompt="best quality",
+            negative_prompt="blur, lowres, bad anatomy, bad hands, cropped, worst quality",
+            strength=0.7,
+            num_inference_steps=32,
+        )
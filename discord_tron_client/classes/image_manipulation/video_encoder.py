@@ -0,0 +1,250 @@
+import logging, os, queue, shutil, subprocess, tempfile, threading
+from typing import Optional
+import numpy as np
+from discord_tron_client.classes.app_config import AppConfig
+
+try:
+    import imageio_ffmpeg
+except ImportError:
+    imageio_ffmpeg = None
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+VIDEO_FORMATS = {
+    "mp4": [
+        "-c:v", "libx264",
+        "-pix_fmt", "yuv420p",
+        # yuv420p needs even sides.
+        "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+        "-crf", "18",
+        "-movflags", "+faststart",
+    ],
+    "webp": ["-c:v", "libwebp", "-lossless", "0", "-q:v", "90", "-loop", "0"],
+}
+
+
+def ffmpeg_executable() -> Optional[str]:
+    """The configured ffmpeg, the one on PATH, or the one imageio-ffmpeg ships."""
+    configured = config.get_config_value("ffmpeg_path", None)
+    if configured:
+        return configured
+    found = shutil.which("ffmpeg")
+    if found is None and imageio_ffmpeg is not None:
+        try:
+            found = imageio_ffmpeg.get_ffmpeg_exe()
+        except RuntimeError:
+            found = None
+    return found
+
+
+def _is_tensor(value) -> bool:
+    return hasattr(value, "detach") and hasattr(value, "permute")
+
+
+def _rgb(frames):
+    """Keep three channels of channels-last frames."""
+    channels = frames.shape[-1]
+    if channels == 1:
+        return np.repeat(frames, 3, axis=-1)
+    return frames[..., :3]
+
+
+def _tensor_chunk_bytes(chunk) -> tuple:
+    import torch
+
+    # Frames come channels first from `output_type="pt"`, in [0, 1].
+    if chunk.ndim == 4 and chunk.shape[1] in (1, 3, 4) and chunk.shape[-1] not in (1, 3, 4):
+        chunk = chunk.permute(0, 2, 3, 1)
+    if chunk.dtype != torch.uint8:
+        chunk = (chunk.float().clamp(0, 1) * 255).round().to(torch.uint8)
+    array = _rgb(chunk.contiguous().cpu().numpy())
+    return array.shape[1:3], np.ascontiguousarray(array).tobytes()
+
+
+def _array_chunk_bytes(frames: list) -> tuple:
+    arrays = []
+    for frame in frames:
+        if hasattr(frame, "convert"):
+            frame = np.asarray(frame.convert("RGB"))
+        frame = np.asarray(frame)
+        if frame.ndim == 2:
+            frame = frame[..., None]
+        if frame.dtype != np.uint8:
+            frame = (np.clip(frame, 0, 1) * 255).round().astype(np.uint8)
+        arrays.append(_rgb(frame))
+    array = np.stack(arrays)
+    return array.shape[1:3], array.tobytes()
+
+
+class VideoEncoder:
+    """
+    A sink for decoded video frames that pipes them to an ffmpeg process as
+    they arrive. Frames are converted to uint8 a chunk at a time, on the
+    device they were decoded on, and only `queue_chunks` converted chunks
+    are ever waiting in host memory. The file is complete once `close()`
+    returns.
+
+        with VideoEncoder(fps=24) as encoder:
+            encoder.write(frames)  # (frames, channels, height, width) in [0, 1]
+        path = encoder.path
+
+    `write` also takes numpy frames (channels last) or PIL images, and may be
+    called repeatedly as a decoder produces frames.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        fps: int = 24,
+        video_format: str = None,
+        chunk_frames: int = None,
+        queue_chunks: int = None,
+        ffmpeg: str = None,
+    ):
+        self.format = (video_format or config.get_config_value("video_format", "mp4")).lower()
+        if self.format not in VIDEO_FORMATS:
+            raise ValueError(f"Unsupported video format {self.format!r}, expected one of {sorted(VIDEO_FORMATS)}.")
+        self.path = path or tempfile.NamedTemporaryFile(suffix=f".{self.format}", delete=False).name
+        self.fps = fps
+        self.chunk_frames = max(
+            int(chunk_frames or config.get_config_value("video_encoder_chunk_frames", 8)), 1
+        )
+        self.queue = queue.Queue(
+            maxsize=max(int(queue_chunks or config.get_config_value("video_encoder_queue_chunks", 4)), 1)
+        )
+        self.ffmpeg = ffmpeg or ffmpeg_executable()
+        if self.ffmpeg is None:
+            raise RuntimeError("No ffmpeg found; install imageio-ffmpeg or set ffmpeg_path.")
+        self.process = None
+        self.writer = None
+        self.size = None
+        self.frames = 0
+        self.error = None
+
+    def _start(self, height: int, width: int):
+        self.size = (height, width)
+        command = [
+            self.ffmpeg,
+            "-y",
+            "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-s", f"{width}x{height}",
+            "-r", str(self.fps),
+            "-i", "-",
+            *VIDEO_FORMATS[self.format],
+            self.path,
+        ]
+        logger.debug(f"Starting video encoder: {' '.join(command)}")
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        self.writer = threading.Thread(target=self._drain, name="video-encoder", daemon=True)
+        self.writer.start()
+
+    def _drain(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            if self.error is not None:
+                # Keep emptying the queue so the producer never blocks on a dead encoder.
+                continue
+            try:
+                self.process.stdin.write(data)
+            except (BrokenPipeError, OSError) as error:
+                self.error = error
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError) as error:
+            self.error = self.error or error
+
+    def _raise_error(self):
+        if self.error is None:
+            return
+        stderr = b""
+        if self.process is not None:
+            self.process.kill()
+            stderr = self.process.stderr.read() or b""
+            self.process.wait()
+            self.process.stderr.close()
+        raise RuntimeError(f"ffmpeg failed writing {self.path}: {stderr.decode(errors='replace').strip() or self.error}")
+
+    def _push(self, size: tuple, data: bytes):
+        if self.process is None:
+            self._start(*size)
+        elif size != self.size:
+            raise ValueError(f"Frame size changed from {self.size} to {size} mid-video.")
+        self._raise_error()
+        self.queue.put(data)
+
+    def write(self, frames):
+        """Queue `frames` for encoding, blocking while the queue is full."""
+        if _is_tensor(frames):
+            frames = frames.detach()
+            if frames.ndim == 5:
+                # A batch of one video.
+                frames = frames[0]
+            for start in range(0, frames.shape[0], self.chunk_frames):
+                chunk = frames[start : start + self.chunk_frames]
+                self._push(*_tensor_chunk_bytes(chunk))
+                self.frames += chunk.shape[0]
+            return
+        if isinstance(frames, np.ndarray) and frames.ndim == 3:
+            frames = frames[None]
+        for start in range(0, len(frames), self.chunk_frames):
+            chunk = frames[start : start + self.chunk_frames]
+            self._push(*_array_chunk_bytes(list(chunk)))
+            self.frames += len(chunk)
+
+    def close(self) -> str:
+        """Finish the file and return its path."""
+        if self.process is None:
+            raise RuntimeError("No frames were written.")
+        if self.writer is not None:
+            self.queue.put(None)
+            self.writer.join()
+            self.writer = None
+        self._raise_error()
+        returncode = self.process.wait()
+        if returncode != 0:
+            stderr = self.process.stderr.read() or b""
+            raise RuntimeError(f"ffmpeg exited with {returncode}: {stderr.decode(errors='replace').strip()}")
+        self.process.stderr.close()
+        logger.info(f"Encoded {self.frames} frames to {self.path}.")
+        return self.path
+
+    def abort(self):
+        """Stop ffmpeg and remove the partial file."""
+        if self.process is not None:
+            # Killed first, so queued chunks fail fast instead of being encoded.
+            self.process.kill()
+        if self.writer is not None:
+            self.error = self.error or RuntimeError("aborted")
+            self.queue.put(None)
+            self.writer.join()
+            self.writer = None
+        if self.process is not None:
+            self.process.wait()
+            self.process.stderr.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def encode_video(frames, fps: int = 24, path: str = None, video_format: str = None) -> str:
+    """Encode a whole clip through a `VideoEncoder` and return the file's path."""
+    with VideoEncoder(path=path, fps=fps, video_format=video_format) as encoder:
+        encoder.write(frames)
+    return encoder.path
+
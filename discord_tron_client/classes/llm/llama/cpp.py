@@ -1,6 +1,5 @@
 from discord_tron_client.classes.app_config import AppConfig
-
-from llama_cpp import Llama
+from discord_tron_client.classes.llm.llama.registry import get_llama_registry
 
 import os, sys, json, logging, time
 
@@ -12,6 +11,9 @@ class LlamaCpp:
         self.model = config.llama_model_default()
         self.model_file_name = config.llama_model_filename()
         self.model_config = None
+        self.model_path = None
+        self.llama = None
+        self.usage = None
         self.path = config.llama_model_path() + "/" + self.model
 
     def details(self):
@@ -53,9 +55,19 @@ class LlamaCpp:
         self.model_path = self.path + "/" + self.model_file_name
 
     def load_model(self):
-        self.locate_model()
-        self.locate_ggml()
-        self.llama = Llama(model_path=self.model_path, n_ctx=8192)
+        if self.model_path is None:
+            self.locate_model()
+            self.locate_ggml()
+        # The registry hands back the resident model when one is already loaded.
+        self.llama = get_llama_registry().acquire(
+            self.model_path,
+            n_ctx=config.get_config_value("llama_context_length", 8192),
+        )
+
+    def release_model(self):
+        if self.llama is not None:
+            get_llama_registry().release(self.llama)
+            self.llama = None
 
     def _predict(
         self,
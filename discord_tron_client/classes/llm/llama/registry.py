@@ -0,0 +1,200 @@
+import logging, os, re, threading, time
+from typing import Callable, Dict, NamedTuple, Optional
+from discord_tron_client.classes.app_config import AppConfig
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+
+class ModelKey(NamedTuple):
+    model_path: str
+    n_ctx: int
+    quantization: str
+
+
+class ResidentModel:
+    def __init__(self, key: ModelKey, model, size_bytes: int):
+        self.key = key
+        self.model = model
+        self.size_bytes = size_bytes
+        self.loaded_at = time.monotonic()
+        self.last_used = self.loaded_at
+        self.in_use = 0
+        self.hits = 0
+
+
+def guess_quantization(model_path: str) -> str:
+    """Pull the quantisation tag (f16, q4_0, q5_k_m, ...) out of a GGML/GGUF file name."""
+    match = re.search(
+        r"(f16|f32|bf16|q\d(?:_[a-z0-9]+)*)", os.path.basename(model_path).lower()
+    )
+    return match.group(1) if match else "unknown"
+
+
+def _default_loader(key: ModelKey, prefix_cache_bytes: int):
+    from llama_cpp import Llama
+
+    llama = Llama(model_path=key.model_path, n_ctx=key.n_ctx)
+    if prefix_cache_bytes > 0:
+        # Lets requests that share a system prompt skip re-evaluating it.
+        try:
+            from llama_cpp import LlamaRAMCache as PrefixCache
+        except ImportError:
+            from llama_cpp import LlamaCache as PrefixCache
+        llama.set_cache(PrefixCache(capacity_bytes=prefix_cache_bytes))
+    return llama
+
+
+class LlamaModelRegistry:
+    """
+    Keeps llama.cpp models resident between requests, keyed by
+    (model path, n_ctx, quantisation).
+
+    Models that have been idle for `idle_timeout` seconds are dropped by a
+    background reaper, and the least recently used idle models are dropped
+    whenever resident models plus `external_usage()` (the diffusion pipeline
+    cache) would exceed `memory_budget_bytes`.
+    """
+
+    def __init__(
+        self,
+        loader: Callable = None,
+        idle_timeout: float = 1800,
+        memory_budget_bytes: Optional[int] = None,
+        prefix_cache_bytes: int = 0,
+        external_usage: Callable[[], int] = None,
+    ):
+        self.loader = loader or _default_loader
+        self.idle_timeout = idle_timeout
+        self.memory_budget_bytes = memory_budget_bytes
+        self.prefix_cache_bytes = prefix_cache_bytes
+        self.external_usage = external_usage
+        self.models: Dict[ModelKey, ResidentModel] = {}
+        self.lock = threading.RLock()
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._reaper = None
+
+    def set_external_usage(self, external_usage: Callable[[], int]):
+        self.external_usage = external_usage
+
+    def resident_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in list(self.models.values()))
+
+    def acquire(self, model_path: str, n_ctx: int = 8192, quantization: str = None):
+        """
+        Return a loaded model for the key, loading it only if it is not
+        already resident. Every acquire() must be paired with release().
+        """
+        key = ModelKey(
+            model_path, int(n_ctx), quantization or guess_quantization(model_path)
+        )
+        with self.lock:
+            self.evict_idle()
+            entry = self.models.get(key)
+            if entry is not None:
+                entry.hits += 1
+                self.hits += 1
+                logger.debug(f"Reusing resident llama.cpp model {key}.")
+            else:
+                try:
+                    size_bytes = os.path.getsize(model_path)
+                except OSError:
+                    size_bytes = 0
+                self._make_room(size_bytes)
+                logger.info(f"Loading llama.cpp model {key} ({size_bytes} bytes).")
+                model = self.loader(key, self.prefix_cache_bytes)
+                entry = ResidentModel(key, model, size_bytes)
+                self.models[key] = entry
+                self.loads += 1
+            entry.in_use += 1
+            entry.last_used = time.monotonic()
+            self._start_reaper()
+            return entry.model
+
+    def release(self, model):
+        with self.lock:
+            for entry in self.models.values():
+                if entry.model is model:
+                    entry.in_use = max(entry.in_use - 1, 0)
+                    entry.last_used = time.monotonic()
+                    return
+
+    def evict(self, key: ModelKey) -> bool:
+        with self.lock:
+            entry = self.models.get(key)
+            if entry is None or entry.in_use > 0:
+                return False
+            logger.info(f"Evicting llama.cpp model {key}.")
+            del self.models[key]
+            self.evictions += 1
+            close = getattr(entry.model, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception as e:
+                    logger.warning(f"Error closing llama.cpp model {key}: {e}")
+            del entry
+            return True
+
+    def evict_idle(self, now: float = None):
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            for key, entry in list(self.models.items()):
+                if entry.in_use == 0 and now - entry.last_used > self.idle_timeout:
+                    self.evict(key)
+
+    def _make_room(self, incoming_bytes: int):
+        if self.memory_budget_bytes is None:
+            return
+        external = 0
+        if self.external_usage is not None:
+            try:
+                external = int(self.external_usage())
+            except Exception as e:
+                logger.warning(f"Could not read external memory usage: {e}")
+        idle = sorted(
+            (e for e in self.models.values() if e.in_use == 0),
+            key=lambda e: e.last_used,
+        )
+        while (
+            idle
+            and self.resident_bytes() + external + incoming_bytes
+            > self.memory_budget_bytes
+        ):
+            self.evict(idle.pop(0).key)
+
+    def _start_reaper(self):
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        self._reaper = threading.Thread(
+            target=self._reap, name="llama-registry-reaper", daemon=True
+        )
+        self._reaper.start()
+
+    def _reap(self):
+        interval = max(min(self.idle_timeout / 4, 60), 1)
+        while self.models:
+            time.sleep(interval)
+            self.evict_idle()
+
+
+_registry = None
+
+
+def get_llama_registry() -> LlamaModelRegistry:
+    global _registry
+    if _registry is None:
+        budget_gb = config.get_config_value("llm_memory_budget_gb", None)
+        _registry = LlamaModelRegistry(
+            idle_timeout=float(config.get_config_value("llama_idle_timeout", 1800)),
+            memory_budget_bytes=(
+                int(float(budget_gb) * 2**30) if budget_gb is not None else None
+            ),
+            prefix_cache_bytes=int(
+                float(config.get_config_value("llama_prefix_cache_mb", 0)) * 2**20
+            ),
+        )
+    return _registry
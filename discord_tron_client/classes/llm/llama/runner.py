@@ -16,7 +16,11 @@ class LlamaRunner:
                 self.driver.load_model()
         except Exception as e:
             logging.error(f"Could not load Llama driver: {e}")
-        return self.driver.predict(prompt, user_config)
+        try:
+            return self.driver.predict(prompt, user_config)
+        finally:
+            if hasattr(self.driver, "release_model"):
+                self.driver.release_model()
 
     def usage(self):
         driver_usage = self.driver.get_usage()
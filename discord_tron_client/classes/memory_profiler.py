@@ -0,0 +1,244 @@
+import logging, sys, threading, time, tracemalloc
+from typing import List, Optional
+from discord_tron_client.classes.app_config import AppConfig
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+# The CUDA allocator counters worth reading in an error report.
+CUDA_STATS = (
+    "allocated_bytes.all.current",
+    "allocated_bytes.all.peak",
+    "reserved_bytes.all.current",
+    "reserved_bytes.all.peak",
+    "inactive_split_bytes.all.current",
+    "num_alloc_retries",
+    "num_ooms",
+)
+ACTIONS = ("start", "stop", "report", "status")
+
+
+def _mib(value) -> str:
+    return f"{value / 2**20:.1f} MiB"
+
+
+def cuda_memory_report() -> List[str]:
+    """
+    Allocator counters (`memory_stats`) and a summary of the segments in
+    `memory_snapshot` for each CUDA device. Empty when torch was never
+    imported or there is no CUDA, so it never pays for importing torch.
+    """
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return []
+    lines = []
+    for device in range(torch.cuda.device_count()):
+        try:
+            stats = torch.cuda.memory_stats(device)
+        except Exception as e:
+            lines.append(f"cuda:{device}: memory_stats unavailable ({e})")
+            continue
+        counters = ", ".join(
+            f"{name}={_mib(stats[name]) if '_bytes' in name else stats[name]}"
+            for name in CUDA_STATS
+            if name in stats
+        )
+        lines.append(f"cuda:{device}: {counters}")
+        try:
+            segments = [
+                segment
+                for segment in torch.cuda.memory_snapshot()
+                if segment.get("device") == device
+            ]
+        except Exception:
+            continue
+        if not segments:
+            continue
+        free_blocks = [
+            block["size"]
+            for segment in segments
+            for block in segment.get("blocks", [])
+            if block.get("state") == "inactive"
+        ]
+        lines.append(
+            f"cuda:{device}: {len(segments)} segments, "
+            f"{_mib(sum(segment['total_size'] for segment in segments))} reserved, "
+            f"largest free block {_mib(max(free_blocks, default=0))}"
+        )
+    return lines
+
+
+class MemoryProfiler:
+    """
+    Opt-in allocation tracing with tracemalloc. Off unless started, either
+    by the master (the `diagnostics` module), the local `/diagnostics/memory`
+    endpoint, or `memory_profiler: true` in the config, and it always stops
+    itself after a bounded window, because tracing slows down every Python
+    allocation while it runs. The last window's top allocation sites are
+    kept after it stops so a later error report can still show them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timer: Optional[threading.Timer] = None
+        self.started_at = None
+        self.stops_at = None
+        self.last_window: List[str] = []
+        self.last_peak_bytes = None
+
+    @property
+    def active(self) -> bool:
+        return self.started_at is not None and tracemalloc.is_tracing()
+
+    def start(self, seconds: float = None, frames: int = None) -> dict:
+        """Trace allocations for `seconds`, capped at `memory_profiler_max_seconds`."""
+        seconds = float(seconds or config.get_config_value("memory_profiler_seconds", 300))
+        seconds = min(seconds, float(config.get_config_value("memory_profiler_max_seconds", 3600)))
+        frames = max(int(frames or config.get_config_value("memory_profiler_frames", 1)), 1)
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            tracemalloc.reset_peak()
+            self.started_at = time.time()
+            self.stops_at = self.started_at + seconds
+            self.timer = threading.Timer(seconds, self.stop)
+            self.timer.daemon = True
+            self.timer.start()
+        logger.info(f"Memory profiler tracing allocations for {seconds:.0f}s ({frames} frame(s)).")
+        return self.status()
+
+    def stop(self) -> dict:
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.started_at is not None and tracemalloc.is_tracing():
+                self.last_window = self._top_allocations()
+                self.last_peak_bytes = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                logger.info("Memory profiler stopped.")
+            self.started_at = None
+            self.stops_at = None
+        return self.status()
+
+    def _top_allocations(self, limit: int = None) -> List[str]:
+        limit = limit or int(config.get_config_value("memory_profiler_top", 10))
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+        return [str(stat) for stat in snapshot.statistics("lineno")[:limit]]
+
+    def status(self) -> dict:
+        status = {"active": self.active, "stops_at": self.stops_at}
+        if self.active:
+            current, peak = tracemalloc.get_traced_memory()
+            status.update({"traced_bytes": current, "peak_bytes": peak})
+        elif self.last_peak_bytes is not None:
+            status["last_peak_bytes"] = self.last_peak_bytes
+        return status
+
+    def report(self, limit: int = None) -> List[str]:
+        lines = []
+        if self.active:
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"Python heap (traced): {_mib(current)} now, {_mib(peak)} peak")
+            lines.extend(self._top_allocations(limit))
+        elif self.last_window:
+            lines.append(f"Python heap (last window): {_mib(self.last_peak_bytes or 0)} peak")
+            lines.extend(self.last_window[:limit] if limit else self.last_window)
+        lines.extend(cuda_memory_report())
+        return lines
+
+    def error_report(self, limit: int = 5) -> Optional[str]:
+        """The memory section of a job's error report, or None while diagnostics are off."""
+        if not self.active and not config.get_config_value("memory_profiler", False):
+            return None
+        try:
+            lines = self.report(limit)
+        except Exception as e:
+            logger.warning(f"Could not build the memory report: {e}")
+            return None
+        return "\n".join(lines) or None
+
+    def handle(self, action: str, seconds: float = None, frames: int = None) -> dict:
+        """Apply a start/stop/report/status request from the master or the local endpoint."""
+        action = str(action or "status").lower()
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown memory profiler action {action!r}, expected one of {ACTIONS}.")
+        if action == "start":
+            return self.start(seconds, frames)
+        if action == "stop":
+            return self.stop()
+        status = self.status()
+        if action == "report":
+            status["report"] = self.report()
+        return status
+
+    async def command_handler(self, payload, websocket):
+        from discord_tron_client.classes.hardware import HardwareInfo
+        from discord_tron_client.classes.message import WebsocketMessage
+
+        arguments = payload.get("arguments") or payload
+        result = self.handle(
+            arguments.get("action"), arguments.get("seconds"), arguments.get("frames")
+        )
+        message = WebsocketMessage(
+            message_type="diagnostics_result",
+            module_name="diagnostics",
+            module_command="memory_profiler_result",
+            data=result,
+            arguments={"worker_id": HardwareInfo.get_identifier()},
+        )
+        websocket = AppConfig.get_websocket()
+        await websocket.send(message.to_json())
+
+
+def blueprint():
+    """Flask routes for the local endpoint: GET for status and report, POST to start or stop."""
+    from flask import Blueprint, jsonify, request
+
+    routes = Blueprint("diagnostics", __name__, url_prefix="/diagnostics")
+
+    @routes.route("/memory", methods=["GET", "POST"])
+    def memory():
+        arguments = request.get_json(silent=True) or request.args
+        action = arguments.get("action") or ("report" if request.method == "GET" else None)
+        try:
+            return jsonify(
+                get_memory_profiler().handle(action, arguments.get("seconds"), arguments.get("frames"))
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    return routes
+
+
+_profiler: Optional[MemoryProfiler] = None
+_profiler_lock = threading.Lock()
+
+
+def get_memory_profiler() -> MemoryProfiler:
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = MemoryProfiler()
+            if config.get_config_value("memory_profiler", False):
+                _profiler.start()
+        return _profiler
+
+
+def error_report_section(limit: int = 5, max_chars: int = 1000) -> str:
+    """The memory report as a block for a job's error message; empty while diagnostics are off."""
+    report = get_memory_profiler().error_report(limit)
+    if report is None:
+        return ""
+    logger.error(f"Memory at the time of the error:\n{report}")
+    if len(report) > max_chars:
+        report = report[: max_chars - 3] + "..."
+    return f"\nMemory:\n```{report}\n```"
+
@@ -1,6 +1,7 @@
 import time, logging
 from PIL import Image
 from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.image_manipulation.image_encoder import EncodedImage
 
 config = AppConfig()
 logger = logging.getLogger(__name__)
@@ -47,6 +48,8 @@ class WebsocketMessage:
         import io
         import base64
 
+        if isinstance(image, EncodedImage):
+            return image.to_base64()
         buffered = io.BytesIO()
         image.save(buffered, format="PNG")
         return base64.b64encode(buffered.getvalue()).decode("utf-8")
@@ -0,0 +1,455 @@
+import bisect, logging, math, threading, time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from discord_tron_client.classes.app_config import AppConfig
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, from a fast upload to a long video job.
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# (labels, value) pairs for one metric, as produced by a collector.
+Samples = Iterable[Tuple[Dict[str, str], float]]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    One named metric with a fixed set of label names. Updating it costs a
+    dict lookup and an uncontended lock, so it is only called per job, per
+    upload or per pipeline move, never per denoising step.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values: Dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple, **extra) -> Dict[str, str]:
+        labels = dict(zip(self.labelnames, key))
+        labels.update(extra)
+        return labels
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self.lock:
+            return [(self.name, self._labels(key), value) for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(bucket) for bucket in buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket counts (the last is +Inf), then the sum.
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        with self.lock:
+            values = [(key, list(state)) for key, state in self.values.items()]
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), state[:-1]):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", self._labels(key, le=_format_value(bound)), cumulative))
+            samples.append((f"{self.name}_sum", self._labels(key), state[-1]))
+            samples.append((f"{self.name}_count", self._labels(key), cumulative))
+        return samples
+
+    def time(self, **labels) -> "_Timer":
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started_at = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.monotonic() - self.started_at, **self.labels)
+
+
+class Collected:
+    """A metric whose values are read from elsewhere at scrape time."""
+
+    def __init__(self, name: str, kind: str, documentation: str, samples: Samples):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self._samples = samples
+
+    def samples(self):
+        return [(self.name, dict(labels), value) for labels, value in self._samples]
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms in the Prometheus text format. Values
+    that other classes already keep (cache hit counts, executor and queue
+    depths, GPU telemetry) are read by collectors when the endpoint is
+    scraped, so they cost nothing between scrapes.
+    """
+
+    def __init__(self, prefix: str = "tron_"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, Metric] = {}
+        self.collectors: Dict[str, Callable[[], Iterable[Collected]]] = {}
+
+    def _register(self, metric_class, name: str, *args, **kwargs):
+        name = self.prefix + name
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = metric_class(name, *args, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}.")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, name: str, collector: Callable[[], Iterable[Collected]]):
+        """Add (or replace) a scrape-time collector; `name` identifies it for replacement."""
+        with self.lock:
+            self.collectors[name] = collector
+
+    def collect(self) -> List:
+        with self.lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors.items())
+        for name, collector in collectors:
+            try:
+                for metric in collector():
+                    metric.name = self.prefix + metric.name
+                    metrics.append(metric)
+            except Exception as e:
+                logger.warning(f"Metrics collector {name} failed: {e}")
+        return metrics
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.collect():
+            samples = metric.samples()
+            if not samples and metric.kind != "counter":
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _cache_collector() -> Iterable[Collected]:
+    """Hit and miss counts the prompt embedding, LoRA, RoPE and component caches keep already."""
+    import sys
+
+    caches = {}
+    manager = AppConfig.get_pipeline_manager()
+    store = getattr(manager, "component_store", None)
+    if store is not None:
+        caches["component"] = store.stats()
+    for cache, module, getter in (
+        ("embedding", "discord_tron_client.classes.image_manipulation.embedding_cache", "get_embedding_cache"),
+        ("adapter", "discord_tron_client.classes.image_manipulation.adapter_cache", "get_adapter_cache"),
+        ("rope", "discord_tron_client.classes.image_manipulation.rope_cache", "get_rope_cache"),
+    ):
+        # Only report caches the worker has actually imported.
+        if module in sys.modules:
+            caches[cache] = getattr(sys.modules[module], getter)().stats()
+    requests = []
+    for cache, stats in caches.items():
+        requests.append(({"cache": cache, "result": "hit"}, stats.get("hits", 0) + stats.get("spill_hits", 0)))
+        requests.append(({"cache": cache, "result": "miss"}, stats.get("misses", 0)))
+    yield Collected("cache_lookups_total", "counter", "Lookups in the worker's caches by result.", requests)
+
+
+def _executor_collector() -> Iterable[Collected]:
+    topology = AppConfig.executor_topology
+    if topology is None:
+        return
+    lanes = topology.stats()
+    for field, kind, documentation in (
+        ("queue_depth", "gauge", "Work submitted to an executor lane that has not started."),
+        ("running", "gauge", "Work running on an executor lane."),
+        ("completed", "counter", "Work completed by an executor lane."),
+        ("failed", "counter", "Work that raised on an executor lane."),
+        ("wait_seconds_max", "gauge", "Longest wait for an executor lane so far."),
+    ):
+        name = f"executor_{field}" + ("_total" if kind == "counter" else "")
+        yield Collected(name, kind, documentation, [({"lane": lane}, stats[field]) for lane, stats in lanes.items()])
+
+
+def _gpu_collector() -> Iterable[Collected]:
+    import sys
+
+    telemetry = sys.modules.get("discord_tron_client.classes.gpu_telemetry")
+    sampler = telemetry.get_telemetry_sampler() if telemetry is not None else None
+    if sampler is None:
+        return
+    latest = [
+        (str(index), sampler.device_names[index], sample)
+        for index, sample in enumerate(sampler.latest())
+        if sample is not None
+    ]
+    for field, name, documentation in (
+        ("power_watts", "gpu_power_watts", "GPU power draw."),
+        ("vram_used_mb", "gpu_memory_used_bytes", "GPU memory in use."),
+        ("vram_total_mb", "gpu_memory_total_bytes", "GPU memory in total."),
+        ("utilization", "gpu_utilization_percent", "GPU utilisation."),
+        ("temperature", "gpu_temperature_celsius", "GPU temperature."),
+    ):
+        scale = 2**20 if field.endswith("_mb") else 1
+        yield Collected(
+            name,
+            "gauge",
+            documentation,
+            [({"gpu": index, "name": device}, getattr(sample, field) * scale) for index, device, sample in latest],
+        )
+
+
+def _residency_collector() -> Iterable[Collected]:
+    manager = AppConfig.get_pipeline_manager()
+    residency = getattr(manager, "residency", None)
+    if residency is None:
+        return
+    stats = residency.stats()
+    yield Collected(
+        "residency_bytes",
+        "gauge",
+        "Bytes of pipeline components held on each tier.",
+        [({"tier": tier}, used) for tier, used in stats["used"].items()],
+    )
+    yield Collected(
+        "residency_budget_bytes",
+        "gauge",
+        "Byte budget for each tier.",
+        [({"tier": tier}, budget) for tier, budget in stats["budgets"].items()],
+    )
+    yield Collected(
+        "residency_evictions_total",
+        "counter",
+        "Components evicted from each tier.",
+        [({"tier": tier}, count) for tier, count in stats["evictions"].items()],
+    )
+    yield Collected(
+        "pipelines_loaded",
+        "gauge",
+        "Pipelines held in memory.",
+        [({}, len(getattr(manager, "pipelines", {})))],
+    )
+
+
+def _process_collector() -> Iterable[Collected]:
+    try:
+        import psutil
+    except ImportError:
+        return
+    process = psutil.Process()
+    yield Collected("process_resident_memory_bytes", "gauge", "Resident set size.", [({}, process.memory_info().rss)])
+    yield Collected("process_cpu_seconds_total", "counter", "CPU time used.", [({}, sum(process.cpu_times()[:2]))])
+
+
+def worker_queue_collector(worker_queue) -> Callable[[], Iterable[Collected]]:
+    """A collector for WorkerQueue.stats(); registered by the websocket client once it has a queue."""
+
+    def collect() -> Iterable[Collected]:
+        stats = worker_queue.stats()
+        lanes = stats["lanes"]
+        yield Collected(
+            "job_queue_depth",
+            "gauge",
+            "Jobs waiting in each worker queue lane and priority class.",
+            [
+                ({"lane": lane, "priority": priority}, count)
+                for lane, lane_stats in lanes.items()
+                for priority, count in lane_stats["queued_by_class"].items()
+            ],
+        )
+        yield Collected(
+            "job_queue_running",
+            "gauge",
+            "Jobs running in each worker queue lane.",
+            [({"lane": lane}, lane_stats["running"]) for lane, lane_stats in lanes.items()],
+        )
+        yield Collected(
+            "job_queue_predicted_wait_seconds",
+            "gauge",
+            "Predicted wait for a new job in each lane.",
+            [({"lane": lane}, lane_stats["predicted_wait_seconds"]) for lane, lane_stats in lanes.items()],
+        )
+        yield Collected(
+            "job_admissions_total",
+            "counter",
+            "Jobs offered to the worker queue by outcome.",
+            [({"result": "admitted"}, stats["admitted"]), ({"result": "rejected"}, stats["rejected"])],
+        )
+
+    return collect
+
+
+_registry: Optional[MetricsRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+            _registry.register_collector("caches", _cache_collector)
+            _registry.register_collector("executors", _executor_collector)
+            _registry.register_collector("gpu", _gpu_collector)
+            _registry.register_collector("residency", _residency_collector)
+            _registry.register_collector("process", _process_collector)
+        return _registry
+
+
+# The event metrics, updated where the events happen.
+metrics = get_metrics()
+JOB_QUEUE_WAIT = metrics.histogram(
+    "job_queue_wait_seconds", "Time a job spent in the worker queue before it started.", ("lane",)
+)
+JOB_RUN = metrics.histogram(
+    "job_run_seconds", "Time a job (or batch) ran after leaving the worker queue.", ("lane",)
+)
+JOB_HANDLER = metrics.histogram(
+    "job_handler_seconds", "Time in each command handler.", ("module", "command", "outcome")
+)
+JOB_STAGE = metrics.histogram(
+    "job_stage_seconds", "Time in each stage of an image job.", ("stage",)
+)
+PIPELINE_LOADS = metrics.counter(
+    "pipeline_loads_total", "Pipelines created from disk.", ("pipe_type",)
+)
+PIPELINE_LOAD_SECONDS = metrics.histogram(
+    "pipeline_load_seconds", "Time to create a pipeline from disk.", ("pipe_type",)
+)
+PIPELINE_LOAD_BYTES = metrics.counter(
+    "pipeline_load_bytes_total", "Bytes of components loaded from disk.", ("pipe_type",)
+)
+PIPELINE_LOOKUPS = metrics.counter(
+    "pipeline_lookups_total", "Pipeline requests by whether the pipeline was already loaded.", ("result",)
+)
+COMPONENT_MOVES = metrics.counter(
+    "component_moves_total", "Pipeline components moved between tiers.", ("source", "target")
+)
+COMPONENT_MOVE_BYTES = metrics.counter(
+    "component_move_bytes_total", "Bytes of pipeline components moved between tiers.", ("source", "target")
+)
+COMPONENT_MOVE_SECONDS = metrics.histogram(
+    "component_move_seconds",
+    "Time to move one pipeline component between tiers.",
+    ("source", "target"),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+PIPELINE_DROPS = metrics.counter("pipeline_drops_total", "Pipelines released back to disk.")
+PIPELINE_DROP_BYTES = metrics.counter(
+    "pipeline_drop_bytes_total", "Bytes freed by releasing pipelines back to disk."
+)
+UPLOADS = metrics.counter("uploads_total", "Uploads to the master.", ("endpoint", "outcome"))
+UPLOAD_SECONDS = metrics.histogram(
+    "upload_seconds", "Time to upload one file to the master, including retries.", ("endpoint",)
+)
+UPLOAD_BYTES = metrics.counter("upload_bytes_total", "Bytes uploaded to the master.", ("endpoint",))
+HTTP_RETRIES = metrics.counter(
+    "http_retries_total", "Retried requests to the master by the reason of the failure.", ("method", "reason")
+)
+
+
+def blueprint():
+    """Flask route for the Prometheus scrape endpoint."""
+    from flask import Blueprint, Response
+
+    routes = Blueprint("metrics", __name__)
+
+    @routes.route("/metrics", methods=["GET"])
+    def scrape():
+        return Response(get_metrics().render(), content_type=CONTENT_TYPE)
+
+    return routes
+
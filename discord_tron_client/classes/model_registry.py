@@ -0,0 +1,417 @@
+import builtins, importlib, importlib.util, logging, sys, threading, time
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+from discord_tron_client.classes.app_config import AppConfig
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+OVERRIDES = "discord_tron_client.classes.image_manipulation.pipeline_runners.overrides"
+RUNNERS = "discord_tron_client.classes.image_manipulation.pipeline_runners"
+
+# kind -> family -> "module:attribute". Nothing is imported until it is asked for.
+ENTRY_POINTS = {
+    "pipeline": {
+        "text2img": "diffusers:DiffusionPipeline",
+        "variation": "diffusers:StableDiffusionPipeline",
+        "upscaler": "diffusers:StableDiffusionPipeline",
+        "prompt_variation": "diffusers.pipelines.ltx.pipeline_ltx_image2video:LTXImageToVideoPipeline",
+        "ltx": "diffusers.pipelines.ltx.pipeline_ltx:LTXPipeline",
+        "ltx_image_to_video": "diffusers.pipelines.ltx.pipeline_ltx_image2video:LTXImageToVideoPipeline",
+        "flux": "diffusers.pipelines.flux.pipeline_flux:FluxPipeline",
+        "sana": "diffusers.pipelines.sana.pipeline_sana:SanaPipeline",
+        "aura": "diffusers.pipelines.aura_flow.pipeline_aura_flow:AuraFlowPipeline",
+        "lumina2": "diffusers.pipelines.lumina2.pipeline_lumina2:Lumina2Pipeline",
+        "omnigen": "diffusers.pipelines.omnigen.pipeline_omnigen:OmniGenPipeline",
+        "kandinsky-2.2": "diffusers.pipelines.kandinsky2_2.pipeline_kandinsky2_2_combined:KandinskyV22CombinedPipeline",
+        "pixart": f"{OVERRIDES}.pixart:PixArtSigmaPipeline",
+        "z_image": f"{OVERRIDES}.z_image:ZImagePipeline",
+        "stable_cascade": f"{OVERRIDES}.stable_cascade.pipeline_combined:StableCascadeCombinedPipeline",
+        "ace_step": f"{OVERRIDES}.ace_step.pipeline:ACEStepPipeline",
+        "flux2": f"{OVERRIDES}.flux2.pipeline:Flux2Pipeline",
+        "kandinsky5_image": f"{OVERRIDES}.kandinsky5_image.pipeline_kandinsky5_t2i:Kandinsky5T2IPipeline",
+        "kandinsky5_i2i": f"{OVERRIDES}.kandinsky5_image.pipeline_kandinsky5_i2i:Kandinsky5I2IPipeline",
+        "kandinsky5_video": f"{OVERRIDES}.kandinsky5_video.pipeline_kandinsky5_t2v:Kandinsky5T2VPipeline",
+        "kandinsky5_i2v": f"{OVERRIDES}.kandinsky5_video.pipeline_kandinsky5_i2v:Kandinsky5I2VPipeline",
+        "cosmos": f"{OVERRIDES}.cosmos.pipeline:Cosmos2TextToImagePipeline",
+        "wan": f"{OVERRIDES}.wan.pipeline:WanPipeline",
+    },
+    "runner": {
+        "text2img": f"{RUNNERS}.text2img:Text2ImgPipelineRunner",
+        "img2img": f"{RUNNERS}.img2img:Img2ImgPipelineRunner",
+        "sdxl_base": f"{RUNNERS}.sdxl_base:SdxlBasePipelineRunner",
+        "sdxl_refiner": f"{RUNNERS}.sdxl_refiner:SdxlRefinerPipelineRunner",
+        "kandinsky_2.2": f"{RUNNERS}.kandinsky_2_2:KandinskyTwoTwoPipelineRunner",
+        "deep_floyd": f"{RUNNERS}.deep_floyd:DeepFloydPipelineRunner",
+        "sd3": f"{RUNNERS}.sd3_runner:SD3PipelineRunner",
+        "sana": f"{RUNNERS}.sana_runner:SanaPipelineRunner",
+        "pixart": f"{RUNNERS}.pixart:PixArtPipelineRunner",
+        "aura": f"{RUNNERS}.aura:AuraPipelineRunner",
+        "flux": f"{RUNNERS}.flux:FluxPipelineRunner",
+        "ltxvideo": f"{RUNNERS}.ltxvideo:LtxVideoPipelineRunner",
+        "z_image": f"{RUNNERS}.z_image:ZImagePipelineRunner",
+        "stable_cascade": f"{RUNNERS}.extra:StableCascadePipelineRunner",
+        "flux2": f"{RUNNERS}.extra:Flux2PipelineRunner",
+        "kandinsky5_image": f"{RUNNERS}.extra:Kandinsky5ImagePipelineRunner",
+        "kandinsky5_video": f"{RUNNERS}.extra:Kandinsky5VideoPipelineRunner",
+        "cosmos": f"{RUNNERS}.extra:CosmosPipelineRunner",
+        "wan": f"{RUNNERS}.extra:WanPipelineRunner",
+        "lumina2": f"{RUNNERS}.extra:Lumina2PipelineRunner",
+        "omnigen": f"{RUNNERS}.extra:OmniGenPipelineRunner",
+        "ace_step": f"{RUNNERS}.extra:ACEStepPipelineRunner",
+    },
+    # Factories for the WorkerProcessor's model-backed command handlers.
+    "worker": {
+        "llama": "discord_tron_client.classes.llm.llama.factory:LlamaFactory",
+        "stablelm": "discord_tron_client.classes.llm.stablelm.factory:StableLMFactory",
+        "stablevicuna": "discord_tron_client.classes.llm.stable_vicuna.factory:StableVicunaFactory",
+        "tts_bark": "discord_tron_client.classes.tts.bark.factory:BarkFactory",
+    },
+}
+
+# Modules the worker imports before it registers; see check_startup().
+STARTUP_MODULES = (
+    "discord_tron_client.__main__",
+    "discord_tron_client.classes.image_manipulation.diffusion",
+    "discord_tron_client.ws_client",
+)
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def _split_entry_point(entry_point: str) -> tuple:
+    module, _, attribute = entry_point.partition(":")
+    if not module or not attribute:
+        raise ValueError(f"Entry point {entry_point!r} should look like 'package.module:Attribute'.")
+    return module, attribute
+
+
+class FamilyMap(Mapping):
+    """
+    A read-only view of one kind of entry point, for code that used to hold
+    a dict of classes (eg. `runner_map`). Looking a family up imports it;
+    `in` and iteration do not.
+    """
+
+    def __init__(self, registry: "ModelRegistry", kind: str):
+        self.registry = registry
+        self.kind = kind
+
+    def __getitem__(self, family: str):
+        return self.registry.resolve(self.kind, family)
+
+    def __contains__(self, family) -> bool:
+        return self.registry.is_registered(self.kind, family)
+
+    def __iter__(self):
+        return iter(self.registry.families(self.kind))
+
+    def __len__(self) -> int:
+        return len(self.registry.families(self.kind))
+
+    def __repr__(self) -> str:
+        return f"FamilyMap({self.kind!r}, {self.registry.families(self.kind)})"
+
+
+class ModelRegistry:
+    """
+    Maps model families to the entry points that implement them, and imports
+    each one only when it is first used. Keeps what every import cost so the
+    startup report can show where the time went.
+
+    Families are grouped by kind ("pipeline", "runner", "worker"); the same
+    family name in several kinds is warmed up together.
+    """
+
+    def __init__(self, entry_points: Dict[str, Dict[str, object]] = None):
+        self.entry_points: Dict[str, Dict[str, object]] = {}
+        self.resolved: Dict[tuple, object] = {}
+        self.imports: List[dict] = []
+        self.lock = threading.Lock()
+        for kind, families in (entry_points or {}).items():
+            for family, entry_point in families.items():
+                self.register(kind, family, entry_point)
+
+    def register(self, kind: str, family: str, entry_point):
+        """`entry_point` is "module:Attribute", or the object itself when it is already imported."""
+        if isinstance(entry_point, str):
+            _split_entry_point(entry_point)
+        with self.lock:
+            self.entry_points.setdefault(kind, {})[family] = entry_point
+            self.resolved.pop((kind, family), None)
+
+    def is_registered(self, kind: str, family: str) -> bool:
+        return family in self.entry_points.get(kind, {})
+
+    def families(self, kind: str) -> List[str]:
+        return list(self.entry_points.get(kind, {}))
+
+    def _entry_point(self, kind: str, family: str):
+        try:
+            return self.entry_points[kind][family]
+        except KeyError:
+            raise KeyError(f"No {kind} registered for model family {family!r}.") from None
+
+    def resolve(self, kind: str, family: str):
+        """The object behind `family`, importing it on first use. Import errors propagate."""
+        key = (kind, family)
+        if key in self.resolved:
+            return self.resolved[key]
+        entry_point = self._entry_point(kind, family)
+        if not isinstance(entry_point, str):
+            value = entry_point
+        else:
+            module_name, attribute = _split_entry_point(entry_point)
+            was_loaded = module_name in sys.modules
+            rss_before = _rss_bytes()
+            started_at = time.perf_counter()
+            value = getattr(importlib.import_module(module_name), attribute)
+            seconds = time.perf_counter() - started_at
+            rss_after = _rss_bytes()
+            if not was_loaded:
+                record = {
+                    "kind": kind,
+                    "family": family,
+                    "module": module_name,
+                    "seconds": seconds,
+                    "rss_bytes": (
+                        rss_after - rss_before
+                        if rss_before is not None and rss_after is not None
+                        else None
+                    ),
+                }
+                logger.debug(f"Imported {kind} {family} from {module_name} in {seconds:.2f}s.")
+                with self.lock:
+                    self.imports.append(record)
+        with self.lock:
+            self.resolved[key] = value
+        return value
+
+    def get(self, kind: str, family: str, default=None):
+        """resolve(), but logs and returns `default` when the family cannot be imported."""
+        try:
+            return self.resolve(kind, family)
+        except KeyError:
+            raise
+        except Exception as e:
+            logger.error(f"Could not import dependency for {kind} {family}: {e}")
+            return default
+
+    def loaded(self, kind: str, family: str):
+        """The object behind `family` if its module is already imported, else None. Never imports."""
+        key = (kind, family)
+        if key in self.resolved:
+            return self.resolved[key]
+        entry_point = self.entry_points.get(kind, {}).get(family)
+        if entry_point is None:
+            return None
+        if not isinstance(entry_point, str):
+            return entry_point
+        module_name, attribute = _split_entry_point(entry_point)
+        module = sys.modules.get(module_name)
+        if module is None:
+            return None
+        try:
+            return getattr(module, attribute, None)
+        except Exception:
+            return None
+
+    def matches(self, obj, *families: str, kind: str = "pipeline", exact: bool = False) -> bool:
+        """
+        Whether `obj` is an instance of any of `families`. A family that was
+        never imported cannot have made `obj`, so this does not import one.
+        """
+        for family in families:
+            cls = self.loaded(kind, family)
+            if not isinstance(cls, type):
+                continue
+            if (type(obj) is cls) if exact else isinstance(obj, cls):
+                return True
+        return False
+
+    def mapping(self, kind: str) -> FamilyMap:
+        return FamilyMap(self, kind)
+
+    def warm_up(self, families: Iterable[str] = None, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Import the families listed in `warm_up_families` (every kind they are
+        registered under) so their first job does not pay for it. Runs on a
+        daemon thread by default, so it never holds up worker registration.
+        """
+        if families is None:
+            families = config.get_config_value("warm_up_families", []) or []
+        families = [str(family) for family in families]
+        if not families:
+            return None
+
+        def run():
+            started_at = time.perf_counter()
+            for family in families:
+                kinds = [kind for kind in self.entry_points if self.is_registered(kind, family)]
+                if not kinds:
+                    logger.warning(f"Cannot warm up unknown model family {family!r}.")
+                for kind in kinds:
+                    self.get(kind, family)
+            logger.info(f"Warmed up {', '.join(families)} in {time.perf_counter() - started_at:.2f}s.")
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def import_report(self) -> List[dict]:
+        with self.lock:
+            return sorted(self.imports, key=lambda record: record["seconds"], reverse=True)
+
+
+class ImportProfile:
+    """
+    Per-module import cost collected by `profile_imports()`. `seconds`
+    includes the imports a module made itself; `self_seconds` does not. It
+    is an approximation of `python -X importtime`, which remains the tool
+    for an exact trace.
+    """
+
+    def __init__(self):
+        self.modules: Dict[str, dict] = {}
+        self.seconds = 0.0
+        self.rss_bytes = None
+
+    def record(self, module: str, seconds: float, self_seconds: float):
+        self.modules[module] = {"module": module, "seconds": seconds, "self_seconds": self_seconds}
+
+    def report(self, limit: int = None, key: str = "seconds") -> List[dict]:
+        rows = sorted(self.modules.values(), key=lambda row: row[key], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def log(self, limit: int = None):
+        limit = limit or int(config.get_config_value("startup_import_report_modules", 15))
+        rss = f", {self.rss_bytes / 2**20:.0f} MiB RSS" if self.rss_bytes is not None else ""
+        logger.info(
+            f"Startup imports took {self.seconds:.2f}s across {len(self.modules)} modules{rss}. Slowest (self time):"
+        )
+        for row in self.report(limit, key="self_seconds"):
+            logger.info(
+                f"  {row['self_seconds']:7.3f}s self  {row['seconds']:7.3f}s total  {row['module']}"
+            )
+
+
+def _absolute_name(name: str, globals: Optional[dict], level: int) -> Optional[str]:
+    if not level:
+        return name
+    try:
+        package = (globals or {}).get("__package__") or (globals or {}).get("__name__")
+        return importlib.util.resolve_name("." * level + name, package)
+    except Exception:
+        return None
+
+
+@contextmanager
+def profile_imports(profile: ImportProfile = None):
+    """
+    Time every module first imported, on this thread, inside the block.
+    Pass an earlier `profile` to add to it.
+
+        with profile_imports() as profile:
+            import heavy_module
+        profile.log()
+    """
+    profile = profile or ImportProfile()
+    original = builtins.__import__
+    owner = threading.get_ident()
+    # Time spent in nested imports, per level of the import stack.
+    children: List[float] = []
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if threading.get_ident() != owner:
+            return original(name, globals, locals, fromlist, level)
+        module = _absolute_name(name, globals, level)
+        if module is None or module in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+        children.append(0.0)
+        started_at = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            seconds = time.perf_counter() - started_at
+            nested = children.pop()
+            if children:
+                children[-1] += seconds
+            if module in sys.modules:
+                profile.record(module, seconds, seconds - nested)
+
+    rss_before = _rss_bytes()
+    started_at = time.perf_counter()
+    builtins.__import__ = timed_import
+    try:
+        yield profile
+    finally:
+        builtins.__import__ = original
+        profile.seconds += time.perf_counter() - started_at
+        rss_after = _rss_bytes()
+        if rss_before is not None and rss_after is not None:
+            profile.rss_bytes = (profile.rss_bytes or 0) + rss_after - rss_before
+
+
+def _torch_weights() -> tuple:
+    """(modules holding parameters, parameter elements) alive in this process."""
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return 0, 0
+    import gc
+
+    modules, elements = 0, 0
+    for obj in gc.get_objects():
+        try:
+            if not isinstance(obj, torch.nn.Module):
+                continue
+            count = sum(parameter.numel() for parameter in obj.parameters(recurse=False))
+        except Exception:
+            continue
+        if count:
+            modules += 1
+            elements += count
+    return modules, elements
+
+
+def check_startup(modules: Iterable[str] = STARTUP_MODULES) -> bool:
+    """
+    Import what the worker imports before it registers and confirm no torch
+    model weights were loaded on the way. Run it in a fresh interpreter:
+
+        poetry run python benchmarks/model_registry.py --check-startup
+    """
+    with profile_imports() as profile:
+        for module in modules:
+            importlib.import_module(module)
+    profile.log()
+    weight_modules, elements = _torch_weights()
+    if weight_modules:
+        logger.error(
+            f"Importing {', '.join(modules)} loaded {elements:,} weights across {weight_modules} torch modules."
+        )
+        return False
+    logger.info(f"Importing {', '.join(modules)} loaded no torch model weights.")
+    return True
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry(ENTRY_POINTS)
+        return _registry
+
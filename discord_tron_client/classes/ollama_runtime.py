@@ -2,9 +2,8 @@ import json
 import logging
 from typing import Any
 
-import requests
-
 from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.http_client import get_http_session
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +19,7 @@ class OllamaRuntime:
         return self.config.get_ollama_timeout_seconds()
 
     def _post(self, path: str, *, json_body: dict[str, Any], stream: bool = False):
-        response = requests.post(
+        response = get_http_session().post(
             f"{self._base_url()}{path}",
             json=json_body,
             timeout=self._timeout(),
@@ -31,7 +30,7 @@ class OllamaRuntime:
 
     def available_models(self) -> set[str]:
         try:
-            response = requests.get(
+            response = get_http_session().get(
                 f"{self._base_url()}/api/tags",
                 timeout=min(self._timeout(), 30),
             )
@@ -76,7 +75,7 @@ class OllamaRuntime:
         if not models:
             return
         try:
-            response = requests.get(
+            response = get_http_session().get(
                 f"{self._base_url()}/api/ps",
                 timeout=min(self._timeout(), 30),
             )
@@ -36,6 +36,8 @@ class OllamaWorker:
         }
         try:
             loop = asyncio.get_event_loop()
+            # The Ollama server shares the GPU, so completions are serialised
+            # with diffusion work on the GPU thread.
             result_payload["text"] = await loop.run_in_executor(
                 AppConfig.get_image_worker_thread(),
                 self.complete,
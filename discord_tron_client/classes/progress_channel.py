@@ -0,0 +1,201 @@
+import asyncio, contextvars, logging, time
+from contextlib import contextmanager
+from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.discord_progress_bar import DiscordProgressBar
+from discord_tron_client.classes.gpu_telemetry import get_telemetry_sampler
+from discord_tron_client.classes.hardware import HardwareInfo
+
+config = AppConfig()
+# The channel of the job running in the current thread, if any.
+current_progress_channel = contextvars.ContextVar(
+    "current_progress_channel", default=None
+)
+_hook_installed = False
+
+
+class ProgressTracker:
+    """
+    A stand-in for the tqdm bar that diffusers pipelines create through
+    `self.progress_bar()`. It draws nothing; every update() is handed to the
+    job's ProgressChannel instead.
+    """
+
+    def __init__(self, channel, iterable=None, total=None):
+        self.channel = channel
+        self.iterable = iterable
+        if total is None and iterable is not None:
+            try:
+                total = len(iterable)
+            except TypeError:
+                total = None
+        self.total = total
+        self.n = 0
+
+    def __iter__(self):
+        for item in self.iterable:
+            yield item
+            self.update()
+
+    def __len__(self):
+        return self.total or 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def update(self, n: int = 1):
+        self.n += n
+        self.channel.report(self.n, self.total)
+
+    def close(self):
+        pass
+
+    def set_description(self, *args, **kwargs):
+        pass
+
+    def set_postfix(self, *args, **kwargs):
+        pass
+
+    def set_postfix_str(self, *args, **kwargs):
+        pass
+
+
+def install_progress_hook():
+    """
+    Route DiffusionPipeline.progress_bar() to the current job's channel.
+
+    Pipelines running outside of a ProgressChannel.attached() block keep the
+    stock tqdm bar.
+    """
+    global _hook_installed
+    if _hook_installed:
+        return
+    from diffusers import DiffusionPipeline
+
+    original_progress_bar = DiffusionPipeline.progress_bar
+
+    def progress_bar(self, iterable=None, total=None):
+        channel = current_progress_channel.get()
+        if channel is None:
+            return original_progress_bar(self, iterable=iterable, total=total)
+        return ProgressTracker(channel, iterable=iterable, total=total)
+
+    DiffusionPipeline.progress_bar = progress_bar
+    _hook_installed = True
+
+
+class ProgressChannel:
+    """
+    Carries one job's progress from the pipeline thread to Discord.
+
+    Updates go through a single-slot asyncio queue on the event loop, so a
+    newer percentage replaces one that has not been sent yet, and the sender
+    waits `progress_update_interval_ms` between websocket messages. Nothing
+    touches the filesystem or sys.stderr, so concurrent jobs stay isolated.
+
+    The channel also keeps the job's GPU energy accounting (see begin/finish).
+    """
+
+    def __init__(self, progress_bar: DiscordProgressBar, loop):
+        install_progress_hook()
+        self.progress_bar = progress_bar
+        self.loop = loop
+        self.update_interval = (
+            float(config.get_config_value("progress_update_interval_ms", 500)) / 1000
+        )
+        self.hardware_info = HardwareInfo()
+        self.telemetry = get_telemetry_sampler()
+        self.gpu_power_consumption = 0.0
+        # Integrated energy for the job, when the telemetry sampler is running.
+        self.gpu_energy_joules = None
+        self.start_time = time.monotonic()
+        # Start below zero so that a progress of zero will begin the bar.
+        self.progress = -1
+        self.queue = None
+        self.sender = None
+        self.closing = False
+
+    @contextmanager
+    def attached(self):
+        """Make this the progress channel for pipelines run in this thread."""
+        token = current_progress_channel.set(self)
+        try:
+            yield self
+        finally:
+            current_progress_channel.reset(token)
+
+    def begin(self):
+        """Mark the start of the job's GPU work for energy accounting."""
+        self.start_time = time.monotonic()
+        self.gpu_power_consumption = 0.0
+        self.gpu_energy_joules = None
+        self.closing = False
+
+    def finish(self):
+        """
+        Close out the job: flush the last progress update and settle the
+        energy figures. With the telemetry sampler, the reported power is the
+        average over the job's integrated energy.
+        """
+        self.loop.call_soon_threadsafe(self._close)
+        if self.telemetry is None:
+            return
+        end_time = time.monotonic()
+        self.gpu_energy_joules = self.telemetry.energy_joules(self.start_time, end_time)
+        duration = end_time - self.start_time
+        if duration > 0:
+            self.gpu_power_consumption = round(self.gpu_energy_joules / duration, 1)
+
+    def report(self, completed: int, total: int = None):
+        """Called from the pipeline thread with a step count."""
+        if not total:
+            return
+        progress = min(int(completed * 100 / total), 100)
+        if progress == self.progress:
+            return
+        self.progress = progress
+        if self.telemetry is None:
+            try:
+                gpu_power_consumption = float(
+                    self.hardware_info.get_gpu_power_consumption()
+                )
+            except:
+                gpu_power_consumption = 0.0
+            if gpu_power_consumption > self.gpu_power_consumption:
+                # Store the maximum power used rather than a random sample.
+                self.gpu_power_consumption = gpu_power_consumption
+        self.loop.call_soon_threadsafe(self._offer, progress)
+
+    def _offer(self, progress: int):
+        # Runs on the event loop. Keep only the newest unsent value.
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=1)
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(progress)
+        if self.sender is None or self.sender.done():
+            self.closing = False
+            self.sender = self.loop.create_task(self._send_updates())
+
+    def _close(self):
+        if self.queue is None or self.sender is None or self.sender.done():
+            return
+        if self.queue.empty():
+            self.queue.put_nowait(None)
+        else:
+            self.closing = True
+
+    async def _send_updates(self):
+        while True:
+            progress = await self.queue.get()
+            if progress is None:
+                return
+            try:
+                await self.progress_bar.update_progress_bar(progress)
+            except Exception as e:
+                logging.error(f"Could not send progress update: {e}")
+            if self.closing and self.queue.empty():
+                return
+            await asyncio.sleep(self.update_interval)
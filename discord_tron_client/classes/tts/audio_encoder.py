@@ -0,0 +1,125 @@
+import asyncio, base64, logging
+from io import BytesIO
+import numpy as np
+from scipy.io.wavfile import write as write_wav
+from discord_tron_client.classes.app_config import AppConfig
+
+try:
+    import lameenc
+except ImportError:
+    lameenc = None
+
+config = AppConfig()
+logger = logging.getLogger(__name__)
+
+ENCODER_FORMATS = {
+    "wav": ("audio/wav", "wav"),
+    "mp3": ("audio/mpeg", "mp3"),
+}
+
+
+class EncodedAudio:
+    """
+    The final, compressed bytes of generated audio. Encoded once and handed
+    unchanged to the uploader and the websocket message, like EncodedImage.
+    """
+
+    def __init__(self, data: bytes, encoder: str, sample_rate: int, samples: int):
+        self.data = data
+        self.encoder = encoder
+        self.mime_type, self.extension = ENCODER_FORMATS[encoder]
+        self.sample_rate = sample_rate
+        self.samples = samples
+
+    @property
+    def duration(self) -> float:
+        return self.samples / self.sample_rate if self.sample_rate else 0.0
+
+    @property
+    def filename(self) -> str:
+        return f"audio.{self.extension}"
+
+    def as_file(self) -> BytesIO:
+        return BytesIO(self.data)
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.data).decode("utf-8")
+
+
+def _resolve_encoder(encoder: str = None) -> str:
+    encoder = str(encoder or config.get_config_value("audio_encoder", "mp3")).lower()
+    if encoder not in ENCODER_FORMATS:
+        logger.warning(f"Unknown audio encoder {encoder}, using MP3.")
+        return "mp3"
+    return encoder
+
+
+def _to_pcm16(audio: np.ndarray) -> np.ndarray:
+    audio = np.asarray(audio)
+    if audio.dtype == np.int16:
+        return audio
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def _encode(audio: np.ndarray, sample_rate: int, encoder: str, bitrate: int) -> bytes:
+    """Encode one clip. Runs inside the encode process pool."""
+    pcm = _to_pcm16(audio)
+    channels = 1 if pcm.ndim == 1 else pcm.shape[1]
+    if encoder == "wav":
+        buffer = BytesIO()
+        write_wav(buffer, sample_rate, pcm)
+        return buffer.getvalue()
+    if lameenc is not None:
+        mp3 = lameenc.Encoder()
+        mp3.set_bit_rate(bitrate)
+        mp3.set_in_sample_rate(sample_rate)
+        mp3.set_channels(channels)
+        mp3.set_quality(2)
+        return bytes(mp3.encode(np.ascontiguousarray(pcm).tobytes()) + mp3.flush())
+    # Without lameenc, pydub hands the PCM to an ffmpeg subprocess.
+    from pydub import AudioSegment
+
+    segment = AudioSegment(
+        np.ascontiguousarray(pcm).tobytes(),
+        frame_rate=sample_rate,
+        sample_width=2,
+        channels=channels,
+    )
+    return segment.export(format="mp3", bitrate=f"{bitrate}k").read()
+
+
+def encode_audio(
+    audio: np.ndarray, sample_rate: int, encoder: str = None, use_pool: bool = True
+) -> EncodedAudio:
+    """
+    Encode `audio` (floats in [-1, 1] or int16) exactly once. With use_pool,
+    the work runs on the encode process pool so it does not hold the GIL.
+    """
+    encoder = _resolve_encoder(encoder)
+    bitrate = int(config.get_config_value("audio_bitrate_kbps", 128))
+    if use_pool and config.get_config_value("audio_encode_in_subprocess", True):
+        try:
+            data = AppConfig.get_encode_executor().submit(
+                _encode, audio, sample_rate, encoder, bitrate
+            ).result()
+        except Exception as e:
+            logger.warning(f"Encode pool failed ({e}), encoding in-process.")
+            data = _encode(audio, sample_rate, encoder, bitrate)
+    else:
+        data = _encode(audio, sample_rate, encoder, bitrate)
+    return EncodedAudio(data, encoder, sample_rate, len(audio))
+
+
+async def encode_audio_async(
+    audio: np.ndarray, sample_rate: int, encoder: str = None
+) -> EncodedAudio:
+    """encode_audio() for the event loop: awaits the encode pool."""
+    if not config.get_config_value("audio_encode_in_subprocess", True):
+        return encode_audio(audio, sample_rate, encoder=encoder, use_pool=False)
+    encoder = _resolve_encoder(encoder)
+    bitrate = int(config.get_config_value("audio_bitrate_kbps", 128))
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(
+        AppConfig.get_encode_executor(), _encode, audio, sample_rate, encoder, bitrate
+    )
+    return EncodedAudio(data, encoder, sample_rate, len(audio))
@@ -2,7 +2,8 @@ from discord_tron_client.classes.app_config import AppConfig
 from discord_tron_client.message.discord import DiscordMessage
 from discord_tron_client.classes.debug import clean_traceback
 from discord_tron_client.classes.uploader import Uploader
-import logging, asyncio, base64
+from discord_tron_client.classes.tts.audio_encoder import encode_audio_async
+import logging, asyncio
 
 config = AppConfig()
 
@@ -69,19 +70,11 @@ class BarkRunner:
             logging.debug(
                 f"Received result from TTS engine: {output_audio}, {self.sample_rate}"
             )
+            # Encode once, off the event loop; the upload and the message share the bytes.
+            encoded_audio = await encode_audio_async(output_audio, self.sample_rate)
             uploader = Uploader(api_client=api_client, config=config)
-            url_list = await uploader.audio(output_audio, self.sample_rate)
-            # Convert audio from wav to mp3:
-            import io
-            from scipy.io.wavfile import write as write_wav
-            from pydub import AudioSegment
-
-            wav_binary_stream = io.BytesIO()
-            write_wav(wav_binary_stream, self.sample_rate, output_audio)
-            sound = AudioSegment.from_wav(wav_binary_stream)
-            output_audio = base64.b64encode(sound.export(format="mp3").read()).decode(
-                "utf-8"
-            )
+            url_list = await uploader.audio(encoded_audio)
+            output_audio = encoded_audio.to_base64()
 
             usage = self.usage()
             discord_msg = DiscordMessage(
@@ -1,11 +1,10 @@
 from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.tts.engine import TTSEngine
 from bark.api import generate_audio
 from bark.generation import preload_models
 from bark.generation import SAMPLE_RATE
 import os, sys, json, logging, time, io, re
-from pydub import AudioSegment
-from scipy.io.wavfile import write as write_wav
-from typing import List
+from typing import List, Optional
 import numpy as np
 
 config = AppConfig()
@@ -47,6 +46,15 @@ class BarkTorch:
         audio = generate_audio(prompt, history_prompt=character_voice)
         return audio, None
 
+    def synthesize_groups(self, prompts: List[str], character_voice: Optional[str]):
+        """One clip per prompt. Bark's API takes a single prompt, so they are generated in turn."""
+        if character_voice in ("none", "default"):
+            character_voice = None
+        return [
+            generate_audio(prompt, history_prompt=character_voice, silent=True)
+            for prompt in prompts
+        ]
+
     def generate(self, prompt, user_config):
         logging.debug(f"Begin Bark generate() routine")
         time_begin = time.time()
@@ -112,23 +120,23 @@ class BarkTorch:
         return self.generate_long_from_segments(segments, user_config)
 
     def generate_long_from_segments(self, prompts: List[str], user_config):
-        # Generate audio for each prompt
-        audio_segments = []
         actors = user_config.get("tts_actors", None)
         logging.debug(
             f"Generating long prompt with {len(prompts)} segments. using actors {actors}"
         )
+        lines = []
         current_voice = None
         for prompt in prompts:
             line, voice = BarkTorch.process_line(prompt, actors)
             if voice is not None:
                 # Set a voice, if found. Otherwise, keep last voice.
                 current_voice = voice
-            audio, semantics = self._generate(line, user_config, current_voice)
-            audio_segments.append(audio)
-        # Concatenate the audio segments
-        concatenated_audio = self.concatenate_audio_segments(audio_segments)
-        return concatenated_audio, SAMPLE_RATE, semantics
+            if line.strip():
+                lines.append((line, current_voice))
+        # Sentence groups are synthesised in speaking order straight into one buffer.
+        engine = TTSEngine(self.synthesize_groups, SAMPLE_RATE)
+        audio = engine.synthesize(lines)
+        return audio, SAMPLE_RATE, None
 
     @staticmethod
     def clean_audio(audio):
@@ -136,13 +144,10 @@ class BarkTorch:
 
     @staticmethod
     def concatenate_audio_segments(audio_segments):
-        combined_audio = np.array([], dtype=np.int16)
-
-        for audio in audio_segments:
-            # Concatenate the audio
-            combined_audio = np.concatenate((combined_audio, audio))
-
-        return combined_audio
+        if not audio_segments:
+            return np.array([], dtype=np.float32)
+        # One copy into a buffer sized for all of them.
+        return np.concatenate(audio_segments)
 
     @staticmethod
     def process_line(line, characters):
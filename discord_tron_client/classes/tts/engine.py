@@ -0,0 +1,133 @@
+import logging, re, time
+from typing import Callable, List, Optional, Sequence, Tuple
+import numpy as np
+from discord_tron_client.classes.app_config import AppConfig
+
+config = AppConfig()
+logger = logging.getLogger(__name__)
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+# Speech runs at about 150 words a minute; the first buffer is sized a little over that.
+WORDS_PER_SECOND = 2.5
+BUFFER_HEADROOM = 1.25
+
+# (texts, voice) -> one clip per text.
+Synthesizer = Callable[[List[str], Optional[str]], List[np.ndarray]]
+
+
+def _word_count(text: str) -> int:
+    # Non-speech cues such as [laughs] take no time to read out.
+    return len(re.sub(r"\[.*?\]", "", text).split())
+
+
+def split_sentences(text: str) -> List[str]:
+    text = re.sub(r"\s{2,}", " ", text).strip()
+    return [sentence for sentence in SENTENCE_BOUNDARY.split(text) if sentence]
+
+
+def group_sentences(sentences: Sequence[str], max_words: int) -> List[str]:
+    """Join whole sentences into groups of at most `max_words`; longer sentences are cut on words."""
+    groups, current, current_words = [], [], 0
+    for sentence in sentences:
+        words = sentence.split()
+        while len(words) > max_words:
+            if current:
+                groups.append(" ".join(current))
+                current, current_words = [], 0
+            groups.append(" ".join(words[:max_words]))
+            words = words[max_words:]
+        if not words:
+            continue
+        if current and current_words + len(words) > max_words:
+            groups.append(" ".join(current))
+            current, current_words = [], 0
+        current.append(" ".join(words))
+        current_words += len(words)
+    if current:
+        groups.append(" ".join(current))
+    return groups
+
+
+class AudioBuffer:
+    """
+    One mono buffer that clips are written into. Allocated up front from an
+    estimate and doubled when the estimate falls short, so appending is
+    linear in the total length.
+    """
+
+    def __init__(self, capacity: int, dtype=np.float32):
+        self.data = np.zeros(max(int(capacity), 1), dtype=dtype)
+        self.length = 0
+
+    def append(self, samples: np.ndarray):
+        samples = np.asarray(samples).reshape(-1)
+        end = self.length + samples.shape[0]
+        if end > self.data.shape[0]:
+            grown = np.zeros(max(end, 2 * self.data.shape[0]), dtype=self.data.dtype)
+            grown[: self.length] = self.data[: self.length]
+            self.data = grown
+        self.data[self.length : end] = samples
+        self.length = end
+
+    def result(self) -> np.ndarray:
+        return self.data[: self.length]
+
+
+class TTSEngine:
+    """
+    Synthesises long text with a sentence-level acoustic model. Lines are
+    split into sentence groups short enough for the model, consecutive
+    groups in the same voice go to the model in one call (which may still
+    synthesise them one at a time), and the clips land in a single
+    preallocated buffer in order.
+    """
+
+    def __init__(
+        self,
+        synthesize: Synthesizer,
+        sample_rate: int,
+        group_words: int = None,
+        groups_per_call: int = None,
+    ):
+        self.synthesize_groups = synthesize
+        self.sample_rate = sample_rate
+        self.group_words = max(
+            int(group_words or config.get_config_value("tts_group_words", 30)), 1
+        )
+        self.groups_per_call = max(
+            int(groups_per_call or config.get_config_value("tts_groups_per_call", 4)), 1
+        )
+        self.usage = None
+
+    def plan(self, lines: Sequence[Tuple[str, Optional[str]]]) -> List[Tuple[Optional[str], List[str]]]:
+        """(voice, sentence groups) for each model call on (text, voice) lines, in speaking order."""
+        calls = []
+        for text, voice in lines:
+            for group in group_sentences(split_sentences(text), self.group_words):
+                if calls and calls[-1][0] == voice and len(calls[-1][1]) < self.groups_per_call:
+                    calls[-1][1].append(group)
+                else:
+                    calls.append((voice, [group]))
+        return calls
+
+    def synthesize(self, lines: Sequence[Tuple[str, Optional[str]]]) -> np.ndarray:
+        started_at = time.monotonic()
+        calls = self.plan(lines)
+        words = sum(_word_count(group) for _, groups in calls for group in groups)
+        buffer = AudioBuffer(words / WORDS_PER_SECOND * self.sample_rate * BUFFER_HEADROOM)
+        for voice, groups in calls:
+            clips = self.synthesize_groups(groups, voice)
+            if len(clips) != len(groups):
+                raise RuntimeError(f"Expected {len(groups)} clips from the acoustic model, received {len(clips)}.")
+            for clip in clips:
+                buffer.append(clip)
+        audio = buffer.result()
+        self.usage = {
+            "words": words,
+            "groups": sum(len(groups) for _, groups in calls),
+            "calls": len(calls),
+            "time_duration": time.monotonic() - started_at,
+        }
+        logger.debug(f"Synthesised {self.usage} into {audio.shape[0]} samples.")
+        return audio
+
@@ -3,30 +3,32 @@ from discord_tron_client.classes.hardware import HardwareInfo
 from discord_tron_client.message.job_queue import JobQueueMessage
 from discord_tron_client.modules.image_generation import generator as image_generator
 from discord_tron_client.modules.image_generation import variation
-from discord_tron_client.classes.llm.llama.factory import LlamaFactory
-from discord_tron_client.classes.llm.stablelm.factory import StableLMFactory
-from discord_tron_client.classes.llm.stable_vicuna.factory import StableVicunaFactory
-from discord_tron_client.classes.tts.bark.factory import BarkFactory
 from discord_tron_client.classes.ollama_worker import OllamaWorker
+from discord_tron_client.classes.model_registry import get_model_registry
+from discord_tron_client.classes.memory_profiler import get_memory_profiler
+from discord_tron_client.classes.metrics import JOB_HANDLER
 from typing import Dict, Any
-import logging, json, websocket
+import logging, json, time, websocket
 from discord_tron_client.classes.app_config import AppConfig
 
 config = AppConfig()
-try:
-    llamarunner = LlamaFactory.get()
-except:
-    logging.warn("Could not retrieve a Llama driver.")
+# Runners are built by their factory when their first command arrives.
+runners = {}
 
-try:
-    stablelmrunner = StableLMFactory.get()
-except:
-    logging.warn("Could not retrieve a StableLM driver.")
 
-try:
-    stablevicunarunner = StableVicunaFactory.get()
-except:
-    logging.warn("Could not retrieve a StableVicuna driver.")
+def get_runner(family: str):
+    if family not in runners:
+        runners[family] = get_model_registry().resolve("worker", family).get()
+    return runners[family]
+
+
+def lazy_handler(family: str, method: str):
+    async def handler(payload, websocket):
+        return await getattr(get_runner(family), method)(payload, websocket)
+
+    handler.__qualname__ = f"{family}.{method}"
+    return handler
+
 
 identifier = HardwareInfo.get_identifier()
 ollama_worker = OllamaWorker()
@@ -45,11 +47,16 @@ class WorkerProcessor:
                 "promptless_variation": variation.promptless_variation,
                 "prompt_variation": variation.prompt_variation,
             },
-            "llama": {"predict": llamarunner.predict_handler},
-            "stablelm": {"predict": stablelmrunner.predict_handler},
-            "stablevicuna": {"predict": stablevicunarunner.predict_handler},
-            "tts_bark": {"generate": BarkFactory.get().generate_handler},
+            "llama": {"predict": lazy_handler("llama", "predict_handler")},
+            "stablelm": {"predict": lazy_handler("stablelm", "predict_handler")},
+            "stablevicuna": {
+                "predict": lazy_handler("stablevicuna", "predict_handler")
+            },
+            "tts_bark": {"generate": lazy_handler("tts_bark", "generate_handler")},
             "ollama": {"complete": ollama_worker.complete_handler},
+            "diagnostics": {
+                "memory_profiler": get_memory_profiler().command_handler,
+            },
             # Add more command handlers as needed
         }
 
@@ -85,26 +92,28 @@ class WorkerProcessor:
                 + ", payload: "
                 + str(payload)
             )
-            handler_result = await handler(payload, websocket)
+            started_at = time.monotonic()
+            outcome = "error"
+            try:
+                handler_result = await handler(payload, websocket)
+                outcome = "ok"
+            finally:
+                JOB_HANDLER.observe(
+                    time.monotonic() - started_at,
+                    module=payload["module_name"],
+                    command=payload["module_command"],
+                    outcome=outcome,
+                )
 
         except Exception as e:
-            # enable tracemalloc:
-            import tracemalloc
-
-            tracemalloc.start()
-            # take a snapshot:
-            snapshot = tracemalloc.take_snapshot()
-            # show top 10 lines
-            top_stats = snapshot.statistics("lineno")
-            for stat in top_stats[:10]:
-                logging.info(stat)
-            # disable tracemalloc:
-            tracemalloc.stop()
             import traceback
 
             logging.error(
                 f"Error processing command: {e}, traceback: {traceback.format_exc()} "
             )
+            memory_report = get_memory_profiler().error_report(limit=10)
+            if memory_report is not None:
+                logging.error(f"Memory at the time of the error:\n{memory_report}")
 
             return json.dumps({"error": str(e)})
 
@@ -120,4 +129,27 @@ class WorkerProcessor:
                 websocket = AppConfig.get_websocket()
                 await websocket.send(discord_msg.to_json())
 
+    async def process_batch(self, payloads: list, websocket: websocket) -> None:
+        """Run a group of compatible image jobs from the BatchScheduler together."""
+        try:
+            logging.info(f"Running {len(payloads)} image job(s) as one batch.")
+            await image_generator.generate_image_batch(payloads, websocket)
+        except Exception as e:
+            import traceback
+
+            logging.error(
+                f"Error processing batch: {e}, traceback: {traceback.format_exc()} "
+            )
+        finally:
+            websocket = AppConfig.get_websocket()
+            for payload in payloads:
+                if "job_id" in payload and payload["job_id"] != "":
+                    discord_msg = JobQueueMessage(
+                        websocket=websocket,
+                        job_id=payload["job_id"],
+                        worker_id=identifier,
+                        module_command="finish",
+                    )
+                    await websocket.send(discord_msg.to_json())
+
     # Add more command handler methods as needed
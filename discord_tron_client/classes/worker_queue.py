@@ -0,0 +1,396 @@
+import asyncio, logging, time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, List, Optional
+from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.cost_model import CostModel, get_cost_model
+from discord_tron_client.classes.metrics import JOB_QUEUE_WAIT, JOB_RUN
+
+logger = logging.getLogger(__name__)
+config = AppConfig()
+
+# Priority classes, most urgent first.
+INTERACTIVE = 0
+LLM = 1
+TTS = 2
+LONG_MEDIA = 3
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive",
+    LLM: "llm",
+    TTS: "tts",
+    LONG_MEDIA: "long_media",
+}
+
+IMAGE_MODULES = {"image_generation", "image_variation", "image_upscaling"}
+LLM_MODULES = {"llama", "stablelm", "stablevicuna", "ollama"}
+TTS_MODULES = {"tts_bark"}
+# Image modules also run the video and music pipelines, picked by model name.
+LONG_MEDIA_MODEL_HINTS = ("video", "ltx", "wan", "t2v", "i2v", "ace-step", "music")
+
+# Seconds per job before any have been measured, and the default deadlines.
+DEFAULT_DURATIONS = {INTERACTIVE: 30.0, LLM: 20.0, TTS: 60.0, LONG_MEDIA: 600.0}
+DEFAULT_DEADLINES = {INTERACTIVE: 900.0, LLM: 600.0, TTS: 900.0, LONG_MEDIA: 3600.0}
+
+
+def classify(payload: dict) -> int:
+    module_name = payload.get("module_name")
+    if module_name in LLM_MODULES:
+        return LLM
+    if module_name in TTS_MODULES:
+        return TTS
+    model = str(payload.get("config", {}).get("model", "")).lower()
+    if module_name in IMAGE_MODULES and any(
+        hint in model for hint in LONG_MEDIA_MODEL_HINTS
+    ):
+        return LONG_MEDIA
+    return INTERACTIVE
+
+
+def job_user(payload: dict) -> str:
+    try:
+        return str(payload["discord_context"]["author"]["id"])
+    except (KeyError, TypeError):
+        return str(payload.get("config", {}).get("user_id", "anonymous"))
+
+
+def duration_key(payload: dict) -> tuple:
+    return (
+        payload.get("module_name"),
+        payload.get("module_command"),
+        payload.get("config", {}).get("model"),
+    )
+
+
+class DurationEstimator:
+    """
+    Predicted run time per job. Image jobs use the cost model's fit over
+    resolution and steps once their model has been measured; everything
+    else uses an exponentially weighted moving average per kind of job.
+    """
+
+    def __init__(self, alpha: float = 0.3, cost_model: CostModel = None):
+        self.alpha = alpha
+        self.cost_model = cost_model
+        self.estimates: Dict[tuple, float] = {}
+
+    def _from_cost_model(self, payload: dict) -> Optional[float]:
+        user_config = payload.get("config", {})
+        if (
+            self.cost_model is None
+            or payload.get("module_name") not in IMAGE_MODULES
+            or "resolution" not in user_config
+            or "steps" not in user_config
+        ):
+            return None
+        try:
+            prediction = self.cost_model.predict(
+                user_config.get("model"),
+                user_config["resolution"],
+                batch=config.get_snapshot().maximum_batch_size,
+                steps=int(float(user_config["steps"])),
+                tiling=bool(user_config.get("enable_tiling", False)),
+            )
+        except (KeyError, TypeError, ValueError):
+            return None
+        return prediction.seconds if prediction.measured else None
+
+    def predict(self, payload: dict, priority: int) -> float:
+        measured = self._from_cost_model(payload)
+        if measured is not None:
+            return measured
+        return self.estimates.get(duration_key(payload), DEFAULT_DURATIONS[priority])
+
+    def record(self, payload: dict, seconds: float):
+        key = duration_key(payload)
+        previous = self.estimates.get(key)
+        self.estimates[key] = (
+            seconds
+            if previous is None
+            else previous + self.alpha * (seconds - previous)
+        )
+
+
+class QueuedJob:
+    def __init__(self, payload: dict, websocket, priority: int, predicted: float):
+        self.payload = payload
+        self.websocket = websocket
+        self.priority = priority
+        self.user = job_user(payload)
+        self.predicted_seconds = predicted
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+
+
+class Lane:
+    """
+    The queued and running jobs for one pool of consumers.
+
+    Within a priority class, users are served round-robin, so one user's
+    burst cannot starve everybody else. Between classes the most urgent
+    wins, but a job's class improves by one for every `aging_seconds` it
+    has waited, so long jobs are never starved outright.
+    """
+
+    def __init__(self, name: str, workers: int, aging_seconds: float = 120.0):
+        self.name = name
+        self.workers = max(int(workers), 1)
+        self.aging_seconds = aging_seconds
+        self.classes: Dict[int, "OrderedDict[str, deque]"] = {
+            priority: OrderedDict() for priority in PRIORITY_NAMES
+        }
+        self.running: List[QueuedJob] = []
+        self.available = asyncio.Event()
+        self.completed = 0
+
+    def depth(self) -> int:
+        return sum(
+            len(jobs) for users in self.classes.values() for jobs in users.values()
+        )
+
+    def jobs(self):
+        for users in self.classes.values():
+            for jobs in users.values():
+                yield from jobs
+
+    def put(self, job: QueuedJob):
+        self.classes[job.priority].setdefault(job.user, deque()).append(job)
+        self.available.set()
+
+    def _effective_priority(self, job: QueuedJob, now: float) -> float:
+        waited = now - job.enqueued_at
+        return job.priority - (waited // self.aging_seconds if self.aging_seconds else 0)
+
+    def _pop(self) -> Optional[QueuedJob]:
+        now = time.monotonic()
+        best = None
+        for priority, users in self.classes.items():
+            if not users:
+                continue
+            head = next(iter(users.values()))[0]
+            rank = (self._effective_priority(head, now), priority, head.enqueued_at)
+            if best is None or rank < best[0]:
+                best = (rank, priority)
+        if best is None:
+            return None
+        users = self.classes[best[1]]
+        user, jobs = next(iter(users.items()))
+        job = jobs.popleft()
+        # Move the user to the back of the line for this class.
+        del users[user]
+        if jobs:
+            users[user] = jobs
+        return job
+
+    async def get(self) -> QueuedJob:
+        while True:
+            job = self._pop()
+            if job is not None:
+                return job
+            self.available.clear()
+            await self.available.wait()
+
+    def take(self, match: Callable[[dict], bool], limit: int) -> List[QueuedJob]:
+        """Remove up to `limit` queued jobs whose payload satisfies `match`."""
+        taken = []
+        for users in self.classes.values():
+            for user in list(users):
+                jobs = users[user]
+                for job in list(jobs):
+                    if len(taken) >= limit:
+                        return taken
+                    try:
+                        matched = match(job.payload)
+                    except Exception as e:
+                        # Leave it queued rather than lose what was taken so far.
+                        logger.warning(f"Could not match a queued job for batching: {e}")
+                        matched = False
+                    if matched:
+                        jobs.remove(job)
+                        taken.append(job)
+                if not jobs:
+                    del users[user]
+        return taken
+
+    def predicted_wait(self, priority: int = LONG_MEDIA) -> float:
+        """Seconds until a new job of `priority` would start, roughly."""
+        now = time.monotonic()
+        ahead = sum(
+            max(job.predicted_seconds - (now - job.started_at), 0.0)
+            for job in self.running
+        )
+        ahead += sum(
+            job.predicted_seconds for job in self.jobs() if job.priority <= priority
+        )
+        return ahead / self.workers
+
+    def stats(self) -> dict:
+        by_class = {name: 0 for name in PRIORITY_NAMES.values()}
+        for job in self.jobs():
+            by_class[PRIORITY_NAMES[job.priority]] += 1
+        return {
+            "workers": self.workers,
+            "queued": self.depth(),
+            "running": len(self.running),
+            "completed": self.completed,
+            "queued_by_class": by_class,
+            "predicted_wait_seconds": round(self.predicted_wait(), 1),
+        }
+
+
+class Admission:
+    def __init__(self, admitted: bool, reason: str = "", predicted_seconds: float = 0.0):
+        self.admitted = admitted
+        self.reason = reason
+        self.predicted_seconds = predicted_seconds
+
+
+class WorkerQueue:
+    """
+    The worker-side job queue between the websocket loop and the handlers.
+
+    Jobs go to a lane by job type (GPU, Llama or general), each served by a
+    fixed number of consumers. offer() refuses a job when the queue is at
+    `max_depth`, or when its predicted completion time is past its deadline,
+    so that the master can hand it to another worker instead.
+    """
+
+    def __init__(
+        self,
+        run_job: Callable[[QueuedJob], Awaitable],
+        lanes: Dict[str, int],
+        max_depth: int = 32,
+        deadlines: Dict[int, float] = None,
+        aging_seconds: float = 120.0,
+        batch_scheduler=None,
+        run_batch: Callable[[List[QueuedJob]], Awaitable] = None,
+        cost_model: CostModel = None,
+    ):
+        self.run_job = run_job
+        self.run_batch = run_batch
+        self.batch_scheduler = batch_scheduler
+        self.lanes = {
+            name: Lane(name, workers, aging_seconds) for name, workers in lanes.items()
+        }
+        self.max_depth = max(int(max_depth), 1)
+        self.deadlines = dict(DEFAULT_DEADLINES)
+        self.deadlines.update(deadlines or {})
+        self.estimator = DurationEstimator(cost_model=cost_model)
+        self.admitted = 0
+        self.rejected = 0
+        self._consumers: List[asyncio.Task] = []
+
+    @staticmethod
+    def lane_for(payload: dict) -> str:
+        job_type = payload.get("job_type")
+        # The local Ollama server shares this worker's GPU, so its jobs wait
+        # their turn with diffusion work instead of competing for VRAM.
+        if job_type in {"gpu", "ollama"}:
+            return "gpu"
+        if job_type == "llama":
+            return "llama"
+        return "general"
+
+    def depth(self) -> int:
+        return sum(lane.depth() for lane in self.lanes.values())
+
+    def offer(self, payload: dict, websocket) -> Admission:
+        priority = classify(payload)
+        lane = self.lanes[self.lane_for(payload)]
+        predicted = self.estimator.predict(payload, priority)
+        if self.depth() >= self.max_depth:
+            self.rejected += 1
+            return Admission(False, f"queue is full ({self.max_depth} jobs)")
+        completion = lane.predicted_wait(priority) + predicted
+        deadline = float(payload.get("deadline_seconds") or self.deadlines[priority])
+        if completion > deadline:
+            self.rejected += 1
+            return Admission(
+                False,
+                f"predicted completion in {completion:.0f}s exceeds the {deadline:.0f}s deadline",
+                completion,
+            )
+        lane.put(QueuedJob(payload, websocket, priority, predicted))
+        self.admitted += 1
+        return Admission(True, predicted_seconds=completion)
+
+    def start(self):
+        if self._consumers:
+            return
+        for lane in self.lanes.values():
+            for _ in range(lane.workers):
+                self._consumers.append(asyncio.create_task(self._consume(lane)))
+
+    async def _collect(self, lane: Lane, job: QueuedJob) -> List[QueuedJob]:
+        """
+        `job` plus the queued jobs the batch scheduler adds to it. If the
+        scheduler fails, the jobs it took go back in the lane and `job` runs
+        alone, so a scheduling error never stops the consumer.
+        """
+        taken: List[QueuedJob] = []
+
+        def take(match: Callable[[dict], bool], limit: int) -> List[QueuedJob]:
+            jobs = lane.take(match, limit)
+            taken.extend(jobs)
+            return jobs
+
+        try:
+            return await self.batch_scheduler.collect(job, take, lane.depth)
+        except Exception as e:
+            logger.error(f"Could not batch a {lane.name} job, running it alone: {e}")
+            for queued in taken:
+                lane.put(queued)
+            return [job]
+
+    async def _consume(self, lane: Lane):
+        while True:
+            job = await lane.get()
+            jobs = [job]
+            if lane.name == "gpu" and self.batch_scheduler is not None:
+                jobs = await self._collect(lane, job)
+            started_at = time.monotonic()
+            for queued in jobs:
+                queued.started_at = started_at
+                lane.running.append(queued)
+                JOB_QUEUE_WAIT.observe(started_at - queued.enqueued_at, lane=lane.name)
+            try:
+                if len(jobs) > 1 and self.run_batch is not None:
+                    await self.run_batch(jobs)
+                else:
+                    await self.run_job(job)
+            except Exception as e:
+                logger.error(f"Unhandled error running a {lane.name} job: {e}")
+            finally:
+                elapsed = time.monotonic() - started_at
+                JOB_RUN.observe(elapsed, lane=lane.name)
+                for queued in jobs:
+                    lane.running.remove(queued)
+                    self.estimator.record(queued.payload, elapsed)
+                lane.completed += len(jobs)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "lanes": {name: lane.stats() for name, lane in self.lanes.items()},
+        }
+
+
+def build_worker_queue(run_job, run_batch=None, batch_scheduler=None) -> WorkerQueue:
+    concurrent_slots = config.get_concurrent_slots()
+    deadlines = {
+        priority: float(seconds)
+        for name, seconds in config.get_config_value("job_deadline_seconds", {}).items()
+        for priority, known in PRIORITY_NAMES.items()
+        if known == name
+    }
+    return WorkerQueue(
+        run_job,
+        lanes={"gpu": 1, "llama": concurrent_slots, "general": concurrent_slots},
+        max_depth=int(config.get_config_value("job_queue_max_depth", 32)),
+        deadlines=deadlines,
+        aging_seconds=float(config.get_config_value("job_priority_aging_seconds", 120)),
+        batch_scheduler=batch_scheduler,
+        run_batch=run_batch,
+        cost_model=get_cost_model(),
+    )
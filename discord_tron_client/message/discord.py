@@ -5,6 +5,7 @@ import logging, websocket, gzip, base64
 from io import BytesIO
 from discord_tron_client.classes.hardware import HardwareInfo
 from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.classes.image_manipulation.image_encoder import EncodedImage
 
 hardware = HardwareInfo()
 config = AppConfig()
@@ -69,6 +70,8 @@ class DiscordMessage(WebsocketMessage):
         )
 
     def b64_image(self, image: Image):
+        if isinstance(image, EncodedImage):
+            return image.to_base64()
         # Save image to buffer before encoding as base64
         buffered = BytesIO()
         image.save(buffered, format="PNG")
@@ -162,6 +165,9 @@ class DiscordMessage(WebsocketMessage):
         refiner_status = ""
         if latent_refiner_enabled:
             refiner_status = f"**SDXL Refiner**: {latent_refiner}\n"
+        power_used = f"{payload['gpu_power_consumption']}W power used"
+        if payload.get("gpu_energy_joules") is not None:
+            power_used = f"{payload['gpu_energy_joules'] / 3600:.2f}Wh ({payload['gpu_power_consumption']}W avg) used"
         truncate_suffix = ""
         if len(prompt) > 255:
             truncate_suffix = "..(truncated).."
@@ -171,7 +177,7 @@ class DiscordMessage(WebsocketMessage):
                 f"**Prompt**: {prompt[:255]}{truncate_suffix}\n"
                 f"**Settings**: `!seed {seed}`, `!guidance {user_config['guidance_scaling']}`, `!guidance_rescale {guidance_rescale}`, `!steps {steps}`, `!strength {strength}`, `!resolution {resolution_string}`{stage1_guidance}\n"
                 f"**Model**: `{model_id}` (`{latest_hash}` {last_modified})\n{refiner_status}{model_adapter_text}"
-                f"**{HardwareInfo.get_identifier()}**: {payload['gpu_power_consumption']}W power used in {execute_time} seconds via {system_hw['gpu_type']} ({vmem}G)\n"  # , on a {system_hw['cpu_type']} with {system_hw['memory_amount']}G RAM\n"
+                f"**{HardwareInfo.get_identifier()}**: {power_used} in {execute_time} seconds via {system_hw['gpu_type']} ({vmem}G)\n"  # , on a {system_hw['cpu_type']} with {system_hw['memory_amount']}G RAM\n"
                 # f"**Job ID:** `{payload['job_id']}`\n"
             )
         except Exception as e:
@@ -11,10 +11,16 @@ hardware = HardwareInfo()
 
 class JobQueueMessage(WebsocketMessage):
     def __init__(
-        self, websocket: websocket, job_id: str, worker_id: str, module_command: str
+        self,
+        websocket: websocket,
+        job_id: str,
+        worker_id: str,
+        module_command: str,
+        **details,
     ):
         self.websocket = websocket
-        arguments = {"job_id": job_id, "worker_id": worker_id}
+        # Extra details, eg. the reason a job was handed back to the master.
+        arguments = {"job_id": job_id, "worker_id": worker_id, **details}
         super().__init__(
             message_type="job",
             module_name="job_queue",
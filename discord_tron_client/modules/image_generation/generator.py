@@ -14,12 +14,229 @@ from discord_tron_client.classes.app_config import AppConfig
 
 config = AppConfig()
 from discord_tron_client.classes.debug import clean_traceback
+from discord_tron_client.classes.memory_profiler import error_report_section
+from discord_tron_client.classes.metrics import JOB_STAGE
+
+
+async def _announce(payload):
+    websocket = AppConfig.get_websocket()
+    discord_msg = DiscordMessage(
+        websocket=websocket,
+        context=payload["discord_first_message"],
+        module_command="edit",
+        message="Your prompt is now being processed. This might take a while to get to the next step if we have to download your model!",
+    )
+    await websocket.send(discord_msg.to_json())
+    return websocket, discord_msg
+
+
+async def _get_pipeline_runner(user_config, discord_msg, websocket, model_config):
+    model_manager = TransformerModelManager()
+    pipeline_manager = AppConfig.get_pipeline_manager()
+    pipeline_runner = AppConfig.get_pipeline_runner()
+    if pipeline_runner is None:
+        pipeline_runner = pipeline.PipelineRunner(
+            model_manager=model_manager,
+            pipeline_manager=pipeline_manager,
+            app_config=config,
+            user_config=user_config,
+            discord_msg=discord_msg,
+            websocket=websocket,
+            model_config=model_config,
+        )
+        AppConfig.set_pipeline_runner(pipeline_runner)
+    else:
+        pipeline_runner.model_manager = model_manager
+        pipeline_runner.pipeline_manager = pipeline_manager
+        pipeline_runner.config = config
+        pipeline_runner.user_config = user_config
+        pipeline_runner.discord_msg = discord_msg
+        pipeline_runner.websocket = websocket
+        pipeline_runner.model_config = model_config
+        await pipeline_runner.reset_bar(discord_msg=discord_msg, websocket=websocket)
+    return pipeline_runner, pipeline_manager
+
+
+async def _claim(payload, websocket):
+    discord_msg = DiscordMessage(
+        websocket=websocket,
+        context=payload["discord_context"],
+        module_command="delete",
+    )
+    await websocket.send(discord_msg.to_json())
+    if "overridden_user_id" in payload and payload["overridden_user_id"] is not None:
+        payload["discord_context"]["author"]["id"] = payload["overridden_user_id"]
+    payload["config"]["user_id"] = payload["discord_context"]["author"]["id"]
+
+
+async def _publish(
+    payload,
+    prompt,
+    model_id,
+    output_images,
+    execute_duration,
+    pipeline_runner,
+    pipeline_manager,
+    seed,
+):
+    websocket = AppConfig.get_websocket()
+    discord_msg = DiscordMessage(
+        websocket=websocket,
+        context=payload["discord_first_message"],
+        module_command="delete",
+    )
+    for attempt in range(1, 6):
+        if not websocket or not hasattr(websocket, "open") or websocket.open != True:
+            logging.warn("WebSocket connection is not open. Retrieving fresh instance.")
+            websocket = AppConfig.get_websocket()
+            await asyncio.sleep(2)
+        else:
+            logging.debug("WebSocket connection is open. Continuing.")
+            break
+    await websocket.send(discord_msg.to_json())
+    payload["seed"] = seed
+    payload["gpu_power_consumption"] = pipeline_runner.gpu_power_consumption
+    payload["gpu_energy_joules"] = getattr(pipeline_runner, "gpu_energy_joules", None)
+    logging.info("Image generated successfully!")
+    # Truncate prompt to 32 chars and add a ...
+    truncated_prompt = prompt[:29] + "..."
+
+    # Try uploading via the HTTP API
+    api_client = AppConfig.get_api_client()
+    uploader = Uploader(api_client=api_client, config=config)
+    if type(output_images) is str and (
+        "webp" in output_images or "mp4" in output_images
+    ):
+        url_list = await uploader.upload_videos(output_images)
+    else:
+        url_list = await uploader.upload_images(output_images)
+    # Now we can remove the message.
+    discord_msg = DiscordMessage(
+        websocket=websocket,
+        context=payload["discord_first_message"],
+        module_command="delete",
+    )
+    await websocket.send(discord_msg.to_json())
+    # discord_msg = DiscordMessage(websocket=websocket, context=payload["discord_first_message"], module_command="send", message=DiscordMessage.print_prompt(payload), image_url_list=url_list)
+    if hasattr(pipeline_manager, "pipeline_runner"):
+        if (
+            hasattr(pipeline_manager.pipeline_runner, "generation_time")
+            and getattr(pipeline_manager.pipeline_runner, "generation_time", None)
+            is not None
+        ):
+            execute_duration = pipeline_manager.pipeline_runner.generation_time
+            logging.info(
+                f"Overriding execute_duration with pipeline_runner.generation_time: {execute_duration}"
+            )
+    websocket = AppConfig.get_websocket()
+    attributes = {
+        "last_modified": pipeline_manager.pipeline_versions.get(model_id, {}).get(
+            "last_modified", "unknown"
+        ),
+        "latest_hash": pipeline_manager.pipeline_versions.get(model_id, {}).get(
+            "latest_hash", "unknown hash"
+        ),
+    }
+    discord_msg = DiscordMessage(
+        websocket=websocket,
+        context=payload["discord_first_message"],
+        module_command="create_thread",
+        name=truncated_prompt,
+        image_model=model_id,
+        image_prompt=prompt,
+        message=DiscordMessage.print_prompt(
+            payload, execute_duration=execute_duration, attributes=attributes
+        ),
+        image_url_list=url_list,
+        user_id=payload["discord_context"]["author"]["id"],
+        message_flags=payload.get("message_flags"),
+    )
+    await websocket.send(discord_msg.to_json())
+
+
+async def _report_error(payload, pipeline_manager, e):
+    import traceback
+
+    try:
+        s = str(e)
+        if "out of memory" in s:
+            logging.error(
+                "The exception occurred because we ran out of memory. Clearing CUDA."
+            )
+            import torch, gc
+
+            torch.cuda.empty_cache()
+            gc.collect()
+            pipeline_manager.delete_pipes()
+
+        logging.error(
+            f"Error generating image: {e}\n\nStack trace:\n{traceback.format_exc()}"
+        )
+        websocket = AppConfig.get_websocket()
+        discord_msg = DiscordMessage(
+            websocket=websocket,
+            context=payload["discord_context"],
+            module_command="delete_errors",
+        )
+        await websocket.send(discord_msg.to_json())
+        discord_msg = DiscordMessage(
+            websocket=websocket,
+            context=payload["discord_first_message"],
+            module_command="edit",
+            message=f"It seems we had an error while generating this image!\n```{e}\n```"
+            + error_report_section(),
+        )
+        await websocket.send(discord_msg.to_json())
+        discord_msg = DiscordMessage(
+            websocket=websocket,
+            context=payload["discord_context"],
+            module_command="delete",
+        )
+        await websocket.send(discord_msg.to_json())
+        raise e
+    except Exception as e_squash:
+        logging.error(f"Error squashed: {e}, traceback: {traceback.format_exc()}")
+
+
+def _fetch_reference(url: str):
+    import io, requests
+
+    raw = requests.get(url, timeout=12).content
+    ref = Image.open(io.BytesIO(raw))
+    try:
+        if ref.mode in ("RGBA", "LA"):
+            background = Image.new("RGBA", ref.size, (255, 255, 255))
+            alpha_composite = Image.alpha_composite(background, ref.convert("RGBA"))
+            ref = alpha_composite.convert("RGB")
+        else:
+            ref = ref.convert("RGB")
+    except Exception as e:
+        logging.error(f"Error compositing reference image {url}: {e}")
+    return ref
+
+
+def _generation_resolution(user_config):
+    resolution = user_config["resolution"]
+    if "width" not in resolution or "height" not in resolution:
+        resolution = {"width": 1024, "height": 1024}
+    return resolution
 
 
 # Image generator plugin for the worker.
 async def generate_image(payload, websocket):
+    await _generate_image(payload)
+
+
+async def _generate_image(payload, announced=None):
+    """
+    Run a single job. `announced` is the (websocket, discord_msg) pair of a
+    job that generate_image_batch already announced and claimed, so those
+    messages are not sent a second time.
+    """
     # We extract the features from the payload and pass them onto the actual generator
+    pipeline_manager = None
     try:
+        prepare_started_at = asyncio.get_event_loop().time()
         user_config = payload["config"]
         prompt = payload["image_prompt"]
         model_id = user_config["model"]
@@ -29,60 +246,18 @@ async def generate_image(payload, websocket):
         model_config = payload.get("model_config", {})
         positive_prompt = user_config["positive_prompt"]
         upscaler = payload.get("upscaler", False)
-        websocket = AppConfig.get_websocket()
-        discord_msg = DiscordMessage(
-            websocket=websocket,
-            context=payload["discord_first_message"],
-            module_command="edit",
-            message="Your prompt is now being processed. This might take a while to get to the next step if we have to download your model!",
-        )
-        await websocket.send(discord_msg.to_json())
-        model_manager = TransformerModelManager()
-        pipeline_manager = AppConfig.get_pipeline_manager()
-        pipeline_runner = AppConfig.get_pipeline_runner()
-        if pipeline_runner is None:
-            pipeline_runner = pipeline.PipelineRunner(
-                model_manager=model_manager,
-                pipeline_manager=pipeline_manager,
-                app_config=config,
-                user_config=user_config,
-                discord_msg=discord_msg,
-                websocket=websocket,
-                model_config=model_config,
-            )
-            AppConfig.set_pipeline_runner(pipeline_runner)
+        if announced is None:
+            websocket, discord_msg = await _announce(payload)
         else:
-            pipeline_runner.model_manager = model_manager
-            pipeline_runner.pipeline_manager = pipeline_manager
-            pipeline_runner.config = config
-            pipeline_runner.user_config = user_config
-            pipeline_runner.discord_msg = discord_msg
-            pipeline_runner.websocket = websocket
-            pipeline_runner.model_config = model_config
-            await pipeline_runner.reset_bar(
-                discord_msg=discord_msg, websocket=websocket
-            )
+            websocket, discord_msg = announced
+        pipeline_runner, pipeline_manager = await _get_pipeline_runner(
+            user_config, discord_msg, websocket, model_config
+        )
         # Attach a positive prompt weight to the end so that it's more likely to show up this way.
         prompt = prompt + " " + positive_prompt
         image = None
         if "image_data" in payload:
             logging.debug(f"Found image data in payload: {payload['image_data']}")
-            import io, requests
-
-            def _fetch_reference(url: str):
-                raw = requests.get(url, timeout=12).content
-                ref = Image.open(io.BytesIO(raw))
-                try:
-                    if ref.mode in ("RGBA", "LA"):
-                        background = Image.new("RGBA", ref.size, (255, 255, 255))
-                        alpha_composite = Image.alpha_composite(background, ref.convert("RGBA"))
-                        ref = alpha_composite.convert("RGB")
-                    else:
-                        ref = ref.convert("RGB")
-                except Exception as e:
-                    logging.error(f"Error compositing reference image {url}: {e}")
-                return ref
-
             image_data = payload["image_data"]
             if isinstance(image_data, list):
                 refs = []
@@ -102,22 +277,12 @@ async def generate_image(payload, websocket):
                 image = image.resize(
                     (resolution["width"], resolution["height"]), resample=Image.LANCZOS
                 )
-        discord_msg = DiscordMessage(
-            websocket=websocket,
-            context=payload["discord_context"],
-            module_command="delete",
-        )
-        await websocket.send(discord_msg.to_json())
-        if (
-            "overridden_user_id" in payload
-            and payload["overridden_user_id"] is not None
-        ):
-            payload["discord_context"]["author"]["id"] = payload["overridden_user_id"]
-        user_config["user_id"] = payload["discord_context"]["author"]["id"]
-        if "width" not in resolution or "height" not in resolution:
-            resolution = {"width": 1024, "height": 1024}
+        if announced is None:
+            await _claim(payload, websocket)
+        resolution = _generation_resolution(user_config)
         # Grab a beginning timestamp:
         start_time = asyncio.get_event_loop().time()
+        JOB_STAGE.observe(start_time - prepare_started_at, stage="prepare")
         output_images = await pipeline_runner.generate_image(
             user_config=user_config,
             prompt=prompt,
@@ -130,126 +295,91 @@ async def generate_image(payload, websocket):
             upscaler=upscaler,
         )
         end_time = asyncio.get_event_loop().time()
-
-        websocket = AppConfig.get_websocket()
-        discord_msg = DiscordMessage(
-            websocket=websocket,
-            context=payload["discord_first_message"],
-            module_command="delete",
+        JOB_STAGE.observe(end_time - start_time, stage="generate")
+        await _publish(
+            payload,
+            prompt,
+            model_id,
+            output_images,
+            end_time - start_time,
+            pipeline_runner,
+            pipeline_manager,
+            pipeline_runner.seed,
         )
-        for attempt in range(1, 6):
-            if (
-                not websocket
-                or not hasattr(websocket, "open")
-                or websocket.open != True
-            ):
-                logging.warn(
-                    "WebSocket connection is not open. Retrieving fresh instance."
+        JOB_STAGE.observe(asyncio.get_event_loop().time() - end_time, stage="publish")
+    except Exception as e:
+        await _report_error(payload, pipeline_manager, e)
+
+
+async def generate_image_batch(payloads: list, websocket):
+    """
+    Generate several compatible text2img jobs with one pipeline call, see
+    BatchScheduler. When the pipeline cannot batch, or the batched call
+    fails, the jobs run one at a time instead.
+    """
+    if len(payloads) == 1:
+        return await generate_image(payloads[0], websocket)
+    pipeline_manager = None
+    items = []
+    announced = {}
+    batched = False
+    try:
+        for index, payload in enumerate(payloads):
+            user_config = payload["config"]
+            job_websocket, discord_msg = await _announce(payload)
+            if not items:
+                # The first job's progress bar tracks the whole batch.
+                pipeline_runner, pipeline_manager = await _get_pipeline_runner(
+                    user_config,
+                    discord_msg,
+                    job_websocket,
+                    payload.get("model_config", {}),
                 )
-                websocket = AppConfig.get_websocket()
-                await asyncio.sleep(2)
-            else:
-                logging.debug("WebSocket connection is open. Continuing.")
-                break
-        await websocket.send(discord_msg.to_json())
-        payload["seed"] = pipeline_runner.seed
-        payload["gpu_power_consumption"] = pipeline_runner.gpu_power_consumption
-        logging.info(
-            "Image generated successfully!"
-        )  # Truncate prompt to 32 chars and add a ...
-        truncated_prompt = prompt[:29] + "..."
-
-        # Try uploading via the HTTP API
-        api_client = AppConfig.get_api_client()
-        uploader = Uploader(api_client=api_client, config=config)
-        if type(output_images) is str and (
-            "webp" in output_images or "mp4" in output_images
-        ):
-            url_list = await uploader.upload_videos(output_images)
-        else:
-            url_list = await uploader.upload_images(output_images)
-        # Now we can remove the message.
-        discord_msg = DiscordMessage(
-            websocket=websocket,
-            context=payload["discord_first_message"],
-            module_command="delete",
-        )
-        await websocket.send(discord_msg.to_json())
-        # discord_msg = DiscordMessage(websocket=websocket, context=payload["discord_first_message"], module_command="send", message=DiscordMessage.print_prompt(payload), image_url_list=url_list)
-        execute_duration = end_time - start_time
-        if hasattr(pipeline_manager, "pipeline_runner"):
-            if (
-                hasattr(pipeline_manager.pipeline_runner, "generation_time")
-                and getattr(pipeline_manager.pipeline_runner, "generation_time", None)
-                is not None
-            ):
-                execute_duration = pipeline_manager.pipeline_runner.generation_time
-                logging.info(
-                    f"Overriding execute_duration with pipeline_runner.generation_time: {execute_duration}"
+            await _claim(payload, job_websocket)
+            announced[index] = (job_websocket, discord_msg)
+            items.append(
+                pipeline.BatchItem(
+                    user_config=user_config,
+                    # Attach a positive prompt weight, as generate_image does.
+                    prompt=payload["image_prompt"] + " " + user_config["positive_prompt"],
+                    negative_prompt=user_config["negative_prompt"],
                 )
-        websocket = AppConfig.get_websocket()
-        attributes = {
-            "last_modified": pipeline_manager.pipeline_versions.get(model_id, {}).get(
-                "last_modified", "unknown"
-            ),
-            "latest_hash": pipeline_manager.pipeline_versions.get(model_id, {}).get(
-                "latest_hash", "unknown hash"
-            ),
-        }
-        discord_msg = DiscordMessage(
-            websocket=websocket,
-            context=payload["discord_first_message"],
-            module_command="create_thread",
-            name=truncated_prompt,
-            image_model=model_id,
-            image_prompt=prompt,
-            message=DiscordMessage.print_prompt(
-                payload, execute_duration=execute_duration, attributes=attributes
-            ),
-            image_url_list=url_list,
-            user_id=payload["discord_context"]["author"]["id"],
-            message_flags=payload.get("message_flags"),
+            )
+        user_config = payloads[0]["config"]
+        model_id = user_config["model"]
+        resolution = _generation_resolution(user_config)
+        start_time = asyncio.get_event_loop().time()
+        batched = await pipeline_runner.generate_batch(
+            items,
+            model_id=model_id,
+            side_x=resolution["width"],
+            side_y=resolution["height"],
+            steps=user_config["steps"],
         )
-        await websocket.send(discord_msg.to_json())
-
+        end_time = asyncio.get_event_loop().time()
+        if batched:
+            JOB_STAGE.observe(end_time - start_time, stage="generate_batch")
     except Exception as e:
         import traceback
 
+        logging.error(
+            f"Batched generation of {len(payloads)} jobs failed, running them one at a time: {e}\n{traceback.format_exc()}"
+        )
+    if not batched:
+        for index, payload in enumerate(payloads):
+            await _generate_image(payload, announced.get(index))
+        return
+    for payload, item in zip(payloads, items):
         try:
-            s = str(e)
-            if "out of memory" in s:
-                logging.error(
-                    "The exception occurred because we ran out of memory. Clearing CUDA."
-                )
-                import torch, gc
-
-                torch.cuda.empty_cache()
-                gc.collect()
-                pipeline_manager.delete_pipes()
-
-            logging.error(
-                f"Error generating image: {e}\n\nStack trace:\n{traceback.format_exc()}"
-            )
-            discord_msg = DiscordMessage(
-                websocket=websocket,
-                context=payload["discord_context"],
-                module_command="delete_errors",
-            )
-            websocket = AppConfig.get_websocket()
-            await websocket.send(discord_msg.to_json())
-            discord_msg = DiscordMessage(
-                websocket=websocket,
-                context=payload["discord_first_message"],
-                module_command="edit",
-                message=f"It seems we had an error while generating this image!\n```{e}\n```",
-            )
-            await websocket.send(discord_msg.to_json())
-            discord_msg = DiscordMessage(
-                websocket=websocket,
-                context=payload["discord_context"],
-                module_command="delete",
+            await _publish(
+                payload,
+                item.prompt,
+                model_id,
+                item.images,
+                end_time - start_time,
+                pipeline_runner,
+                pipeline_manager,
+                item.seed,
             )
-            await websocket.send(discord_msg.to_json())
-            raise e
-        except Exception as e_squash:
-            logging.error(f"Error squashed: {e}, traceback: {traceback.format_exc()}")
+        except Exception as e:
+            await _report_error(payload, pipeline_manager, e)
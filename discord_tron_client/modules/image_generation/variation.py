@@ -14,6 +14,7 @@ from discord_tron_client.classes.app_config import AppConfig
 
 config = AppConfig()
 from discord_tron_client.classes.debug import clean_traceback
+from discord_tron_client.classes.memory_profiler import error_report_section
 
 
 # Image generator plugin for the worker.
@@ -105,6 +106,9 @@ async def promptless_variation(payload, websocket):
         total_time = start_time.elapsed_time(end_time) / 1000
         payload["seed"] = pipeline_runner.seed
         payload["gpu_power_consumption"] = pipeline_runner.gpu_power_consumption
+        payload["gpu_energy_joules"] = getattr(
+            pipeline_runner, "gpu_energy_joules", None
+        )
         websocket = AppConfig.get_websocket()
         logging.info("Image generated successfully!")
         discord_msg = DiscordMessage(
@@ -146,7 +150,8 @@ async def promptless_variation(payload, websocket):
             websocket=websocket,
             context=payload["discord_first_message"],
             module_command="edit",
-            message=f"It seems we had an error while generating this image!\n```{e}\n{clean_traceback(traceback.format_exc())}\n```",
+            message=f"It seems we had an error while generating this image!\n```{e}\n{clean_traceback(traceback.format_exc())}\n```"
+            + error_report_section(),
         )
         await websocket.send(discord_msg.to_json())
         discord_msg = DiscordMessage(
@@ -261,6 +266,9 @@ async def prompt_variation(payload, websocket):
         total_time = end_time - start_time
         payload["seed"] = pipeline_runner.seed
         payload["gpu_power_consumption"] = pipeline_runner.gpu_power_consumption
+        payload["gpu_energy_joules"] = getattr(
+            pipeline_runner, "gpu_energy_joules", None
+        )
         websocket = AppConfig.get_websocket()
         logging.info("Image generated successfully!")
         discord_msg = DiscordMessage(
@@ -318,7 +326,8 @@ async def prompt_variation(payload, websocket):
             websocket=websocket,
             context=payload["discord_first_message"],
             module_command="edit",
-            message=f"It seems we had an error while generating this image!\n```{e}\n{clean_traceback(traceback.format_exc())}\n```",
+            message=f"It seems we had an error while generating this image!\n```{e}\n{clean_traceback(traceback.format_exc())}\n```"
+            + error_report_section(),
         )
         await websocket.send(discord_msg.to_json())
         discord_msg = DiscordMessage(
@@ -0,0 +1,3 @@
+from .harness import ReplayHarness, format_report, load_recording
+
+__all__ = ["ReplayHarness", "format_report", "load_recording"]
@@ -0,0 +1,44 @@
+import argparse, asyncio, json, logging, os
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m discord_tron_client.replay",
+        description="Replay recorded master job messages against this worker, on CPU, with tiny stand-in models.",
+    )
+    parser.add_argument("recording", nargs="?", help="JSONL recording (default: the bundled mixed session).")
+    parser.add_argument("--stand-ins", help="Where the tiny models are built and cached.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed; 2 sends messages twice as fast.")
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds to wait for the jobs to finish.")
+    parser.add_argument("--output", help="Write the full JSON report here.")
+    parser.add_argument("--log-level", default="WARNING")
+    arguments = parser.parse_args()
+
+    # CPU only, and nothing is fetched from the Hub.
+    os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    logging.basicConfig(level=getattr(logging, arguments.log_level.upper(), logging.WARNING))
+
+    from discord_tron_client.replay.harness import (
+        RECORDING,
+        STAND_IN_ROOT,
+        ReplayHarness,
+        format_report,
+    )
+
+    harness = ReplayHarness(
+        recording=arguments.recording or RECORDING,
+        root=arguments.stand_ins or STAND_IN_ROOT,
+        speed=arguments.speed,
+        timeout=arguments.timeout,
+    )
+    report = asyncio.run(harness.run())
+    print(format_report(report))
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            json.dump(report, output, indent=4)
+
+
+if __name__ == "__main__":
+    main()
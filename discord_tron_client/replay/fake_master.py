@@ -0,0 +1,214 @@
+import asyncio, json, logging, threading, time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_FIELDS = {
+    "/upload_image": "image_url",
+    "/upload_video": "video_url",
+    "/upload_audio": "audio_url",
+}
+
+
+class Recorder:
+    """Timestamped events seen by the fake master, shared by its websocket and HTTP sides."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events: List[dict] = []
+        self.listeners: List[Callable[[dict], None]] = []
+
+    def record(self, kind: str, **fields) -> dict:
+        event = {"kind": kind, "at": time.perf_counter(), **fields}
+        with self.lock:
+            self.events.append(event)
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(event)
+        return event
+
+
+def _multipart_sizes(content_type: str, body: bytes) -> dict:
+    """Field name -> byte size of each part of a multipart/form-data body."""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+    )
+    sizes = {}
+    if message.is_multipart():
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition") or "file"
+            sizes[name] = len(part.get_payload(decode=True) or b"")
+    return sizes
+
+
+def _handler(master: "FakeMaster"):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _reply(self, status: int, payload: dict):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self) -> bytes:
+            if "chunked" not in self.headers.get("Transfer-Encoding", "").lower():
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            # Streamed multipart bodies of unknown size arrive chunked.
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/ollama/api/tags":
+                return self._reply(200, {"models": [{"name": master.llm_name}]})
+            if path == "/ollama/api/ps":
+                return self._reply(200, {"models": []})
+            self._reply(404, {"error": f"No route for GET {path}"})
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            started_at = time.perf_counter()
+            body = self._body()
+            if path in UPLOAD_FIELDS:
+                sizes = _multipart_sizes(self.headers.get("Content-Type", ""), body)
+                index = master.next_upload_index()
+                master.recorder.record(
+                    "upload",
+                    endpoint=path,
+                    bytes=sum(sizes.values()) or len(body),
+                    request_bytes=len(body),
+                    started_at=started_at,
+                )
+                return self._reply(
+                    200, {UPLOAD_FIELDS[path]: f"{master.http_url}/files/{index}"}
+                )
+            if path in ("/authorize", "/refresh_token"):
+                return self._reply(200, master.ticket())
+            if path in ("/ollama/api/chat", "/ollama/api/generate"):
+                return self._reply(200, master.complete(path, json.loads(body or b"{}")))
+            if path == "/ollama/api/pull":
+                return self._reply(200, {"status": "success"})
+            self._reply(404, {"error": f"No route for POST {path}"})
+
+    return Handler
+
+
+class FakeMaster:
+    """
+    A local stand-in for the hub: a websocket server that plays a recording
+    of job messages to the worker and records its replies, plus the HTTP
+    routes the worker calls (`/upload_image`, `/upload_video`,
+    `/upload_audio`, `/authorize`) and an Ollama-compatible API under
+    `/ollama` served by the tiny language model.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", language_model=None, llm_name: str = "tiny-llm"):
+        self.host = host
+        self.language_model = language_model
+        self.llm_name = llm_name
+        self.recorder = Recorder()
+        self.connected = asyncio.Event()
+        self.worker = None
+        self.ws_server = None
+        self.http_server: Optional[ThreadingHTTPServer] = None
+        self.uploads = 0
+        self.upload_lock = threading.Lock()
+        self.llm_lock = threading.Lock()
+
+    @property
+    def ws_port(self) -> int:
+        return self.ws_server.sockets[0].getsockname()[1]
+
+    @property
+    def http_url(self) -> str:
+        return f"http://{self.host}:{self.http_server.server_address[1]}"
+
+    def next_upload_index(self) -> int:
+        with self.upload_lock:
+            self.uploads += 1
+            return self.uploads
+
+    def ticket(self) -> dict:
+        return {
+            "access_token": "replay",
+            "refresh_token": "replay",
+            "expires_in": 86400,
+            "issued_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    def complete(self, path: str, request: dict) -> dict:
+        options = request.get("options") or {}
+        if path.endswith("/chat"):
+            prompt = " ".join(str(message.get("content", "")) for message in request.get("messages") or [])
+        else:
+            prompt = str(request.get("prompt") or "")
+        if not prompt or self.language_model is None:
+            # An empty /api/generate is how the runtime unloads a model.
+            return {"model": request.get("model"), "response": "", "done": True}
+        started_at = time.perf_counter()
+        with self.llm_lock:
+            text = self.language_model.generate(prompt, min(int(options.get("num_predict") or 32), 64))
+        self.recorder.record("llm_generate", seconds=time.perf_counter() - started_at)
+        text = text or "..."
+        return {
+            "model": request.get("model"),
+            "message": {"role": "assistant", "content": text},
+            "response": text,
+            "done": True,
+        }
+
+    async def _serve_worker(self, websocket, path=None):
+        self.worker = websocket
+        self.recorder.record("connected")
+        self.connected.set()
+        try:
+            async for message in websocket:
+                try:
+                    payload = json.loads(message)
+                except ValueError:
+                    continue
+                self.recorder.record("message", payload=payload, bytes=len(message))
+        finally:
+            self.recorder.record("disconnected")
+            self.connected.clear()
+
+    async def send(self, payload: dict):
+        await self.worker.send(json.dumps(payload))
+
+    async def start(self):
+        import websockets
+
+        self.http_server = ThreadingHTTPServer((self.host, 0), _handler(self))
+        self.http_server.daemon_threads = True
+        threading.Thread(
+            target=self.http_server.serve_forever, name="replay-master-http", daemon=True
+        ).start()
+        self.ws_server = await websockets.serve(
+            self._serve_worker, self.host, 0, max_size=33554432
+        )
+        logger.info(f"Fake master on ws://{self.host}:{self.ws_port} and {self.http_url}")
+        return self
+
+    async def stop(self):
+        if self.ws_server is not None:
+            self.ws_server.close()
+            await self.ws_server.wait_closed()
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
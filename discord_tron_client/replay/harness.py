@@ -0,0 +1,420 @@
+import asyncio, copy, json, logging, os, resource, tempfile, threading, time
+from typing import Dict, List, Optional
+from discord_tron_client.classes.app_config import AppConfig
+from discord_tron_client.replay.fake_master import FakeMaster
+from discord_tron_client.replay.stand_ins import (
+    FAMILIES,
+    TinyLanguageModel,
+    build_stand_ins,
+)
+
+logger = logging.getLogger(__name__)
+
+RECORDING = os.path.join(os.path.dirname(__file__), "recordings", "mixed.jsonl")
+# get_pipe() picks pipeline types from substrings of the model id, so the
+# default root must not contain any of them (eg. "wan", "sana", "cascade").
+STAND_IN_ROOT = os.path.join(tempfile.gettempdir(), "tron-replay-stand-ins")
+STAND_IN_PREFIX = "tiny:"
+STAGES = ("queue_wait", "run", "upload", "finish", "total")
+LLM_NAME = "tiny-llm"
+
+
+def load_recording(path: str) -> tuple:
+    """
+    Read a recording: one JSON object per line, either
+    `{"offset": seconds, "payload": {...}}` for a message the master sent,
+    or `{"config": {...}}` for config values the replay needs. Returns
+    (messages sorted by offset, config overrides).
+    """
+    messages, overrides = [], {}
+    with open(path, "r") as recording:
+        for number, line in enumerate(recording, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line)
+            if "config" in entry:
+                overrides.update(entry["config"])
+            elif "payload" in entry:
+                messages.append((float(entry.get("offset", 0)), entry["payload"]))
+            else:
+                raise ValueError(f"{path}:{number}: expected a payload or config entry.")
+    messages.sort(key=lambda message: message[0])
+    return messages, overrides
+
+
+def _families(value, found: set):
+    if isinstance(value, str) and value.startswith(STAND_IN_PREFIX):
+        found.add(value[len(STAND_IN_PREFIX) :])
+    elif isinstance(value, dict):
+        for item in value.values():
+            _families(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            _families(item, found)
+    return found
+
+
+def _rewrite(value, paths: Dict[str, str]):
+    """Replace every `tiny:<family>` string with the stand-in's model id."""
+    if isinstance(value, str) and value.startswith(STAND_IN_PREFIX):
+        family = value[len(STAND_IN_PREFIX) :]
+        return LLM_NAME if family == "llm" else paths[family]
+    if isinstance(value, dict):
+        return {key: _rewrite(item, paths) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rewrite(item, paths) for item in value]
+    return value
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    index = (len(values) - 1) * q
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+
+class JobTrace:
+    """What the fake master saw of one replayed job, in perf_counter seconds."""
+
+    def __init__(self, key: str, family: str, payload: dict):
+        self.key = key
+        self.family = family
+        self.module = f"{payload.get('module_name')}.{payload.get('module_command')}"
+        self.tracked = "job_id" in payload
+        # Anything else is fire-and-forget unless it is answered by request id.
+        self.expects_reply = self.tracked or payload.get("module_name") == "ollama"
+        self.sent_at = None
+        self.acknowledged_at = None
+        self.started_at = None
+        self.first_upload_at = None
+        self.last_upload_at = None
+        self.published_at = None
+        self.finished_at = None
+        self.rejected = None
+        self.uploads = 0
+        self.bytes_uploaded = 0
+        self.messages = 0
+        self.peak_rss = 0
+
+    @property
+    def done(self) -> bool:
+        return self.rejected is not None or self.finished_at is not None
+
+    def stages(self) -> dict:
+        def span(start, end):
+            return end - start if start is not None and end is not None else None
+
+        produced_at = self.first_upload_at or self.published_at or self.finished_at
+        return {
+            "queue_wait": span(self.acknowledged_at or self.sent_at, self.started_at),
+            "run": span(self.started_at, produced_at),
+            "upload": span(self.first_upload_at, self.last_upload_at),
+            "finish": span(self.last_upload_at or self.published_at, self.finished_at),
+            "total": span(self.sent_at, self.finished_at),
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "job": self.key,
+            "family": self.family,
+            "module": self.module,
+            "done": self.done,
+            "rejected": self.rejected,
+            "stages": self.stages(),
+            "uploads": self.uploads,
+            "bytes_uploaded": self.bytes_uploaded,
+            "messages": self.messages,
+            "peak_rss_bytes": self.peak_rss,
+        }
+
+
+class ReplayHarness:
+    """
+    Replays a recording of the master's job messages against the real
+    worker: the websocket client, WorkerQueue, WorkerProcessor, pipeline
+    manager and runners all run unchanged in this process, connected to a
+    FakeMaster, with tiny randomly initialised models standing in for the
+    real checkpoints. The report has per-stage latency, queue wait, bytes
+    uploaded and peak RSS for each job and family.
+    """
+
+    def __init__(
+        self,
+        recording: str = RECORDING,
+        root: str = STAND_IN_ROOT,
+        speed: float = 1.0,
+        timeout: float = 1800,
+        sample_interval: float = 0.02,
+    ):
+        self.recording = recording
+        self.root = root
+        self.speed = max(float(speed), 1e-6)
+        self.timeout = float(timeout)
+        self.sample_interval = float(sample_interval)
+        self.jobs: Dict[str, JobTrace] = {}
+        self.lock = threading.Lock()
+        self.peak_rss = 0
+        self.sampling = threading.Event()
+        self.all_done = None
+        self.loop = None
+
+    # Events from the fake master's websocket and HTTP threads.
+    def _active_job(self) -> Optional[JobTrace]:
+        active = [
+            job for job in self.jobs.values() if job.started_at is not None and not job.done
+        ]
+        return min(active, key=lambda job: job.started_at) if active else None
+
+    def _on_event(self, event: dict):
+        with self.lock:
+            if event["kind"] == "message":
+                self._on_message(event["payload"], event["at"])
+            elif event["kind"] == "upload":
+                # Uploads carry no job id; the GPU lane runs one job at a
+                # time, so they belong to the earliest job still running.
+                job = self._active_job()
+                if job is not None:
+                    job.uploads += 1
+                    job.bytes_uploaded += event["bytes"]
+                    job.first_upload_at = job.first_upload_at or event["started_at"]
+                    job.last_upload_at = event["at"]
+            if self.jobs and all(job.done for job in self.jobs.values()):
+                self.loop.call_soon_threadsafe(self.all_done.set)
+
+    def _on_message(self, payload: dict, at: float):
+        arguments = payload.get("arguments") or {}
+        data = payload.get("data") or {}
+        if payload.get("module_name") == "job_queue":
+            job = self.jobs.get(str(arguments.get("job_id")))
+            if job is None:
+                return
+            command = payload.get("module_command")
+            if command == "acknowledge":
+                job.acknowledged_at = at
+            elif command == "reject":
+                job.rejected = arguments.get("reason") or "rejected"
+                job.finished_at = at
+            elif command == "finish":
+                job.started_at = job.started_at or at
+                job.finished_at = at
+            return
+        key = data.get("replay_job") if isinstance(data, dict) else None
+        if key is None and isinstance(data, dict):
+            key = data.get("request_id")
+        job = self.jobs.get(str(key))
+        if job is None:
+            return
+        job.messages += 1
+        job.started_at = job.started_at or at
+        if payload.get("module_command") in ("send", "create_thread", "complete_result"):
+            job.published_at = at
+            if not job.tracked:
+                job.finished_at = at
+
+    def _sample(self):
+        try:
+            import psutil
+
+            process = psutil.Process()
+            rss = lambda: process.memory_info().rss
+        except ImportError:
+            rss = None
+        while self.sampling.is_set():
+            if rss is not None:
+                value = rss()
+                with self.lock:
+                    self.peak_rss = max(self.peak_rss, value)
+                    for job in self.jobs.values():
+                        if job.started_at is not None and not job.done:
+                            job.peak_rss = max(job.peak_rss, value)
+            time.sleep(self.sample_interval)
+
+    # Replay.
+    def _prepare(self, messages: list, paths: Dict[str, str]) -> list:
+        """Give every message a unique job id, tag its Discord contexts, and point it at the stand-ins."""
+        prepared = []
+        for index, (offset, payload) in enumerate(messages):
+            family = ",".join(sorted(_families(payload, set()))) or "none"
+            payload = _rewrite(copy.deepcopy(payload), paths)
+            key = f"replay-{index}"
+            if "job_id" in payload or "job_type" in payload:
+                payload["job_id"] = key
+            if payload.get("module_name") == "ollama":
+                payload["request_id"] = key
+            for context in ("discord_context", "discord_first_message"):
+                if isinstance(payload.get(context), dict):
+                    payload[context]["replay_job"] = key
+            self.jobs[key] = JobTrace(key, family, payload)
+            prepared.append((offset, key, payload))
+        return prepared
+
+    def _worker_config(self, master: FakeMaster, overrides: dict) -> dict:
+        host, port = master.host, master.ws_port
+        return {
+            "websocket_hub": {"host": host, "port": port, "tls": False, "verify_ssl": False},
+            "master_url": master.http_url,
+            "master_api_key": "replay",
+            "ollama": {
+                "base_url": f"{master.http_url}/ollama",
+                "model": LLM_NAME,
+                "keep_alive": "5m",
+                "timeout_seconds": 300,
+            },
+            "memory_profiler": False,
+            **overrides,
+        }
+
+    def _start_worker(self, master: FakeMaster):
+        """The same startup as __main__.main(), authenticated against the fake master."""
+        from discord_tron_client.classes.api_client import ApiClient
+        from discord_tron_client.classes.auth import Auth
+        from discord_tron_client.classes.hardware import HardwareInfo
+        from discord_tron_client.classes.image_manipulation.diffusion import (
+            DiffusionPipelineManager,
+        )
+        from discord_tron_client.classes.message import WebsocketMessage
+        from discord_tron_client.ws_client import websocket_client
+
+        class ReplayAuth(Auth):
+            # The fake master accepts any token, so skip the ticket file on disk.
+            def get(self):
+                return master.ticket()
+
+        config = AppConfig()
+        config.set_pipeline_manager(DiffusionPipelineManager())
+        ticket = master.ticket()
+        auth = ReplayAuth(
+            config,
+            ticket["access_token"],
+            ticket["refresh_token"],
+            ticket["expires_in"],
+            ticket["issued_at"],
+        )
+        AppConfig.set_api_client(ApiClient(auth=auth, config=config))
+        AppConfig.set_loop(asyncio.get_running_loop())
+        hardware_info = HardwareInfo()
+        identifier = HardwareInfo.get_identifier()
+        register_data = hardware_info.get_register_data(worker_id=identifier)
+        register_data["hardware"] = hardware_info.get_simple_hardware_info()
+        startup_sequence = [
+            WebsocketMessage(
+                message_type="hello_world",
+                module_name="worker",
+                module_command="register",
+                arguments=register_data,
+            )
+        ]
+        return asyncio.create_task(websocket_client(config, startup_sequence, auth=auth))
+
+    async def run(self) -> dict:
+        messages, overrides = load_recording(self.recording)
+        families = set()
+        for _, payload in messages:
+            _families(payload, families)
+        unknown = families - set(FAMILIES)
+        if unknown:
+            raise ValueError(f"Unknown stand-in families {sorted(unknown)}, expected {FAMILIES}.")
+        self.loop = asyncio.get_running_loop()
+        self.all_done = asyncio.Event()
+        built_at = time.perf_counter()
+        paths = await self.loop.run_in_executor(None, build_stand_ins, self.root, sorted(families))
+        build_seconds = time.perf_counter() - built_at
+        language_model = TinyLanguageModel(paths["llm"]) if "llm" in paths else None
+        prepared = self._prepare(messages, paths)
+
+        master = await FakeMaster(language_model=language_model, llm_name=LLM_NAME).start()
+        master.recorder.listeners.append(self._on_event)
+        AppConfig.set_config_overrides(self._worker_config(master, overrides))
+        self.sampling.set()
+        sampler = threading.Thread(target=self._sample, name="replay-rss", daemon=True)
+        sampler.start()
+        worker = None
+        started_at = time.perf_counter()
+        try:
+            worker = self._start_worker(master)
+            await asyncio.wait_for(master.connected.wait(), timeout=60)
+            replay_started_at = time.perf_counter()
+            for offset, key, payload in prepared:
+                delay = replay_started_at + offset / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                with self.lock:
+                    job = self.jobs[key]
+                    job.sent_at = time.perf_counter()
+                await master.send(payload)
+                if not job.expects_reply:
+                    job.finished_at = job.sent_at
+            if all(job.done for job in self.jobs.values()):
+                self.all_done.set()
+            try:
+                await asyncio.wait_for(self.all_done.wait(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Replay timed out after {self.timeout:.0f}s with jobs still running.")
+        finally:
+            wall_seconds = time.perf_counter() - started_at
+            self.sampling.clear()
+            if worker is not None:
+                worker.cancel()
+                await asyncio.gather(worker, return_exceptions=True)
+            await master.stop()
+            AppConfig.set_config_overrides(None)
+        return self.report(wall_seconds, build_seconds)
+
+    def report(self, wall_seconds: float, build_seconds: float = None) -> dict:
+        with self.lock:
+            jobs = [job.to_dict() for job in self.jobs.values()]
+        families = {}
+        for job in jobs:
+            families.setdefault(job["family"], []).append(job)
+        summary = {}
+        for family, family_jobs in sorted(families.items()):
+            stages = {}
+            for stage in STAGES:
+                values = [job["stages"][stage] for job in family_jobs if job["stages"][stage] is not None]
+                stages[stage] = {
+                    "p50": _percentile(values, 0.5),
+                    "p95": _percentile(values, 0.95),
+                    "max": max(values) if values else None,
+                }
+            summary[family] = {
+                "jobs": len(family_jobs),
+                "completed": sum(1 for job in family_jobs if job["done"] and not job["rejected"]),
+                "stages": stages,
+                "bytes_uploaded": sum(job["bytes_uploaded"] for job in family_jobs),
+                "peak_rss_bytes": max(job["peak_rss_bytes"] for job in family_jobs),
+            }
+        # ru_maxrss is in KiB on Linux.
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return {
+            "recording": self.recording,
+            "wall_seconds": wall_seconds,
+            "stand_in_build_seconds": build_seconds,
+            "jobs": jobs,
+            "families": summary,
+            "bytes_uploaded": sum(job["bytes_uploaded"] for job in jobs),
+            "peak_rss_bytes": max(self.peak_rss, max_rss),
+        }
+
+
+def format_report(report: dict) -> str:
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f}s"
+
+    lines = [
+        f"Replayed {len(report['jobs'])} jobs from {report['recording']} in {report['wall_seconds']:.1f}s, "
+        f"{report['bytes_uploaded'] / 2**20:.2f} MiB uploaded, peak RSS {report['peak_rss_bytes'] / 2**20:.0f} MiB."
+    ]
+    header = f"{'family':<12}{'jobs':>6}{'done':>6}" + "".join(f"{stage + ' p50':>16}" for stage in STAGES)
+    lines.append(header + f"{'MiB up':>10}{'peak RSS':>12}")
+    for family, summary in report["families"].items():
+        lines.append(
+            f"{family:<12}{summary['jobs']:>6}{summary['completed']:>6}"
+            + "".join(f"{seconds(summary['stages'][stage]['p50']):>16}" for stage in STAGES)
+            + f"{summary['bytes_uploaded'] / 2**20:>10.2f}"
+            + f"{summary['peak_rss_bytes'] / 2**20:>9.0f} MiB"
+        )
+    return "\n".join(lines)
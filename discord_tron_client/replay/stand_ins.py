@@ -0,0 +1,341 @@
+import json, logging, os, tempfile
+from typing import Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+# The families a recording can ask for as `tiny:<family>`.
+FAMILIES = ("sdxl", "flux", "sd3", "wan", "llm")
+# Words the word-level T5 / GPT-2 tokenizers know; anything else becomes <unk>.
+WORDS = (
+    "a photo of the cat dog astronaut horse riding on moon city at night with "
+    "neon lights painting portrait landscape mountain river forest red blue green "
+    "style by in and detailed high quality cinematic video walking running sky"
+).split()
+CLIP_HIDDEN = 32
+T5_HIDDEN = 32
+
+
+def _seed():
+    import torch
+
+    torch.manual_seed(0)
+
+
+def _clip_tokenizer():
+    """A byte-level CLIP tokenizer with no merges, written locally instead of downloaded."""
+    from transformers import CLIPTokenizer
+    from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+    characters = list(bytes_to_unicode().values())
+    vocab = characters + [f"{character}</w>" for character in characters]
+    vocab += ["<|startoftext|>", "<|endoftext|>"]
+    with tempfile.TemporaryDirectory() as path:
+        with open(os.path.join(path, "vocab.json"), "w") as vocab_file:
+            json.dump({token: index for index, token in enumerate(vocab)}, vocab_file)
+        with open(os.path.join(path, "merges.txt"), "w") as merges_file:
+            merges_file.write("#version: 0.2\n")
+        return CLIPTokenizer(
+            os.path.join(path, "vocab.json"),
+            os.path.join(path, "merges.txt"),
+            model_max_length=77,
+        )
+
+
+def _word_tokenizer(model_max_length: int = 128):
+    """A whitespace word-level tokenizer over WORDS, used for the T5 and GPT-2 stand-ins."""
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {token: index for index, token in enumerate(["<pad>", "</s>", "<unk>"] + list(WORDS))}
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        pad_token="<pad>",
+        eos_token="</s>",
+        unk_token="<unk>",
+        model_max_length=model_max_length,
+    )
+
+
+def _clip_config():
+    from transformers import CLIPTextConfig
+
+    # eos_token_id=2 keeps CLIP's argmax pooling, which lands on <|endoftext|>, the highest id.
+    return CLIPTextConfig(
+        bos_token_id=0,
+        eos_token_id=2,
+        hidden_size=CLIP_HIDDEN,
+        intermediate_size=37,
+        layer_norm_eps=1e-05,
+        num_attention_heads=4,
+        num_hidden_layers=2,
+        pad_token_id=1,
+        vocab_size=1000,
+        hidden_act="gelu",
+        projection_dim=CLIP_HIDDEN,
+    )
+
+
+def _t5_encoder(vocab_size: int):
+    from transformers import T5Config, T5EncoderModel
+
+    return T5EncoderModel(
+        T5Config(
+            vocab_size=vocab_size,
+            d_model=T5_HIDDEN,
+            d_ff=37,
+            d_kv=8,
+            num_layers=2,
+            num_heads=4,
+            relative_attention_num_buckets=8,
+        )
+    )
+
+
+def _vae(latent_channels: int, flow: bool = False):
+    """A four-block, 8x-downsampling VAE with a handful of channels."""
+    from diffusers import AutoencoderKL
+
+    return AutoencoderKL(
+        in_channels=3,
+        out_channels=3,
+        down_block_types=["DownEncoderBlock2D"] * 4,
+        up_block_types=["UpDecoderBlock2D"] * 4,
+        block_out_channels=(8, 8, 8, 8),
+        layers_per_block=1,
+        latent_channels=latent_channels,
+        norm_num_groups=1,
+        sample_size=64,
+        use_quant_conv=not flow,
+        use_post_quant_conv=not flow,
+        shift_factor=0.0609 if flow else None,
+        scaling_factor=1.5035 if flow else 0.13025,
+    )
+
+
+def build_sdxl():
+    from diffusers import EulerDiscreteScheduler, StableDiffusionXLPipeline, UNet2DConditionModel
+    from transformers import CLIPTextModel, CLIPTextModelWithProjection
+
+    _seed()
+    unet = UNet2DConditionModel(
+        block_out_channels=(8, 16),
+        layers_per_block=1,
+        sample_size=32,
+        in_channels=4,
+        out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        attention_head_dim=(2, 4),
+        use_linear_projection=True,
+        addition_embed_type="text_time",
+        addition_time_embed_dim=8,
+        transformer_layers_per_block=(1, 1),
+        # Six time ids of 8 each, plus the pooled text embedding.
+        projection_class_embeddings_input_dim=6 * 8 + CLIP_HIDDEN,
+        cross_attention_dim=2 * CLIP_HIDDEN,
+        norm_num_groups=1,
+    )
+    scheduler = EulerDiscreteScheduler(
+        beta_start=0.00085,
+        beta_end=0.012,
+        steps_offset=1,
+        beta_schedule="scaled_linear",
+        timestep_spacing="leading",
+    )
+    tokenizer = _clip_tokenizer()
+    return StableDiffusionXLPipeline(
+        vae=_vae(4),
+        text_encoder=CLIPTextModel(_clip_config()),
+        text_encoder_2=CLIPTextModelWithProjection(_clip_config()),
+        tokenizer=tokenizer,
+        tokenizer_2=tokenizer,
+        unet=unet,
+        scheduler=scheduler,
+    )
+
+
+def build_flux():
+    from diffusers import FlowMatchEulerDiscreteScheduler, FluxPipeline, FluxTransformer2DModel
+    from transformers import CLIPTextModel
+
+    _seed()
+    tokenizer_2 = _word_tokenizer()
+    # Flux packs 2x2 patches of the 4-channel latent into 16 input channels.
+    transformer = FluxTransformer2DModel(
+        patch_size=1,
+        in_channels=16,
+        num_layers=1,
+        num_single_layers=1,
+        attention_head_dim=16,
+        num_attention_heads=2,
+        joint_attention_dim=T5_HIDDEN,
+        pooled_projection_dim=CLIP_HIDDEN,
+        axes_dims_rope=[4, 4, 8],
+    )
+    return FluxPipeline(
+        scheduler=FlowMatchEulerDiscreteScheduler(),
+        vae=_vae(4, flow=True),
+        text_encoder=CLIPTextModel(_clip_config()),
+        tokenizer=_clip_tokenizer(),
+        text_encoder_2=_t5_encoder(len(tokenizer_2)),
+        tokenizer_2=tokenizer_2,
+        transformer=transformer,
+    )
+
+
+def build_sd3():
+    from diffusers import (
+        FlowMatchEulerDiscreteScheduler,
+        SD3Transformer2DModel,
+        StableDiffusion3Pipeline,
+    )
+    from transformers import CLIPTextModelWithProjection
+
+    _seed()
+    tokenizer = _clip_tokenizer()
+    tokenizer_3 = _word_tokenizer()
+    transformer = SD3Transformer2DModel(
+        sample_size=32,
+        patch_size=1,
+        in_channels=4,
+        num_layers=1,
+        attention_head_dim=8,
+        num_attention_heads=4,
+        caption_projection_dim=32,
+        joint_attention_dim=T5_HIDDEN,
+        pooled_projection_dim=2 * CLIP_HIDDEN,
+        out_channels=4,
+    )
+    return StableDiffusion3Pipeline(
+        scheduler=FlowMatchEulerDiscreteScheduler(),
+        vae=_vae(4, flow=True),
+        text_encoder=CLIPTextModelWithProjection(_clip_config()),
+        tokenizer=tokenizer,
+        text_encoder_2=CLIPTextModelWithProjection(_clip_config()),
+        tokenizer_2=tokenizer,
+        text_encoder_3=_t5_encoder(len(tokenizer_3)),
+        tokenizer_3=tokenizer_3,
+        transformer=transformer,
+    )
+
+
+def build_wan():
+    from diffusers import (
+        AutoencoderKLWan,
+        FlowMatchEulerDiscreteScheduler,
+        WanPipeline,
+        WanTransformer3DModel,
+    )
+
+    _seed()
+    tokenizer = _word_tokenizer()
+    vae = AutoencoderKLWan(
+        base_dim=3,
+        z_dim=16,
+        dim_mult=[1, 1, 1, 1],
+        num_res_blocks=1,
+        temperal_downsample=[False, True, True],
+    )
+    transformer = WanTransformer3DModel(
+        patch_size=(1, 2, 2),
+        num_attention_heads=2,
+        attention_head_dim=12,
+        in_channels=16,
+        out_channels=16,
+        text_dim=T5_HIDDEN,
+        freq_dim=256,
+        ffn_dim=32,
+        num_layers=2,
+        cross_attn_norm=True,
+        qk_norm="rms_norm_across_heads",
+        rope_max_seq_len=32,
+    )
+    return WanPipeline(
+        tokenizer=tokenizer,
+        text_encoder=_t5_encoder(len(tokenizer)),
+        vae=vae,
+        transformer=transformer,
+        scheduler=FlowMatchEulerDiscreteScheduler(shift=7.0),
+    )
+
+
+class TinyLanguageModel:
+    """A randomly initialised two-layer GPT-2 over the word-level vocabulary."""
+
+    def __init__(self, path: str):
+        from transformers import GPT2LMHeadModel
+
+        self.path = path
+        self.tokenizer = _word_tokenizer()
+        self.model = GPT2LMHeadModel.from_pretrained(path).eval()
+
+    @staticmethod
+    def build(path: str):
+        from transformers import GPT2Config, GPT2LMHeadModel
+
+        _seed()
+        tokenizer = _word_tokenizer()
+        GPT2LMHeadModel(
+            GPT2Config(
+                vocab_size=len(tokenizer),
+                n_positions=256,
+                n_embd=32,
+                n_layer=2,
+                n_head=2,
+                bos_token_id=1,
+                eos_token_id=1,
+            )
+        ).save_pretrained(path)
+
+    def generate(self, prompt: str, max_tokens: int = 32) -> str:
+        import torch
+
+        inputs = self.tokenizer(prompt or "a", return_tensors="pt")
+        with torch.no_grad():
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=max(int(max_tokens), 1),
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id,
+                eos_token_id=None,
+            )
+        return self.tokenizer.decode(
+            output[0, inputs["input_ids"].shape[1] :], skip_special_tokens=True
+        )
+
+
+BUILDERS = {
+    "sdxl": build_sdxl,
+    "flux": build_flux,
+    "sd3": build_sd3,
+    "wan": build_wan,
+}
+
+
+def stand_in_path(root: str, family: str) -> str:
+    # get_pipe() picks some pipeline types from the model id, eg. "wan".
+    return os.path.join(os.path.abspath(root), f"tiny-{family}")
+
+
+def build_stand_ins(root: str, families: Iterable[str] = FAMILIES) -> Dict[str, str]:
+    """
+    Build (once) and save the randomly initialised stand-in for each family
+    under `root`, returning family -> model path. Nothing is downloaded.
+    """
+    paths = {}
+    for family in families:
+        if family not in FAMILIES:
+            raise ValueError(f"Unknown stand-in family {family!r}, expected one of {FAMILIES}.")
+        path = stand_in_path(root, family)
+        paths[family] = path
+        marker = os.path.join(path, "model_index.json" if family != "llm" else "config.json")
+        if os.path.exists(marker):
+            continue
+        logger.info(f"Building the tiny {family} stand-in in {path}")
+        if family == "llm":
+            TinyLanguageModel.build(path)
+        else:
+            BUILDERS[family]().save_pretrained(path, safe_serialization=True)
+    return paths
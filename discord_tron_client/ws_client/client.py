@@ -7,30 +7,93 @@ from discord_tron_client.classes.app_config import AppConfig
 from discord_tron_client.classes.auth import Auth
 from discord_tron_client.message.job_queue import JobQueueMessage
 from discord_tron_client.classes.worker_processor import WorkerProcessor
+from discord_tron_client.classes.batch_scheduler import build_batch_scheduler
+from discord_tron_client.classes.message import WebsocketMessage
+from discord_tron_client.classes.worker_queue import build_worker_queue
+from discord_tron_client.classes.metrics import get_metrics, worker_queue_collector
+from discord_tron_client.message.discord import DiscordMessage
 
 
-async def periodic_wakeup(interval, websocket):
+async def periodic_wakeup(interval, websocket, worker_queue=None):
     """
-    Send a periodic ping to the server to keep the connection alive and responsive.
+    Send a periodic ping to the server to keep the connection alive and responsive,
+    along with a heartbeat that reports the job queue depth and predicted wait.
     """
     while True:
         await asyncio.sleep(interval)
         try:
             # You might send a ping or some other non-blocking operation here
             await websocket.ping()
+            if worker_queue is not None:
+                heartbeat = WebsocketMessage(
+                    message_type="heartbeat",
+                    module_name="worker",
+                    module_command="heartbeat",
+                    arguments={
+                        "worker_id": HardwareInfo.get_identifier(),
+                        "queue": worker_queue.stats(),
+                    },
+                )
+                await websocket.send(heartbeat.to_json())
         except Exception as e:
             logging.error(f"Error during periodic wakeup: {e}")
             # Handle the exception as needed (e.g., reconnection logic)
 
 
+async def reject_job(websocket, payload, admission):
+    """Hand a job back to the master, or tell the user when it has no job id."""
+    logging.warning(f"Refusing job: {admission.reason}")
+    if "job_id" in payload:
+        await websocket.send(
+            JobQueueMessage(
+                websocket,
+                payload["job_id"],
+                HardwareInfo.get_identifier(),
+                module_command="reject",
+                reason=admission.reason,
+                predicted_seconds=round(admission.predicted_seconds, 1),
+            ).to_json()
+        )
+    elif "discord_first_message" in payload:
+        await websocket.send(
+            DiscordMessage(
+                websocket=websocket,
+                context=payload["discord_first_message"],
+                module_command="edit",
+                message=f"This worker is too busy to take your request: {admission.reason}. Please try again later.",
+            ).to_json()
+        )
+
+
 async def websocket_client(
     config: AppConfig, startup_sequence: str = None, auth: Auth = None
 ):
     processor = WorkerProcessor()
     concurrent_slots = config.get_concurrent_slots()
     general_semaphore = asyncio.Semaphore(concurrent_slots)
-    gpu_semaphore = asyncio.Semaphore(1)
-    llama_semaphore = asyncio.Semaphore(concurrent_slots)
+
+    async def run_job(job):
+        await log_slow_callbacks(
+            processor.process_command(
+                payload=job.payload, websocket=AppConfig.get_websocket()
+            ),
+            threshold=0.5,
+        )
+
+    async def run_batch(jobs):
+        await log_slow_callbacks(
+            processor.process_batch(
+                [job.payload for job in jobs], AppConfig.get_websocket()
+            ),
+            threshold=0.5,
+        )
+
+    # Jobs wait here, by lane and priority, instead of piling up as tasks.
+    worker_queue = build_worker_queue(
+        run_job, run_batch=run_batch, batch_scheduler=build_batch_scheduler()
+    )
+    worker_queue.start()
+    get_metrics().register_collector("worker_queue", worker_queue_collector(worker_queue))
     while True:
         try:
             websocket_config = config.get_websocket_config()
@@ -89,7 +152,7 @@ async def websocket_client(
                 AppConfig.set_websocket(websocket)
                 # Start the periodic wakeup task
                 wakeup_task = asyncio.create_task(
-                    periodic_wakeup(30, websocket)
+                    periodic_wakeup(30, websocket, worker_queue)
                 )  # Ping every 30 seconds
                 # Send the startup sequence
                 if startup_sequence:
@@ -104,11 +167,14 @@ async def websocket_client(
                     logging.debug(f"Received message from master")
                     logging.debug(f"{message}")
                     payload = json.loads(message)
-                    semaphore = general_semaphore
                     if "job_type" in payload:
+                        admission = worker_queue.offer(payload, websocket)
+                        if not admission.admitted:
+                            await reject_job(websocket, payload, admission)
+                            continue
                         if "job_id" in payload:
                             logging.debug(
-                                f"Processing job {payload['job_id']} of type {payload['job_type']}"
+                                f"Queued job {payload['job_id']} of type {payload['job_type']}, predicted completion in {admission.predicted_seconds:.0f}s"
                             )
                             # Send websocket command for the 'job_queue' module 'acknowledge' command
                             await websocket.send(
@@ -119,17 +185,12 @@ async def websocket_client(
                                     module_command="acknowledge",
                                 ).to_json()
                             )
-                        if payload["job_type"] in {"gpu", "ollama"}:
-                            logging.debug("Using GPU-specific semaphore")
-                            semaphore = gpu_semaphore
-                        if payload["job_type"] == "llama":
-                            logging.debug("Using Llama-specific semaphore")
-                            semaphore = llama_semaphore
+                        continue
                     asyncio.create_task(
                         log_slow_callbacks(
                             process_command_with_semaphore(
                                 processor,
-                                semaphore,
+                                general_semaphore,
                                 payload=payload,
                                 websocket=websocket,
                             ),
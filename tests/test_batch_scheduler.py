@@ -0,0 +1,102 @@
+import asyncio
+
+from discord_tron_client.classes.batch_scheduler import BatchScheduler
+
+
+class Job:
+    def __init__(self, **overrides):
+        user_config = {"model": "sdxl", "steps": 30, "resolution": {"width": 1024, "height": 1024}}
+        user_config.update(overrides.pop("config", {}))
+        self.payload = {
+            "job_type": "gpu",
+            "module_name": "image_generation",
+            "module_command": "generate_image",
+            "image_prompt": "a cat",
+            "config": user_config,
+        }
+        self.payload.update(overrides)
+
+
+class FakeLane:
+    def __init__(self, jobs):
+        self.jobs = list(jobs)
+
+    def take(self, match, limit):
+        taken = [job for job in self.jobs if match(job.payload)][:limit]
+        for job in taken:
+            self.jobs.remove(job)
+        return taken
+
+    def queued(self):
+        return len(self.jobs)
+
+
+def collect(scheduler, first, lane):
+    return asyncio.run(scheduler.collect(first, lane.take, lane.queued))
+
+
+def test_is_batchable():
+    assert BatchScheduler.is_batchable(Job().payload)
+    assert not BatchScheduler.is_batchable(Job(job_type="llama").payload)
+    assert not BatchScheduler.is_batchable(Job(image_data="http://x/y.png").payload)
+    assert not BatchScheduler.is_batchable(Job(upscaler=True).payload)
+    assert not BatchScheduler.is_batchable(Job(image_prompt="a cat --steps 5").payload)
+    assert not BatchScheduler.is_batchable(Job(module_command="variation").payload)
+
+
+def test_batch_key_ignores_per_job_settings():
+    key = BatchScheduler.batch_key
+    assert key(Job(config={"seed": 1}).payload) == key(Job(config={"seed": 2}).payload)
+    assert key(Job().payload) != key(Job(config={"steps": 20}).payload)
+    assert key(Job().payload) != key(
+        Job(config={"lora_adapter_1": "style"}).payload
+    )
+    assert key(Job().payload) != key(Job(model_config={"variant": "fp16"}).payload)
+
+
+def test_collect_takes_compatible_queued_jobs_up_to_max_jobs():
+    scheduler = BatchScheduler(window_seconds=0, max_jobs=3)
+    first = Job()
+    other_model = Job(config={"model": "flux"})
+    peers = [Job(), Job(), Job()]
+    lane = FakeLane([other_model] + peers)
+
+    jobs = collect(scheduler, first, lane)
+
+    assert jobs == [first] + peers[:2]
+    assert lane.jobs == [other_model, peers[2]]
+    assert (scheduler.batches, scheduler.batched_jobs) == (1, 3)
+
+
+def test_collect_respects_the_batch_limit():
+    scheduler = BatchScheduler(
+        window_seconds=0, max_jobs=4, batch_limit=lambda payload, max_jobs: 2
+    )
+    first = Job()
+    lane = FakeLane([Job(), Job()])
+
+    assert len(collect(scheduler, first, lane)) == 2
+
+
+def test_collect_waits_for_peers_only_when_the_lane_is_empty():
+    scheduler = BatchScheduler(window_seconds=0.01, max_jobs=2)
+    first, late = Job(), Job()
+    lane = FakeLane([])
+
+    async def scenario():
+        async def arrive():
+            lane.jobs.append(late)
+
+        asyncio.get_running_loop().call_soon(lambda: asyncio.ensure_future(arrive()))
+        return await scheduler.collect(first, lane.take, lane.queued)
+
+    assert asyncio.run(scenario()) == [first, late]
+
+
+def test_disabled_or_unbatchable_jobs_run_alone():
+    lane = FakeLane([Job()])
+    first = Job()
+    assert collect(BatchScheduler(max_jobs=1), first, lane) == [first]
+    unbatchable = Job(upscaler=True)
+    assert collect(BatchScheduler(window_seconds=0), unbatchable, lane) == [unbatchable]
+    assert lane.queued() == 1
@@ -0,0 +1,130 @@
+import json
+import time
+
+from discord_tron_client.classes.cost_model import (
+    DEFAULT_BYTES_PER_PIXEL,
+    CostModel,
+    CostSample,
+)
+
+RES_512 = {"width": 512, "height": 512}
+RES_1024 = {"width": 1024, "height": 1024}
+
+
+def sample(model="sdxl", width=512, height=512, batch=1, steps=20, peak=None, seconds=None, tiling=False):
+    pixels = width * height * batch
+    return CostSample(
+        model,
+        "StableDiffusionXLPipeline",
+        width,
+        height,
+        batch,
+        steps,
+        tiling,
+        peak if peak is not None else 1e9 + 2000 * pixels,
+        seconds if seconds is not None else 1e-6 * pixels * steps,
+    )
+
+
+def test_unmeasured_models_use_the_default_heuristic():
+    prediction = CostModel().predict("sdxl", RES_512, steps=20)
+
+    assert not prediction.measured
+    assert prediction.peak_bytes == 512 * 512 * DEFAULT_BYTES_PER_PIXEL
+    assert prediction.seconds is None
+
+
+def test_memory_and_time_are_fitted_against_pixels():
+    model = CostModel()
+    model.record(sample(width=512, height=512), save=False)
+    model.record(sample(width=1024, height=1024), save=False)
+
+    prediction = model.predict("sdxl", {"width": 768, "height": 768}, steps=20)
+
+    assert prediction.measured
+    assert abs(prediction.peak_bytes - (1e9 + 2000 * 768 * 768)) < 1
+    assert abs(prediction.seconds - 1e-6 * 768 * 768 * 20) < 1e-6
+
+
+def test_one_resolution_borrows_the_pooled_slope():
+    model = CostModel()
+    model.record(sample("a", 512, 512), save=False)
+    model.record(sample("a", 1024, 1024), save=False)
+    model.record(sample("b", 512, 512, peak=3e9), save=False)
+
+    small = model.predict("b", RES_512).peak_bytes
+    large = model.predict("b", RES_1024).peak_bytes
+
+    pooled_slope = model._fit(None, False)[0].slope
+    assert abs(small - 3e9) < 1
+    assert pooled_slope > 0
+    assert abs((large - small) - pooled_slope * (1024 * 1024 - 512 * 512)) < 1
+
+
+def test_max_batch_fits_the_budget_and_skips_sizes_that_ran_out_of_memory():
+    model = CostModel()
+    model.record(sample(batch=1), save=False)
+    model.record(sample(batch=4), save=False)
+    budget = model.predict("sdxl", RES_512, batch=3).peak_bytes
+
+    assert model.max_batch("sdxl", RES_512, budget, limit=4) == 3
+    model.record_oom_rung("sdxl", RES_512, 3, "vae_tiling", save=False)
+    assert model.max_batch("sdxl", RES_512, budget, limit=4) == 2
+
+
+def test_oom_rungs_expire():
+    model = CostModel(oom_rung_ttl=60)
+    model.record_oom_rung("sdxl", RES_1024, 2, "vae_tiling", save=False)
+    assert model.oom_rung("sdxl", RES_1024, 2) == "vae_tiling"
+    assert model.oom_rung("sdxl", RES_1024, 1) is None
+
+    key = next(iter(model.oom_rungs))
+    model.oom_rungs[key]["recorded_at"] -= 61
+    assert model.oom_rung("sdxl", RES_1024, 2) is None
+
+
+def test_samples_are_capped_per_model():
+    model = CostModel(max_samples=3)
+    for width in (64, 128, 192, 256):
+        model.record(sample(width=width), save=False)
+
+    assert [s.width for s in model.samples["sdxl"]] == [128, 192, 256]
+
+
+def test_profiles_round_trip_and_legacy_rungs_load(tmp_path):
+    path = tmp_path / "cost_profile.json"
+    model = CostModel(path=str(path), save_delay=0)
+    model.record(sample())
+    model.record_oom_rung("sdxl", RES_512, 1, "model_cpu_offload")
+
+    loaded = CostModel(path=str(path))
+    assert loaded.stats() == model.stats()
+    assert loaded.oom_rung("sdxl", RES_512) == "model_cpu_offload"
+
+    data = json.loads(path.read_text())
+    data["oom_rungs"] = {"sdxl|512x512|1": "vae_tiling"}
+    path.write_text(json.dumps(data))
+    assert CostModel(path=str(path)).oom_rung("sdxl", RES_512) == "vae_tiling"
+
+
+def test_saves_are_debounced(tmp_path):
+    path = tmp_path / "cost_profile.json"
+    model = CostModel(path=str(path), save_delay=60)
+    for _ in range(10):
+        model.record(sample())
+    assert not path.exists()
+
+    model.flush()
+
+    assert len(json.loads(path.read_text())["samples"]) == 10
+    assert model._save_timer is None
+
+
+def test_profile_times_the_enclosed_call():
+    model = CostModel()
+    with model.profile("sdxl", "Pipeline", 512, 512, steps=20):
+        time.sleep(0.01)
+
+    recorded = model.samples["sdxl"][0]
+    assert recorded.seconds >= 0.01
+    assert (recorded.width, recorded.height, recorded.steps) == (512, 512, 20)
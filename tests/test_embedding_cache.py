@@ -0,0 +1,137 @@
+import gc
+
+import pytest
+
+from discord_tron_client.classes.image_manipulation.embedding_cache import (
+    PromptEmbeddingCache,
+)
+
+
+class FakeTensor:
+    """Just enough of a tensor for the cache's byte accounting and spilling."""
+
+    def __init__(self, nbytes: int, device: str = "cuda:0"):
+        self.nbytes = nbytes
+        self.device = device
+
+    def numel(self):
+        return self.nbytes
+
+    def element_size(self):
+        return 1
+
+    def detach(self):
+        return self
+
+    def to(self, device, non_blocking=False):
+        return FakeTensor(self.nbytes, device)
+
+
+class Encoder:
+    pass
+
+
+def test_hits_misses_and_lru_spill():
+    cache = PromptEmbeddingCache(budget_bytes=100, cpu_budget_bytes=60)
+    encoder = Encoder()
+    keys = [cache.key([encoder], text) for text in ("a", "b", "c")]
+
+    for key in keys:
+        cache.put(key, FakeTensor(50))
+
+    # "a" was least recently used, so it spilled to system memory.
+    assert cache.stats()["entries"] == 2
+    assert cache.spilled[keys[0]].value.device == "cpu"
+    restored = cache.get(keys[0])
+    assert restored.device == "cuda:0"
+    assert cache.get(cache.key([encoder], "d")) is None
+    stats = cache.stats()
+    assert (stats["spill_hits"], stats["misses"], stats["spills"]) == (1, 1, 2)
+
+
+def test_entries_over_every_budget_are_evicted():
+    cache = PromptEmbeddingCache(budget_bytes=10, cpu_budget_bytes=10)
+    key = cache.key([Encoder()], "long prompt")
+
+    cache.put(key, FakeTensor(50))
+
+    assert cache.get(key) is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_keys_include_encoder_settings_and_text():
+    cache = PromptEmbeddingCache(budget_bytes=100)
+    first, second = Encoder(), Encoder()
+
+    assert cache.key([first], "a") == cache.key([first, None], "a")
+    assert cache.key([first], "a") != cache.key([second], "a")
+    assert cache.key([first], "a", 77) != cache.key([first], "a", 256)
+    assert cache.key([first], "a", clip_skip=1) != cache.key([first], "a", clip_skip=2)
+
+
+def test_entries_go_with_their_encoder():
+    cache = PromptEmbeddingCache(budget_bytes=100, cpu_budget_bytes=100)
+    kept, patched, collected = Encoder(), Encoder(), Encoder()
+    for encoder in (kept, patched, collected):
+        cache.put(cache.key([encoder], "a"), FakeTensor(10))
+
+    cache.invalidate(patched)
+    del encoder, collected
+    gc.collect()
+
+    assert cache.stats()["entries"] == 1
+    assert cache.get(cache.key([kept], "a")) is not None
+
+
+class TinyEncoder:
+    """A word-level tokenizer in front of an embedding table."""
+
+    def __init__(self, torch, width: int = 8):
+        self.torch = torch
+        self.vocab = {}
+        self.embedding = torch.nn.Embedding(64, width)
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        ids = [
+            [self.vocab.setdefault(word, len(self.vocab)) for word in text.split()][:4]
+            for text in texts
+        ]
+        ids = [row + [0] * (4 - len(row)) for row in ids]
+        with self.torch.no_grad():
+            embeds = self.embedding(self.torch.tensor(ids))
+        return embeds, embeds.mean(dim=1)
+
+
+def test_cached_embeddings_match_a_fresh_encode():
+    torch = pytest.importorskip("torch")
+    encoder = TinyEncoder(torch)
+    cache = PromptEmbeddingCache(budget_bytes=2**20)
+    texts = ["a red fox", "blurry", "a red fox"]
+
+    first = cache.encode_batch([encoder.embedding], texts, encoder, max_len=4)
+    second = cache.encode_batch([encoder.embedding], ["blurry", "a cat"], encoder, max_len=4)
+    fresh = encoder(["blurry", "a cat"])
+
+    # Duplicates are encoded once, and cached texts are not encoded again.
+    assert encoder.calls[:2] == [["a red fox", "blurry"], ["a cat"]]
+    assert [tuple(part.shape) for part in first] == [(3, 4, 8), (3, 8)]
+    assert torch.equal(first[0][0], first[0][2])
+    for cached, expected in zip(second, fresh):
+        assert torch.equal(cached, expected)
+
+
+def test_changed_weights_are_not_served_from_the_cache():
+    torch = pytest.importorskip("torch")
+    encoder = TinyEncoder(torch)
+    cache = PromptEmbeddingCache(budget_bytes=2**20)
+    before = cache.encode_batch([encoder.embedding], ["a fox"], encoder)
+
+    with torch.no_grad():
+        encoder.embedding.weight.add_(1.0)
+    cache.invalidate(encoder.embedding)
+    after = cache.encode_batch([encoder.embedding], ["a fox"], encoder)
+
+    assert len(encoder.calls) == 2
+    assert not torch.equal(before[0], after[0])
@@ -0,0 +1,65 @@
+import pytest
+
+from discord_tron_client.classes import gpu_telemetry
+from discord_tron_client.classes.gpu_telemetry import FakeNvmlBackend, GpuTelemetrySampler
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(gpu_telemetry.time, "monotonic", lambda: now[0])
+    return now
+
+
+def sampler_with(clock, readings, devices=1):
+    """Sample every device at each (timestamp, power_watts, vram_used_mb) reading."""
+    backend = FakeNvmlBackend([{"name": f"GPU {idx}"} for idx in range(devices)])
+    sampler = GpuTelemetrySampler(backend, interval_ms=100, history_seconds=60)
+    for timestamp, power_watts, vram_used_mb in readings:
+        clock[0] = timestamp
+        for idx in range(devices):
+            backend.set(idx, power_watts=power_watts, vram_used_mb=vram_used_mb)
+        sampler.sample_once()
+    return sampler
+
+
+def test_latest(clock):
+    sampler = sampler_with(clock, [(10.0, 100.0, 1000.0), (12.0, 200.0, 3000.0)], devices=2)
+
+    assert sampler.device_names == ["GPU 0", "GPU 1"]
+    assert [sample.power_watts for sample in sampler.latest()] == [200.0, 200.0]
+    assert sampler.latest(1).timestamp == 12.0
+    assert sampler.total_power_watts() == 400.0
+
+
+def test_max_since(clock):
+    sampler = sampler_with(
+        clock, [(10.0, 100.0, 1000.0), (12.0, 300.0, 3000.0), (14.0, 200.0, 2000.0)]
+    )
+
+    assert sampler.max_since(0.0) == 300.0
+    assert sampler.max_since(13.0) == 200.0
+    assert sampler.max_since(11.0, field="vram_used_mb") == 3000.0
+    assert sampler.max_since(15.0) == 0.0
+
+
+def test_energy_joules_trapezoids(clock):
+    sampler = sampler_with(
+        clock, [(10.0, 100.0, 0.0), (12.0, 200.0, 0.0), (14.0, 200.0, 0.0)], devices=2
+    )
+
+    # (100 + 200) / 2 * 2s + 200 * 2s
+    assert sampler.energy_joules(10.0, 14.0, device=0) == pytest.approx(700.0)
+    assert sampler.energy_joules(10.0, 14.0) == pytest.approx(1400.0)
+    # Clipped to the window: 150 W for 1s, then 200 W for 1s.
+    assert sampler.energy_joules(11.0, 13.0, device=0) == pytest.approx(350.0)
+    # The edge readings hold for the 2s before and after the samples.
+    assert sampler.energy_joules(8.0, 16.0, device=0) == pytest.approx(1300.0)
+    assert sampler.energy_joules(14.0, 14.0) == 0.0
+
+
+def test_energy_joules_defaults_to_now(clock):
+    sampler = sampler_with(clock, [(10.0, 100.0, 0.0), (12.0, 100.0, 0.0)])
+    clock[0] = 15.0
+
+    assert sampler.energy_joules(10.0) == pytest.approx(500.0)
@@ -0,0 +1,99 @@
+from discord_tron_client.classes.llm.llama.registry import LlamaModelRegistry
+
+
+class StubModel:
+    def __init__(self, key):
+        self.key = key
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class StubLoader:
+    def __init__(self):
+        self.loaded = []
+
+    def __call__(self, key, prefix_cache_bytes):
+        model = StubModel(key)
+        self.loaded.append(model)
+        return model
+
+
+def model_file(tmp_path, name, size_bytes):
+    path = tmp_path / f"{name}.q4_0.gguf"
+    path.write_bytes(b"\0" * size_bytes)
+    return str(path)
+
+
+def test_reuses_warm_models_by_key(tmp_path):
+    loader = StubLoader()
+    registry = LlamaModelRegistry(loader=loader)
+    path = model_file(tmp_path, "a", 10)
+
+    first = registry.acquire(path, n_ctx=2048)
+    registry.release(first)
+    again = registry.acquire(path, n_ctx=2048)
+    other_ctx = registry.acquire(path, n_ctx=4096)
+
+    assert again is first
+    assert other_ctx is not first
+    assert first.key.quantization == "q4_0"
+    assert (registry.loads, registry.hits) == (2, 1)
+
+
+def test_release_tracks_in_use_and_protects_busy_models(tmp_path):
+    registry = LlamaModelRegistry(loader=StubLoader())
+    path = model_file(tmp_path, "a", 10)
+
+    model = registry.acquire(path)
+    registry.acquire(path)
+    entry = registry.models[model.key]
+    assert entry.in_use == 2
+    assert not registry.evict(model.key)
+
+    registry.release(model)
+    registry.release(model)
+    registry.release(model)
+    assert entry.in_use == 0
+    assert registry.evict(model.key)
+    assert model.closed
+
+
+def test_idle_timeout_evicts_only_idle_models(tmp_path):
+    registry = LlamaModelRegistry(loader=StubLoader(), idle_timeout=60)
+    idle = registry.acquire(model_file(tmp_path, "idle", 10))
+    busy = registry.acquire(model_file(tmp_path, "busy", 10))
+    registry.release(idle)
+    entry = registry.models[idle.key]
+
+    registry.evict_idle(now=entry.last_used + 30)
+    assert idle.key in registry.models
+
+    registry.evict_idle(now=entry.last_used + 61)
+    assert idle.key not in registry.models
+    assert busy.key in registry.models
+    assert idle.closed and not busy.closed
+
+
+def test_budget_evicts_least_recently_used_counting_external_usage(tmp_path):
+    external = [0]
+    registry = LlamaModelRegistry(
+        loader=StubLoader(), memory_budget_bytes=100, external_usage=lambda: external[0]
+    )
+    old = registry.acquire(model_file(tmp_path, "old", 40))
+    recent = registry.acquire(model_file(tmp_path, "recent", 40))
+    registry.release(old)
+    registry.release(recent)
+
+    # 80 resident + 30 incoming fits only once the older model is gone.
+    registry.acquire(model_file(tmp_path, "third", 30))
+    assert old.key not in registry.models
+    assert recent.key in registry.models
+
+    # The diffusion pipelines now hold 50 bytes, so nothing idle can stay.
+    external[0] = 50
+    registry.acquire(model_file(tmp_path, "fourth", 20))
+    assert recent.key not in registry.models
+    assert registry.evictions == 2
+    assert registry.resident_bytes() == 50
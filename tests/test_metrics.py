@@ -0,0 +1,120 @@
+import re
+
+import pytest
+
+from discord_tron_client.classes.metrics import (
+    CONTENT_TYPE,
+    Collected,
+    MetricsRegistry,
+)
+from discord_tron_client.classes.image_manipulation.residency import (
+    CPU,
+    GPU,
+    ResidencyManager,
+)
+
+# One sample line of the Prometheus text exposition format.
+SAMPLE_LINE = re.compile(
+    r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\]|\\.)*",?)*\})? '
+    r"(-?[0-9.e+-]+|NaN|\+Inf|-Inf)$"
+)
+
+
+def assert_exposition(text: str):
+    assert text.endswith("\n")
+    declared = set()
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            continue
+        if line.startswith("# TYPE "):
+            name, kind = line.split()[2:4]
+            assert kind in ("counter", "gauge", "histogram", "untyped")
+            declared.add(name)
+            continue
+        assert SAMPLE_LINE.match(line), line
+        name = re.split(r"[{ ]", line, 1)[0]
+        assert re.sub(r"_(bucket|sum|count)$", "", name) in declared | {name}
+
+
+def test_render_counters_gauges_and_histograms():
+    registry = MetricsRegistry(prefix="test_")
+    jobs = registry.counter("jobs_total", "Jobs run.", ("outcome",))
+    depth = registry.gauge("queue_depth", "Queued jobs.")
+    seconds = registry.histogram("job_seconds", "Job time.", buckets=(1, 10))
+    jobs.inc(outcome="ok")
+    jobs.inc(2, outcome="ok")
+    depth.set(3)
+    seconds.observe(0.5)
+    seconds.observe(5)
+    seconds.observe(50)
+
+    text = registry.render()
+
+    assert_exposition(text)
+    assert "# TYPE test_jobs_total counter" in text
+    assert 'test_jobs_total{outcome="ok"} 3' in text
+    assert "test_queue_depth 3" in text
+    assert 'test_job_seconds_bucket{le="1"} 1' in text
+    assert 'test_job_seconds_bucket{le="10"} 2' in text
+    assert 'test_job_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_job_seconds_sum 55.5" in text
+    assert "test_job_seconds_count 3" in text
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry(prefix="test_")
+    registry.counter("errors_total", "Errors.", ("message",)).inc(message='a "b"\n')
+
+    text = registry.render()
+
+    assert_exposition(text)
+    assert 'message="a \\"b\\"\\n"' in text
+
+
+def test_registering_a_name_twice_returns_the_same_metric():
+    registry = MetricsRegistry(prefix="test_")
+    assert registry.counter("a_total", "") is registry.counter("a_total", "")
+    with pytest.raises(ValueError):
+        registry.gauge("a_total", "")
+
+
+def test_collectors_are_read_at_scrape_time_and_failures_are_skipped():
+    registry = MetricsRegistry(prefix="test_")
+    reads = []
+
+    def collector():
+        reads.append(1)
+        yield Collected("cache_entries", "gauge", "Entries.", [({"cache": "x"}, len(reads))])
+
+    def broken():
+        raise RuntimeError("boom")
+        yield
+
+    registry.register_collector("cache", collector)
+    registry.register_collector("broken", broken)
+
+    assert 'test_cache_entries{cache="x"} 1' in registry.render()
+    assert 'test_cache_entries{cache="x"} 2' in registry.render()
+
+
+def test_residency_stats_copy_the_manager_state():
+    residency = ResidencyManager(gpu_budget_bytes=100, cpu_budget_bytes=1000)
+    stats = residency.stats()
+    stats["budgets"][GPU] = 0
+    assert residency.stats()["budgets"] == {GPU: 100, CPU: 1000}
+
+
+def test_metrics_endpoint_serves_the_exposition_format():
+    pytest.importorskip("flask")
+    from discord_tron_client.app_factory import create_app
+    from discord_tron_client.classes.metrics import JOB_STAGE
+
+    JOB_STAGE.observe(0.2, stage="prepare")
+    response = create_app().test_client().get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    assert_exposition(text)
+    assert "# TYPE tron_job_stage_seconds histogram" in text
+    assert 'tron_job_stage_seconds_count{stage="prepare"}' in text
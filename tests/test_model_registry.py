@@ -0,0 +1,90 @@
+import sys
+
+import pytest
+
+from discord_tron_client.classes.model_registry import (
+    ModelRegistry,
+    profile_imports,
+)
+
+
+@pytest.fixture
+def family_module(tmp_path, monkeypatch):
+    """A throwaway module on sys.path, so tests can see when it gets imported."""
+    name = f"registry_family_{id(tmp_path)}"
+    (tmp_path / f"{name}.py").write_text(
+        "class Pipeline:\n    pass\n\nclass Runner:\n    pass\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield name
+    sys.modules.pop(name, None)
+
+
+def test_families_are_imported_on_first_resolve(family_module):
+    registry = ModelRegistry({"pipeline": {"fake": f"{family_module}:Pipeline"}})
+
+    assert family_module not in sys.modules
+    assert registry.loaded("pipeline", "fake") is None
+    assert "fake" in registry.mapping("pipeline")
+    assert family_module not in sys.modules
+
+    cls = registry.resolve("pipeline", "fake")
+
+    assert cls is sys.modules[family_module].Pipeline
+    assert registry.loaded("pipeline", "fake") is cls
+    assert [record["module"] for record in registry.import_report()] == [
+        family_module
+    ]
+
+
+def test_matches_never_imports(family_module):
+    registry = ModelRegistry({"pipeline": {"fake": f"{family_module}:Pipeline"}})
+
+    assert not registry.matches(object(), "fake")
+    assert family_module not in sys.modules
+
+    pipeline = registry.resolve("pipeline", "fake")()
+    assert registry.matches(pipeline, "other", "fake")
+
+
+def test_unknown_and_broken_families():
+    registry = ModelRegistry({"pipeline": {"broken": "no_such_module_xyz:Pipeline"}})
+
+    with pytest.raises(KeyError):
+        registry.resolve("pipeline", "missing")
+    with pytest.raises(ImportError):
+        registry.resolve("pipeline", "broken")
+    assert registry.get("pipeline", "broken", default="fallback") == "fallback"
+    with pytest.raises(ValueError):
+        registry.register("pipeline", "bad", "not-an-entry-point")
+
+
+def test_registered_objects_are_returned_as_is():
+    sentinel = object()
+    registry = ModelRegistry()
+    registry.register("worker", "fake", sentinel)
+
+    assert registry.resolve("worker", "fake") is sentinel
+    assert registry.mapping("worker")["fake"] is sentinel
+
+
+def test_warm_up_imports_every_kind_of_a_family(family_module):
+    registry = ModelRegistry(
+        {
+            "pipeline": {"fake": f"{family_module}:Pipeline"},
+            "runner": {"fake": f"{family_module}:Runner"},
+        }
+    )
+
+    registry.warm_up(["fake"], background=False)
+
+    assert registry.loaded("pipeline", "fake") is not None
+    assert registry.loaded("runner", "fake") is not None
+
+
+def test_profile_imports_records_new_modules(family_module):
+    with profile_imports() as profile:
+        __import__(family_module)
+
+    assert family_module in profile.modules
+    assert profile.seconds >= profile.modules[family_module]["seconds"]
@@ -0,0 +1,104 @@
+import pytest
+
+from discord_tron_client.classes.cost_model import CostModel
+from discord_tron_client.classes.image_manipulation.oom_ladder import (
+    CAPPED_RESOLUTION,
+    FULL,
+    MODEL_OFFLOAD,
+    SMALLER_BATCH,
+    VAE_TILING,
+    RUNGS,
+    OOMLadder,
+    SimulatedOutOfMemoryError,
+    is_out_of_memory,
+)
+
+
+def ladder(cost_model=None, failing=()):
+    cleanups = []
+    return (
+        OOMLadder(
+            cost_model=cost_model,
+            cleanup=lambda: cleanups.append(1),
+            inject=lambda rung: rung in failing,
+        ),
+        cleanups,
+    )
+
+
+def test_is_out_of_memory():
+    assert is_out_of_memory(RuntimeError("CUDA out of memory. Tried to allocate"))
+    assert is_out_of_memory(SimulatedOutOfMemoryError("Simulated CUDA out of memory"))
+    assert not is_out_of_memory(ValueError("bad prompt"))
+
+
+def test_degradations_accumulate():
+    oom = OOMLadder()
+
+    assert oom.degradation(FULL, 4, 1024, 1024).batch_size == 4
+    tiled = oom.degradation(VAE_TILING, 4, 1024, 1024)
+    assert (tiled.batch_size, tiled.tiling, tiled.offload) == (1, True, None)
+    assert oom.degradation(MODEL_OFFLOAD, 4, 1024, 1024).offload == "model"
+    capped = oom.degradation(CAPPED_RESOLUTION, 4, 1024, 1024)
+    assert (capped.side_x, capped.side_y, capped.offload) == (704, 704, "sequential")
+
+
+def test_climbs_until_a_rung_fits_and_records_it():
+    cost_model = CostModel()
+    oom, cleanups = ladder(cost_model, failing={FULL, SMALLER_BATCH})
+    attempts, restored = [], []
+
+    result = oom.run(
+        lambda degradation: attempts.append(degradation) or "image",
+        "sdxl",
+        1024,
+        1024,
+        batch_size=2,
+        restore=restored.append,
+    )
+
+    assert result == "image"
+    assert [d.rung for d in attempts] == [VAE_TILING]
+    # Every rung that was tried, failed or not, is undone.
+    assert [d.rung for d in restored] == [FULL, SMALLER_BATCH, VAE_TILING]
+    assert len(cleanups) == 2
+    assert cost_model.oom_rung("sdxl", {"width": 1024, "height": 1024}, 2) == VAE_TILING
+
+
+def test_the_next_job_starts_on_the_recorded_rung():
+    cost_model = CostModel()
+    cost_model.record_oom_rung("sdxl", {"width": 1024, "height": 1024}, 1, MODEL_OFFLOAD)
+    oom, _ = ladder(cost_model)
+    attempts = []
+
+    oom.run(attempts.append, "sdxl", 1024, 1024)
+
+    assert [d.rung for d in attempts] == [MODEL_OFFLOAD]
+
+
+def test_rungs_that_change_nothing_are_skipped():
+    oom, _ = ladder(failing={FULL})
+    attempts = []
+
+    oom.run(attempts.append, "sdxl", 256, 256, batch_size=1)
+
+    # A batch of one cannot shrink, so the smaller batch rung is skipped.
+    assert [d.rung for d in attempts] == [VAE_TILING]
+
+
+def test_other_errors_propagate_without_climbing():
+    oom, cleanups = ladder()
+
+    def attempt(degradation):
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError):
+        oom.run(attempt, "sdxl", 1024, 1024)
+    assert cleanups == []
+
+
+def test_the_last_error_propagates_when_every_rung_fails():
+    oom, _ = ladder(failing=set(RUNGS))
+
+    with pytest.raises(SimulatedOutOfMemoryError, match="capped_resolution"):
+        oom.run(lambda degradation: None, "sdxl", 1024, 1024, batch_size=2)
@@ -0,0 +1,67 @@
+from discord_tron_client.replay import format_report, load_recording
+from discord_tron_client.replay.harness import RECORDING, _families, _rewrite
+from discord_tron_client.replay.stand_ins import FAMILIES
+
+
+def test_bundled_recording_only_uses_stand_ins():
+    messages, overrides = load_recording(RECORDING)
+
+    assert overrides["concurrent_slots"] == 1
+    assert [offset for offset, _ in messages] == sorted(offset for offset, _ in messages)
+    found = set()
+    for _, payload in messages:
+        _families(payload, found)
+    assert found and found <= set(FAMILIES)
+
+
+def test_bundled_image_jobs_run_offline():
+    messages, _ = load_recording(RECORDING)
+    configs = [
+        payload["config"]
+        for _, payload in messages
+        if payload["module_command"] == "generate_image"
+    ]
+
+    assert configs
+    for config in configs:
+        # The tile pass would fetch a ControlNet from the Hub.
+        assert config["tile_strength"] == 0.0
+        # Read by DiscordMessage.print_prompt() when the result is posted.
+        for key in ("model", "resolution", "steps", "temperature", "strength"):
+            assert key in config
+
+
+def test_rewrite_points_models_at_the_stand_ins():
+    payload = {"config": {"model": "tiny:sdxl"}, "models": ["tiny:llm", "other"]}
+
+    assert _rewrite(payload, {"sdxl": "/stand-ins/tiny-sdxl"}) == {
+        "config": {"model": "/stand-ins/tiny-sdxl"},
+        "models": ["tiny-llm", "other"],
+    }
+
+
+def test_format_report():
+    stages = {stage: {"p50": 1.0} for stage in ("queue_wait", "run", "finish", "total")}
+    stages["upload"] = {"p50": None}
+    report = {
+        "recording": "mixed.jsonl",
+        "wall_seconds": 3.0,
+        "bytes_uploaded": 2**20,
+        "peak_rss_bytes": 2**30,
+        "jobs": [{}, {}],
+        "families": {
+            "sdxl": {
+                "jobs": 2,
+                "completed": 2,
+                "stages": stages,
+                "bytes_uploaded": 2**20,
+                "peak_rss_bytes": 2**30,
+            }
+        },
+    }
+
+    lines = format_report(report).splitlines()
+    assert lines[0] == (
+        "Replayed 2 jobs from mixed.jsonl in 3.0s, 1.00 MiB uploaded, peak RSS 1024 MiB."
+    )
+    assert lines[2].split() == ["sdxl", "2", "2", "1.00s", "1.00s", "-", "1.00s", "1.00s", "1.00", "1024", "MiB"]
@@ -0,0 +1,143 @@
+import math
+
+from discord_tron_client.classes.image_manipulation.residency import (
+    CPU,
+    DISK,
+    GPU,
+    ResidencyManager,
+)
+
+
+class FakeModule:
+    """A component of known size; the manager never touches tensors."""
+
+    def __init__(self, size_bytes: int):
+        self.size_bytes = size_bytes
+
+    def to(self, device):
+        return self
+
+
+def manager(gpu=None, cpu=None, **kwargs):
+    moves, drops = [], []
+    residency = ResidencyManager(
+        gpu_budget_bytes=gpu,
+        cpu_budget_bytes=cpu,
+        mover=lambda entry, tier: moves.append((entry.model_id, entry.name, tier)),
+        dropper=drops.append,
+        **kwargs,
+    )
+    return residency, moves, drops
+
+
+def register(residency, model_id, tier=CPU, **sizes):
+    return residency.register(
+        model_id, {name: FakeModule(size) for name, size in sizes.items()}, tier=tier
+    )
+
+
+def test_gdsf_evicts_the_least_used_model_first():
+    residency, moves, _ = manager(gpu=200, cpu=1000)
+    for model_id in ("popular", "rare", "new"):
+        register(residency, model_id, unet=100)
+    residency.make_resident("popular", GPU)
+    residency.make_resident("rare", GPU)
+    for _ in range(3):
+        residency.touch("popular")
+
+    assert residency.make_resident("new", GPU)
+
+    assert residency.model_tier("popular") == GPU
+    assert residency.model_tier("rare") == CPU
+    assert residency.model_tier("new") == GPU
+    assert ("rare", "unet", CPU) in moves
+    assert residency.evictions[GPU] == 1
+
+
+def test_cheap_to_reload_components_go_first_on_cpu():
+    residency, _, drops = manager(gpu=0, cpu=200)
+    register(residency, "slow", unet=100)
+    register(residency, "fast", unet=100)
+    residency.record_load("slow", 60.0)
+    residency.record_load("fast", 1.0)
+
+    register(residency, "incoming", unet=100)
+
+    assert drops == ["fast"]
+    assert residency.model_tier("slow") == CPU
+
+
+def test_gpu_evictions_spill_to_cpu_then_disk():
+    residency, moves, drops = manager(gpu=100, cpu=200)
+    register(residency, "a", unet=100)
+    residency.make_resident("a", GPU)
+    register(residency, "b", unet=100)
+
+    residency.make_resident("b", GPU)
+    assert residency.model_tier("b") == GPU
+    assert residency.model_tier("a") == CPU
+
+    # "b" leaves the GPU, and the CPU makes room for it by dropping "a".
+    register(residency, "c", unet=100)
+    residency.make_resident("c", GPU)
+    assert drops == ["a"]
+    assert residency.model_tier("a") == DISK
+    assert residency.model_tier("b") == CPU
+    assert residency.model_tier("c") == GPU
+
+
+def test_shared_components_are_counted_once_and_outlive_one_owner():
+    residency, _, drops = manager(gpu=1000, cpu=1000)
+    vae = FakeModule(50)
+    residency.register("a", {"unet": FakeModule(100), "vae": vae})
+    residency.register("b", {"unet": FakeModule(100), "vae": vae})
+
+    assert residency.tier_bytes(CPU) == 250
+    assert residency.stats()["shared_components"] == 1
+
+    residency.demote("a", DISK)
+
+    assert drops == ["a"]
+    assert residency.is_tracked(vae)
+    assert residency.tier_bytes(CPU) == 150
+    assert residency.components["b"]["vae"].owners == {"b"}
+
+
+def test_make_resident_only_clears_the_tier_when_forced():
+    residency, moves, _ = manager(gpu=100, cpu=1000)
+    register(residency, "small", unet=80)
+    register(residency, "huge", unet=150)
+    residency.make_resident("small", GPU)
+
+    assert not residency.make_resident("huge", GPU)
+    assert residency.model_tier("small") == GPU
+    assert residency.model_tier("huge") == CPU
+
+    # Over budget, but moved in anyway once everything else has been evicted.
+    assert not residency.make_resident("huge", GPU, force=True)
+    assert residency.model_tier("small") == CPU
+    assert residency.model_tier("huge") == GPU
+
+
+def test_an_unknown_budget_never_evicts():
+    residency, _, drops = manager(gpu=None, cpu=None)
+    for model_id in ("a", "b", "c"):
+        register(residency, model_id, unet=10**12)
+        residency.make_resident(model_id, GPU, force=True)
+
+    assert residency.budgets[GPU] == math.inf
+    assert all(residency.model_tier(m) == GPU for m in ("a", "b", "c"))
+    assert residency.evictions == {GPU: 0, CPU: 0}
+    assert drops == []
+
+
+def test_a_zero_budget_keeps_only_the_forced_model():
+    residency, _, _ = manager(gpu=0, cpu=1000)
+    register(residency, "a", unet=10)
+    register(residency, "b", unet=10)
+    residency.make_resident("a", GPU, force=True)
+
+    residency.make_resident("b", GPU, force=True)
+
+    assert residency.model_tier("a") == CPU
+    assert residency.model_tier("b") == GPU
@@ -0,0 +1,106 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from discord_tron_client.classes.image_manipulation import rope_cache
+from discord_tron_client.classes.image_manipulation.rope_cache import RopeCache
+
+
+class PosEmbed:
+    """Stands in for FluxPosEmbed: a table per id row, counting its calls."""
+
+    theta = 10000
+    axes_dim = (2, 2, 2)
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, ids):
+        self.calls += 1
+        angles = ids.double().sum(dim=-1, keepdim=True) / self.theta
+        return angles.cos(), angles.sin()
+
+
+def latent_ids(height: int, width: int, dtype=torch.float32):
+    """Flux's latent image id grid, computed without the cache."""
+    ids = torch.zeros(height // 2, width // 2, 3)
+    ids[..., 1] += torch.arange(height // 2)[:, None]
+    ids[..., 2] += torch.arange(width // 2)[None, :]
+    return ids.reshape(-1, 3).to(dtype)
+
+
+def test_rotary_hits_on_equal_ids_of_the_same_shape_dtype_and_device():
+    cache = RopeCache()
+    pos_embed = PosEmbed()
+    ids = latent_ids(8, 8)
+
+    first = cache.rotary(pos_embed, ids)
+    # A fresh tensor with the same contents, as a transformer builds every step.
+    again = cache.rotary(pos_embed, ids.clone())
+
+    assert again is first
+    assert (cache.hits, cache.misses, pos_embed.calls) == (1, 1, 1)
+
+    cache.rotary(pos_embed, ids.double())
+    cache.rotary(pos_embed, latent_ids(8, 16))
+    cache.rotary(pos_embed, torch.empty(ids.shape, device="meta"))
+    assert (cache.hits, cache.misses) == (1, 4)
+
+    # Different ids of the same shape are told apart, then both stay cached.
+    shifted = ids + 1
+    cache.rotary(pos_embed, shifted)
+    cache.rotary(pos_embed, shifted.clone())
+    cache.rotary(pos_embed, ids.clone())
+    assert (cache.hits, cache.misses) == (3, 5)
+
+
+def test_grid_matches_the_uncached_computation():
+    cache = RopeCache()
+    computed = []
+
+    def grid(height, width, dtype):
+        key = ("flux_latent_ids", height, width, "cpu", str(dtype))
+
+        def compute():
+            computed.append(key)
+            return latent_ids(height, width, dtype)
+
+        return cache.grid(key, compute)
+
+    for height, width, dtype in ((16, 16, torch.float32), (16, 32, torch.float32), (16, 16, torch.bfloat16)):
+        assert torch.equal(grid(height, width, dtype), latent_ids(height, width, dtype))
+        assert torch.equal(grid(height, width, dtype), latent_ids(height, width, dtype))
+
+    assert len(computed) == 3
+    assert (cache.hits, cache.misses) == (3, 3)
+
+
+def test_lru_evicts_over_entry_and_byte_budgets():
+    cache = RopeCache(max_entries=2, budget_bytes=10**6)
+    for size in (4, 8, 16):
+        cache.grid(("ids", size), lambda: torch.zeros(size))
+
+    assert [key[-1] for key in cache.entries] == [8, 16]
+    assert cache.evictions == 1
+
+    small = RopeCache(budget_bytes=64)
+    small.grid(("ids", 32), lambda: torch.zeros(32))
+    assert small.stats()["entries"] == 0
+
+
+def test_wan_rotary_table_is_cached_per_latent_grid(monkeypatch):
+    pytest.importorskip("diffusers")
+    from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.wan.transformer import (
+        WanRotaryPosEmbed,
+    )
+
+    monkeypatch.setattr(rope_cache, "_cache", RopeCache())
+    rope = WanRotaryPosEmbed(attention_head_dim=12, patch_size=(1, 2, 2), max_seq_len=32)
+    small = torch.zeros(1, 4, 2, 8, 8)
+    large = torch.zeros(1, 4, 2, 8, 16)
+
+    cached = rope(small)
+    assert rope(small) is cached
+    assert torch.equal(cached, rope._freqs(small.device, 2, 4, 4))
+    assert torch.equal(rope(large), rope._freqs(large.device, 2, 4, 8))
+    assert rope_cache.get_rope_cache().stats()["misses"] == 2
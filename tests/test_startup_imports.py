@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_startup_imports_load_no_model_weights():
+    # The startup modules need the worker's full dependency set.
+    pytest.importorskip("torch")
+    pytest.importorskip("diffusers")
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "from discord_tron_client.classes.model_registry import check_startup;"
+            "print(check_startup())",
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=600,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "True", result.stderr
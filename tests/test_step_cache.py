@@ -0,0 +1,197 @@
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+diffusers = pytest.importorskip("diffusers")
+
+from discord_tron_client.classes.image_manipulation.pipeline_runners.overrides.step_cache import (
+    StepCache,
+    find_spec,
+    step_cache,
+    user_thresholds,
+)
+
+NUM_STEPS = 8
+
+
+def tiny_flux():
+    model = diffusers.FluxTransformer2DModel(
+        patch_size=1,
+        in_channels=4,
+        num_layers=1,
+        num_single_layers=1,
+        attention_head_dim=16,
+        num_attention_heads=2,
+        joint_attention_dim=32,
+        pooled_projection_dim=32,
+        axes_dims_rope=[4, 4, 8],
+    )
+    inputs = {
+        "hidden_states": torch.randn(1, 16, 4),
+        "encoder_hidden_states": torch.randn(1, 8, 32),
+        "pooled_projections": torch.randn(1, 32),
+        "img_ids": torch.randn(16, 3),
+        "txt_ids": torch.randn(8, 3),
+    }
+    # Flux embeds timesteps in [0, 1].
+    return model, inputs, 1 / 1000
+
+
+def tiny_sd3():
+    model = diffusers.SD3Transformer2DModel(
+        sample_size=8,
+        patch_size=1,
+        in_channels=4,
+        num_layers=2,
+        attention_head_dim=8,
+        num_attention_heads=4,
+        caption_projection_dim=32,
+        joint_attention_dim=32,
+        pooled_projection_dim=16,
+        out_channels=4,
+        pos_embed_max_size=16,
+    )
+    inputs = {
+        "hidden_states": torch.randn(1, 4, 8, 8),
+        "encoder_hidden_states": torch.randn(1, 8, 32),
+        "pooled_projections": torch.randn(1, 16),
+    }
+    return model, inputs, 1
+
+
+def tiny_wan():
+    model = diffusers.WanTransformer3DModel(
+        patch_size=(1, 2, 2),
+        num_attention_heads=2,
+        attention_head_dim=12,
+        in_channels=4,
+        out_channels=4,
+        text_dim=16,
+        freq_dim=256,
+        ffn_dim=32,
+        num_layers=2,
+        cross_attn_norm=True,
+        qk_norm="rms_norm_across_heads",
+        rope_max_seq_len=32,
+    )
+    inputs = {
+        "hidden_states": torch.randn(1, 4, 2, 8, 8),
+        "encoder_hidden_states": torch.randn(1, 8, 16),
+    }
+    return model, inputs, 1
+
+
+def tiny_ltx():
+    model = diffusers.LTXVideoTransformer3DModel(
+        in_channels=4,
+        out_channels=4,
+        patch_size=1,
+        patch_size_t=1,
+        num_attention_heads=2,
+        attention_head_dim=8,
+        cross_attention_dim=16,
+        num_layers=2,
+        caption_channels=16,
+    )
+    inputs = {
+        "hidden_states": torch.randn(1, 2 * 4 * 4, 4),
+        "encoder_hidden_states": torch.randn(1, 8, 16),
+        "encoder_attention_mask": torch.ones(1, 8),
+        "num_frames": 2,
+        "height": 4,
+        "width": 4,
+    }
+    return model, inputs, 1
+
+
+MODELS = {"flux": tiny_flux, "sd3": tiny_sd3, "wan": tiny_wan, "ltx": tiny_ltx}
+
+
+def build(name):
+    torch.manual_seed(0)
+    model, inputs, timestep_scale = MODELS[name]()
+    return model.eval(), inputs, timestep_scale
+
+
+def denoise(model, inputs, timestep_scale, on_step=None):
+    """A minimal sampling loop: the latent moves a little along each output."""
+    inputs = dict(inputs)
+    with torch.no_grad():
+        for step, timestep in enumerate(torch.linspace(999, 1, NUM_STEPS)):
+            output = model(
+                **inputs, timestep=(timestep * timestep_scale).reshape(1), return_dict=False
+            )[0]
+            inputs["hidden_states"] = inputs["hidden_states"] - 0.05 * output
+            if on_step is not None:
+                on_step(step)
+    return inputs["hidden_states"]
+
+
+@pytest.mark.parametrize("name", sorted(MODELS))
+def test_disabled_cache_is_identical(name):
+    model, inputs, timestep_scale = build(name)
+    assert find_spec(model).name == name
+    pipeline = SimpleNamespace(transformer=model)
+
+    expected = denoise(model, inputs, timestep_scale)
+    with step_cache(pipeline, num_inference_steps=NUM_STEPS, disable=True):
+        assert "forward" not in model.__dict__
+        result = denoise(model, inputs, timestep_scale)
+
+    assert torch.equal(result, expected)
+
+
+@pytest.mark.parametrize("name", sorted(MODELS))
+def test_skips_are_bounded_and_spare_first_and_last_steps(name):
+    model, inputs, timestep_scale = build(name)
+    # Any change is under the threshold, so every step that may be skipped is.
+    cache = StepCache(
+        model, find_spec(model), num_steps=NUM_STEPS, threshold=1e9, max_skip_ratio=0.5
+    )
+    skipped_steps = []
+    skipped_before = [0]
+
+    def on_step(step):
+        if cache.skipped > skipped_before[0]:
+            skipped_steps.append(step)
+        skipped_before[0] = cache.skipped
+
+    cache.attach()
+    try:
+        result = denoise(model, inputs, timestep_scale, on_step)
+    finally:
+        cache.detach()
+
+    assert 0 < len(skipped_steps) <= NUM_STEPS * 0.5
+    assert 0 not in skipped_steps
+    assert NUM_STEPS - 1 not in skipped_steps
+    assert result.shape == inputs["hidden_states"].shape
+    assert torch.isfinite(result).all()
+
+
+@pytest.mark.parametrize("name", sorted(MODELS))
+def test_detach_restores_forward(name):
+    model, inputs, timestep_scale = build(name)
+    cache = StepCache(model, find_spec(model), num_steps=NUM_STEPS)
+    modules = [model] + [block for blocks in cache.stacks for block in blocks]
+
+    cache.attach()
+    assert all("forward" in module.__dict__ for module in modules)
+    cache.detach()
+
+    assert all("forward" not in module.__dict__ for module in modules)
+    assert model.forward.__func__ is type(model).forward
+    expected = denoise(model, inputs, timestep_scale)
+    assert cache.calls == 0
+    assert torch.isfinite(expected).all()
+
+
+def test_user_distance_only_applies_to_teacache_models():
+    thresholds = user_thresholds(
+        {"teacache_distance": 0.3, "step_cache_thresholds": {"wan": 0.04}}
+    )
+
+    assert thresholds == {"flux": 0.3, "ltx": 0.3, "wan": 0.04}
+    assert user_thresholds({}) == {}
+    assert user_thresholds(None) == {}
@@ -0,0 +1,59 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from discord_tron_client.classes.tts.engine import (
+    AudioBuffer,
+    TTSEngine,
+    group_sentences,
+    split_sentences,
+)
+
+
+def test_split_sentences():
+    assert split_sentences("One.  Two?   Three! Four") == ["One.", "Two?", "Three!", "Four"]
+
+
+def test_group_sentences_keeps_sentences_whole_and_cuts_long_ones():
+    sentences = ["a b c.", "d e.", "f g h i j k l."]
+
+    assert group_sentences(sentences, 5) == ["a b c. d e.", "f g h i j", "k l."]
+
+
+def test_audio_buffer_grows_and_keeps_order():
+    buffer = AudioBuffer(2)
+    buffer.append(np.array([1, 2, 3], dtype=np.float32))
+    buffer.append(np.array([4], dtype=np.float32))
+
+    assert buffer.result().tolist() == [1, 2, 3, 4]
+
+
+def test_consecutive_groups_in_one_voice_share_a_call():
+    engine = TTSEngine(lambda texts, voice: [], 24000, group_words=2, groups_per_call=2)
+
+    calls = engine.plan([("a b. c d. e f.", "v1"), ("g h.", "v1"), ("i j.", "v2")])
+
+    assert calls == [("v1", ["a b.", "c d."]), ("v1", ["e f.", "g h."]), ("v2", ["i j."])]
+
+
+def test_synthesize_concatenates_clips_in_speaking_order():
+    calls = []
+
+    def synthesize(texts, voice):
+        calls.append((list(texts), voice))
+        return [np.full(len(text), index, dtype=np.float32) for index, text in enumerate(texts)]
+
+    engine = TTSEngine(synthesize, 24000, group_words=3, groups_per_call=4)
+    audio = engine.synthesize([("a b. cd.", None)])
+
+    assert calls == [(["a b. cd."], None)]
+    assert audio.tolist() == [0.0] * len("a b. cd.")
+    assert engine.usage["words"] == 3
+    assert engine.usage["calls"] == 1
+
+
+def test_too_few_clips_from_the_model_is_an_error():
+    engine = TTSEngine(lambda texts, voice: [], 24000, group_words=1, groups_per_call=4)
+
+    with pytest.raises(RuntimeError, match="Expected 2 clips"):
+        engine.synthesize([("a. b.", None)])
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+imageio_ffmpeg = pytest.importorskip("imageio_ffmpeg")
+
+from discord_tron_client.classes.image_manipulation.video_encoder import (
+    VideoEncoder,
+    ffmpeg_executable,
+)
+
+if ffmpeg_executable() is None:
+    pytest.skip("no ffmpeg available", allow_module_level=True)
+
+
+def frames(count: int, height: int = 32, width: int = 48):
+    return [
+        np.full((height, width, 3), index * 10 % 256, dtype=np.uint8) for index in range(count)
+    ]
+
+
+def test_pipes_every_frame_to_ffmpeg(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+
+    with VideoEncoder(path=path, fps=8, video_format="mp4", chunk_frames=4) as encoder:
+        encoder.write(frames(6))
+        encoder.write(frames(5))
+
+    assert encoder.frames == 11
+    assert imageio_ffmpeg.count_frames_and_secs(path)[0] == 11
+
+
+def test_frame_size_may_not_change(tmp_path):
+    encoder = VideoEncoder(path=str(tmp_path / "clip.mp4"), video_format="mp4")
+    encoder.write(frames(2))
+
+    with pytest.raises(ValueError, match="Frame size changed"):
+        encoder.write(frames(2, height=64))
+    encoder.abort()
+
+
+def test_abort_leaves_no_process_or_file(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+
+    with pytest.raises(RuntimeError, match="job failed"):
+        with VideoEncoder(path=path, video_format="mp4", chunk_frames=2, queue_chunks=1) as encoder:
+            encoder.write(frames(20))
+            raise RuntimeError("job failed")
+
+    assert encoder.process.poll() is not None
+    assert encoder.writer is None
+    assert not os.path.exists(path)
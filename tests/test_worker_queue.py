@@ -0,0 +1,158 @@
+import asyncio
+
+from discord_tron_client.classes.worker_queue import (
+    INTERACTIVE,
+    LLM,
+    LONG_MEDIA,
+    TTS,
+    Lane,
+    QueuedJob,
+    WorkerQueue,
+    classify,
+)
+
+
+def payload(user="1", module="image_generation", job_type="gpu", model="sdxl", **extra):
+    return dict(
+        module_name=module,
+        module_command="generate_image",
+        job_type=job_type,
+        config={"model": model},
+        discord_context={"author": {"id": user}},
+        **extra,
+    )
+
+
+def queued(user="1", priority=INTERACTIVE, **extra):
+    return QueuedJob(payload(user, **extra), None, priority, 10.0)
+
+
+def test_classify():
+    assert classify(payload()) == INTERACTIVE
+    assert classify(payload(model="wan-2.1-t2v")) == LONG_MEDIA
+    assert classify(payload(module="ollama", job_type="ollama")) == LLM
+    assert classify(payload(module="tts_bark")) == TTS
+
+
+def test_lane_for():
+    assert WorkerQueue.lane_for(payload()) == "gpu"
+    assert WorkerQueue.lane_for(payload(job_type="llama")) == "llama"
+    assert WorkerQueue.lane_for(payload(job_type="ollama")) == "gpu"
+    assert WorkerQueue.lane_for(payload(job_type=None)) == "general"
+
+
+def test_lane_serves_users_round_robin_within_a_class():
+    lane = Lane("gpu", 1)
+    for user in ("a", "a", "a", "b"):
+        lane.put(queued(user))
+
+    order = [lane._pop().user for _ in range(4)]
+
+    assert order == ["a", "b", "a", "a"]
+    assert lane._pop() is None
+
+
+def test_lane_prefers_urgent_classes_but_ages_waiting_jobs():
+    lane = Lane("gpu", 1, aging_seconds=60)
+    long_job = queued("a", LONG_MEDIA)
+    lane.put(long_job)
+    lane.put(queued("b", INTERACTIVE))
+    assert lane._pop().priority == INTERACTIVE
+
+    lane.put(queued("b", INTERACTIVE))
+    # Four aging periods lift a long media job past the interactive class.
+    long_job.enqueued_at -= 4 * 60
+    assert lane._pop() is long_job
+
+
+def test_take_leaves_unmatched_and_failing_jobs_queued():
+    lane = Lane("gpu", 1)
+    jobs = [queued("a", model="x"), queued("b", model="y"), queued("c", model="x")]
+    for job in jobs:
+        lane.put(job)
+
+    def match(job_payload):
+        if job_payload["discord_context"]["author"]["id"] == "b":
+            raise ValueError("unreadable payload")
+        return job_payload["config"]["model"] == "x"
+
+    assert lane.take(match, limit=5) == [jobs[0], jobs[2]]
+    assert lane.depth() == 1
+
+
+def test_offer_refuses_full_queues_and_missed_deadlines():
+    queue = WorkerQueue(lambda job: None, lanes={"gpu": 1}, max_depth=2)
+
+    assert queue.offer(payload(), None).admitted
+    refused = queue.offer(payload(deadline_seconds=1), None)
+    assert not refused.admitted and "deadline" in refused.reason
+    assert queue.offer(payload(), None).admitted
+    refused = queue.offer(payload(), None)
+    assert not refused.admitted and "full" in refused.reason
+    assert (queue.admitted, queue.rejected) == (2, 2)
+
+
+class FailingScheduler:
+    """Takes a queued job, then fails as a broken batch_key() would."""
+
+    async def collect(self, first, take, queued):
+        take(lambda job_payload: True, 1)
+        raise RuntimeError("boom")
+
+
+def test_scheduler_errors_requeue_taken_jobs_and_keep_consuming():
+    async def scenario():
+        ran = []
+        done = asyncio.Event()
+
+        async def run_job(job):
+            ran.append(job.payload["index"])
+            if len(ran) == 3:
+                done.set()
+
+        queue = WorkerQueue(
+            run_job, lanes={"gpu": 1}, batch_scheduler=FailingScheduler()
+        )
+        for index in range(3):
+            assert queue.offer(payload(index=index), None).admitted
+        queue.start()
+        await asyncio.wait_for(done.wait(), timeout=5)
+        for task in queue._consumers:
+            task.cancel()
+        return ran, queue.stats()
+
+    ran, stats = asyncio.run(scenario())
+
+    assert sorted(ran) == [0, 1, 2]
+    assert stats["lanes"]["gpu"]["completed"] == 3
+    assert stats["depth"] == 0
+
+
+def test_batches_go_to_run_batch():
+    class PairScheduler:
+        async def collect(self, first, take, queued):
+            return [first] + take(lambda job_payload: True, 1)
+
+    async def scenario():
+        batches = []
+        done = asyncio.Event()
+
+        async def run_batch(jobs):
+            batches.append([job.payload["index"] for job in jobs])
+            done.set()
+
+        queue = WorkerQueue(
+            lambda job: None,
+            lanes={"gpu": 1},
+            batch_scheduler=PairScheduler(),
+            run_batch=run_batch,
+        )
+        queue.offer(payload(index=0), None)
+        queue.offer(payload(index=1), None)
+        queue.start()
+        await asyncio.wait_for(done.wait(), timeout=5)
+        for task in queue._consumers:
+            task.cancel()
+        return batches
+
+    assert asyncio.run(scenario()) == [[0, 1]]